@@ -0,0 +1,13 @@
+"""
+URL configuration for ASGI deployments (ASYNC_READ_VIEWS)
+
+The polling endpoints are answered by the coroutines in game.async_views;
+everything else falls through to the usual routes in backend.urls.
+"""
+from django.urls import path, include
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/game/', include('game.async_urls')),
+    *sync_urlpatterns,
+]
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -56,6 +57,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'game.sharding.SessionShardMiddleware',
+    'game.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -180,6 +183,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Email settings (for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -227,3 +231,63 @@ if ENV_MODE == 'dev':
     MAX_DEALS_PER_SESSION = 4
 else:
     MAX_DEALS_PER_SESSION = int(os.getenv('MAX_DEALS_PER_SESSION', '32'))
+
+# Write a compact tree snapshot every N events in a deal's event log
+TREE_SNAPSHOT_INTERVAL = int(os.getenv('TREE_SNAPSHOT_INTERVAL', '50'))
+
+# Historical tree views (?as_of=) are cached per deal and event sequence this long
+TREE_AS_OF_CACHE_SECONDS = int(os.getenv('TREE_AS_OF_CACHE_SECONDS', '3600'))
+
+# Constrained deal generation gives up after this many candidate deals (at
+# most 200000 without NumPy), and spreads rare constraints over this many
+# processes (0: search in the request's own process)
+DEAL_GENERATOR_MAX_CANDIDATES = int(os.getenv('DEAL_GENERATOR_MAX_CANDIDATES', '5000000'))
+DEAL_GENERATOR_WORKERS = int(os.getenv('DEAL_GENERATOR_WORKERS', '0'))
+
+# Responses to requests sent with an Idempotency-Key are replayed to retries for this long
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+
+# Tree writes that lose an optimistic version check are run again this many
+# times in all, after a random pause of up to attempt * delay seconds
+TREE_WRITE_MAX_ATTEMPTS = int(os.getenv('TREE_WRITE_MAX_ATTEMPTS', '5'))
+TREE_WRITE_RETRY_DELAY = float(os.getenv('TREE_WRITE_RETRY_DELAY', '0.05'))
+
+# Where derived tree state is recomputed after a call: 'sync' (in the request),
+# 'thread' (in-process pool after commit) or 'queue' (manage.py run_tree_worker).
+# Queue workers retake jobs another worker has held for TREE_WORKER_CLAIM_SECONDS
+TREE_WORKER_MODE = os.getenv('TREE_WORKER_MODE', 'sync')
+TREE_WORKER_THREADS = int(os.getenv('TREE_WORKER_THREADS', '2'))
+TREE_WORKER_CLAIM_SECONDS = int(os.getenv('TREE_WORKER_CLAIM_SECONDS', '300'))
+
+# Serve the polling endpoints with async views (game.async_views); backend/asgi.py
+# turns this on, WSGI deployments keep the DRF actions
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '0').lower() in ('1', 'true', 'yes')
+if ASYNC_READ_VIEWS:
+    ROOT_URLCONF = 'backend.asgi_urls'
+
+# Sessions are spread over SESSION_SHARD_COUNT databases (game.sharding): default
+# holds the users and deal pools plus the first shard, shard_1... the others.
+# manage.py migrate --database shard_N creates a new shard's tables
+SESSION_SHARD_COUNT = int(os.getenv('SESSION_SHARD_COUNT', '1'))
+SESSION_SHARDS = ['default'] + [f'shard_{shard}' for shard in range(1, SESSION_SHARD_COUNT)]
+for shard_alias in SESSION_SHARDS[1:]:
+    DATABASES[shard_alias] = {**DATABASES['default'], 'NAME': BASE_DIR / f'db_{shard_alias}.sqlite3'}
+
+# Each database above gets READ_REPLICA_COUNT read replicas, <alias>_replica_N,
+# kept up to date by the database's own replication (game.replicas). The session
+# list, all_deals, auction_tree and get_user_sequences read from them, except for
+# users who wrote in the last READ_YOUR_WRITES_SECONDS
+READ_REPLICA_COUNT = int(os.getenv('READ_REPLICA_COUNT', '0'))
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', '5'))
+DATABASE_REPLICAS = {
+    primary_alias: [f'{primary_alias}_replica_{replica}' for replica in range(1, READ_REPLICA_COUNT + 1)]
+    for primary_alias in SESSION_SHARDS
+}
+for primary_alias, replica_aliases in DATABASE_REPLICAS.items():
+    for replica_alias in replica_aliases:
+        DATABASES[replica_alias] = {
+            **DATABASES[primary_alias],
+            'NAME': BASE_DIR / f'db_{replica_alias}.sqlite3',
+            'TEST': {'MIRROR': primary_alias},
+        }
+DATABASE_ROUTERS = ['game.replicas.ReplicaRouter']
@@ -7,6 +7,8 @@ from .bidding_actions import BiddingActionsMixin
 from .sequence_actions import SequenceActionsMixin
 from .tree_actions import TreeActionsMixin
 from .scheduler_actions import SchedulerActionsMixin
+from .import_actions import ImportActionsMixin
+from .participant_actions import ParticipantActionsMixin
 
 __all__ = [
     'DealActionsMixin',
@@ -14,4 +16,6 @@ __all__ = [
     'SequenceActionsMixin',
     'TreeActionsMixin',
     'SchedulerActionsMixin',
+    'ImportActionsMixin',
+    'ParticipantActionsMixin',
 ]
@@ -5,17 +5,21 @@ from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 from django.utils import timezone
 from ..models import Session, PlayerGame, Deal, UserBiddingSequence
 from ..serializers import PlayerGameSerializer, DealSerializer
-from ..utils import calculate_bid_value, is_auction_complete, get_next_position
+from ..sharding import select_users
+from ..utils import get_next_position
 from ..bridge_auction_validator import (
     validate_call,
     update_auction_state,
     get_auction_state_from_history
 )
-from ..services.auction_tree import record_user_response
+from ..services.auction_tree import record_user_response, record_user_responses
+from ..services.auction_calls import append_deal_call, AuctionConflict
+from ..services.idempotency import idempotent
+from ..services.tree_versions import tree_write_attempts
+from ..services.user_sequences import append_calls, truncate_sequence, pop_call, sequence_entries
 
 
 class BiddingActionsMixin:
@@ -50,7 +54,7 @@ class BiddingActionsMixin:
     @action(detail=True, methods=['get'])
     def bidding_history(self, request, pk=None):
         session = self.get_object()
-        player_games = PlayerGame.objects.filter(session=session)
+        player_games = select_users(PlayerGame.objects.filter(session=session), 'player').prefetch_related('bids')
 
         history = []
         for pg in player_games:
@@ -71,7 +75,7 @@ class BiddingActionsMixin:
         """
         session = self.get_object()
 
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response({'error': 'User not part of this session'}, status=403)
 
         all_deals = list(session.deals.order_by('deal_number'))
@@ -91,12 +95,11 @@ class BiddingActionsMixin:
         deal = all_deals[current_index]
 
         user_sequence = UserBiddingSequence.objects.filter(deal=deal, user=request.user).first()
-        if not user_sequence or not user_sequence.sequence:
+        if not user_sequence or not user_sequence.call_count:
             return Response({'error': "No calls to undo"}, status=400)
 
         # Remove last call from sequence (does NOT touch Response model)
-        last_call = user_sequence.sequence.pop()
-        user_sequence.save()
+        last_call = pop_call(user_sequence)
 
         # Set next position as what we removed from the user sequence
         next_position = last_call['position']
@@ -108,12 +111,12 @@ class BiddingActionsMixin:
             'deal': {
                 'id': deal.id,
                 'deal_number': deal.deal_number,
-                'hands': deal.hands,
+                'hands': deal.board_hands,
                 'dealer': deal.dealer,
                 'vulnerability': deal.vulnerability
             },
             'position': next_position,
-            'user_sequence': user_sequence.sequence,
+            'user_sequence': sequence_entries(user_sequence),
             'deal_number_after_undo': deal.deal_number
         })
 
@@ -140,7 +143,7 @@ class BiddingActionsMixin:
             )
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -158,64 +161,32 @@ class BiddingActionsMixin:
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Use atomic transaction to prevent race conditions
-        with transaction.atomic():
-            # Lock the deal row for update to prevent concurrent modifications
-            try:
-                deal = Deal.objects.select_for_update().get(id=deal_id, session=session)
-            except Deal.DoesNotExist:
-                return Response(
-                    {'error': 'Deal not found'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-
-            # Get the current auction history (fresh from DB due to lock)
-            auction_history = deal.auction_history or []
-
-            # Validate the call
-            call_type = 'bid' if call[0].isdigit() else 'action'
-
-            if call_type == 'bid':
-                # Check if bid is legal
-                last_bid_value = -1
-                for historical_call in auction_history:
-                    if historical_call.get('type') == 'bid':
-                        last_bid_value = calculate_bid_value(historical_call['call'])
-
-                new_bid_value = calculate_bid_value(call)
-                if new_bid_value <= last_bid_value:
-                    return Response(
-                        {'error': 'Bid must be higher than the last bid'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-            # Add the call to auction history with timestamp for ordering
-            call_obj = {
-                'position': player_game.position,
-                'player': request.user.username,
-                'call': call,
-                'alert': alert_text,
-                'type': call_type,
-                'timestamp': timezone.now().isoformat(),
-                'call_index': len(auction_history)  # Add index for proper ordering
-            }
-
-            auction_history.append(call_obj)
-            deal.auction_history = auction_history
-
-            # Check if auction is complete
-            if is_auction_complete(auction_history):
-                deal.is_complete = True
+        try:
+            deal = Deal.objects.get(id=deal_id, session=session)
+        except Deal.DoesNotExist:
+            return Response(
+                {'error': 'Deal not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-            deal.save()
+        # Append-only: validated against the deal's cached auction state and
+        # stored as one call row, retried if a concurrent call took the slot
+        try:
+            _, after = append_deal_call(deal.id, player_game.position, request.user, call, alert_text)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except AuctionConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        for field, value in after.items():
+            setattr(deal, field, value)
 
-        # Return the updated deal (outside the transaction)
         return Response({
             'deal': DealSerializer(deal).data,
             'auction_complete': deal.is_complete
         })
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def make_user_call(self, request):
         """Make a call in user's independent bidding sequence"""
         session_id = request.data.get('session_id')
@@ -241,7 +212,7 @@ class BiddingActionsMixin:
             )
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -255,9 +226,7 @@ class BiddingActionsMixin:
         )
 
         # Check if this is a different branch from user's sequence
-        current_sequence = user_sequence.sequence or []
-        user_history_calls = [entry['call'] for entry in current_sequence]
-        user_history = ' '.join(user_history_calls) if user_history_calls else ''
+        user_history = user_sequence.history
 
         # Determine if on same branch
         is_same_branch = False
@@ -279,7 +248,7 @@ class BiddingActionsMixin:
         else:
             # No history provided, assume same branch (use user's sequence)
             is_same_branch = True
-            auction_state = get_auction_state_from_history(deal.dealer, current_sequence)
+            auction_state = get_auction_state_from_history(deal.dealer, sequence_entries(user_sequence))
             history_str = user_history
 
         # Validate the call using comprehensive bridge rules
@@ -293,40 +262,31 @@ class BiddingActionsMixin:
         # Update auction state
         update_auction_state(auction_state, call, position)
 
-        # Only add to user's sequence if on the same branch
-        if is_same_branch:
-            call_type = 'bid' if call[0].isdigit() else 'action'
-            call_entry = {
-                'position': position,
-                'call': call,
-                'alert': alert_text,
-                'type': call_type,
-                'timestamp': timezone.now().isoformat(),
-                'call_index': len(current_sequence)
-            }
-
-            if not user_sequence.sequence:
-                user_sequence.sequence = []
-            user_sequence.sequence.append(call_entry)
-            user_sequence.save()
-
         # Check if auction is complete
         deal_just_completed = auction_state.auction_ended
 
-        # Record the response in the auction tree using correct history
-        record_user_response(
-            session_id=session.id,
-            deal_index=deal.deal_number,
-            user_id=request.user.id,
-            history=history_str,
-            seat_to_act=position,
-            call=call
-        )
+        # The sequence and the tree response commit together, run again if a
+        # partner's concurrent write to the deal commits first
+        for attempt in tree_write_attempts():
+            with attempt:
+                # Only add to user's sequence if on the same branch
+                if is_same_branch:
+                    append_calls(user_sequence, [(position, call, alert_text)])
+
+                # Record the response in the auction tree using correct history
+                record_user_response(
+                    session_id=session.id,
+                    deal_index=deal.deal_number,
+                    user_id=request.user.id,
+                    history=history_str,
+                    seat_to_act=position,
+                    call=call
+                )
 
         # Prepare response sequence for display
         if is_same_branch:
             # Same branch - return user's updated sequence
-            display_sequence = user_sequence.sequence
+            display_sequence = sequence_entries(user_sequence)
         else:
             # Different branch - build display sequence from history + new call
             history_calls = history_str.split() if history_str else []
@@ -358,3 +318,135 @@ class BiddingActionsMixin:
             },
             'auction_complete': deal_just_completed
         })
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def make_user_calls(self, request):
+        """
+        Make several consecutive calls along one branch in a single request.
+        Calls are validated in one pass and recorded in one transaction.
+        """
+        session_id = request.data.get('session_id')
+        deal_id = request.data.get('deal_id')
+        calls = request.data.get('calls')
+        current_history = request.data.get('history', '')  # Branch history the line starts from
+
+        if not all([session_id, deal_id, calls]) or not isinstance(calls, list):
+            return Response(
+                {'error': 'session_id, deal_id, and a non-empty calls list are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            session = select_users(Session.objects.all(), 'creator', 'partner').get(id=session_id)
+            deal = Deal.objects.get(id=deal_id, session=session)
+        except (Session.DoesNotExist, Deal.DoesNotExist):
+            return Response(
+                {'error': 'Session or deal not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # Check if user is part of this session
+        if not session.has_participant(request.user):
+            return Response(
+                {'error': 'You are not part of this session'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # Accept plain call strings or {'call', 'position', 'alert'} objects
+        entries = []
+        for entry in calls:
+            if isinstance(entry, str):
+                entry = {'call': entry}
+            if not isinstance(entry, dict) or not entry.get('call'):
+                return Response(
+                    {'error': 'Each call must be a string or an object with a call'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            entries.append(entry)
+
+        user_sequence, created = UserBiddingSequence.objects.get_or_create(
+            deal=deal,
+            user=request.user,
+            defaults={'position': 'S'}  # Default starting position
+        )
+        user_history = user_sequence.history
+
+        if current_history is None:
+            current_history = user_history
+        is_same_branch = (user_history.startswith(current_history) or
+                          current_history.startswith(user_history))
+
+        # Validate the whole line in one pass through AuctionState
+        history_calls = current_history.split() if current_history else []
+        temp_sequence = []
+        pos = deal.dealer
+        for c in history_calls:
+            temp_sequence.append({'position': pos, 'call': c})
+            pos = get_next_position(pos)
+        auction_state = get_auction_state_from_history(deal.dealer, temp_sequence)
+
+        line = []
+        for index, entry in enumerate(entries):
+            call = entry['call']
+            position = entry.get('position') or auction_state.to_act_seat
+            validation = validate_call(auction_state, call, position)
+            if not validation['ok']:
+                return Response(
+                    {'error': validation['error'], 'call_index': index},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            update_auction_state(auction_state, call, position)
+            line.append((position, call))
+
+        # The line and the sequence commit together, run again if a partner's
+        # concurrent write to the deal commits first
+        for attempt in tree_write_attempts():
+            with attempt:
+                record_user_responses(session, deal, request.user, current_history, line)
+
+                new_entries = []
+                now = timezone.now().isoformat()
+                for (position, call), entry in zip(line, entries):
+                    new_entries.append({
+                        'position': position,
+                        'call': call,
+                        'alert': entry.get('alert', ''),
+                        'type': 'bid' if call[0].isdigit() else 'action',
+                        'timestamp': now,
+                    })
+
+                if is_same_branch:
+                    # Keep the user's calls up to the branch point, fill in any
+                    # branch calls they have not made themselves, then add the line
+                    truncate_sequence(user_sequence, len(history_calls))
+                    fill = [(entry['position'], entry['call']) for entry in temp_sequence[user_sequence.call_count:]]
+                    append_calls(user_sequence, fill + [
+                        (entry['position'], entry['call'], entry['alert']) for entry in new_entries
+                    ])
+
+        if is_same_branch:
+            display_sequence = sequence_entries(user_sequence)
+        else:
+            display_sequence = []
+            pos = deal.dealer
+            for c in history_calls:
+                display_sequence.append({
+                    'position': pos,
+                    'call': c,
+                    'type': 'bid' if c[0].isdigit() else 'action',
+                    'call_index': len(display_sequence)
+                })
+                pos = get_next_position(pos)
+            for entry in new_entries:
+                display_sequence.append({**entry, 'call_index': len(display_sequence)})
+
+        return Response({
+            'user_sequence': {
+                'sequence': display_sequence,
+                'user': request.user.username,
+                'updated_at': timezone.now().isoformat()
+            },
+            'calls_recorded': len(line),
+            'auction_complete': auction_state.auction_ended
+        })
@@ -1,11 +1,17 @@
 """
 Deal-related actions for SessionViewSet
 """
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from ..models import Deal, Node
+from ..models import Deal, DealCall, Node
+from ..pagination import DealCursorPagination
+from ..services.deal_pools import build_field_tree
+from ..services.deal_generator import generate_deals
+from ..services.pending_work import refresh_pending_counters
 from ..serializers import DealSerializer
+from ..sharding import select_users
 from ..utils import shuffle_and_deal
 
 
@@ -37,7 +43,7 @@ class DealActionsMixin:
 
     @action(detail=True, methods=['post'])
     def create_deal(self, request, pk=None):
-        """Create a new deal with shuffled cards"""
+        """Create a new deal with shuffled cards (matching 'constraint' if given)"""
         session = self.get_object()
 
         # Get the next deal number
@@ -48,8 +54,19 @@ class DealActionsMixin:
         deal = Deal(session=session, deal_number=deal_number)
         deal.dealer = deal.get_dealer_for_deal()
         deal.vulnerability = deal.get_vulnerability_for_deal()
-        deal.hands = shuffle_and_deal()
+        constraint = (request.data.get('constraint') or '').strip()
+        if constraint:
+            try:
+                deal.hands = generate_deals(constraint, 1)[0]
+            except ValueError as e:
+                return Response(
+                    {'error': f'Could not generate deals: {e}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            deal.hands = shuffle_and_deal()
         deal.save()
+        refresh_pending_counters(session, [deal])
 
         serializer = DealSerializer(deal)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -99,20 +116,62 @@ class DealActionsMixin:
 
     @action(detail=True, methods=['get'])
     def all_deals(self, request, pk=None):
-        """Get all deals for a session"""
+        """
+        Get all deals for a session.
+        Pass page_size to receive one page at a time with next/previous cursors.
+        """
         session = self.get_object()
-        deals = session.deals.order_by('deal_number')
-        serializer = DealSerializer(deals, many=True)
 
-        # Add has_tree_data flag for each deal
-        deals_data = serializer.data
-        for deal_data in deals_data:
-            # Check if this deal has any nodes (which means it has auction tree data)
-            has_nodes = Node.objects.filter(deal_id=deal_data['id']).exists()
-            deal_data['has_tree_data'] = has_nodes
+        # A deal has auction tree data once any node exists for it
+        deals = select_users(session.deals.all(), 'pooled_deal').prefetch_related(
+            Prefetch('calls', queryset=select_users(DealCall.objects.all(), 'player'))
+        ).annotate(
+            has_tree_data=Exists(Node.objects.filter(deal=OuterRef('pk')))
+        ).order_by('deal_number')
+        totals = session.deals.aggregate(total=Count('id'), latest=Max('deal_number'))
 
-        return Response({
+        paginator = DealCursorPagination()
+        page = paginator.paginate_queryset(deals, request, view=self)
+        deal_list = page if page is not None else list(deals)
+
+        deals_data = DealSerializer(deal_list, many=True).data
+        for deal, deal_data in zip(deal_list, deals_data):
+            deal_data['has_tree_data'] = deal.has_tree_data
+
+        data = {
             'deals': deals_data,
-            'total': deals.count(),
-            'latest_deal_number': deals.last().deal_number if deals.exists() else 0
-        })
+            'total': totals['total'],
+            'latest_deal_number': totals['latest'] or 0
+        }
+        if page is not None:
+            data['next'] = paginator.get_next_link()
+            data['previous'] = paginator.get_previous_link()
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def field_tree(self, request, pk=None):
+        """
+        Compare a pooled deal's bidding with every other session playing it.
+        Each state lists the field's calls, with this session's own calls as 'session_calls'.
+        """
+        session = self.get_object()
+        try:
+            deal = select_users(session.deals.all(), 'pooled_deal').get(
+                deal_number=int(request.query_params.get('deal_index', 1))
+            )
+        except (ValueError, TypeError, Deal.DoesNotExist):
+            return Response(
+                {'error': 'Invalid deal index or deal not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if deal.pooled_deal is None:
+            return Response(
+                {'error': 'Deal is not from a deal pool'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        field = build_field_tree(deal.pooled_deal, deal)
+        field['session_id'] = session.id
+        field['deal_index'] = deal.deal_number
+        return Response(field)
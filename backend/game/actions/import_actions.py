@@ -0,0 +1,135 @@
+"""
+Import and export actions for SessionViewSet
+"""
+import io
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.response import Response
+from ..models import Deal
+from ..sharding import bind_shard
+from ..services.system_import import import_system_notes
+from ..services.deal_formats import READERS, WRITERS, read_records, import_deal_records, iter_deal_records
+
+
+def request_lines(request):
+    """Lines of an uploaded 'file' (streamed) or of a 'content' text field"""
+    upload = request.FILES.get('file')
+    if upload is not None:
+        return io.TextIOWrapper(upload.file, encoding='utf-8', errors='replace')
+    content = request.data.get('content')
+    if content:
+        return content.splitlines()
+    return None
+
+
+class ImportActionsMixin:
+    """Mixin for importing and exporting tree and deal data"""
+
+    @action(detail=True, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def import_system(self, request, pk=None):
+        """
+        Import agreed partnership sequences ("1NT-2C-2D", one per line) as
+        a pre-populated line for both partners. Continuations other than the
+        first listed at a node are returned as 'conflicts'.
+        Accepts a 'file' upload or a 'content' field; 'deal_index' limits
+        the import to one deal, otherwise every deal in the session is populated.
+        """
+        session = self.get_object()
+
+        # Check if user is part of this session
+        if not session.has_participant(request.user):
+            return Response(
+                {'error': 'You are not part of this session'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        lines = request_lines(request)
+        if lines is None:
+            return Response(
+                {'error': 'A file upload or content field is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        deals = None
+        deal_index = request.data.get('deal_index')
+        if deal_index:
+            try:
+                deals = [session.deals.get(deal_number=int(deal_index))]
+            except (ValueError, Deal.DoesNotExist):
+                return Response(
+                    {'error': 'Invalid deal_index or deal not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+        summary = import_system_notes(session, lines, deals)
+        if not summary['sequences']:
+            return Response(
+                {'error': 'No valid sequences found', 'errors': summary['errors']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(summary, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def import_deals(self, request, pk=None):
+        """
+        Append the boards of a PBN or LIN file to this session as new deals.
+        Accepts a 'file' upload or a 'content' field; 'file_format' ('pbn' or
+        'lin') is detected from the content when omitted. Each board's
+        auction is recorded for both partners unless 'auctions' is false.
+        """
+        session = self.get_object()
+
+        # Check if user is part of this session
+        if not session.has_participant(request.user):
+            return Response(
+                {'error': 'You are not part of this session'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        file_format = (request.data.get('file_format') or '').lower() or None
+        if file_format and file_format not in READERS:
+            return Response(
+                {'error': 'file_format must be pbn or lin'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        lines = request_lines(request)
+        if lines is None:
+            return Response(
+                {'error': 'A file upload or content field is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with_auctions = str(request.data.get('auctions', 'true')).lower() not in ('false', '0', 'no')
+        summary = import_deal_records(session, read_records(lines, file_format), with_auctions)
+        if not summary['deals']:
+            return Response(
+                {'error': 'No valid boards found', 'errors': summary['errors']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(summary, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def export_deals(self, request, pk=None):
+        """
+        Stream this session's deals as a PBN or LIN file ('file_format',
+        default pbn), with the requesting user's own auction for each deal.
+        """
+        session = self.get_object()
+        file_format = request.query_params.get('file_format', 'pbn').lower()
+        if file_format not in WRITERS:
+            return Response(
+                {'error': 'file_format must be pbn or lin'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        records = iter_deal_records(session, request.user)
+        response = StreamingHttpResponse(
+            bind_shard(WRITERS[file_format](records)), content_type='text/plain; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="session-{session.id}.{file_format}"'
+        return response
@@ -0,0 +1,77 @@
+"""
+Participant-related actions for SessionViewSet
+"""
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from ..models import SessionParticipant
+from ..serializers import SessionParticipantSerializer
+from ..sharding import select_users
+from ..services.participants import add_participant as add_session_participant
+
+User = get_user_model()
+
+JOINABLE_ROLES = ('member', 'coach')
+
+
+class ParticipantActionsMixin:
+    """Mixin for managing the participants of a session beyond the pair"""
+
+    @action(detail=True, methods=['get'])
+    def participants(self, request, pk=None):
+        """List the session's participants with their slots and mask bits"""
+        session = self.get_object()
+        participants = select_users(session.participants.order_by('slot'), 'user')
+        return Response({
+            'participant_mask': session.participant_mask,
+            'participants': SessionParticipantSerializer(participants, many=True).data
+        })
+
+    @action(detail=True, methods=['post'])
+    def add_participant(self, request, pk=None):
+        """
+        Add a user (by 'email') to the session as a 'member' or 'coach'.
+        Only the session creator can add participants.
+        """
+        session = self.get_object()
+
+        if session.creator != request.user:
+            return Response(
+                {'error': 'Only session creator can add participants'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        role = request.data.get('role', 'member')
+        if role not in JOINABLE_ROLES:
+            return Response(
+                {'error': f"role must be one of: {', '.join(JOINABLE_ROLES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        email = request.data.get('email')
+        if not email:
+            return Response(
+                {'error': 'Participant email is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            return Response(
+                {'error': 'User not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if SessionParticipant.objects.filter(session=session, user=user).exists():
+            return Response(
+                {'error': 'User is already part of this session'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            participant = add_session_participant(session, user, role=role)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(SessionParticipantSerializer(participant).data, status=status.HTTP_201_CREATED)
@@ -5,8 +5,9 @@ from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from ..models import UserBiddingSequence
-from ..utils import get_next_position
+from ..services.poll_payloads import next_task_payload, no_task_payload, off_branch_entries, shows_user_sequence
 from ..services.scheduler import next_node
+from ..services.user_sequences import sequence_entries
 
 
 class SchedulerActionsMixin:
@@ -18,7 +19,7 @@ class SchedulerActionsMixin:
         session = self.get_object()
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -28,15 +29,7 @@ class SchedulerActionsMixin:
         node, reason = next_node(request.user.id, session.id)
 
         if not node:
-            return Response({
-                'node_id': None,
-                'deal_index': None,
-                'depth': None,
-                'seat': None,
-                'history': '',
-                'reason': reason,
-                'all_completed': reason == 'ALL_CAUGHT_UP'
-            })
+            return Response(no_task_payload(reason))
 
         # Get user's existing sequence for this deal
         user_sequence = UserBiddingSequence.objects.filter(
@@ -46,45 +39,11 @@ class SchedulerActionsMixin:
 
         # CRITICAL: Build display sequence for frontend
         # requires_user() has already ensured node.seat_to_act is correct for this user
-        if user_sequence and user_sequence.sequence:
-            # Build user's history from their sequence
-            user_history_calls = [call.get('call') for call in user_sequence.sequence]
-            user_history = ' '.join(user_history_calls) if user_history_calls else ''
-
-            # Check if on same branch as user's sequence
-            if user_history.startswith(node.history) or node.history.startswith(user_history):
-                # Same branch - use user's sequence for display
-                display_sequence = user_sequence.sequence
-            else:
-                # Different branch - build display sequence from node's history
-                history_calls = node.history.split() if node.history else []
-                display_sequence = []
-                pos = node.deal.dealer
-                for call in history_calls:
-                    display_sequence.append({
-                        'position': pos,
-                        'call': call,
-                        'type': 'bid' if call[0].isdigit() else 'action',
-                        'call_index': len(display_sequence)
-                    })
-                    pos = get_next_position(pos)
+        if shows_user_sequence(user_sequence, node):
+            # Same branch - use user's sequence for display
+            display_sequence = sequence_entries(user_sequence)
         else:
-            # No sequence yet - empty display
-            display_sequence = []
+            # Different branch (or no sequence yet) - built from node's history
+            display_sequence = off_branch_entries(user_sequence, node)
 
-        return Response({
-            'node_id': node.id,
-            'deal_index': node.deal.deal_number,
-            'depth': node.depth,
-            'seat': node.seat_to_act,  # Use node's seat (verified by requires_user)
-            'history': node.history or '',
-            'reason': reason,
-            'deal': {
-                'id': node.deal.id,
-                'deal_number': node.deal.deal_number,
-                'hands': node.deal.hands,
-                'dealer': node.deal.dealer,
-                'vulnerability': node.deal.vulnerability
-            },
-            'user_sequence': display_sequence
-        })
+        return Response(next_task_payload(node, reason, display_sequence))
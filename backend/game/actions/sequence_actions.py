@@ -1,12 +1,16 @@
 """
 Sequence-related actions for SessionViewSet
 """
+from django.db.models import F, FilteredRelation, Q
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from ..models import Session, Deal, UserBiddingSequence
+from ..pagination import DealCursorPagination
 from ..serializers import DealSerializer
-from ..utils import is_auction_complete
+from ..sharding import select_users
+from ..services.user_sequences import sequence_entries, with_entries
+from ..streaming import JSONArray, JSONObject, StreamingJSONResponse, wants_stream
 
 
 class SequenceActionsMixin:
@@ -14,7 +18,7 @@ class SequenceActionsMixin:
 
     @action(detail=True, methods=['get'])
     def get_user_sequences(self, request, pk=None):
-        """Get all users' bidding sequences for a specific deal"""
+        """Get all users' bidding sequences for a specific deal (?stream=1 to stream them)"""
         session = self.get_object()
         deal_number = request.query_params.get('deal_number')
 
@@ -33,18 +37,36 @@ class SequenceActionsMixin:
             )
 
         # Get all user sequences for this deal
-        sequences = UserBiddingSequence.objects.filter(deal=deal)
+        sequences = select_users(UserBiddingSequence.objects.filter(deal=deal), 'user')
+
+        if wants_stream(request):
+            has_user_sequence = sequences.filter(user=request.user).exists()
+            user_sequences = (
+                {
+                    'user': seq.user.username,
+                    'user_id': seq.user.id,
+                    'sequence': entries,
+                    'notes': seq.notes,
+                    'updated_at': seq.updated_at
+                }
+                for seq, entries in with_entries(sequences.iterator(chunk_size=2000), lambda seq: seq.id)
+            )
+            return StreamingJSONResponse(JSONObject([
+                ('deal', DealSerializer(deal).data),
+                ('user_sequences', JSONArray(user_sequences)),
+                ('has_user_sequence', has_user_sequence),
+            ]), request)
 
         result = {
             'deal': DealSerializer(deal).data,
             'user_sequences': []
         }
 
-        for seq in sequences:
+        for seq in sequences.prefetch_related('calls'):
             result['user_sequences'].append({
                 'user': seq.user.username,
                 'user_id': seq.user.id,
-                'sequence': seq.sequence,
+                'sequence': sequence_entries(seq),
                 'notes': seq.notes,
                 'updated_at': seq.updated_at
             })
@@ -77,7 +99,7 @@ class SequenceActionsMixin:
             )
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -95,40 +117,61 @@ class SequenceActionsMixin:
 
     @action(detail=True, methods=['get'])
     def get_deal_history(self, request, pk=None):
-        """Get all completed deals history for the user"""
+        """Get all completed deals history for the user (?stream=1 to stream it)"""
         session = self.get_object()
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Get all deals with user sequences
-        all_deals = Deal.objects.filter(session=session).order_by('deal_number')
-        history = []
-
-        for deal in all_deals:
-            user_sequence = UserBiddingSequence.objects.filter(
-                deal=deal,
-                user=request.user
-            ).first()
-
-            if user_sequence and user_sequence.sequence:
-                # Check if this deal's auction is complete
-                if is_auction_complete(user_sequence.sequence):
-                    history.append({
-                        'deal_id': deal.id,
-                        'deal_number': deal.deal_number,
-                        'hands': deal.hands,
-                        'dealer': deal.dealer,
-                        'vulnerability': deal.vulnerability,
-                        'sequence': user_sequence.sequence,
-                        'completed_at': user_sequence.updated_at
-                    })
-
-        return Response({
+        # Deals joined to the user's own sequence, completed ones only
+        completed_deals = select_users(Deal.objects.filter(session=session), 'pooled_deal').annotate(
+            own_sequence=FilteredRelation(
+                'user_sequences',
+                condition=Q(user_sequences__user=request.user)
+            )
+        ).filter(
+            own_sequence__is_complete=True
+        ).annotate(
+            sequence_id=F('own_sequence__id'),
+            completed_at=F('own_sequence__updated_at')
+        ).order_by('deal_number')
+
+        def history_entries(deals):
+            # Call rows are read once per chunk of deals
+            for deal, sequence in with_entries(deals, lambda deal: deal.sequence_id):
+                yield {
+                    'deal_id': deal.id,
+                    'deal_number': deal.deal_number,
+                    'hands': deal.board_hands,
+                    'dealer': deal.dealer,
+                    'vulnerability': deal.vulnerability,
+                    'sequence': sequence,
+                    'completed_at': deal.completed_at
+                }
+
+        # Streaming mode: the whole history, read and written incrementally
+        if wants_stream(request) and 'page_size' not in request.query_params:
+            return StreamingJSONResponse(JSONObject([
+                ('history', JSONArray(history_entries(completed_deals.iterator()))),
+                ('total_completed', completed_deals.count()),
+            ]), request)
+
+        # Optional cursor pagination (only when page_size is given)
+        paginator = DealCursorPagination()
+        page = paginator.paginate_queryset(completed_deals, request, view=self)
+        deal_list = page if page is not None else list(completed_deals)
+
+        history = list(history_entries(deal_list))
+
+        data = {
             'history': history,
-            'total_completed': len(history)
-        })
+            'total_completed': len(history) if page is None else completed_deals.count()
+        }
+        if page is not None:
+            data['next'] = paginator.get_next_link()
+            data['previous'] = paginator.get_previous_link()
+        return Response(data)
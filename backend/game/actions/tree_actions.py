@@ -1,15 +1,17 @@
 """
 Auction tree and progress-related actions for SessionViewSet
 """
+import base64
+import binascii
+import json
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import transaction
 from django.utils import timezone
 from ..models import Deal, Node, NodeComment, ResponseAudit
 from ..models import Response as ResponseModel
 from ..models import UserBiddingSequence
-from ..services.auction_tree import build_auction_tree
+from ..services.auction_tree import build_auction_tree, build_tree_delta, build_auction_subtree
 from ..services.scheduler import next_node
 from ..services.rewind_helpers import (
     collect_downstream_nodes,
@@ -18,19 +20,61 @@ from ..services.rewind_helpers import (
     recompute_all_for_nodes,
     cleanup_orphaned_edges
 )
+from ..services.event_log import append_event
+from ..services.pending_work import refresh_pending_counters
+from ..services.poll_payloads import progress_payload, comments_payload
+from ..services.tree_history import parse_as_of, build_auction_tree_as_of
+from ..services.tree_versions import tree_write_attempts, expect_tree_version
+from ..services.tree_stream import stream_auction_tree
+from ..services.tree_codec import build_columnar_tree
+from ..services.user_sequences import truncate_sequence
+from ..renderers import COLUMNAR_FORMATS, tree_renderer_classes
+from ..sharding import select_users
+from ..streaming import StreamingJSONResponse, wants_stream
+
+
+SUBTREE_DEFAULT_DEPTH = 3
+SUBTREE_MAX_DEPTH = 20
+SUBTREE_DEFAULT_LIMIT = 200
+SUBTREE_MAX_LIMIT = 1000
+
+
+def encode_subtree_cursor(cursor):
+    """Opaque string for a (depth, history) keyset cursor"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+
+def decode_subtree_cursor(value):
+    """(depth, history) from an opaque cursor string; raises ValueError if invalid"""
+    try:
+        depth, history = json.loads(base64.urlsafe_b64decode(value.encode()))
+    except (TypeError, json.JSONDecodeError, binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(depth, int) or not isinstance(history, str):
+        raise ValueError('Invalid cursor')
+    return depth, history
 
 
 class TreeActionsMixin:
     """Mixin for auction tree and progress-related actions"""
 
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], renderer_classes=tree_renderer_classes())
     def auction_tree(self, request, pk=None):
-        """Get the auction tree for a specific deal"""
+        """
+        Get the auction tree for a specific deal (optionally ?as_of=<ISO timestamp>).
+        With ?since_version=<tree version> only the nodes changed after that
+        version (and their outgoing edges) are returned; with ?stream=1 the
+        full tree is streamed (gzip/brotli per Accept-Encoding). Full trees
+        are sent in the compact columnar form with ?format=columnar or
+        Accept: application/msgpack.
+        """
         session = self.get_object()
         deal_index = request.query_params.get('deal_index')
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -50,6 +94,67 @@ class TreeActionsMixin:
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Historical mode: rebuild the tree as it was at the given instant
+        as_of_param = request.query_params.get('as_of')
+        if as_of_param:
+            as_of = parse_as_of(as_of_param)
+            if as_of is None:
+                return Response(
+                    {'error': 'Invalid as_of timestamp'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                deal = session.deals.get(deal_number=deal_index)
+            except Deal.DoesNotExist:
+                return Response(
+                    {'error': 'Session or deal not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(build_auction_tree_as_of(session, deal, as_of))
+
+        # Delta mode: only what changed since the client's last version
+        since_param = request.query_params.get('since_version')
+        if since_param is not None:
+            try:
+                since_version = int(since_param)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid since_version'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                deal = session.deals.get(deal_number=deal_index)
+            except Deal.DoesNotExist:
+                return Response(
+                    {'error': 'Session or deal not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            # A client ahead of the server (e.g. after a reset) needs the full tree
+            if since_version <= deal.tree_version:
+                return Response(build_tree_delta(session, deal, since_version))
+
+        # Streaming mode: nodes and edges are read and written incrementally
+        if wants_stream(request):
+            try:
+                deal = session.deals.get(deal_number=deal_index)
+            except Deal.DoesNotExist:
+                return Response(
+                    {'error': 'Session or deal not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return StreamingJSONResponse(stream_auction_tree(session, deal), request)
+
+        # Compact mode: parallel arrays instead of one object per node
+        if request.accepted_renderer.format in COLUMNAR_FORMATS:
+            try:
+                deal = session.deals.get(deal_number=deal_index)
+            except Deal.DoesNotExist:
+                return Response(
+                    {'error': 'Session or deal not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(build_columnar_tree(session, deal))
+
         # Build the tree
         tree = build_auction_tree(session.id, deal_index)
 
@@ -58,6 +163,78 @@ class TreeActionsMixin:
 
         return Response(tree)
 
+    @action(detail=True, methods=['get'])
+    def auction_subtree(self, request, pk=None):
+        """
+        Get one page of the auction tree below a node, for lazy expansion.
+        Query params: deal_index (required), node_id (default: the root),
+        depth (levels below the node, default 3), limit (nodes per page,
+        default 200) and cursor (next_cursor of the previous page).
+        """
+        session = self.get_object()
+
+        # Check if user is part of this session
+        if not session.has_participant(request.user):
+            return Response(
+                {'error': 'You are not part of this session'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            deal_index = int(request.query_params.get('deal_index', ''))
+            depth = int(request.query_params.get('depth', SUBTREE_DEFAULT_DEPTH))
+            limit = int(request.query_params.get('limit', SUBTREE_DEFAULT_LIMIT))
+        except ValueError:
+            return Response(
+                {'error': 'deal_index, depth and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        depth = max(0, min(depth, SUBTREE_MAX_DEPTH))
+        limit = max(1, min(limit, SUBTREE_MAX_LIMIT))
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                cursor = decode_subtree_cursor(cursor)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid cursor'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            cursor = None
+
+        try:
+            deal = session.deals.get(deal_number=deal_index)
+        except Deal.DoesNotExist:
+            return Response(
+                {'error': 'Session or deal not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        node_id = request.query_params.get('node_id')
+        if node_id:
+            try:
+                root = Node.objects.filter(id=int(node_id.split('_', 1)[1]), deal=deal).first()
+            except (ValueError, IndexError):
+                root = None
+        else:
+            root = Node.objects.filter(deal=deal, history='', seat_to_act=deal.dealer).first()
+            if root is None:
+                # The tree has not been started yet; build it once to create the root
+                build_auction_tree(session.id, deal_index)
+                deal.refresh_from_db(fields=['tree_version'])
+                root = Node.objects.filter(deal=deal, history='', seat_to_act=deal.dealer).first()
+        if root is None:
+            return Response(
+                {'error': 'Node not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        subtree = build_auction_subtree(session, deal, root, depth, cursor, limit)
+        subtree['next_cursor'] = encode_subtree_cursor(subtree['next_cursor'])
+        return Response(subtree)
+
     @action(detail=True, methods=['get'])
     def my_progress(self, request, pk=None):
         """Get user's bidding progress for a specific deal"""
@@ -65,7 +242,7 @@ class TreeActionsMixin:
         deal_index = request.query_params.get('deal_index')
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -93,52 +270,7 @@ class TreeActionsMixin:
             is_active=True
         ).select_related('node').order_by('node__history')
 
-        # Build the progress timeline
-        nodes = []
-        current_node_id = None
-
-        # Add root node
-        root_node = {
-            'node_id': f'n_0',
-            'seat': deal.dealer,
-            'history': '',
-            'your_call': None,
-            'created_at': None,
-            'is_terminal': False
-        }
-        nodes.append(root_node)
-
-        # Build nodes from responses
-        for idx, response in enumerate(user_responses):
-            node = response.node
-            node_data = {
-                'node_id': f'n_{idx + 1}',
-                'seat': node.seat_to_act,
-                'history': node.history,
-                'your_call': response.call,
-                'created_at': response.timestamp.isoformat(),
-                'is_terminal': node.is_auction_complete(),
-                'who_needs': node.who_needs  # Add who_needs for coloring
-            }
-            nodes.append(node_data)
-            current_node_id = f'n_{idx + 1}'
-
-        # Default theme colors
-        theme = {
-            'primary': '#2D3A8C',
-            'muted': '#6B7280',
-            'bg': '#0B1023'
-        }
-
-        return Response({
-            'session_id': session.id,
-            'deal_index': deal_index,
-            'dealer': deal.dealer,
-            'vul': deal.vulnerability,
-            'theme': theme,
-            'nodes': nodes,
-            'current_node_id': current_node_id or 'n_0'
-        })
+        return Response(progress_payload(session, deal, user_responses))
 
     @action(detail=True, methods=['post'])
     def rewind(self, request, pk=None):
@@ -156,7 +288,7 @@ class TreeActionsMixin:
         preview = request.query_params.get('preview', '0') == '1'
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -177,24 +309,18 @@ class TreeActionsMixin:
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Parse node_id to get target node
+        # Parse node_id ('n_root' or 'n_<node pk>') to get target node
         try:
-            target_idx = int(node_id.split('_')[1])
-        except (ValueError, IndexError):
+            target_key = node_id.split('_', 1)[1]
+            target_pk = None if target_key == 'root' else int(target_key)
+        except (AttributeError, ValueError, IndexError):
             return Response(
                 {'error': 'Invalid node_id format'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get user's responses in order
-        user_responses = list(ResponseModel.objects.filter(
-            node__deal=deal,
-            user=request.user,
-            is_active=True
-        ).select_related('node').order_by('node__depth', 'timestamp'))
-
         # Identify target node
-        if target_idx == 0:
+        if target_pk is None:
             # Rewind to root
             target_node = Node.objects.filter(
                 deal=deal,
@@ -206,20 +332,17 @@ class TreeActionsMixin:
                     {'error': 'Root node not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-        elif target_idx <= len(user_responses):
-            target_node = user_responses[target_idx - 1].node
         else:
-            return Response(
-                {'error': 'Invalid node_id index'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Collect downstream nodes using prefix-based search
-        downstream_nodes = collect_downstream_nodes(target_node, request.user)
+            target_node = Node.objects.filter(id=target_pk, deal=deal).first()
+            if not target_node:
+                return Response(
+                    {'error': 'Invalid node_id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
         # Preview mode - return what would be affected without committing
         if preview:
-            downstream_count = len(downstream_nodes)
+            downstream_count = len(collect_downstream_nodes(target_node, request.user))
             affected_nodes = collect_affected_nodes(target_node, request.user)
 
             return Response({
@@ -240,85 +363,110 @@ class TreeActionsMixin:
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Execute rewind in atomic transaction
-        with transaction.atomic():
-            # Step 1: Lock target node to prevent concurrent modifications
-            target_node = Node.objects.select_for_update().get(id=target_node.id)
-
-            # Step 2: Collect all downstream responses to invalidate
-            responses_to_rewind = ResponseModel.objects.filter(
-                node__in=downstream_nodes,
-                user=request.user,
-                is_active=True
-            )
-
-            deleted_response_ids = []
-
-            # Step 3: Soft-delete downstream responses with audit trail
-            for response in responses_to_rewind:
-                # Create audit entry
-                ResponseAudit.objects.create(
-                    response=response,
+        # Execute rewind in atomic transaction (one tree version bump)
+        for attempt in tree_write_attempts():
+            with attempt:
+                # Step 1: Commit only if the deal's tree is unchanged since here;
+                # a concurrent write to the deal makes this block run again
+                expect_tree_version(deal.id)
+
+                # Step 2: Read what the rewind depends on after the version
+                # check, so a call committed meanwhile is seen or forces a retry
+                target_node.refresh_from_db()
+                if target_pk is None:
+                    keep_calls = 0
+                else:
+                    # The sequence keeps the calls up to the target, including the
+                    # user's own call there (which the rewind does not clear)
+                    keep_calls = target_node.depth + ResponseModel.objects.filter(
+                        node=target_node, user=request.user, is_active=True
+                    ).exists()
+                # Collect downstream nodes using prefix-based search
+                downstream_nodes = collect_downstream_nodes(target_node, request.user)
+
+                # Step 3: Collect all downstream responses to invalidate
+                responses_to_rewind = ResponseModel.objects.filter(
+                    node__in=downstream_nodes,
                     user=request.user,
-                    node=response.node,
-                    session=session,
-                    deal=deal,
-                    old_call=response.call,
-                    action='REWIND',
-                    metadata={
-                        'rewind_to_node': node_id,
-                        'target_node_history': target_node.history,
-                        'deleted_node_history': response.node.history
-                    }
+                    is_active=True
                 )
 
-                # Soft-delete
-                response.is_active = False
-                response.superseded_at = timezone.now()
-                response.superseded_by_action = 'REWIND'
-                response.save()
-
-                deleted_response_ids.append(response.id)
-
-            # Step 4: Update UserBiddingSequence
-            user_sequence = UserBiddingSequence.objects.filter(
-                deal=deal,
-                user=request.user
-            ).first()
-
-            if user_sequence and user_sequence.sequence:
-                # Truncate to target_idx
-                user_sequence.sequence = user_sequence.sequence[:target_idx]
-                user_sequence.save()
-
-            # Step 5: Recompute depth for entire deal
-            recompute_depth_for_deal(deal)
+                deleted_response_ids = []
+                cleared_nodes = []
+
+                # Step 4: Soft-delete downstream responses with audit trail
+                for response in responses_to_rewind:
+                    # Create audit entry
+                    ResponseAudit.objects.create(
+                        response=response,
+                        user=request.user,
+                        node=response.node,
+                        session=session,
+                        deal=deal,
+                        old_call=response.call,
+                        action='REWIND',
+                        metadata={
+                            'rewind_to_node': node_id,
+                            'answered_at': response.timestamp.isoformat(),
+                            'target_node_history': target_node.history,
+                            'deleted_node_history': response.node.history
+                        }
+                    )
+
+                    # Soft-delete
+                    response.is_active = False
+                    response.superseded_at = timezone.now()
+                    response.superseded_by_action = 'REWIND'
+                    response.save()
+
+                    deleted_response_ids.append(response.id)
+                    cleared_nodes.append([response.node.history, response.node.seat_to_act])
+
+                append_event(
+                    deal, request.user, 'REWIND',
+                    target_node.history, target_node.seat_to_act,
+                    payload={'cleared': cleared_nodes}
+                )
 
-            # Step 6: Collect all affected nodes and recompute properties
-            affected_nodes = collect_affected_nodes(target_node, request.user)
-            recompute_stats = recompute_all_for_nodes(affected_nodes)
-
-            # Step 7: Cleanup orphaned edges
-            edges_deleted = cleanup_orphaned_edges(deal)
-
-            # Step 8: Get next node from scheduler
-            next_node_obj, reason = next_node(request.user.id, session.id)
-
-            if next_node_obj:
-                next_action = {
-                    'node_id': next_node_obj.id,
-                    'seat': next_node_obj.seat_to_act,
-                    'history': next_node_obj.history,
-                    'deal_number': next_node_obj.deal.deal_number,
-                    'scheduler_reason': reason,
-                    'message': f'Rewind complete. Next task: {reason}'
-                }
-            else:
-                next_action = {
-                    'node_id': None,
-                    'scheduler_reason': reason,
-                    'message': 'All caught up! No more tasks at the moment.'
-                }
+                # Step 5: Update UserBiddingSequence
+                user_sequence = UserBiddingSequence.objects.filter(
+                    deal=deal,
+                    user=request.user
+                ).first()
+
+                if user_sequence and user_sequence.call_count:
+                    # Truncate to the target node
+                    truncate_sequence(user_sequence, keep_calls)
+
+                # Step 6: Recompute depth for entire deal
+                recompute_depth_for_deal(deal)
+
+                # Step 7: Collect all affected nodes and recompute properties
+                affected_nodes = collect_affected_nodes(target_node, request.user)
+                recompute_stats = recompute_all_for_nodes(affected_nodes)
+
+                # Step 8: Cleanup orphaned edges
+                edges_deleted = cleanup_orphaned_edges(deal)
+                refresh_pending_counters(session, [deal])
+
+                # Step 9: Get next node from scheduler
+                next_node_obj, reason = next_node(request.user.id, session.id)
+
+                if next_node_obj:
+                    next_action = {
+                        'node_id': next_node_obj.id,
+                        'seat': next_node_obj.seat_to_act,
+                        'history': next_node_obj.history,
+                        'deal_number': next_node_obj.deal.deal_number,
+                        'scheduler_reason': reason,
+                        'message': f'Rewind complete. Next task: {reason}'
+                    }
+                else:
+                    next_action = {
+                        'node_id': None,
+                        'scheduler_reason': reason,
+                        'message': 'All caught up! No more tasks at the moment.'
+                    }
 
         # Return summary
         return Response({
@@ -346,7 +494,7 @@ class TreeActionsMixin:
         session = self.get_object()
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -406,95 +554,106 @@ class TreeActionsMixin:
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Execute undo using rewind logic in atomic transaction
-        with transaction.atomic():
-            # Step 1: Lock parent node
-            parent_node = Node.objects.select_for_update().get(id=parent_node.id)
-
-            # Step 2: Collect downstream nodes (everything after parent)
-            downstream_nodes = collect_downstream_nodes(parent_node, request.user)
-
-            # Step 3: Soft-delete downstream responses with audit trail
-            deleted_response_ids = []
-            responses_to_undo = ResponseModel.objects.filter(
-                node__in=downstream_nodes,
-                user=request.user,
-                is_active=True
-            )
-
-            for response in responses_to_undo:
-                # Create audit entry
-                ResponseAudit.objects.create(
-                    response=response,
+        # Execute undo using rewind logic in atomic transaction (one tree version bump)
+        for attempt in tree_write_attempts():
+            with attempt:
+                # Step 1: Commit only if the deal's tree is unchanged since here;
+                # a concurrent write to the deal makes this block run again
+                expect_tree_version(affected_deal.id)
+
+                # Step 2: Collect downstream nodes (everything after parent)
+                downstream_nodes = collect_downstream_nodes(parent_node, request.user)
+
+                # Step 3: Soft-delete downstream responses with audit trail
+                deleted_response_ids = []
+                cleared_nodes = []
+                responses_to_undo = ResponseModel.objects.filter(
+                    node__in=downstream_nodes,
                     user=request.user,
-                    node=response.node,
-                    session=session,
-                    deal=affected_deal,
-                    old_call=response.call,
-                    action='UNDO',
-                    metadata={
-                        'undo_from_node': response_node.id,
-                        'parent_node': parent_node.id,
-                        'parent_history': parent_node.history
-                    }
+                    is_active=True
                 )
 
-                # Soft-delete
-                response.is_active = False
-                response.superseded_at = timezone.now()
-                response.superseded_by_action = 'UNDO'
-                response.save()
-
-                deleted_response_ids.append(response.id)
-
-            # Step 4: Find target index in user's sequence
-            # Count how many responses the user had before the parent node
-            responses_before_parent = ResponseModel.objects.filter(
-                node__deal=affected_deal,
-                user=request.user,
-                is_active=True,
-                node__depth__lte=parent_node.depth
-            ).count()
-
-            # Step 5: Update UserBiddingSequence
-            user_sequence = UserBiddingSequence.objects.filter(
-                deal=affected_deal,
-                user=request.user
-            ).first()
-
-            if user_sequence and user_sequence.sequence:
-                # Truncate to parent position
-                user_sequence.sequence = user_sequence.sequence[:responses_before_parent]
-                user_sequence.save()
-
-            # Step 6: Recompute depth for affected deal
-            recompute_depth_for_deal(affected_deal)
-
-            # Step 7: Collect affected nodes and recompute properties
-            affected_nodes = collect_affected_nodes(parent_node, request.user)
-            recompute_stats = recompute_all_for_nodes(affected_nodes)
-
-            # Step 8: Cleanup orphaned edges
-            edges_deleted = cleanup_orphaned_edges(affected_deal)
+                for response in responses_to_undo:
+                    # Create audit entry
+                    ResponseAudit.objects.create(
+                        response=response,
+                        user=request.user,
+                        node=response.node,
+                        session=session,
+                        deal=affected_deal,
+                        old_call=response.call,
+                        action='UNDO',
+                        metadata={
+                            'undo_from_node': response_node.id,
+                            'answered_at': response.timestamp.isoformat(),
+                            'parent_node': parent_node.id,
+                            'parent_history': parent_node.history
+                        }
+                    )
+
+                    # Soft-delete
+                    response.is_active = False
+                    response.superseded_at = timezone.now()
+                    response.superseded_by_action = 'UNDO'
+                    response.save()
+
+                    deleted_response_ids.append(response.id)
+                    cleared_nodes.append([response.node.history, response.node.seat_to_act])
+
+                append_event(
+                    affected_deal, request.user, 'UNDO',
+                    parent_node.history, parent_node.seat_to_act,
+                    payload={'cleared': cleared_nodes}
+                )
 
-            # Step 9: Get next node from scheduler
-            next_node_obj, reason = next_node(request.user.id, session.id)
+                # Step 4: Find target index in user's sequence
+                # Count how many responses the user had before the parent node
+                responses_before_parent = ResponseModel.objects.filter(
+                    node__deal=affected_deal,
+                    user=request.user,
+                    is_active=True,
+                    node__depth__lte=parent_node.depth
+                ).count()
 
-            if next_node_obj:
-                next_action = {
-                    'node_id': next_node_obj.id,
-                    'seat': next_node_obj.seat_to_act,
-                    'history': next_node_obj.history,
-                    'deal_number': next_node_obj.deal.deal_number,
-                    'scheduler_reason': reason,
-                    'message': f'Undo complete. Next task: {reason}'
-                }
-            else:
-                next_action = {
-                    'node_id': None,
-                    'scheduler_reason': reason,
-                    'message': 'All caught up! No more tasks at the moment.'
-                }
+                # Step 5: Update UserBiddingSequence
+                user_sequence = UserBiddingSequence.objects.filter(
+                    deal=affected_deal,
+                    user=request.user
+                ).first()
+
+                if user_sequence and user_sequence.call_count:
+                    # Truncate to parent position
+                    truncate_sequence(user_sequence, responses_before_parent)
+
+                # Step 6: Recompute depth for affected deal
+                recompute_depth_for_deal(affected_deal)
+
+                # Step 7: Collect affected nodes and recompute properties
+                affected_nodes = collect_affected_nodes(parent_node, request.user)
+                recompute_stats = recompute_all_for_nodes(affected_nodes)
+
+                # Step 8: Cleanup orphaned edges
+                edges_deleted = cleanup_orphaned_edges(affected_deal)
+                refresh_pending_counters(session, [affected_deal])
+
+                # Step 9: Get next node from scheduler
+                next_node_obj, reason = next_node(request.user.id, session.id)
+
+                if next_node_obj:
+                    next_action = {
+                        'node_id': next_node_obj.id,
+                        'seat': next_node_obj.seat_to_act,
+                        'history': next_node_obj.history,
+                        'deal_number': next_node_obj.deal.deal_number,
+                        'scheduler_reason': reason,
+                        'message': f'Undo complete. Next task: {reason}'
+                    }
+                else:
+                    next_action = {
+                        'node_id': None,
+                        'scheduler_reason': reason,
+                        'message': 'All caught up! No more tasks at the moment.'
+                    }
 
         # Return summary
         return Response({
@@ -525,7 +684,7 @@ class TreeActionsMixin:
         deal_index = request.query_params.get('deal_index')
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
@@ -547,32 +706,12 @@ class TreeActionsMixin:
             )
 
         # Get all comments for this deal
-        comments = NodeComment.objects.filter(
+        comments = select_users(NodeComment.objects.filter(
             deal=deal,
             session=session
-        ).select_related('user', 'node')
-
-        # Format comments by node
-        comments_data = []
-        for comment in comments:
-            comments_data.append({
-                'id': comment.id,
-                'node_id': comment.node.id,
-                'node_history': comment.node.history,
-                'user': {
-                    'id': comment.user.id,
-                    'username': comment.user.username,
-                    'email': comment.user.email
-                },
-                'comment_text': comment.comment_text,
-                'created_at': comment.created_at.isoformat(),
-                'updated_at': comment.updated_at.isoformat()
-            })
+        ).select_related('node'), 'user')
 
-        return Response({
-            'comments': comments_data,
-            'deal_index': deal_index
-        })
+        return Response(comments_payload(deal, comments))
 
     @action(detail=True, methods=['post'])
     def save_node_comment(self, request, pk=None):
@@ -583,7 +722,7 @@ class TreeActionsMixin:
         comment_text = request.data.get('comment_text', '').strip()
 
         # Check if user is part of this session
-        if request.user not in [session.creator, session.partner]:
+        if not session.has_participant(request.user):
             return Response(
                 {'error': 'You are not part of this session'},
                 status=status.HTTP_403_FORBIDDEN
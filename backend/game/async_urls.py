@@ -0,0 +1,13 @@
+"""
+Routes of the async polling endpoints (see game.async_views); included ahead
+of game.urls by backend.asgi_urls
+"""
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('sessions/<int:pk>/auction_tree/', async_views.auction_tree),
+    path('sessions/<int:pk>/my_progress/', async_views.my_progress),
+    path('sessions/<int:pk>/get_next_task/', async_views.get_next_task),
+    path('sessions/<int:pk>/node_comments/', async_views.node_comments),
+]
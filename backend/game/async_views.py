@@ -0,0 +1,226 @@
+"""
+Async versions of the polling endpoints, for ASGI deployments
+
+Clients poll auction_tree, my_progress, get_next_task and node_comments, and
+under WSGI each poll holds a worker thread for as long as its queries take.
+When the app is served through backend/asgi.py (ASYNC_READ_VIEWS, which
+routes through backend/asgi_urls.py) these coroutines answer the same URLs
+instead: queries go through Django's async ORM, so a request waiting on the
+database yields the event loop to the other clients.
+
+They return the same JSON as the SessionViewSet actions, built by the
+payload functions both share (game.services.poll_payloads). The services that
+are synchronous throughout (tree builds and deltas, the scheduler) run via
+sync_to_async, and auction_tree passes the modes it does not implement
+(?as_of, ?stream, ?format and columnar Accept types) to the DRF action.
+Each request runs with its session's shard active (game.sharding), and
+auction_tree reads from replicas like the DRF action (game.replicas).
+"""
+import functools
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .models import Deal, NodeComment, Session, UserBiddingSequence
+from .models import Response as ResponseModel
+from .replicas import aread_from_replicas
+from .services.auction_tree import build_auction_tree, build_tree_delta
+from .services.poll_payloads import (
+    comments_payload, next_task_payload, no_task_payload, off_branch_entries, progress_payload, shows_user_sequence
+)
+from .sharding import ashard_of_session, select_users, use_shard
+from .services.scheduler import next_node
+from .services.user_sequences import call_entry
+
+User = get_user_model()
+
+SYNC_TREE_MODES = ('as_of', 'stream', 'format')
+SYNC_TREE_MEDIA_TYPES = ('columnar', 'msgpack')
+
+
+class _Refused(Exception):
+    """Carries the error response of a failed check"""
+
+    def __init__(self, response: JsonResponse):
+        self.response = response
+
+
+def error(message: str, status: int, key: str = 'error') -> JsonResponse:
+    response = JsonResponse({key: message}, status=status)
+    if status == 401:
+        response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+async def authenticate(request):
+    """
+    The request's user from its JWT bearer token, else from the Django session.
+
+    Raises:
+        _Refused: 401 as DRF answers unauthenticated requests
+    """
+    jwt = JWTAuthentication()
+    header = jwt.get_header(request)
+    if header is not None:
+        raw_token = jwt.get_raw_token(header)
+        if raw_token is not None:
+            try:
+                token = jwt.get_validated_token(raw_token)
+                user_id = token[jwt_settings.USER_ID_CLAIM]
+            except (InvalidToken, TokenError, KeyError):
+                raise _Refused(error('Given token not valid for any token type', 401, 'detail'))
+            user = await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}, is_active=True).afirst()
+            if user is None:
+                raise _Refused(error('User not found', 401, 'detail'))
+            return user
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise _Refused(error('Authentication credentials were not provided.', 401, 'detail'))
+    return user
+
+
+async def participant_session(pk, user) -> Session:
+    """
+    An active session the user takes part in (SessionViewSet.get_object's rules).
+
+    Raises:
+        _Refused: 404 if there is none
+    """
+    session = await Session.objects.filter(pk=pk, participants__user=user, is_active=True).afirst()
+    if session is None:
+        raise _Refused(error('No Session matches the given query.', 404, 'detail'))
+    return session
+
+
+async def session_deal(session: Session, deal_index) -> Deal:
+    """
+    The deal of a session by its deal_index query parameter.
+
+    Raises:
+        _Refused: 400 without a deal_index, 404 for an unknown one
+    """
+    if not deal_index:
+        raise _Refused(error('deal_index is required', 400))
+    try:
+        deal_index = int(deal_index)
+    except ValueError:
+        raise _Refused(error('Invalid deal_index or deal not found', 404))
+    deal = await Deal.objects.filter(session=session, deal_number=deal_index).afirst()
+    if deal is None:
+        raise _Refused(error('Invalid deal_index or deal not found', 404))
+    return deal
+
+
+def session_endpoint(view):
+    """Run a view with the authenticated user and their session, answering refusals"""
+    @functools.wraps(view)
+    async def wrapper(request, pk):
+        if request.method != 'GET':
+            return error(f'Method "{request.method}" not allowed.', 405, 'detail')
+        try:
+            user = await authenticate(request)
+            with use_shard(await ashard_of_session(pk)):
+                session = await participant_session(pk, user)
+                return await view(request, user, session)
+        except _Refused as refused:
+            return refused.response
+    return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def _drf_auction_tree():
+    """The SessionViewSet auction_tree action as the router builds it"""
+    from .views import SessionViewSet
+    return SessionViewSet.as_view(
+        {'get': 'auction_tree'}, basename='session', detail=True, **SessionViewSet.auction_tree.kwargs
+    )
+
+
+def _sync_auction_tree(request, pk):
+    return _drf_auction_tree()(request, pk=pk)
+
+
+@session_endpoint
+async def auction_tree(request, user, session):
+    """Auction tree of a deal: full, or the delta since ?since_version"""
+    accept = request.headers.get('Accept', '')
+    if (any(mode in request.GET for mode in SYNC_TREE_MODES)
+            or any(media_type in accept for media_type in SYNC_TREE_MEDIA_TYPES)):
+        return await sync_to_async(_sync_auction_tree)(request, session.pk)
+
+    await aread_from_replicas(user)
+    deal_index = request.GET.get('deal_index')
+    if not deal_index:
+        return error('deal_index is required', 400)
+    try:
+        deal_index = int(deal_index)
+    except ValueError:
+        return error('Invalid deal_index', 400)
+
+    since_param = request.GET.get('since_version')
+    if since_param is not None:
+        try:
+            since_version = int(since_param)
+        except ValueError:
+            return error('Invalid since_version', 400)
+        deal = await Deal.objects.filter(session=session, deal_number=deal_index).afirst()
+        if deal is None:
+            return error('Session or deal not found', 404)
+        # A client ahead of the server (e.g. after a reset) needs the full tree
+        if since_version <= deal.tree_version:
+            return JsonResponse(await sync_to_async(build_tree_delta)(session, deal, since_version))
+
+    tree = await sync_to_async(build_auction_tree)(session.id, deal_index)
+    if 'error' in tree:
+        return JsonResponse(tree, status=404)
+    return JsonResponse(tree)
+
+
+@session_endpoint
+async def my_progress(request, user, session):
+    """User's bidding progress for a specific deal"""
+    deal = await session_deal(session, request.GET.get('deal_index'))
+
+    user_responses = ResponseModel.objects.filter(
+        node__deal=deal,
+        user=user,
+        is_active=True
+    ).select_related('node').order_by('node__history')
+    return JsonResponse(progress_payload(session, deal, [response async for response in user_responses]))
+
+
+def _next_task_node(user_id: int, session_id: int):
+    """next_node() with the node's deal (and pooled deal) loaded for async use"""
+    node, reason = next_node(user_id, session_id)
+    if node is not None:
+        node.deal = select_users(Deal.objects.all(), 'pooled_deal').get(id=node.deal_id)
+    return node, reason
+
+
+@session_endpoint
+async def get_next_task(request, user, session):
+    """Next task from the scheduler (PLUS4 then RANDOM_DEAL)"""
+    node, reason = await sync_to_async(_next_task_node)(user.id, session.id)
+    if not node:
+        return JsonResponse(no_task_payload(reason))
+
+    user_sequence = await UserBiddingSequence.objects.filter(deal=node.deal, user=user).afirst()
+    if shows_user_sequence(user_sequence, node):
+        # Same branch - use user's sequence for display
+        display_sequence = [call_entry(row) async for row in user_sequence.calls.all()]
+    else:
+        # Different branch (or no sequence yet) - built from node's history
+        display_sequence = off_branch_entries(user_sequence, node)
+    return JsonResponse(next_task_payload(node, reason, display_sequence))
+
+
+@session_endpoint
+async def node_comments(request, user, session):
+    """All comments on a deal's nodes"""
+    deal = await session_deal(session, request.GET.get('deal_index'))
+
+    comments = select_users(NodeComment.objects.filter(deal=deal, session=session).select_related('node'), 'user')
+    return JsonResponse(comments_payload(deal, [comment async for comment in comments]))
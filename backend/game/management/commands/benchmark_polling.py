@@ -0,0 +1,212 @@
+"""
+Management command measuring how many polling clients one process can serve
+Usage: python manage.py benchmark_polling [--clients 10,50,200] [--interval 1] [--seconds 10] [--threads 8] [--nodes 500]
+
+Creates a throwaway session whose deal has a synthetic tree (built as in
+benchmark_tree_payload), then simulates clients that each poll the tree
+delta, progress, comments and next-task endpoints in turn, once per
+--interval seconds, through
+
+- wsgi: Django's WSGI handler on a pool of --threads threads, as a threaded
+  WSGI server runs it, answered by the DRF actions
+- asgi: Django's ASGI handler on a single event loop, answered by
+  game.async_views (backend.asgi_urls)
+
+For each client count it reports the polls served per second against the
+rate the clients ask for, with median and 95th percentile latency. A process
+keeps up while the served rate matches the demand and p95 stays well below
+the interval. The session and its users are deleted at the end.
+"""
+import asyncio
+import random
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from game.management.commands.benchmark_tree_payload import Command as TreePayloadBenchmark
+
+URLCONFS = {'wsgi': 'backend.urls', 'asgi': 'backend.asgi_urls'}
+
+
+def request_host() -> str:
+    """A host name the ALLOWED_HOSTS check accepts"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def wsgi_get(app, host: str, url: str, authorization: str) -> int:
+    """GET a URL through a WSGI application; returns the status code"""
+    parts = urlsplit(url)
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update({
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'HTTP_HOST': host,
+        'SERVER_NAME': host,
+        'HTTP_AUTHORIZATION': authorization,
+    })
+    statuses = []
+    body = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(app, host: str, url: str, authorization: str) -> int:
+    """GET a URL through an ASGI application; returns the status code"""
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', host.encode()), (b'authorization', authorization.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (host, 80),
+    }
+    body_sent = False
+    status = 0
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected until the response is complete
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = 'Compares how many polling clients the WSGI and ASGI deployments serve'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', default='10,50,200', help='Comma-separated client counts')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls of a client')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--nodes', type=int, default=500, help='Nodes in the synthetic tree')
+        parser.add_argument(
+            '--mode',
+            choices=['both', 'wsgi', 'asgi'],
+            default='both',
+            help='Deployment(s) to measure',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            client_counts = [int(count) for count in options['clients'].split(',') if count]
+        except ValueError:
+            raise CommandError('--clients must be comma-separated integers')
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+
+        session, deal = TreePayloadBenchmark().create_tree(options['nodes'])
+        try:
+            base = f'/api/game/sessions/{session.id}'
+            urls = [
+                f'{base}/auction_tree/?deal_index={deal.deal_number}&since_version={deal.tree_version}',
+                f'{base}/my_progress/?deal_index={deal.deal_number}',
+                f'{base}/node_comments/?deal_index={deal.deal_number}',
+                f'{base}/get_next_task/',
+            ]
+            authorization = f'Bearer {AccessToken.for_user(session.creator)}'
+            self.stdout.write(
+                f"{options['nodes']} node tree, polls every {options['interval']:g} s, "
+                f"{options['seconds']:g} s per run, {options['threads']} WSGI threads"
+            )
+            self.stdout.write(
+                f"{'mode':<6}{'clients':>8}{'demand/s':>10}{'served/s':>10}"
+                f"{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+            )
+            for mode in modes:
+                for clients in client_counts:
+                    with override_settings(ROOT_URLCONF=URLCONFS[mode]):
+                        latencies, failures = asyncio.run(
+                            self.run_clients(mode, clients, urls, authorization, options)
+                        )
+                    self.report(mode, clients, latencies, failures, options)
+        finally:
+            creator, partner = session.creator, session.partner
+            session.delete()
+            creator.delete()
+            partner.delete()
+
+    async def run_clients(self, mode, clients, urls, authorization, options):
+        """Poll with `clients` clients for --seconds; returns (latencies, failed statuses)"""
+        host = request_host()
+        interval = options['interval']
+        loop = asyncio.get_running_loop()
+        latencies, failures = [], []
+
+        if mode == 'asgi':
+            app = get_asgi_application()
+            pool = None
+
+            async def get(url):
+                return await asgi_get(app, host, url, authorization)
+        else:
+            app = get_wsgi_application()
+            pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+            async def get(url):
+                return await loop.run_in_executor(pool, wsgi_get, app, host, url, authorization)
+
+        deadline = loop.time() + options['seconds']
+
+        async def client():
+            index = random.randrange(len(urls))
+            # Independent clients start at random points of an interval
+            await asyncio.sleep(random.uniform(0, interval))
+            while loop.time() < deadline:
+                started = loop.time()
+                status = await get(urls[index % len(urls)])
+                latencies.append(loop.time() - started)
+                if status != 200:
+                    failures.append(status)
+                index += 1
+                await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+
+        try:
+            await asyncio.gather(*(client() for _ in range(clients)))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return latencies, failures
+
+    def report(self, mode, clients, latencies, failures, options):
+        demand = clients / options['interval']
+        served = len(latencies) / options['seconds']
+        if len(latencies) >= 2:
+            p50 = statistics.median(latencies) * 1000
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+        else:
+            p50 = p95 = latencies[0] * 1000 if latencies else 0.0
+        self.stdout.write(
+            f'{mode:<6}{clients:>8}{demand:>10.1f}{served:>10.1f}'
+            f'{p50:>9.1f}{p95:>9.1f}{len(failures):>8}'
+        )
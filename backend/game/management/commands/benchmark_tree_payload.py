@@ -0,0 +1,158 @@
+"""
+Management command to benchmark auction tree payloads on a synthetic tree
+Usage: python manage.py benchmark_tree_payload [--nodes 10000] [--live]
+
+Builds a throwaway session whose single deal has a tree of --nodes nodes
+(the partners diverge at every node, so the tree is a binary tree), then
+measures the buffered payload (the whole tree as one dict rendered by DRF's
+JSONRenderer) against the streamed one (stream_auction_tree +
+StreamingJSONResponse, uncompressed and with each available encoding) and
+the columnar form (build_columnar_tree as JSON, and MessagePack when
+installed). Reports wall time, peak traced memory and bytes produced. --live also times
+build_auction_tree, which issues several queries per node and takes minutes
+on large trees. Everything is rolled back at the end.
+"""
+import time
+import tracemalloc
+from contextlib import ExitStack
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from game.models import Session, Deal, Node, Response
+from game.sharding import shard_aliases, use_shard
+from game.services.auction_tree import build_auction_tree, get_next_seat
+from game.services.tree_stream import stream_auction_tree
+from game.services.tree_codec import build_columnar_tree
+from game.renderers import ColumnarJSONRenderer, MessagePackRenderer, msgpack
+from game.streaming import JSONArray, JSONObject, StreamingJSONResponse, available_encodings, orjson
+
+User = get_user_model()
+
+BIDS = [f'{level}{strain}' for level in range(1, 8) for strain in ('C', 'D', 'H', 'S', 'NT')]
+
+
+class Rollback(Exception):
+    """Raised to roll the synthetic data back"""
+
+
+class FakeRequest:
+    """Just enough of a request for content negotiation"""
+
+    def __init__(self, encoding):
+        self.META = {'HTTP_ACCEPT_ENCODING': encoding or 'identity'}
+
+
+class Command(BaseCommand):
+    help = 'Measures buffered vs streamed auction tree payloads on a synthetic tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=10000, help='Number of tree nodes')
+        parser.add_argument(
+            '--live',
+            action='store_true',
+            help='Also time build_auction_tree (slow on large trees)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with ExitStack() as stack:
+                for alias in shard_aliases():
+                    stack.enter_context(transaction.atomic(using=alias))
+                session, deal = self.create_tree(options['nodes'])
+                stack.enter_context(use_shard(session._state.db))
+                self.stdout.write(
+                    f"Synthetic tree: {Node.objects.filter(deal=deal).count()} nodes, "
+                    f"{Response.objects.filter(node__deal=deal).count()} responses "
+                    f"(encoder: {'orjson' if orjson else 'json'})"
+                )
+
+                self.report('buffered', lambda: self.buffered(session, deal))
+                if options['live']:
+                    self.report('live buffered', lambda: self.live(session, deal))
+                for encoding in [None] + available_encodings():
+                    self.report(f"stream {encoding or 'identity'}",
+                                lambda encoding=encoding: self.streamed(session, deal, encoding))
+                self.report('columnar json', lambda: self.columnar(session, deal, ColumnarJSONRenderer))
+                if msgpack is not None:
+                    self.report('columnar msgpack', lambda: self.columnar(session, deal, MessagePackRenderer))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_tree(self, size):
+        """Create users, a session, a deal and a binary tree of `size` nodes"""
+        suffix = time.time_ns()
+        creator = User.objects.create(username=f'bench_a_{suffix}', email=f'a{suffix}@bench.invalid')
+        partner = User.objects.create(username=f'bench_b_{suffix}', email=f'b{suffix}@bench.invalid')
+        session = Session.objects.create(name='Tree payload benchmark', creator=creator, partner=partner)
+        # The session's rows go to the shard it was placed on
+        with use_shard(session._state.db):
+            deal = Deal.objects.create(session=session, deal_number=1, dealer='N', vulnerability='None')
+
+            # Breadth-first: every answered node gets the creator's cheapest
+            # raise and the partner's next one, until `size` nodes exist
+            states = [('', 'N', -1)]
+            answers = []
+            cursor = 0
+            while len(states) < size and cursor < len(states):
+                history, seat, last_bid = states[cursor]
+                cursor += 1
+                calls = [index for index in (last_bid + 1, last_bid + 2) if index < len(BIDS)]
+                answers.append((cursor - 1, [BIDS[index] for index in calls]))
+                for index in calls[:size - len(states)]:
+                    states.append(((history + ' ' + BIDS[index]).strip(), get_next_seat(seat), index))
+
+            nodes = Node.objects.bulk_create([
+                Node(
+                    session=session, deal=deal, history=history, seat_to_act=seat,
+                    depth=len(history.split()), status='open',
+                    divergence=False, who_needs='both'
+                )
+                for history, seat, _ in states
+            ], batch_size=1000)
+            if any(node.pk is None for node in nodes):
+                nodes = list(Node.objects.filter(deal=deal).order_by('id'))
+
+            responses = []
+            for position, calls in answers:
+                if len(calls) < 2 or position >= len(nodes):
+                    continue
+                responses.append(Response(node=nodes[position], user=creator, call=calls[0]))
+                responses.append(Response(node=nodes[position], user=partner, call=calls[1]))
+            Response.objects.bulk_create(responses, batch_size=1000)
+            return session, deal
+
+    def buffered(self, session, deal):
+        tree = {
+            key: dict(value.items) if isinstance(value, JSONObject)
+            else list(value.items) if isinstance(value, JSONArray) else value
+            for key, value in stream_auction_tree(session, deal).items
+        }
+        return len(JSONRenderer().render(tree))
+
+    def live(self, session, deal):
+        tree = build_auction_tree(session.id, deal.deal_number)
+        return len(JSONRenderer().render(tree))
+
+    def streamed(self, session, deal, encoding):
+        response = StreamingJSONResponse(stream_auction_tree(session, deal), FakeRequest(encoding))
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    def columnar(self, session, deal, renderer_class):
+        return len(renderer_class().render(build_columnar_tree(session, deal)))
+
+    def report(self, label, run):
+        """Run once for time and once under tracemalloc for peak memory"""
+        started = time.perf_counter()
+        size = run()
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(
+            f'{label:<16} {elapsed * 1000:>10.1f} ms  {peak / 1024 / 1024:>8.2f} MiB peak  {size:>10} bytes'
+        )
@@ -0,0 +1,57 @@
+"""
+Management command to check auction trees against their event logs
+Usage: python manage.py check_tree_events [--session ID] [--seed] [--snapshot]
+"""
+from django.core.management.base import BaseCommand
+from game.models import Deal
+from game.sharding import for_each_shard
+from game.services.event_log import seed_snapshot, take_snapshot, verify_deal_state
+
+
+class Command(BaseCommand):
+    help = 'Replays each deal\'s tree event log and reports differences from the live tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session',
+            type=int,
+            help='Only check deals in this session',
+        )
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help='Snapshot the live tree of every deal first (for deals that pre-date the event log)',
+        )
+        parser.add_argument(
+            '--snapshot',
+            action='store_true',
+            help='Write a fresh snapshot at the end of every consistent log',
+        )
+
+    def handle(self, *args, **options):
+        inconsistent = 0
+        for _ in for_each_shard():
+            deals = Deal.objects.select_related('session').order_by('session_id', 'deal_number')
+            if options['session']:
+                deals = deals.filter(session_id=options['session'])
+
+            for deal in deals:
+                if options['seed']:
+                    seed_snapshot(deal)
+
+                mismatches = verify_deal_state(deal)
+                if mismatches:
+                    inconsistent += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'Session {deal.session_id} deal {deal.deal_number}: {len(mismatches)} mismatches'
+                    ))
+                    for mismatch in mismatches[:10]:
+                        self.stdout.write(f"  {mismatch['node']} {mismatch['field']}: "
+                                          f"log={mismatch['log']} db={mismatch['db']}")
+                elif options['snapshot']:
+                    take_snapshot(deal)
+
+        if inconsistent:
+            self.stdout.write(self.style.WARNING(f'{inconsistent} deal(s) differ from their event log'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All event logs match the live trees'))
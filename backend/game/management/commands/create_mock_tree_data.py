@@ -5,8 +5,9 @@ Usage: python manage.py create_mock_tree_data
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from game.models import Session, Deal, Node, Response, PlayerGame, UserBiddingSequence
+from game.sharding import activate_shard
 from game.services.auction_tree import get_or_create_node, record_user_response
-from django.utils import timezone
+from game.services.user_sequences import append_calls
 import json
 
 User = get_user_model()
@@ -54,6 +55,8 @@ class Command(BaseCommand):
             vulnerability='None',
             max_deals=4
         )
+        # The session's rows go to the shard it was placed on
+        activate_shard(session._state.db)
 
         # Create PlayerGame entries
         PlayerGame.objects.create(
@@ -87,28 +90,18 @@ class Command(BaseCommand):
         alice_sequence = UserBiddingSequence.objects.create(
             deal=deal,
             user=user1,
-            position='N',
-            sequence=[]
+            position='N'
         )
 
         bob_sequence = UserBiddingSequence.objects.create(
             deal=deal,
             user=user2,
-            position='S',
-            sequence=[]
+            position='S'
         )
 
         # Helper function to add a bid to user's sequence
         def add_to_sequence(user_seq, position, call, alert=''):
-            user_seq.sequence.append({
-                'position': position,
-                'call': call,
-                'alert': alert,
-                'type': 'bid' if call[0].isdigit() else 'action',
-                'timestamp': timezone.now().isoformat(),
-                'call_index': len(user_seq.sequence)
-            })
-            user_seq.save()
+            append_calls(user_seq, [(position, call, alert)])
 
         # Create a complex auction tree with divergences
         # Scenario: Partners disagree at certain points
@@ -0,0 +1,44 @@
+"""
+Management command to export a session's deals as PBN or LIN
+Usage: python manage.py export_deals <session_id> [--output PATH] [--format pbn|lin] [--user EMAIL]
+"""
+import sys
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from game.models import Session
+from game.sharding import select_users, shard_of_session, use_shard
+from game.services.deal_formats import WRITERS, iter_deal_records
+
+
+class Command(BaseCommand):
+    help = 'Streams a session\'s deals (and one user\'s auctions) to a PBN or LIN file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_id', type=int, help='Session id')
+        parser.add_argument('--output', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=sorted(WRITERS), default='pbn', help='File format (default: pbn)')
+        parser.add_argument(
+            '--user',
+            help='Email of the user whose auctions are exported (default: the session creator)',
+        )
+
+    def handle(self, *args, **options):
+        with use_shard(shard_of_session(options['session_id'])):
+            try:
+                session = select_users(Session.objects.all(), 'creator').get(id=options['session_id'])
+            except Session.DoesNotExist:
+                raise CommandError(f"Session {options['session_id']} not found")
+
+            user = session.creator
+            if options['user']:
+                try:
+                    user = get_user_model().objects.get(email=options['user'])
+                except get_user_model().DoesNotExist:
+                    raise CommandError(f"User {options['user']} not found")
+
+            chunks = WRITERS[options['format']](iter_deal_records(session, user))
+            if options['output']:
+                with open(options['output'], 'w', encoding='utf-8') as handle:
+                    handle.writelines(chunks)
+            else:
+                sys.stdout.writelines(chunks)
@@ -0,0 +1,59 @@
+"""
+Management command to import PBN or LIN boards into a session
+Usage: python manage.py import_deals <session_id> <path> [--format pbn|lin] [--no-auctions] [--batch-size N]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from game.models import Session
+from game.sharding import shard_of_session, use_shard
+from game.services.deal_formats import READERS, DEFAULT_BATCH_SIZE, read_records, import_deal_records
+
+
+class Command(BaseCommand):
+    help = 'Streams the boards of a PBN or LIN file into a session as new deals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_id', type=int, help='Target session id')
+        parser.add_argument('path', help='PBN or LIN file')
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='File format (default: detected from the first line)',
+        )
+        parser.add_argument(
+            '--no-auctions',
+            action='store_true',
+            help='Import the deals only, not their auctions',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Deals per bulk insert (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        with use_shard(shard_of_session(options['session_id'])):
+            try:
+                session = Session.objects.get(id=options['session_id'])
+            except Session.DoesNotExist:
+                raise CommandError(f"Session {options['session_id']} not found")
+
+            with open(options['path'], encoding='utf-8', errors='replace') as handle:
+                summary = import_deal_records(
+                    session,
+                    read_records(handle, options['format']),
+                    with_auctions=not options['no_auctions'],
+                    batch_size=options['batch_size']
+                )
+
+        for error in summary['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"Line {error['line']} (board {error['board']}): {error['error']}"
+            ))
+        if summary['deals']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Imported {summary['deals']} deals ({summary['auctions']} with auctions) "
+                f"as deals {summary['first_deal_number']}-{summary['last_deal_number']}"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING('No valid boards found'))
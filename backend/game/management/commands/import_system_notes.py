@@ -0,0 +1,50 @@
+"""
+Management command to import partnership system notes into a session's trees
+Usage: python manage.py import_system_notes <session_id> <path> [--deal N]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from game.models import Session
+from game.sharding import select_users, shard_of_session, use_shard
+from game.services.system_import import import_system_notes
+
+
+class Command(BaseCommand):
+    help = 'Imports agreed bidding sequences (text, CSV or PBN-style) as tree branches for both partners'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_id', type=int, help='Target session id')
+        parser.add_argument('path', help='File with one sequence per line, e.g. "1NT-2C-2D"')
+        parser.add_argument(
+            '--deal',
+            type=int,
+            help='Only populate this deal number (default: every deal in the session)',
+        )
+
+    def handle(self, *args, **options):
+        with use_shard(shard_of_session(options['session_id'])):
+            try:
+                session = select_users(Session.objects.all(), 'creator', 'partner').get(id=options['session_id'])
+            except Session.DoesNotExist:
+                raise CommandError(f"Session {options['session_id']} not found")
+
+            deals = None
+            if options['deal']:
+                deals = list(session.deals.filter(deal_number=options['deal']))
+                if not deals:
+                    raise CommandError(f"Deal {options['deal']} not found in session {session.id}")
+
+            with open(options['path'], encoding='utf-8', errors='replace') as handle:
+                summary = import_system_notes(session, handle, deals)
+
+        for error in summary['errors']:
+            self.stdout.write(self.style.WARNING(f"Line {error['line']}: {error['error']}"))
+        for conflict in summary['conflicts']:
+            self.stdout.write(self.style.WARNING(
+                f"After '{conflict['history']}': {conflict['call']} skipped, {conflict['chosen']} was listed first"
+            ))
+        for deal in summary['deals']:
+            self.stdout.write(
+                f"Deal {deal['deal_number']}: {deal['nodes']} nodes, "
+                f"{deal['edges']} edges, {deal['responses']} responses"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Imported {summary['sequences']} sequences"))
@@ -0,0 +1,192 @@
+"""
+Management command to move sessions between shards
+Usage: python manage.py rebalance_shards [--session ID --to ALIAS] [--dry-run]
+
+Without --session it moves every session whose shard is not the one its id
+assigns it (SESSION_SHARDS[id % count]), which after SESSION_SHARD_COUNT
+grew spreads the existing sessions over the new shards.
+
+A session is closed (is_active=False) while it moves. Its rows are copied
+to the target shard parent first, the directory entry is pointed at the
+target, and only then is the session deleted from its old shard. Path
+statistics and field counts are moved along. The session keeps its id, but
+the rows hanging off it get new ids on the target shard, so clients have to
+reload a moved session's deals and trees.
+"""
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from game.models import (
+    Session, SessionParticipant, Deal, PlayerGame, PlayerGameBid, DealCall,
+    UserBiddingSequence, UserBiddingCall, BidComment, ForkDeal, Node, Response,
+    ResponseAudit, NodeComment, Edge, TreeEvent, TreeSnapshot, PendingWorkCounter,
+    TreeRecomputeJob, AuctionPath, SessionShard
+)
+from game.sharding import home_shard, is_sharded, move_session_entry, shard_aliases, shard_atomic, use_shard
+from game.services.auction_paths import count_session_paths, forget_session_paths, intern_paths
+from game.services.deal_pools import recount_field_states
+
+BATCH_SIZE = 500
+
+# Models copied with a session and the lookup of its id, parents first
+COPY_ORDER = [
+    (Session, 'id'),
+    (SessionParticipant, 'session_id'),
+    (Deal, 'session_id'),
+    (PlayerGame, 'session_id'),
+    (PlayerGameBid, 'player_game__session_id'),
+    (DealCall, 'deal__session_id'),
+    (UserBiddingSequence, 'deal__session_id'),
+    (UserBiddingCall, 'sequence__deal__session_id'),
+    (BidComment, 'deal__session_id'),
+    (ForkDeal, 'original_deal__session_id'),
+    (Node, 'session_id'),
+    (Response, 'node__session_id'),
+    (ResponseAudit, 'session_id'),
+    (NodeComment, 'session_id'),
+    (Edge, 'session_id'),
+    (TreeEvent, 'session_id'),
+    (TreeSnapshot, 'deal__session_id'),
+    (PendingWorkCounter, 'session_id'),
+    (TreeRecomputeJob, 'deal__session_id'),
+]
+
+
+def copy_session(session_id: int, source: str, target: str) -> int:
+    """
+    Copy a session's rows from one shard to another.
+
+    Foreign keys between the copied rows are remapped to the new ids and
+    nodes are linked to the target shard's auction paths. Timestamps keep
+    their values (bulk_create would stamp auto_now fields with the time of
+    the copy).
+
+    Returns:
+        Number of rows copied
+    """
+    id_maps = defaultdict(dict)  # {model: {source id: target id}}
+    paths = dict(
+        AuctionPath.objects.using(source).filter(nodes__session_id=session_id).distinct().values_list('id', 'history')
+    )
+    with use_shard(target):
+        target_paths = intern_paths(paths.values())
+    id_maps[AuctionPath] = {path_id: target_paths[history] for path_id, history in paths.items()}
+
+    copied = 0
+    for model, lookup in COPY_ORDER:
+        rows = list(model.objects.using(source).filter(**{lookup: session_id}).order_by('pk'))
+        if not rows:
+            continue
+        fields = model._meta.concrete_fields
+        copies = []
+        for row in rows:
+            copy = model()
+            for field in fields:
+                if field.primary_key and model is not Session:
+                    continue
+                value = getattr(row, field.attname)
+                if field.is_relation and value is not None and is_sharded(field.related_model):
+                    value = id_maps[field.related_model][value]
+                setattr(copy, field.attname, value)
+            copies.append(copy)
+        model.objects.using(target).bulk_create(copies, batch_size=BATCH_SIZE)
+
+        stamped = [field for field in fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+        if stamped:
+            for row, copy in zip(rows, copies):
+                for field in stamped:
+                    setattr(copy, field.attname, getattr(row, field.attname))
+            model.objects.using(target).bulk_update(copies, [field.name for field in stamped], batch_size=BATCH_SIZE)
+        id_maps[model] = {row.pk: copy.pk for row, copy in zip(rows, copies)}
+        copied += len(copies)
+    return copied
+
+
+def move_session(session_id: int, target: str) -> int:
+    """
+    Move a session to another shard.
+
+    Returns:
+        Number of rows moved
+    """
+    source = SessionShard.objects.get(id=session_id).database
+    session = Session.objects.using(source).filter(id=session_id).first()
+    if session is None:
+        # Deleted sessions leave their directory entry behind
+        move_session_entry(session_id, target)
+        return 0
+
+    was_active = session.is_active
+    Session.objects.using(source).filter(id=session_id).update(is_active=False)
+    try:
+        field_states = defaultdict(set)
+        for pooled_deal_id, history, seat in Node.objects.using(source).filter(
+            session_id=session_id, deal__pooled_deal__isnull=False
+        ).values_list('deal__pooled_deal_id', 'history', 'seat_to_act'):
+            field_states[pooled_deal_id].add((history, seat))
+
+        with use_shard(target), shard_atomic():
+            copied = copy_session(session_id, source, target)
+            Session.objects.using(target).filter(id=session_id).update(is_active=was_active)
+            count_session_paths(Session.objects.using(target).get(id=session_id))
+    except Exception:
+        Session.objects.using(source).filter(id=session_id).update(is_active=was_active)
+        raise
+
+    move_session_entry(session_id, target)
+    with use_shard(source), shard_atomic():
+        forget_session_paths(session)
+        session.delete()
+
+    for alias in (source, target):
+        with use_shard(alias), shard_atomic():
+            for pooled_deal_id, states in field_states.items():
+                recount_field_states(pooled_deal_id, states)
+    return copied
+
+
+class Command(BaseCommand):
+    help = 'Moves sessions to the shard their id assigns them, or one session to a given shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, help='Move only this session (requires --to)')
+        parser.add_argument('--to', help='Target shard alias for --session')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the moves without making them',
+        )
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if (options['session'] is None) != (options['to'] is None):
+            raise CommandError('--session and --to go together')
+
+        if options['session'] is not None:
+            if options['to'] not in aliases:
+                raise CommandError(f"Unknown shard {options['to']!r} (shards: {', '.join(aliases)})")
+            entry = SessionShard.objects.filter(id=options['session']).first()
+            if entry is None:
+                raise CommandError(f"Session {options['session']} not found")
+            moves = [] if entry.database == options['to'] else [(entry, options['to'])]
+        else:
+            moves = [
+                (entry, home_shard(entry.id))
+                for entry in SessionShard.objects.order_by('id')
+                if entry.database != home_shard(entry.id)
+            ]
+
+        moved = rows = 0
+        for entry, target in moves:
+            if entry.database not in aliases:
+                self.stderr.write(f'Session {entry.id}: shard {entry.database} is not configured, skipped')
+                continue
+            self.stdout.write(f'Session {entry.id}: {entry.database} -> {target}')
+            if options['dry_run']:
+                continue
+            rows += move_session(entry.id, target)
+            moved += 1
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(moves)} sessions to move'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Moved {moved} sessions ({rows} rows)'))
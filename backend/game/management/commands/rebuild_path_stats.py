@@ -0,0 +1,43 @@
+"""
+Management command to rebuild the interned auction paths' statistics
+Usage: python manage.py rebuild_path_stats [--batch-size 2000]
+
+Links every node to its AuctionPath (nodes created before paths existed
+have none) and recounts all PathStats from the partners' active responses,
+shard by shard.
+"""
+from django.core.management.base import BaseCommand
+from game.models import Node, PathStats
+from game.sharding import for_each_shard, shard_atomic
+from game.services.auction_paths import refresh_path_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every PathStats row and links nodes to their auction paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Nodes per transaction',
+        )
+
+    def handle(self, *args, **options):
+        nodes = stats = 0
+        for _ in for_each_shard():
+            with shard_atomic():
+                PathStats.objects.all().delete()
+                Node.objects.update(path_outcome=None)
+
+            node_ids = list(Node.objects.order_by('id').values_list('id', flat=True))
+            batch_size = options['batch_size']
+            for start in range(0, len(node_ids), batch_size):
+                with shard_atomic():
+                    refresh_path_stats(node_ids[start:start + batch_size])
+            nodes += len(node_ids)
+            stats += PathStats.objects.count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {nodes} nodes into {stats} path statistics'
+        ))
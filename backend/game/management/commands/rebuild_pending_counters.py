@@ -0,0 +1,32 @@
+"""
+Management command to rebuild the materialized pending-work counters
+Usage: python manage.py rebuild_pending_counters [--session ID]
+"""
+from django.core.management.base import BaseCommand
+from game.models import Session
+from game.sharding import for_each_shard, shard_atomic
+from game.services.pending_work import refresh_pending_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every PendingWorkCounter from the auction trees'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session',
+            type=int,
+            help='Only rebuild counters for this session',
+        )
+
+    def handle(self, *args, **options):
+        written = 0
+        for _ in for_each_shard():
+            sessions = Session.objects.order_by('id')
+            if options['session']:
+                sessions = sessions.filter(id=options['session'])
+
+            for session in sessions.iterator():
+                with shard_atomic():
+                    written += refresh_pending_counters(session)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} counters'))
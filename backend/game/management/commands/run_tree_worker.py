@@ -0,0 +1,48 @@
+"""
+Management command draining the derived tree state queue (TREE_WORKER_MODE='queue')
+Usage: python manage.py run_tree_worker [--once] [--batch-size N] [--poll SECONDS]
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from game.services.tree_worker import drain_queue
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the derived tree state of deals marked dirty by calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for more jobs',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Jobs claimed per query (default 50)',
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between checks of an empty queue (default 1)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                done = drain_queue(batch_size=options['batch_size'])
+                total += done
+                if done:
+                    self.stdout.write(f'Recomputed {done} deals')
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {total} deals in all'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_node_depth_node_who_needs_edge'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(help_text="Position of this event in the deal's log")),
+                ('kind', models.CharField(choices=[('CALL', 'Call'), ('REWIND', 'Rewind'), ('UNDO', 'Undo')], max_length=10)),
+                ('history', models.TextField(blank=True, help_text='History of the node the event applies to')),
+                ('seat_to_act', models.CharField(choices=[('N', 'North'), ('S', 'South'), ('E', 'East'), ('W', 'West')], max_length=1)),
+                ('call', models.CharField(blank=True, help_text='Call made (CALL events only)', max_length=10)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Extra data, e.g. nodes cleared by a rewind')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('deal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_events', to='game.deal')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_events', to='game.session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['deal', 'sequence'],
+                'indexes': [models.Index(fields=['deal', 'created_at'], name='game_treeev_deal_id_b253d7_idx')],
+                'unique_together': {('deal', 'sequence')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TreeSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(help_text='Sequence of the last event folded into this snapshot')),
+                ('state', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('deal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tree_snapshots', to='game.deal')),
+            ],
+            options={
+                'ordering': ['-sequence'],
+                'unique_together': {('deal', 'sequence')},
+            },
+        ),
+    ]
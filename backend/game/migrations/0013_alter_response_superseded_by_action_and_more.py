@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_treeevent_treesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='response',
+            name='superseded_by_action',
+            field=models.CharField(blank=True, choices=[('REWIND', 'Rewind'), ('UNDO', 'Undo'), ('ADMIN', 'Admin Action'), ('MERGE', 'Merge')], help_text='Why this response was superseded', max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='responseaudit',
+            name='action',
+            field=models.CharField(choices=[('REWIND', 'Rewind'), ('UNDO', 'Undo'), ('REPLACE', 'Replace'), ('ADMIN', 'Admin Action'), ('MERGE', 'Merge')], help_text='Type of action performed', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['timestamp'], name='game_respon_timesta_9b4c71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['superseded_at'], name='game_respon_superse_c557ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='responseaudit',
+            index=models.Index(fields=['deal', 'action_timestamp'], name='game_respon_deal_id_572ea7_idx'),
+        ),
+    ]
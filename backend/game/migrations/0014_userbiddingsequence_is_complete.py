@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_is_complete(apps, schema_editor):
+    from game.utils import is_auction_complete
+
+    UserBiddingSequence = apps.get_model('game', 'UserBiddingSequence')
+    completed = [
+        sequence.pk
+        for sequence in UserBiddingSequence.objects.only('pk', 'sequence').iterator()
+        if is_auction_complete(sequence.sequence or [])
+    ]
+    for start in range(0, len(completed), 500):
+        UserBiddingSequence.objects.filter(pk__in=completed[start:start + 500]).update(is_complete=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_alter_response_superseded_by_action_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbiddingsequence',
+            name='is_complete',
+            field=models.BooleanField(default=False, help_text='Stored is_auction_complete(sequence), kept in step by save()'),
+        ),
+        migrations.AddIndex(
+            model_name='userbiddingsequence',
+            index=models.Index(fields=['user', 'is_complete'], name='game_userbi_user_id_200b25_idx'),
+        ),
+        migrations.RunPython(backfill_is_complete, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    Deal = apps.get_model('game', 'Deal')
+    PendingWorkCounter = apps.get_model('game', 'PendingWorkCounter')
+
+    open_nodes = Q(nodes__status='open')
+    rows = Deal.objects.annotate(
+        node_count=Count('nodes'),
+        creator_pending=Count('nodes', filter=open_nodes & Q(nodes__who_needs__in=['both', 'creator'])),
+        partner_pending=Count('nodes', filter=open_nodes & Q(nodes__who_needs__in=['both', 'partner'])),
+    ).values_list(
+        'id', 'session_id', 'session__creator_id', 'session__partner_id',
+        'node_count', 'creator_pending', 'partner_pending'
+    )
+
+    counters = []
+    for deal_id, session_id, creator_id, partner_id, node_count, creator_pending, partner_pending in rows.iterator():
+        if not node_count:
+            creator_pending = partner_pending = 1
+        counters.append(PendingWorkCounter(user_id=creator_id, session_id=session_id, deal_id=deal_id, pending=creator_pending))
+        counters.append(PendingWorkCounter(user_id=partner_id, session_id=session_id, deal_id=deal_id, pending=partner_pending))
+    PendingWorkCounter.objects.bulk_create(counters, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0014_userbiddingsequence_is_complete'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingWorkCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending', models.PositiveIntegerField(default=0, help_text='Open nodes whose who_needs includes the user')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_counters', to='game.deal')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_counters', to='game.session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'session'], name='game_pendin_user_id_c0c705_idx')],
+                'unique_together': {('user', 'deal')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
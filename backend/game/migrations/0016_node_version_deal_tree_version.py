@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0015_pendingworkcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deal',
+            name='tree_version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped once per committed tree write'),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Deal tree_version of the last change'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['deal', 'version'], name='game_node_deal_id_628063_idx'),
+        ),
+    ]
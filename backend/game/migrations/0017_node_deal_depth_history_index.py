@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0016_node_version_deal_tree_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['deal', 'depth', 'history'], name='game_node_deal_id_b8b493_idx'),
+        ),
+    ]
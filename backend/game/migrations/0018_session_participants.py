@@ -0,0 +1,85 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+NEEDS_MASKS = {'none': 0, 'creator': 1, 'partner': 2, 'both': 3}
+ROLE_BITS = {'creator': 1, 'partner': 2}
+
+
+def backfill_participants(apps, schema_editor):
+    Session = apps.get_model('game', 'Session')
+    SessionParticipant = apps.get_model('game', 'SessionParticipant')
+    Node = apps.get_model('game', 'Node')
+    Edge = apps.get_model('game', 'Edge')
+
+    participants = []
+    for session_id, creator_id, partner_id in Session.objects.values_list('id', 'creator_id', 'partner_id').iterator():
+        participants.append(SessionParticipant(session_id=session_id, user_id=creator_id, slot=0, role='creator'))
+        if partner_id != creator_id:
+            participants.append(SessionParticipant(session_id=session_id, user_id=partner_id, slot=1, role='partner'))
+        else:
+            Session.objects.filter(id=session_id).update(participant_mask=1)
+    SessionParticipant.objects.bulk_create(participants, batch_size=500)
+
+    for who_needs, mask in NEEDS_MASKS.items():
+        Node.objects.filter(who_needs=who_needs).update(needs_mask=mask)
+
+    edges = []
+    for edge in Edge.objects.only('id', 'by_set').iterator():
+        edge.by_mask = sum(ROLE_BITS.get(role, 0) for role in set(edge.by_set or []))
+        edges.append(edge)
+    Edge.objects.bulk_update(edges, ['by_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0017_node_deal_depth_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edge',
+            name='by_mask',
+            field=models.PositiveIntegerField(default=0, help_text='Bitmask of the participant slots that made this call'),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='needs_mask',
+            field=models.PositiveIntegerField(default=3, help_text='Bitmask of the participant slots that need to answer'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='participant_mask',
+            field=models.PositiveIntegerField(default=3, help_text='Bitmask of the participant slots in use (creator and partner: 3)'),
+        ),
+        migrations.AlterField(
+            model_name='edge',
+            name='by_set',
+            field=models.JSONField(default=list, help_text="Creator/partner part of by_mask: ['creator'], ['partner'], or ['creator','partner']"),
+        ),
+        migrations.AlterField(
+            model_name='node',
+            name='who_needs',
+            field=models.CharField(default='both', help_text="Creator/partner part of needs_mask: 'both', 'creator', 'partner', or 'none'", max_length=20),
+        ),
+        migrations.CreateModel(
+            name='SessionParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(help_text='Bit position in needs/by masks')),
+                ('role', models.CharField(choices=[('creator', 'Creator'), ('partner', 'Partner'), ('member', 'Member'), ('coach', 'Coach')], default='member', max_length=10)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='game.session')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_participations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['session', 'slot'],
+                'unique_together': {('session', 'slot'), ('session', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_participants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0018_session_participants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledDeal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deal_hash', models.CharField(help_text='SHA-256 of the canonical dealer, vulnerability and hands', max_length=64, unique=True)),
+                ('dealer', models.CharField(choices=[('N', 'North'), ('S', 'South'), ('E', 'East'), ('W', 'West')], max_length=1)),
+                ('vulnerability', models.CharField(choices=[('None', 'None'), ('NS', 'NS'), ('EW', 'EW'), ('Both', 'Both')], max_length=20)),
+                ('hands', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DealPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deal_pools', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DealPoolBoard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board_number', models.PositiveIntegerField()),
+                ('pool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pool_boards', to='game.dealpool')),
+                ('pooled_deal', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pool_boards', to='game.pooleddeal')),
+            ],
+            options={
+                'ordering': ['pool', 'board_number'],
+                'unique_together': {('pool', 'board_number')},
+            },
+        ),
+        migrations.AddField(
+            model_name='dealpool',
+            name='boards',
+            field=models.ManyToManyField(related_name='pools', through='game.DealPoolBoard', to='game.pooleddeal'),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='pooled_deal',
+            field=models.ForeignKey(blank=True, help_text='Shared cards when the deal comes from a deal pool (hands is then empty)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='deals', to='game.pooleddeal'),
+        ),
+        migrations.CreateModel(
+            name='FieldCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('history', models.TextField(blank=True, help_text='Space-separated bidding history')),
+                ('seat_to_act', models.CharField(choices=[('N', 'North'), ('S', 'South'), ('E', 'East'), ('W', 'West')], max_length=1)),
+                ('call', models.CharField(max_length=10)),
+                ('responses', models.PositiveIntegerField(default=0, help_text='Active responses with this call')),
+                ('sessions', models.PositiveIntegerField(default=0, help_text='Sessions with at least one such response')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pooled_deal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='field_calls', to='game.pooleddeal')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pooled_deal', 'history'], name='game_fieldc_pooled__cfba7d_idx')],
+                'unique_together': {('pooled_deal', 'history', 'call')},
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0019_deal_pools'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='path_outcome',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(0, 'Open'), (1, 'Agreed'), (2, 'Diverged')], help_text='How the node is currently counted in PathStats (null: not counted)', null=True),
+        ),
+        migrations.CreateModel(
+            name='AuctionPath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call', models.CharField(blank=True, help_text="Last call of the history ('' for the root)", max_length=10)),
+                ('depth', models.PositiveIntegerField(default=0, help_text='Number of calls from root')),
+                ('history', models.TextField(help_text='Space-separated bidding history', unique=True)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='game.auctionpath')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='path',
+            field=models.ForeignKey(blank=True, help_text='Interned history, set when the node is first stamped', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='nodes', to='game.auctionpath'),
+        ),
+        migrations.CreateModel(
+            name='PathStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nodes', models.PositiveIntegerField(default=0, help_text='Nodes at this path')),
+                ('agreements', models.PositiveIntegerField(default=0, help_text='Nodes where both partners made the same call')),
+                ('divergences', models.PositiveIntegerField(default=0, help_text='Nodes where the partners made different calls')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('partner_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('partner_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('path', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='game.auctionpath')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='auctionpath',
+            index=models.Index(fields=['parent', 'call'], name='game_auctio_parent__54b384_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pathstats',
+            index=models.Index(fields=['partner_a', 'partner_b', 'path'], name='game_pathst_partner_b6b9c7_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pathstats',
+            unique_together={('path', 'partner_a', 'partner_b')},
+        ),
+    ]
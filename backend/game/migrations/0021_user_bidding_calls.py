@@ -0,0 +1,119 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def entry_timestamp(entry):
+    try:
+        return parse_datetime(entry.get('timestamp') or '')
+    except (TypeError, ValueError):
+        return None
+
+
+def split_sequences(apps, schema_editor):
+    """Copy every JSON sequence into call rows and the cached history fields"""
+    UserBiddingSequence = apps.get_model('game', 'UserBiddingSequence')
+    UserBiddingCall = apps.get_model('game', 'UserBiddingCall')
+
+    calls, sequences = [], []
+    for user_sequence in UserBiddingSequence.objects.only('id', 'sequence').iterator():
+        entries = [entry for entry in user_sequence.sequence or [] if entry.get('call')]
+        for index, entry in enumerate(entries):
+            calls.append(UserBiddingCall(
+                sequence_id=user_sequence.id, call_index=index, position=entry.get('position') or '',
+                call=entry['call'], alert=entry.get('alert') or '', timestamp=entry_timestamp(entry)
+            ))
+        user_sequence.history = ' '.join(entry['call'] for entry in entries)
+        user_sequence.call_count = len(entries)
+        user_sequence.last_position = entries[-1].get('position') or '' if entries else ''
+        sequences.append(user_sequence)
+    UserBiddingCall.objects.bulk_create(calls, batch_size=500)
+    UserBiddingSequence.objects.bulk_update(sequences, ['history', 'call_count', 'last_position'], batch_size=500)
+
+
+def join_sequences(apps, schema_editor):
+    """Rebuild the JSON sequences from the call rows"""
+    UserBiddingSequence = apps.get_model('game', 'UserBiddingSequence')
+    UserBiddingCall = apps.get_model('game', 'UserBiddingCall')
+
+    entries = {}
+    for row in UserBiddingCall.objects.order_by('sequence_id', 'call_index').iterator():
+        entries.setdefault(row.sequence_id, []).append({
+            'position': row.position,
+            'call': row.call,
+            'alert': row.alert,
+            'type': 'bid' if row.call[0].isdigit() else 'action',
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+            'call_index': row.call_index,
+        })
+    sequences = []
+    for user_sequence in UserBiddingSequence.objects.only('id').iterator():
+        user_sequence.sequence = entries.get(user_sequence.id, [])
+        sequences.append(user_sequence)
+    UserBiddingSequence.objects.bulk_update(sequences, ['sequence'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0020_auction_paths'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBiddingCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_index', models.PositiveIntegerField(help_text='Position of the call in the sequence')),
+                ('position', models.CharField(choices=[('N', 'North'), ('S', 'South'), ('E', 'East'), ('W', 'West')], max_length=1)),
+                ('call', models.CharField(max_length=10)),
+                ('alert', models.TextField(blank=True, default='')),
+                ('timestamp', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['sequence', 'call_index'],
+            },
+        ),
+        migrations.AddField(
+            model_name='userbiddingsequence',
+            name='call_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of calls in the sequence'),
+        ),
+        migrations.AddField(
+            model_name='userbiddingsequence',
+            name='history',
+            field=models.TextField(blank=True, default='', help_text='Space-separated calls of the sequence'),
+        ),
+        migrations.AddField(
+            model_name='userbiddingsequence',
+            name='last_position',
+            field=models.CharField(blank=True, default='', help_text="Seat of the last call ('' when empty)", max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='userbiddingsequence',
+            name='is_complete',
+            field=models.BooleanField(default=False, help_text='Stored is_auction_complete() of the sequence, kept in step with history'),
+        ),
+        migrations.AddIndex(
+            model_name='userbiddingsequence',
+            index=models.Index(fields=['deal', 'history'], name='game_userbi_deal_id_91400a_idx'),
+        ),
+        migrations.AddField(
+            model_name='userbiddingcall',
+            name='sequence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calls', to='game.userbiddingsequence'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='userbiddingcall',
+            unique_together={('sequence', 'call_index')},
+        ),
+        migrations.RunPython(split_sequences, join_sequences),
+        migrations.RemoveField(
+            model_name='userbiddingsequence',
+            name='sequence',
+        ),
+    ]
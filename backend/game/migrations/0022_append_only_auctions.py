@@ -0,0 +1,168 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def entry_timestamp(entry):
+    try:
+        return parse_datetime(entry.get('timestamp') or '')
+    except (TypeError, ValueError):
+        return None
+
+
+def auction_state(calls):
+    """call_count, last_bid, trailing_passes and is_complete of a list of calls"""
+    last_bid, trailing_passes = '', 0
+    for call in calls:
+        if call[0].isdigit():
+            last_bid = call
+        trailing_passes = trailing_passes + 1 if call == 'Pass' else 0
+    return {
+        'call_count': len(calls),
+        'last_bid': last_bid,
+        'trailing_passes': trailing_passes,
+        'is_complete': (len(calls) == 4 and trailing_passes == 4)
+        or (bool(last_bid) and len(calls) >= 4 and trailing_passes >= 3),
+    }
+
+
+def split_auctions(apps, schema_editor):
+    """Copy the JSON auction and bidding histories into call rows"""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Deal = apps.get_model('game', 'Deal')
+    DealCall = apps.get_model('game', 'DealCall')
+    PlayerGame = apps.get_model('game', 'PlayerGame')
+    PlayerGameBid = apps.get_model('game', 'PlayerGameBid')
+
+    user_ids = dict(User.objects.values_list('username', 'id'))
+    calls, deals = [], []
+    for deal in Deal.objects.only('id', 'auction_history').iterator():
+        entries = [entry for entry in deal.auction_history or [] if entry.get('call')]
+        for index, entry in enumerate(entries):
+            calls.append(DealCall(
+                deal_id=deal.id, call_index=index, position=entry.get('position') or '',
+                player_id=user_ids.get(entry.get('player')), call=entry['call'],
+                alert=entry.get('alert') or '', timestamp=entry_timestamp(entry)
+            ))
+        for field, value in auction_state([entry['call'] for entry in entries]).items():
+            setattr(deal, field, value)
+        deals.append(deal)
+    DealCall.objects.bulk_create(calls, batch_size=500)
+    Deal.objects.bulk_update(deals, ['call_count', 'last_bid', 'trailing_passes', 'is_complete'], batch_size=500)
+
+    bids, player_games = [], []
+    for player_game in PlayerGame.objects.only('id', 'bidding_history').iterator():
+        history = [bid for bid in player_game.bidding_history or [] if bid]
+        bids.extend(
+            PlayerGameBid(player_game_id=player_game.id, bid_index=index, bid=bid)
+            for index, bid in enumerate(history)
+        )
+        player_game.bid_number = len(history)
+        player_games.append(player_game)
+    PlayerGameBid.objects.bulk_create(bids, batch_size=500)
+    PlayerGame.objects.bulk_update(player_games, ['bid_number'], batch_size=500)
+
+
+def join_auctions(apps, schema_editor):
+    """Rebuild the JSON histories from the call rows"""
+    Deal = apps.get_model('game', 'Deal')
+    DealCall = apps.get_model('game', 'DealCall')
+    PlayerGame = apps.get_model('game', 'PlayerGame')
+    PlayerGameBid = apps.get_model('game', 'PlayerGameBid')
+
+    entries = {}
+    for row in DealCall.objects.select_related('player').order_by('deal_id', 'call_index').iterator():
+        entries.setdefault(row.deal_id, []).append({
+            'position': row.position,
+            'player': row.player.username if row.player_id else None,
+            'call': row.call,
+            'alert': row.alert,
+            'type': 'bid' if row.call[0].isdigit() else 'action',
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+            'call_index': row.call_index,
+        })
+    deals = []
+    for deal in Deal.objects.only('id').iterator():
+        deal.auction_history = entries.get(deal.id, [])
+        deals.append(deal)
+    Deal.objects.bulk_update(deals, ['auction_history'], batch_size=500)
+
+    histories = {}
+    for player_game_id, bid in PlayerGameBid.objects.order_by('player_game_id', 'bid_index').values_list(
+        'player_game_id', 'bid'
+    ):
+        histories.setdefault(player_game_id, []).append(bid)
+    player_games = []
+    for player_game in PlayerGame.objects.only('id').iterator():
+        player_game.bidding_history = histories.get(player_game.id, [])
+        player_games.append(player_game)
+    PlayerGame.objects.bulk_update(player_games, ['bidding_history'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0021_user_bidding_calls'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deal',
+            name='call_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of calls in the auction'),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='last_bid',
+            field=models.CharField(blank=True, default='', help_text='Highest contract bid so far', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='trailing_passes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Passes since the last other call'),
+        ),
+        migrations.CreateModel(
+            name='DealCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_index', models.PositiveIntegerField()),
+                ('position', models.CharField(choices=[('N', 'North'), ('S', 'South'), ('E', 'East'), ('W', 'West')], max_length=1)),
+                ('call', models.CharField(max_length=10)),
+                ('alert', models.TextField(blank=True, default='')),
+                ('timestamp', models.DateTimeField(blank=True, null=True)),
+                ('deal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calls', to='game.deal')),
+                ('player', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deal_calls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['deal', 'call_index'],
+                'unique_together': {('deal', 'call_index')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerGameBid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bid_index', models.PositiveIntegerField()),
+                ('bid', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('player_game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='game.playergame')),
+            ],
+            options={
+                'ordering': ['player_game', 'bid_index'],
+                'unique_together': {('player_game', 'bid_index')},
+            },
+        ),
+        migrations.RunPython(split_auctions, join_auctions),
+        migrations.RemoveField(
+            model_name='deal',
+            name='auction_history',
+        ),
+        migrations.RemoveField(
+            model_name='playergame',
+            name='bidding_history',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0023_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeRecomputeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_at', models.DateTimeField(db_index=True, help_text='Time of the latest dirty mark')),
+                ('claimed_at', models.DateTimeField(blank=True, help_text='When a worker started on it', null=True)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('deal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recompute_job', to='game.deal')),
+            ],
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def register_sessions(apps, schema_editor):
+    # Sessions so far all live in the default database
+    Session = apps.get_model('game', 'Session')
+    SessionShard = apps.get_model('game', 'SessionShard')
+    database = schema_editor.connection.alias
+    SessionShard.objects.using(database).bulk_create([
+        SessionShard(id=session_id, database=database)
+        for session_id in Session.objects.using(database).values_list('id', flat=True).iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0024_tree_recompute_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('database', models.CharField(help_text="DATABASES alias of the session's shard", max_length=100)),
+                ('moved_at', models.DateTimeField(blank=True, help_text='When rebalance_shards last moved the session', null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bidcomment',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='bid_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='deal',
+            name='pooled_deal',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Shared cards when the deal comes from a deal pool (hands is then empty)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='deals', to='game.pooleddeal'),
+        ),
+        migrations.AlterField(
+            model_name='dealcall',
+            name='player',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deal_calls', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='fieldcall',
+            name='pooled_deal',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='field_calls', to='game.pooleddeal'),
+        ),
+        migrations.AlterField(
+            model_name='nodecomment',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='node_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pathstats',
+            name='partner_a',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pathstats',
+            name='partner_b',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pendingworkcounter',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pending_counters', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='playergame',
+            name='player',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='player_games', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='response',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='auction_responses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='responseaudit',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='response_audits', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='creator',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='created_sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='partner',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='partner_sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='sessionparticipant',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='session_participations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='treeevent',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='tree_events', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='userbiddingsequence',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='bidding_sequences', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(register_sessions, migrations.RunPython.noop),
+    ]
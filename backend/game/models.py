@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.conf import settings
-from .validators import is_bid_valid
+from django.core.serializers.json import DjangoJSONEncoder
+from .sharding import allocate_session, select_users, use_shard
 
 
 # Create your models here.
@@ -14,12 +15,14 @@ class Session(models.Model):
     creator = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='created_sessions'
+        related_name='created_sessions',
+        db_constraint=False
     )
     partner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='partner_sessions'
+        related_name='partner_sessions',
+        db_constraint=False
     )
     create_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -29,10 +32,72 @@ class Session(models.Model):
     vulnerability = models.CharField(max_length=20, choices=VULNERABILITY_CHOICES, default='None')
     seed = models.CharField(max_length=100, blank=True, null=True)  # Store RNG seed for reproducible deals
     max_deals = models.PositiveIntegerField(default=4)  # Maximum number of deals in this session
+    participant_mask = models.PositiveIntegerField(
+        default=3,
+        help_text="Bitmask of the participant slots in use (creator and partner: 3)"
+    )
 
     def __str__(self):
         return f"{self.name} (Created by {self.creator.email})"
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        if created and self.pk is None:
+            # The shard directory hands out session ids and places the session
+            self.pk, kwargs['using'] = allocate_session()
+        super().save(*args, **kwargs)
+        if created:
+            from .services.participants import ensure_core_participants
+            with use_shard(self._state.db):
+                ensure_core_participants(self)
+
+    def has_participant(self, user) -> bool:
+        """Whether a user takes part in this session (creator, partner or member)"""
+        if not getattr(user, 'is_authenticated', False):
+            return False
+        if user.id in (self.creator_id, self.partner_id):
+            return True
+        return self.participants.filter(user=user).exists()
+
+
+class SessionParticipant(models.Model):
+    """A user taking part in a session, holding the bit 1 << slot in participant masks"""
+    CREATOR_SLOT = 0
+    PARTNER_SLOT = 1
+    ROLE_CHOICES = [
+        ('creator', 'Creator'),
+        ('partner', 'Partner'),
+        ('member', 'Member'),
+        ('coach', 'Coach'),
+    ]
+
+    session = models.ForeignKey(
+        Session,
+        on_delete=models.CASCADE,
+        related_name='participants'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='session_participations',
+        db_constraint=False
+    )
+    slot = models.PositiveSmallIntegerField(help_text="Bit position in needs/by masks")
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='member')
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('session', 'user'), ('session', 'slot')]
+        ordering = ['session', 'slot']
+
+    def __str__(self):
+        return f"{self.user} in {self.session.name} (slot {self.slot}, {self.role})"
+
+    @property
+    def bit(self):
+        """This participant's bit in needs/by masks"""
+        return 1 << self.slot
+
 class Deal(models.Model):
     session = models.ForeignKey(
         Session,
@@ -43,8 +108,20 @@ class Deal(models.Model):
     dealer = models.CharField(max_length=1, choices=position_choice)
     vulnerability = models.CharField(max_length=20, choices=Session.VULNERABILITY_CHOICES)
     hands = models.JSONField(default=dict)  # Store dealt cards for each position
-    auction_history = models.JSONField(default=list)  # Store bidding sequence
+    pooled_deal = models.ForeignKey(
+        'PooledDeal',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='deals',
+        help_text="Shared cards when the deal comes from a deal pool (hands is then empty)",
+        db_constraint=False
+    )
+    call_count = models.PositiveIntegerField(default=0, help_text="Number of calls in the auction")
+    last_bid = models.CharField(max_length=3, blank=True, default='', help_text="Highest contract bid so far")
+    trailing_passes = models.PositiveSmallIntegerField(default=0, help_text="Passes since the last other call")
     is_complete = models.BooleanField(default=False)
+    tree_version = models.PositiveIntegerField(default=0, help_text="Bumped once per committed tree write")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -54,6 +131,24 @@ class Deal(models.Model):
     def __str__(self):
         return f"Deal {self.deal_number} in {self.session.name}"
 
+    @property
+    def board_hands(self):
+        """Dealt cards, read from the shared pooled deal when there is one"""
+        if self.pooled_deal_id:
+            return self.pooled_deal.hands
+        return self.hands
+
+    @property
+    def auction_history(self):
+        """The auction's calls as entries (uses prefetched calls when present)"""
+        if not self.call_count:
+            return []
+        if 'calls' in getattr(self, '_prefetched_objects_cache', {}):
+            calls = self.calls.all()
+        else:
+            calls = select_users(self.calls.all(), 'player')
+        return [call.entry() for call in calls]
+
     def get_dealer_for_deal(self):
         """Calculate dealer based on deal number"""
         deal_index = (self.deal_number - 1) % 16
@@ -77,35 +172,104 @@ class PlayerGame(models.Model):
     player = models.ForeignKey(
     settings.AUTH_USER_MODEL,
     on_delete=models.CASCADE,
-    related_name='player_games'
+    related_name='player_games',
+    db_constraint=False
     )
     bid_number = models.PositiveIntegerField(default=0)
     position = models.CharField(max_length=1, choices=position_choice)
-    bidding_history = models.JSONField(default=list)
     is_active = models.BooleanField(default=True)
     updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         unique_together = ('session', 'player')
     def __str__(self):
         return f"PlayerGame: {self.player.username} in session {self.session.name}"
+
+    @property
+    def bidding_history(self):
+        """The player's bids in order (uses prefetched bids when present)"""
+        if not self.bid_number:
+            return []
+        return [bid.bid for bid in self.bids.all()]
+
     def make_bid(self, bid_action):
-        if not is_bid_valid(bid_action, self.bidding_history):
-            raise ValueError(f"Invalid bid: {bid_action}")
+        from .services.auction_calls import append_player_bid
+        append_player_bid(self, bid_action)
+
+
+class PlayerGameBid(models.Model):
+    """One bid of a player's bidding history; bid_index counts from 0"""
+    player_game = models.ForeignKey(
+        PlayerGame,
+        on_delete=models.CASCADE,
+        related_name='bids'
+    )
+    bid_index = models.PositiveIntegerField()
+    bid = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('player_game', 'bid_index')
+        ordering = ['player_game', 'bid_index']
+
+    def __str__(self):
+        return f"Bid {self.bid_index} of player game {self.player_game_id}: {self.bid}"
+
+
+class DealCall(models.Model):
+    """
+    One call of a deal's shared auction.
+
+    Calls are only ever appended: the unique (deal, call_index) pair makes
+    two concurrent callers race for the same tail slot instead of locking
+    and rewriting the whole auction.
+    """
+    deal = models.ForeignKey(
+        Deal,
+        on_delete=models.CASCADE,
+        related_name='calls'
+    )
+    call_index = models.PositiveIntegerField()
+    position = models.CharField(max_length=1, choices=position_choice)
+    player = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deal_calls',
+        db_constraint=False
+    )
+    call = models.CharField(max_length=10)
+    alert = models.TextField(blank=True, default='')
+    timestamp = models.DateTimeField(null=True, blank=True)
 
-        history = self.bidding_history or []
-        history.append(bid_action)
-        self.bidding_history = history
+    class Meta:
+        unique_together = ('deal', 'call_index')
+        ordering = ['deal', 'call_index']
 
-        self.bid_number += 1
+    def __str__(self):
+        return f"Call {self.call_index} of deal {self.deal_id}: {self.call}"
 
-        self.save()
+    def entry(self):
+        """The call in the auction_history entry shape"""
+        return {
+            'position': self.position,
+            'player': self.player.username if self.player_id else None,
+            'call': self.call,
+            'alert': self.alert,
+            'type': 'bid' if self.call[0].isdigit() else 'action',
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'call_index': self.call_index,
+        }
 
 
 class UserBiddingSequence(models.Model):
     """Tracks each user's independent bidding sequence for a deal.
 
     This allows users to work asynchronously, maintaining their own
-    bidding sequences while viewing a shared space.
+    bidding sequences while viewing a shared space. The calls themselves
+    are UserBiddingCall rows; the space-separated history, length and last
+    position are cached here so branch checks never read the rows. Change
+    the calls through game.services.user_sequences, which keeps both in step.
     """
     deal = models.ForeignKey(
         Deal,
@@ -115,10 +279,22 @@ class UserBiddingSequence(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='bidding_sequences'
+        related_name='bidding_sequences',
+        db_constraint=False
     )
     position = models.CharField(max_length=1, choices=position_choice)
-    sequence = models.JSONField(default=list)  # User's independent bid sequence
+    history = models.TextField(blank=True, default='', help_text="Space-separated calls of the sequence")
+    call_count = models.PositiveIntegerField(default=0, help_text="Number of calls in the sequence")
+    last_position = models.CharField(
+        max_length=1,
+        blank=True,
+        default='',
+        help_text="Seat of the last call ('' when empty)"
+    )
+    is_complete = models.BooleanField(
+        default=False,
+        help_text="Stored is_auction_complete() of the sequence, kept in step with history"
+    )
     notes = models.TextField(blank=True, help_text="User's notes on their bidding")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -126,23 +302,39 @@ class UserBiddingSequence(models.Model):
     class Meta:
         unique_together = ('deal', 'user')
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', 'is_complete']),
+            models.Index(fields=['deal', 'history']),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s sequence for Deal {self.deal.deal_number}"
 
     def add_bid(self, bid_action, alert_text=''):
         """Add a bid to the user's sequence."""
-        sequence = self.sequence or []
-        bid_entry = {
-            'position': self.position,
-            'call': bid_action,
-            'alert': alert_text,
-            'timestamp': str(models.DateTimeField(auto_now_add=True))
-        }
-        sequence.append(bid_entry)
-        self.sequence = sequence
-        self.save()
-        return bid_entry
+        from .services.user_sequences import append_calls
+        return append_calls(self, [(self.position, bid_action, alert_text)])[-1]
+
+
+class UserBiddingCall(models.Model):
+    """One call of a user's bidding sequence"""
+    sequence = models.ForeignKey(
+        UserBiddingSequence,
+        on_delete=models.CASCADE,
+        related_name='calls'
+    )
+    call_index = models.PositiveIntegerField(help_text="Position of the call in the sequence")
+    position = models.CharField(max_length=1, choices=position_choice)
+    call = models.CharField(max_length=10)
+    alert = models.TextField(blank=True, default='')
+    timestamp = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('sequence', 'call_index')
+        ordering = ['sequence', 'call_index']
+
+    def __str__(self):
+        return f"Call {self.call_index} of sequence {self.sequence_id}: {self.call}"
 
 
 class BidComment(models.Model):
@@ -155,7 +347,8 @@ class BidComment(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='bid_comments'
+        related_name='bid_comments',
+        db_constraint=False
     )
     bid_index = models.IntegerField(help_text="Index of bid in sequence")
     comment = models.TextField()
@@ -194,7 +387,7 @@ class ForkDeal(models.Model):
             original_deal=deal,
             dealer=deal.dealer,
             vulnerability=deal.vulnerability,
-            hands=deal.hands,
+            hands=deal.board_hands,
             auction_history=deal.auction_history[:fork_index] + [new_bid],
         )
 
@@ -223,7 +416,26 @@ class Node(models.Model):
     who_needs = models.CharField(
         max_length=20,
         default='both',
-        help_text="Which users need to answer: 'both', 'creator', 'partner', or 'none'"
+        help_text="Creator/partner part of needs_mask: 'both', 'creator', 'partner', or 'none'"
+    )
+    needs_mask = models.PositiveIntegerField(
+        default=3,
+        help_text="Bitmask of the participant slots that need to answer"
+    )
+    version = models.PositiveIntegerField(default=0, help_text="Deal tree_version of the last change")
+    path = models.ForeignKey(
+        'AuctionPath',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='nodes',
+        help_text="Interned history, set when the node is first stamped"
+    )
+    path_outcome = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        choices=[(0, 'Open'), (1, 'Agreed'), (2, 'Diverged')],
+        help_text="How the node is currently counted in PathStats (null: not counted)"
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -233,11 +445,23 @@ class Node(models.Model):
         indexes = [
             models.Index(fields=['deal', 'history']),
             models.Index(fields=['session', 'deal']),
+            models.Index(fields=['deal', 'version']),
+            models.Index(fields=['deal', 'depth', 'history']),
         ]
 
     def __str__(self):
         return f"Node: Deal {self.deal.deal_number} - History: {self.history or 'root'} - Seat: {self.seat_to_act}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .services.tree_versions import mark_nodes_changed
+        mark_nodes_changed(self.deal_id, [self.pk])
+
+    @property
+    def stable_id(self):
+        """Identifier of this node in tree and progress payloads"""
+        return f"n_{self.pk}"
+
     def get_state_key(self):
         """Generate a unique key for this public state"""
         return f"{self.session.id}_{self.deal.deal_number}_{self.seat_to_act}_{self.history}"
@@ -274,7 +498,8 @@ class Response(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='auction_responses'
+        related_name='auction_responses',
+        db_constraint=False
     )
     call = models.CharField(max_length=10, help_text="The call made (e.g., '1H', 'P', 'X')")
     timestamp = models.DateTimeField(auto_now_add=True)
@@ -288,6 +513,7 @@ class Response(models.Model):
         blank=True,
         choices=[
             ('REWIND', 'Rewind'),
+            ('UNDO', 'Undo'),
             ('ADMIN', 'Admin Action'),
             ('MERGE', 'Merge'),
         ],
@@ -299,11 +525,18 @@ class Response(models.Model):
             models.Index(fields=['node', 'call']),
             models.Index(fields=['user', 'node']),
             models.Index(fields=['is_active']),
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['superseded_at']),
         ]
 
     def __str__(self):
         return f"{self.user.username}'s response at {self.node}: {self.call}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .services.tree_versions import mark_nodes_changed
+        mark_nodes_changed(self.node.deal_id, [self.node_id])
+
 
 class ResponseAudit(models.Model):
     """Audit trail for response changes (rewinds, etc.)"""
@@ -317,7 +550,8 @@ class ResponseAudit(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='response_audits'
+        related_name='response_audits',
+        db_constraint=False
     )
     node = models.ForeignKey(
         Node,
@@ -341,6 +575,8 @@ class ResponseAudit(models.Model):
         max_length=20,
         choices=[
             ('REWIND', 'Rewind'),
+            ('UNDO', 'Undo'),
+            ('REPLACE', 'Replace'),
             ('ADMIN', 'Admin Action'),
             ('MERGE', 'Merge'),
         ],
@@ -354,6 +590,7 @@ class ResponseAudit(models.Model):
         indexes = [
             models.Index(fields=['user', 'session', 'deal']),
             models.Index(fields=['action_timestamp']),
+            models.Index(fields=['deal', 'action_timestamp']),
         ]
 
 
@@ -367,7 +604,8 @@ class NodeComment(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='node_comments'
+        related_name='node_comments',
+        db_constraint=False
     )
     session = models.ForeignKey(
         Session,
@@ -421,7 +659,11 @@ class Edge(models.Model):
     call = models.CharField(max_length=10, help_text="The call made (e.g., '1H', 'P', 'X')")
     by_set = models.JSONField(
         default=list,
-        help_text="List of user roles: ['creator'], ['partner'], or ['creator','partner']"
+        help_text="Creator/partner part of by_mask: ['creator'], ['partner'], or ['creator','partner']"
+    )
+    by_mask = models.PositiveIntegerField(
+        default=0,
+        help_text="Bitmask of the participant slots that made this call"
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -434,3 +676,300 @@ class Edge(models.Model):
 
     def __str__(self):
         return f"Edge: {self.call} from node {self.from_node.id} to {self.to_node.id}"
+
+
+class TreeEvent(models.Model):
+    """Append-only log of calls, rewinds and undos made on a deal's tree"""
+    EVENT_CHOICES = [
+        ('CALL', 'Call'),
+        ('REWIND', 'Rewind'),
+        ('UNDO', 'Undo'),
+    ]
+
+    session = models.ForeignKey(
+        Session,
+        on_delete=models.CASCADE,
+        related_name='tree_events'
+    )
+    deal = models.ForeignKey(
+        Deal,
+        on_delete=models.CASCADE,
+        related_name='tree_events'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='tree_events',
+        db_constraint=False
+    )
+    sequence = models.PositiveIntegerField(help_text="Position of this event in the deal's log")
+    kind = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    history = models.TextField(blank=True, help_text="History of the node the event applies to")
+    seat_to_act = models.CharField(max_length=1, choices=position_choice)
+    call = models.CharField(max_length=10, blank=True, help_text="Call made (CALL events only)")
+    payload = models.JSONField(default=dict, blank=True, help_text="Extra data, e.g. nodes cleared by a rewind")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['deal', 'sequence']
+        unique_together = ('deal', 'sequence')
+        indexes = [
+            models.Index(fields=['deal', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Event {self.sequence} ({self.kind}) on Deal {self.deal_id}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("TreeEvent rows are append-only")
+        super().save(*args, **kwargs)
+
+
+class TreeSnapshot(models.Model):
+    """Compact snapshot of a deal's tree state after a given event"""
+    deal = models.ForeignKey(
+        Deal,
+        on_delete=models.CASCADE,
+        related_name='tree_snapshots'
+    )
+    sequence = models.PositiveIntegerField(help_text="Sequence of the last event folded into this snapshot")
+    state = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-sequence']
+        unique_together = ('deal', 'sequence')
+
+    def __str__(self):
+        return f"Snapshot of Deal {self.deal_id} at event {self.sequence}"
+
+
+class PendingWorkCounter(models.Model):
+    """Materialized number of tree nodes awaiting a user's answer in one deal"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='pending_counters',
+        db_constraint=False
+    )
+    session = models.ForeignKey(
+        Session,
+        on_delete=models.CASCADE,
+        related_name='pending_counters'
+    )
+    deal = models.ForeignKey(
+        Deal,
+        on_delete=models.CASCADE,
+        related_name='pending_counters'
+    )
+    pending = models.PositiveIntegerField(default=0, help_text="Open nodes whose who_needs includes the user")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'deal')
+        indexes = [
+            models.Index(fields=['user', 'session']),
+        ]
+
+    def __str__(self):
+        return f"{self.pending} pending for user {self.user_id} in Deal {self.deal_id}"
+
+
+class PooledDeal(models.Model):
+    """A deal's cards stored once and shared by every session that plays it"""
+    deal_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="SHA-256 of the canonical dealer, vulnerability and hands"
+    )
+    dealer = models.CharField(max_length=1, choices=position_choice)
+    vulnerability = models.CharField(max_length=20, choices=Session.VULNERABILITY_CHOICES)
+    hands = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pooled deal {self.deal_hash[:12]}"
+
+
+class DealPool(models.Model):
+    """A named set of boards that many sessions can be started from"""
+    name = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='deal_pools'
+    )
+    boards = models.ManyToManyField(PooledDeal, through='DealPoolBoard', related_name='pools')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class DealPoolBoard(models.Model):
+    """Position of a pooled deal in a pool"""
+    pool = models.ForeignKey(
+        DealPool,
+        on_delete=models.CASCADE,
+        related_name='pool_boards'
+    )
+    pooled_deal = models.ForeignKey(
+        PooledDeal,
+        on_delete=models.PROTECT,
+        related_name='pool_boards'
+    )
+    board_number = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('pool', 'board_number')
+        ordering = ['pool', 'board_number']
+
+    def __str__(self):
+        return f"Board {self.board_number} of {self.pool.name}"
+
+
+class FieldCall(models.Model):
+    """
+    How many players chose a call at one auction state of a pooled deal,
+    across all sessions of a shard (build_field_tree adds the shards up)
+    """
+    pooled_deal = models.ForeignKey(
+        PooledDeal,
+        on_delete=models.CASCADE,
+        related_name='field_calls',
+        db_constraint=False
+    )
+    history = models.TextField(blank=True, help_text="Space-separated bidding history")
+    seat_to_act = models.CharField(max_length=1, choices=position_choice)
+    call = models.CharField(max_length=10)
+    responses = models.PositiveIntegerField(default=0, help_text="Active responses with this call")
+    sessions = models.PositiveIntegerField(default=0, help_text="Sessions with at least one such response")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('pooled_deal', 'history', 'call')
+        indexes = [
+            models.Index(fields=['pooled_deal', 'history']),
+        ]
+
+    def __str__(self):
+        return f"{self.call} after '{self.history}' on {self.pooled_deal}: {self.responses}"
+
+
+class AuctionPath(models.Model):
+    """An auction history stored once per shard and shared by every node that reaches it"""
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='children'
+    )
+    call = models.CharField(max_length=10, blank=True, help_text="Last call of the history ('' for the root)")
+    depth = models.PositiveIntegerField(default=0, help_text="Number of calls from root")
+    history = models.TextField(unique=True, help_text="Space-separated bidding history")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent', 'call']),
+        ]
+
+    def __str__(self):
+        return f"Path: {self.history or 'root'}"
+
+
+class PathStats(models.Model):
+    """Per-partnership counts of the nodes reaching one auction path"""
+    path = models.ForeignKey(
+        AuctionPath,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    # The session's creator and partner, lower user id first
+    partner_a = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_constraint=False
+    )
+    partner_b = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_constraint=False
+    )
+    nodes = models.PositiveIntegerField(default=0, help_text="Nodes at this path")
+    agreements = models.PositiveIntegerField(default=0, help_text="Nodes where both partners made the same call")
+    divergences = models.PositiveIntegerField(default=0, help_text="Nodes where the partners made different calls")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('path', 'partner_a', 'partner_b')
+        indexes = [
+            models.Index(fields=['partner_a', 'partner_b', 'path']),
+        ]
+
+    def __str__(self):
+        return f"{self.path}: {self.divergences}/{self.nodes} diverged"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied Idempotency-Key and the response it produced.
+
+    A row without a status_code belongs to a request still being processed.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)
+    request_hash = models.CharField(max_length=64, help_text="SHA-256 of the endpoint and request body")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of {self.user_id} ({self.endpoint})"
+
+
+class TreeRecomputeJob(models.Model):
+    """
+    A deal whose derived tree state must be recomputed by run_tree_worker.
+
+    One row per deal: marking a deal dirty again before the worker gets to it
+    only moves requested_at, so any number of writes cost one recompute.
+    """
+    deal = models.OneToOneField(
+        Deal,
+        on_delete=models.CASCADE,
+        related_name='recompute_job'
+    )
+    requested_at = models.DateTimeField(db_index=True, help_text="Time of the latest dirty mark")
+    claimed_at = models.DateTimeField(null=True, blank=True, help_text="When a worker started on it")
+    failures = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Recompute deal {self.deal_id} (requested {self.requested_at})"
+
+
+class SessionShard(models.Model):
+    """
+    Directory entry of a session: the database (shard) that holds it.
+
+    Lives in the default database. Sessions take the id of their entry, so
+    session ids stay unique across shards (see game.sharding).
+    """
+    database = models.CharField(max_length=100, help_text="DATABASES alias of the session's shard")
+    moved_at = models.DateTimeField(null=True, blank=True, help_text="When rebalance_shards last moved the session")
+
+    def __str__(self):
+        return f"Session {self.id} on {self.database}"
@@ -0,0 +1,23 @@
+"""
+Pagination classes for the game API
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class SessionCursorPagination(CursorPagination):
+    """Cursor pagination for session listings, most recently updated first"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-updated_at', '-id')
+
+
+class DealCursorPagination(CursorPagination):
+    """
+    Opt-in cursor pagination for per-session deal lists, in deal order.
+    Only applied when the request passes page_size.
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'deal_number'
@@ -0,0 +1,40 @@
+"""
+Renderers for compact tree payloads
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:  # Optional binary format
+    msgpack = None
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON renderer selected with ?format=columnar for columnar tree payloads"""
+    media_type = 'application/vnd.bridge.tree-columnar+json'
+    format = 'columnar'
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack renderer, selected with Accept: application/msgpack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+
+# Formats whose tree payload is the columnar form
+COLUMNAR_FORMATS = ('columnar', 'msgpack')
+
+
+def tree_renderer_classes():
+    """Renderers for tree endpoints: JSON, columnar JSON and MessagePack if installed"""
+    renderers = [JSONRenderer, ColumnarJSONRenderer]
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers
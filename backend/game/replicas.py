@@ -0,0 +1,172 @@
+"""
+Read replicas with read-your-writes
+
+The busiest GETs (the session list, all_deals, auction_tree and
+get_user_sequences) only read, so they can be answered by replicas of the
+databases instead of the primaries. DATABASE_REPLICAS names the replica
+aliases of each primary (default and every session shard).
+
+ReplicaRouter extends SessionShardRouter: writes go to the primary of the
+shard, and reads go to a replica only while a request has allowed it, which
+ReplicaReadMixin does for the actions listed in its replica_actions. Even
+then a read goes to the primary
+
+- inside a transaction on the primary (a full auction_tree build whose
+  stored tree is out of date brings it up to date in one; an up-to-date
+  tree is read without one, as are the since_version, stream and columnar
+  modes)
+- once the request has written anything (reading a tree writes nothing
+  when nothing changed, so polling does not pin the user)
+- while the user is pinned: ReplicaMiddleware pins a user who wrote for
+  READ_YOUR_WRITES_SECONDS, so the bid they just made is visible to their
+  next polls however far the replicas lag
+
+A request sticks to one replica per primary, so its queries see a single
+point in the replica's history. Pins are kept in the cache, which has to be
+shared by the app's processes (the default local-memory cache is not).
+"""
+import random
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from .sharding import SessionShardRouter, is_sharded
+
+
+class _RequestReads:
+    """Where the reads of the current request may go"""
+
+    def __init__(self):
+        self.replicas_allowed = False
+        self.wrote = False
+        self.chosen = {}  # {primary alias: replica alias}
+
+
+_request_reads: ContextVar[Optional[_RequestReads]] = ContextVar('request_reads', default=None)
+
+
+def replica_aliases() -> Dict[str, List[str]]:
+    """{primary alias: [replica aliases]} of the primaries that have replicas"""
+    return {primary: replicas for primary, replicas in getattr(settings, 'DATABASE_REPLICAS', {}).items() if replicas}
+
+
+def primary_of(alias: str) -> str:
+    """The primary of a replica alias (any other alias is its own primary)"""
+    for primary, replicas in replica_aliases().items():
+        if alias in replicas:
+            return primary
+    return alias
+
+
+def _pin_key(user_id) -> str:
+    return f'replicas:pinned:{user_id}'
+
+
+def _pinnable(user) -> bool:
+    return user is not None and user.is_authenticated and settings.READ_YOUR_WRITES_SECONDS > 0
+
+
+def pin_to_primary(user) -> None:
+    """Send the user's reads to the primaries for READ_YOUR_WRITES_SECONDS"""
+    if _pinnable(user):
+        cache.set(_pin_key(user.pk), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+async def apin_to_primary(user) -> None:
+    """pin_to_primary() for async code"""
+    if _pinnable(user):
+        await cache.aset(_pin_key(user.pk), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def _allow_replicas(pinned: bool) -> bool:
+    reads = _request_reads.get()
+    if reads is None or pinned or reads.wrote or not replica_aliases():
+        return False
+    reads.replicas_allowed = True
+    return True
+
+
+def read_from_replicas(user) -> bool:
+    """
+    Let the rest of the request read from replicas, unless the user is pinned.
+
+    Returns:
+        True if reads may now go to replicas
+    """
+    return _allow_replicas(bool(cache.get(_pin_key(user.pk))))
+
+
+async def aread_from_replicas(user) -> bool:
+    """read_from_replicas() for async views"""
+    return _allow_replicas(bool(await cache.aget(_pin_key(user.pk))))
+
+
+class ReplicaMiddleware:
+    """Scope replica reads to a request and pin the user once it has written"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reads = _RequestReads()
+        token = _request_reads.set(reads)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_reads.reset(token)
+        if reads.wrote:
+            # DRF sets the user it authenticated on the underlying request
+            pin_to_primary(getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        reads = _RequestReads()
+        token = _request_reads.set(reads)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_reads.reset(token)
+        if reads.wrote:
+            await apin_to_primary(getattr(request, 'user', None))
+        return response
+
+
+class ReplicaRouter(SessionShardRouter):
+    """SessionShardRouter sending the reads a request allows to replicas"""
+
+    def db_for_read(self, model, **hints):
+        primary = primary_of(self._shard_for(model, **hints))
+        reads = _request_reads.get()
+        if reads is None or not reads.replicas_allowed or reads.wrote:
+            return primary
+        replicas = replica_aliases().get(primary)
+        if not replicas or connections[primary].in_atomic_block:
+            return primary
+        if primary not in reads.chosen:
+            reads.chosen[primary] = random.choice(replicas)
+        return reads.chosen[primary]
+
+    def db_for_write(self, model, **hints):
+        reads = _request_reads.get()
+        if reads is not None:
+            reads.wrote = True
+        return primary_of(self._shard_for(model, **hints))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            return primary_of(obj1._state.db) == primary_of(obj2._state.db)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if primary_of(db) != db:
+            return False
+        return super().allow_migrate(db, app_label, model_name, **hints)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Session, PlayerGame, Deal, ForkDeal
+from .models import Session, SessionParticipant, PlayerGame, Deal, ForkDeal, DealPool
 from django.contrib.auth import get_user_model
+from .sharding import shard_aliases, sharded
 
 User = get_user_model()
 
@@ -14,6 +15,7 @@ class UserSerializer(serializers.ModelSerializer):
 class PlayerGameSerializer(serializers.ModelSerializer):
     player = UserSerializer(read_only=True)
     bid_action = serializers.CharField(write_only=True, required=False)
+    bidding_history = serializers.ListField(child=serializers.CharField(), read_only=True)
 
     class Meta:
         model = PlayerGame
@@ -30,15 +32,33 @@ class PlayerGameSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class SessionParticipantSerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+    bit = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SessionParticipant
+        fields = ['id', 'user', 'slot', 'bit', 'role', 'joined_at']
+        read_only_fields = ['slot', 'joined_at']
+
+
 class DealSerializer(serializers.ModelSerializer):
+    hands = serializers.JSONField(source='board_hands', read_only=True)
+    pooled = serializers.SerializerMethodField()
+    auction_history = serializers.ListField(child=serializers.DictField(), read_only=True)
+
     class Meta:
         model = Deal
         fields = [
             'id', 'deal_number', 'dealer', 'vulnerability',
-            'hands', 'auction_history', 'is_complete', 'created_at'
+            'hands', 'pooled', 'auction_history', 'is_complete', 'created_at'
         ]
         read_only_fields = ['created_at']
 
+    def get_pooled(self, obj):
+        """Whether the deal shares its cards with other sessions through a deal pool"""
+        return obj.pooled_deal_id is not None
+
 class SessionSerializer(serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
     partner = UserSerializer(read_only=True)
@@ -52,6 +72,40 @@ class SessionSerializer(serializers.ModelSerializer):
             "is_active", "dealer", "hands", "vulnerability", "player_games", "deals"
         ]
 
+    def validate_name(self, value):
+        # The unique constraint only covers one shard's sessions
+        if sharded():
+            others = Session.objects.exclude(pk=self.instance.pk) if self.instance else Session.objects.all()
+            if any(others.using(alias).filter(name=value).exists() for alias in shard_aliases()):
+                raise serializers.ValidationError('session with this name already exists.')
+        return value
+
+class PlayerSummarySerializer(serializers.ModelSerializer):
+    player = UserSerializer(read_only=True)
+
+    class Meta:
+        model = PlayerGame
+        fields = ['id', 'player', 'position']
+
+
+class SessionSummarySerializer(serializers.ModelSerializer):
+    """Lightweight session representation for listings (no deals or bidding histories)"""
+    creator = UserSerializer(read_only=True)
+    partner = UserSerializer(read_only=True)
+    player_games = PlayerSummarySerializer(many=True, read_only=True)
+    deal_count = serializers.IntegerField(read_only=True)
+    open_node_count = serializers.IntegerField(read_only=True)
+    pending_count = serializers.IntegerField(read_only=True)
+    players_with_bids = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Session
+        fields = [
+            "id", "name", "creator", "partner", "create_at", "updated_at",
+            "is_active", "dealer", "vulnerability", "max_deals", "player_games",
+            "deal_count", "open_node_count", "pending_count", "players_with_bids"
+        ]
+
 class ForkDealSerializer(serializers.ModelSerializer):
     class Meta:
         model = ForkDeal
@@ -59,4 +113,15 @@ class ForkDealSerializer(serializers.ModelSerializer):
             'id', 'original_deal', 'dealer', 'vulnerability','hands',
             'auction_history', 'is_complete','created_at'
         ]
-        read_only_fields = ['id', 'created_at'] 
+        read_only_fields = ['id', 'created_at']
+
+
+class DealPoolSerializer(serializers.ModelSerializer):
+    """Deal pool listing; boards are created from 'board_count' on create"""
+    created_by = UserSerializer(read_only=True)
+    board_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = DealPool
+        fields = ['id', 'name', 'description', 'created_by', 'created_at', 'board_count']
+        read_only_fields = ['created_at']
@@ -0,0 +1,135 @@
+"""
+Append-only shared auctions
+
+A deal's auction is a list of DealCall rows and a player game's bidding
+history a list of PlayerGameBid rows; neither is ever rewritten. The owning
+row caches what validation needs (the call count, the highest bid, the
+passes since the last other call and the completion flag), so a call is
+validated without reading the auction and stored as one INSERT plus one
+UPDATE.
+
+There is no row lock. The next call takes index call_count, and the UPDATE
+only applies while call_count still has the value that was read, so of two
+concurrent callers exactly one wins the tail slot; the other re-reads the
+state and tries again, against the auction that now includes the first call.
+"""
+from typing import Tuple
+from django.db import IntegrityError
+from django.utils import timezone
+from ..models import Deal, DealCall, PlayerGame, PlayerGameBid
+from ..sharding import shard_atomic
+from ..utils import calculate_bid_value
+from ..validators import is_bid_valid
+
+MAX_ATTEMPTS = 5
+
+
+class AuctionConflict(Exception):
+    """Raised when a call kept losing the tail slot to concurrent callers"""
+
+
+class _LostRace(Exception):
+    pass
+
+
+def auction_state_after(state: dict, call: str) -> dict:
+    """
+    Cached auction fields after appending a call.
+
+    Args:
+        state: {'call_count', 'last_bid', 'trailing_passes'} before the call
+
+    Returns:
+        The same keys plus 'is_complete' (matching utils.is_auction_complete)
+    """
+    call_count = state['call_count'] + 1
+    last_bid = call if call[0].isdigit() else state['last_bid']
+    trailing_passes = state['trailing_passes'] + 1 if call == 'Pass' else 0
+    is_complete = (
+        (call_count == 4 and trailing_passes == 4)  # Passed out
+        or (bool(last_bid) and call_count >= 4 and trailing_passes >= 3)
+    )
+    return {
+        'call_count': call_count,
+        'last_bid': last_bid,
+        'trailing_passes': trailing_passes,
+        'is_complete': is_complete,
+    }
+
+
+def append_deal_call(deal_id: int, position: str, player, call: str, alert: str = '') -> Tuple[DealCall, dict]:
+    """
+    Append a call to a deal's shared auction.
+
+    Args:
+        deal_id: The deal
+        position: Seat making the call
+        player: User making the call
+        call: The call ('1NT', 'Pass', 'X', ...)
+        alert: Alert text
+
+    Returns:
+        (the stored DealCall, the deal's cached fields after the call)
+
+    Raises:
+        ValueError: If a bid is not higher than the last bid
+        AuctionConflict: If the tail slot was lost MAX_ATTEMPTS times
+    """
+    for _ in range(MAX_ATTEMPTS):
+        state = Deal.objects.filter(id=deal_id).values('call_count', 'last_bid', 'trailing_passes').get()
+        if call[0].isdigit() and calculate_bid_value(call) <= calculate_bid_value(state['last_bid']):
+            raise ValueError('Bid must be higher than the last bid')
+
+        after = auction_state_after(state, call)
+        deal_call = DealCall(
+            deal_id=deal_id,
+            call_index=state['call_count'],
+            position=position,
+            player=player,
+            call=call,
+            alert=alert or '',
+            timestamp=timezone.now()
+        )
+        try:
+            with shard_atomic():
+                deal_call.save(force_insert=True)
+                if not Deal.objects.filter(id=deal_id, call_count=state['call_count']).update(**after):
+                    raise _LostRace
+        except (IntegrityError, _LostRace):
+            continue
+        return deal_call, after
+    raise AuctionConflict(f'Deal {deal_id} is receiving too many concurrent calls, please retry')
+
+
+def append_player_bid(player_game: PlayerGame, bid: str) -> PlayerGameBid:
+    """
+    Append a bid to a player game's bidding history.
+
+    player_game.bid_number is the number of bids and is refreshed here.
+
+    Raises:
+        ValueError: If the bid is not valid after the current history
+        AuctionConflict: If the tail slot was lost MAX_ATTEMPTS times
+    """
+    for _ in range(MAX_ATTEMPTS):
+        bid_number = PlayerGame.objects.filter(id=player_game.id).values_list('bid_number', flat=True).get()
+        history = list(player_game.bids.filter(bid_index__lt=bid_number).values_list('bid', flat=True))
+        if not is_bid_valid(bid, history):
+            raise ValueError(f"Invalid bid: {bid}")
+
+        player_bid = PlayerGameBid(player_game=player_game, bid_index=bid_number, bid=bid)
+        try:
+            with shard_atomic():
+                player_bid.save(force_insert=True)
+                if not PlayerGame.objects.filter(id=player_game.id, bid_number=bid_number).update(
+                    bid_number=bid_number + 1, updated_at=timezone.now()
+                ):
+                    raise _LostRace
+        except (IntegrityError, _LostRace):
+            continue
+        player_game.bid_number = bid_number + 1
+        # Drop stale prefetched bids so bidding_history re-reads
+        getattr(player_game, '_prefetched_objects_cache', {}).pop('bids', None)
+        return player_bid
+    raise AuctionConflict(f'Player game {player_game.id} is receiving too many concurrent bids, please retry')
+
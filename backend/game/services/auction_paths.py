@@ -0,0 +1,279 @@
+"""
+Interned auction paths and per-partnership path statistics
+
+The same history strings recur in Node rows across every deal and session.
+AuctionPath stores each distinct history once, as a tree of (parent, call)
+rows, and every node points at its path. Questions about a sequence ("how
+often do we diverge after 1NT P 2C") become lookups on the path id instead
+of string scans over Node.
+
+PathStats rolls nodes up per path and partnership (a session's creator and
+partner): how many nodes reached the path, and at how many both partners
+made the same call or different ones. The rollup is maintained by deltas.
+Each node remembers in path_outcome how it is currently counted, so when
+tree_write stamps changed nodes, refresh_path_stats only reclassifies those
+nodes and moves the counters by the difference.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from django.db.models import Count, F, Q
+from ..models import Session, Node, Response, AuctionPath, PathStats
+from ..sharding import for_each_shard, shard_atomic
+
+BATCH_SIZE = 500
+
+OUTCOME_OPEN = 0
+OUTCOME_AGREED = 1
+OUTCOME_DIVERGED = 2
+
+
+def path_prefixes(history: str) -> List[str]:
+    """Every history on the way to `history`, root ('') first"""
+    calls = history.split()
+    return [' '.join(calls[:depth]) for depth in range(len(calls) + 1)]
+
+
+def intern_paths(histories: Iterable[str]) -> Dict[str, int]:
+    """
+    Get or create the AuctionPath rows of some histories (and their prefixes).
+
+    Paths are created level by level so every parent exists before its
+    children; rows created concurrently are picked up by reading back.
+
+    Returns:
+        {history: path_id} for every requested history
+    """
+    histories = set(histories)
+    by_depth = defaultdict(set)
+    for history in histories:
+        for prefix in path_prefixes(history):
+            by_depth[len(prefix.split())].add(prefix)
+
+    path_ids = {}
+    for depth in sorted(by_depth):
+        level = sorted(by_depth[depth])
+        for start in range(0, len(level), BATCH_SIZE):
+            path_ids.update(AuctionPath.objects.filter(
+                history__in=level[start:start + BATCH_SIZE]
+            ).values_list('history', 'id'))
+
+        missing = [history for history in level if history not in path_ids]
+        if not missing:
+            continue
+        AuctionPath.objects.bulk_create([
+            AuctionPath(
+                parent_id=path_ids[history.rpartition(' ')[0]] if depth else None,
+                call=history.rpartition(' ')[2],
+                depth=depth,
+                history=history
+            )
+            for history in missing
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+        for start in range(0, len(missing), BATCH_SIZE):
+            path_ids.update(AuctionPath.objects.filter(
+                history__in=missing[start:start + BATCH_SIZE]
+            ).values_list('history', 'id'))
+
+    return {history: path_ids[history] for history in histories}
+
+
+def partnership(creator_id: int, partner_id: int) -> tuple:
+    """PathStats key of a session's partners (lower user id first)"""
+    return (min(creator_id, partner_id), max(creator_id, partner_id))
+
+
+def classify(calls: Dict[int, str], creator_id: int, partner_id: int) -> int:
+    """Outcome of a node from the partners' active calls ({user_id: call})"""
+    if creator_id not in calls or partner_id not in calls:
+        return OUTCOME_OPEN
+    return OUTCOME_AGREED if calls[creator_id] == calls[partner_id] else OUTCOME_DIVERGED
+
+
+def apply_deltas(deltas: Dict[tuple, List[int]]) -> None:
+    """
+    Move PathStats counters by {(path_id, partner_a, partner_b): [nodes, agreements, divergences]}.
+
+    Keys with the same delta share one UPDATE, and most writes only produce
+    a handful of distinct deltas.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    PathStats.objects.bulk_create([
+        PathStats(path_id=path_id, partner_a_id=partner_a, partner_b_id=partner_b)
+        for path_id, partner_a, partner_b in deltas
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    keys_by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        keys_by_delta[tuple(delta)].append(key)
+    for (nodes, agreements, divergences), keys in keys_by_delta.items():
+        by_partnership = defaultdict(list)
+        for path_id, partner_a, partner_b in keys:
+            by_partnership[(partner_a, partner_b)].append(path_id)
+        for (partner_a, partner_b), path_ids in by_partnership.items():
+            for start in range(0, len(path_ids), BATCH_SIZE):
+                PathStats.objects.filter(
+                    partner_a_id=partner_a, partner_b_id=partner_b,
+                    path_id__in=path_ids[start:start + BATCH_SIZE]
+                ).update(
+                    nodes=F('nodes') + nodes,
+                    agreements=F('agreements') + agreements,
+                    divergences=F('divergences') + divergences
+                )
+
+
+def refresh_path_stats(node_ids: Iterable[int]) -> int:
+    """
+    Bring the path and PathStats counts of some changed nodes up to date.
+
+    Nodes without a path are interned first. Each node is then reclassified
+    from its partners' active responses and the counters move by the
+    difference from how it was counted before.
+
+    Returns:
+        Number of nodes whose path or outcome changed
+    """
+    node_ids = list(node_ids)
+    changed = 0
+    for start in range(0, len(node_ids), BATCH_SIZE):
+        batch = node_ids[start:start + BATCH_SIZE]
+        nodes = list(Node.objects.filter(id__in=batch).values(
+            'id', 'history', 'path_id', 'path_outcome', 'session__creator_id', 'session__partner_id'
+        ))
+        if not nodes:
+            continue
+
+        unpathed = {node['history'] for node in nodes if node['path_id'] is None}
+        path_ids = intern_paths(unpathed) if unpathed else {}
+
+        calls = defaultdict(dict)
+        for node_id, user_id, call in Response.objects.filter(
+            node_id__in=batch, is_active=True
+        ).values_list('node_id', 'user_id', 'call'):
+            calls[node_id][user_id] = call
+
+        deltas = defaultdict(lambda: [0, 0, 0])
+        updates = []
+        for node in nodes:
+            creator_id, partner_id = node['session__creator_id'], node['session__partner_id']
+            path_id = node['path_id'] or path_ids[node['history']]
+            outcome = classify(calls[node['id']], creator_id, partner_id)
+            old = node['path_outcome']
+            if path_id == node['path_id'] and outcome == old:
+                continue
+
+            delta = deltas[(path_id, *partnership(creator_id, partner_id))]
+            delta[0] += old is None
+            delta[1] += (outcome == OUTCOME_AGREED) - (old == OUTCOME_AGREED)
+            delta[2] += (outcome == OUTCOME_DIVERGED) - (old == OUTCOME_DIVERGED)
+            updates.append(Node(id=node['id'], path_id=path_id, path_outcome=outcome))
+
+        apply_deltas(deltas)
+        # bulk_update skips save(), so this does not mark the nodes changed again
+        Node.objects.bulk_update(updates, ['path', 'path_outcome'], batch_size=BATCH_SIZE)
+        changed += len(updates)
+    return changed
+
+
+def count_new_nodes(nodes: Iterable[Node]) -> None:
+    """
+    Add freshly created nodes to PathStats.
+
+    For bulk writers that set path and path_outcome themselves before
+    bulk_create, instead of having every node reclassified afterwards.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for node in nodes:
+        if node.path_outcome is None:
+            continue
+        delta = deltas[(node.path_id, *partnership(node.session.creator_id, node.session.partner_id))]
+        delta[0] += 1
+        delta[1] += node.path_outcome == OUTCOME_AGREED
+        delta[2] += node.path_outcome == OUTCOME_DIVERGED
+    apply_deltas(deltas)
+
+
+def _session_deltas(session: Session, sign: int) -> Dict[tuple, List[int]]:
+    """PathStats deltas adding (sign 1) or removing (sign -1) a session's counted nodes"""
+    key = partnership(session.creator_id, session.partner_id)
+    counted = Node.objects.filter(session=session, path_outcome__isnull=False).values('path_id').annotate(
+        nodes=Count('id'),
+        agreements=Count('id', filter=Q(path_outcome=OUTCOME_AGREED)),
+        divergences=Count('id', filter=Q(path_outcome=OUTCOME_DIVERGED))
+    ).order_by()
+    return {
+        (row['path_id'], *key): [sign * row['nodes'], sign * row['agreements'], sign * row['divergences']]
+        for row in counted
+    }
+
+
+@shard_atomic()
+def forget_session_paths(session: Session) -> None:
+    """Take a session's nodes out of PathStats (before the session is deleted)"""
+    apply_deltas(_session_deltas(session, -1))
+    Node.objects.filter(session=session).update(path_outcome=None)
+
+
+@shard_atomic()
+def count_session_paths(session: Session) -> None:
+    """Add a session whose nodes were copied in with their path_outcome to PathStats"""
+    apply_deltas(_session_deltas(session, 1))
+
+
+def path_statistics(user, history: str, partner_id: Optional[int] = None) -> Optional[dict]:
+    """
+    Agreement and divergence counts at a path and each of its continuations,
+    over the partnerships of a user (or just the one with `partner_id`).
+
+    Each shard interns and counts its own paths, so the counts are added
+    up over the shards by history.
+
+    Returns:
+        {'history', 'depth', 'nodes', 'agreements', 'divergences',
+         'divergence_rate', 'continuations': [{'call', 'history', ...counts}]}
+        or None if no node anywhere ever reached the path
+    """
+    history = ' '.join(history.split())
+    if partner_id is None:
+        mine = Q(partner_a=user) | Q(partner_b=user)
+    else:
+        mine = Q(partner_a_id=min(user.id, partner_id), partner_b_id=max(user.id, partner_id))
+
+    found = None
+    summary = {'nodes': 0, 'agreements': 0, 'divergences': 0}
+    continuations = {}
+    for _ in for_each_shard():
+        path = AuctionPath.objects.filter(history=history).first()
+        if path is None:
+            continue
+        found = path
+        rows = PathStats.objects.filter(mine).filter(Q(path=path) | Q(path__parent=path)).values(
+            'path_id', 'path__call', 'path__history', 'nodes', 'agreements', 'divergences'
+        )
+        for row in rows:
+            if row['path_id'] == path.id:
+                target = summary
+            else:
+                target = continuations.setdefault(row['path__history'], {
+                    'call': row['path__call'], 'history': row['path__history'],
+                    'nodes': 0, 'agreements': 0, 'divergences': 0
+                })
+            for field in ('nodes', 'agreements', 'divergences'):
+                target[field] += row[field]
+    if found is None:
+        return None
+
+    def rate(counts):
+        answered = counts['agreements'] + counts['divergences']
+        return round(counts['divergences'] / answered, 4) if answered else 0
+
+    for counts in continuations.values():
+        counts['divergence_rate'] = rate(counts)
+    return {
+        'history': found.history,
+        'depth': found.depth,
+        **summary,
+        'divergence_rate': rate(summary),
+        'continuations': sorted(continuations.values(), key=lambda counts: (-counts['nodes'], counts['call'])),
+    }
@@ -1,57 +1,58 @@
 """
 Auction Tree Service for building tree representations of bidding sequences
 """
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat
 from django.contrib.auth import get_user_model
-from ..models import Session, Deal, Node, Response
+from django.utils import timezone
+from ..models import Session, Deal, Node, Response, ResponseAudit, Edge
 from ..utils import get_next_position
+from .participants import participant_bits, participant_names, mask_of, who_needs_for_mask, roles_for_mask
+from .pending_work import refresh_pending_counters
+from .tree_versions import tree_write, mark_nodes_changed, expect_tree_version, retrying_tree_write
+from .tree_upsert import upsert_nodes, upsert_edges
+from .tree_worker import deferring_recompute, schedule_recompute
 
 User = get_user_model()
 
 
 def get_or_create_node(deal: Deal, history: str, seat_to_act: str) -> Node:
     """Get or create a node for the given state (UPSERT with depth)"""
-    # Calculate depth from history
-    depth = len(history.strip().split()) if history.strip() else 0
-    # Determine if auction is closed
-    auction_closed = is_auction_closed(history)
-
-    node, created = Node.objects.get_or_create(
-        deal=deal,
-        history=history,
-        seat_to_act=seat_to_act,
-        defaults={
-            'session': deal.session,
-            'divergence': False,
-            'status': 'closed' if auction_closed else 'open',
-            'depth': depth,
-            'who_needs': 'none' if auction_closed else 'both'  # Closed auctions need no one
-        }
-    )
+    return upsert_nodes(deal, [(history, seat_to_act)])[(history, seat_to_act)]
 
-    # Update depth and status if node already exists
-    if not created:
-        fields_to_update = []
-        if node.depth != depth:
-            node.depth = depth
-            fields_to_update.append('depth')
 
-        # CRITICAL: Update status to reflect current auction state
-        correct_status = 'closed' if auction_closed else 'open'
-        if node.status != correct_status:
-            node.status = correct_status
-            fields_to_update.append('status')
+def get_or_create_root(deal: Deal) -> Node:
+    """
+    A deal's root node, created if the tree has not been started.
 
-        # If auction is closed, no one needs to answer anymore
-        if auction_closed and node.who_needs != 'none':
-            node.who_needs = 'none'
-            fields_to_update.append('who_needs')
+    The root is read first, so a started tree is served without any write
+    (which would pin the reader to the primary, see game.replicas).
+    """
+    root = Node.objects.filter(deal=deal, history='', seat_to_act=deal.dealer).first()
+    if root is not None:
+        return root
+    with tree_write():
+        return get_or_create_node(deal, '', deal.dealer)
 
-        if fields_to_update:
-            node.save(update_fields=fields_to_update)
 
-    return node
+def get_or_create_nodes(deal: Deal, states: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Node]:
+    """
+    Bulk version of get_or_create_node.
+
+    One INSERT ... ON CONFLICT DO NOTHING for all states, one SELECT reading
+    the rows back and at most one bulk UPDATE fixing their depth/status
+    (see services.tree_upsert).
+
+    Args:
+        deal: The deal the nodes belong to
+        states: (history, seat_to_act) pairs
+
+    Returns:
+        {(history, seat_to_act): Node}
+    """
+    return upsert_nodes(deal, states)
 
 
 def is_auction_closed(history: str) -> bool:
@@ -90,6 +91,41 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
     """
     Build the auction tree for a specific deal.
     Returns a tree JSON structure with nodes and edges.
+
+    Node ids are stable ('n_<node pk>'). The tree and each node carry a
+    'version'; passing the tree version back as since_version to
+    build_tree_delta returns only what changed afterwards.
+
+    A tree whose stored state is up to date is read without a transaction
+    (so a replica can answer); otherwise update_auction_tree brings it up
+    to date first.
+    """
+    deal = Deal.objects.filter(
+        session_id=session_id, deal_number=deal_index
+    ).select_related('session').first()
+    if deal is not None:
+        from .tree_stream import read_current_tree
+        tree = read_current_tree(deal.session, deal)
+        if tree is not None:
+            return tree
+
+    tree = update_auction_tree(session_id, deal_index)
+    if 'error' in tree:
+        return tree
+
+    deal_id, tree['version'] = Deal.objects.filter(
+        session_id=session_id, deal_number=deal_index
+    ).values_list('id', 'tree_version').get()
+    versions = dict(Node.objects.filter(deal_id=deal_id).values_list('id', 'version'))
+    for node_json in tree['nodes'].values():
+        node_json['version'] = versions.get(node_json['db_id'], 0)
+    return tree
+
+
+@tree_write()
+def update_auction_tree(session_id: int, deal_index: int) -> dict:
+    """
+    Bring a deal's stored tree up to date and return its JSON (without versions).
     """
     try:
         session = Session.objects.get(id=session_id)
@@ -97,13 +133,9 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
     except (Session.DoesNotExist, Deal.DoesNotExist):
         return {'error': 'Session or deal not found'}
 
-    # Get users involved
-    creator = session.creator
-    partner = session.partner
-
-    # Get display names
-    creator_name = creator.username or creator.email.split('@')[0]
-    partner_name = partner.username or partner.email.split('@')[0]
+    # Participants' bits and display names
+    bits = participant_bits(session)
+    names = participant_names(session)
 
     # Initialize tree structure
     tree = {
@@ -117,9 +149,7 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
     }
 
     # Process nodes - start with root
-    root_history = ""
-    root_seat = deal.dealer
-    root_node = get_or_create_node(deal, root_history, root_seat)
+    root_node = get_or_create_root(deal)
 
     # CRITICAL: Update all existing nodes' status and who_needs FIRST
     # This ensures the tree reflects the current auction state correctly
@@ -133,23 +163,25 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
             node.status = correct_status
             fields_to_update.append('status')
 
-        if auction_closed and node.who_needs != 'none':
+        if auction_closed and (node.who_needs != 'none' or node.needs_mask):
             node.who_needs = 'none'
-            fields_to_update.append('who_needs')
+            node.needs_mask = 0
+            fields_to_update.extend(['who_needs', 'needs_mask'])
 
         if fields_to_update:
             node.save(update_fields=fields_to_update)
 
-    # Use a deterministic node ID based on the state
-    node_id_map = {}
-    node_counter = [0]  # Use a list to avoid nonlocal issues
+    # Stored edges, so that only new or changed ones are written
+    stored_edges = {
+        (from_id, call): (to_id, by_mask)
+        for from_id, call, to_id, by_mask in Edge.objects.filter(deal=deal).values_list(
+            'from_node_id', 'call', 'to_node_id', 'by_mask'
+        )
+    }
 
+    # Use the stable, database-backed node ID
     def get_node_id(node: Node) -> str:
-        key = f"{node.history}_{node.seat_to_act}"
-        if key not in node_id_map:
-            node_id_map[key] = f"n_{node_counter[0]}"
-            node_counter[0] += 1
-        return node_id_map[key]
+        return node.stable_id
 
     # Set root
     root_id = get_node_id(root_node)
@@ -177,7 +209,8 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
             'seat': current_node.seat_to_act,
             'divergence': False,  # Will be set based on responses
             'status': current_node.status,
-            'who_needs': current_node.who_needs  # Add who_needs for coloring
+            'who_needs': current_node.who_needs,  # Add who_needs for coloring
+            'needs_mask': current_node.needs_mask
         }
 
         # CRITICAL: If auction is closed at this node, don't process responses or create child nodes
@@ -185,64 +218,53 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
             continue
 
         # Get responses at this node (only active responses)
-        responses = Response.objects.filter(node=current_node, is_active=True).select_related('user')
+        responses = Response.objects.filter(node=current_node, is_active=True)
 
-        # Group responses by call
+        # Group responding users by call
         call_groups = {}
         for response in responses:
-            if response.call not in call_groups:
-                call_groups[response.call] = []
-
-            # Map user to display name
-            if response.user == creator:
-                display_name = creator_name
-            elif response.user == partner:
-                display_name = partner_name
-            else:
-                display_name = response.user.username
-
-            call_groups[response.call].append(display_name)
+            call_groups.setdefault(response.call, []).append(response.user_id)
 
         # Check for divergence (more than one distinct call)
         if len(call_groups) > 1:
             tree['nodes'][current_id]['divergence'] = True
-            current_node.divergence = True
-            current_node.save(update_fields=['divergence'])
+            if not current_node.divergence:
+                current_node.divergence = True
+                current_node.save(update_fields=['divergence'])
+
+        # Upsert every child node, then every edge, of this node in one statement each
+        child_seat = get_next_seat(current_node.seat_to_act)
+        child_states = {
+            call: ((current_node.history + ' ' + call).strip(), child_seat)
+            for call in call_groups
+        }
+        children = get_or_create_nodes(deal, list(child_states.values()))
+        transitions = [
+            (current_node, children[child_states[call]], call, mask_of(user_ids, bits))
+            for call, user_ids in call_groups.items()
+        ]
+        upsert_edges(deal, [
+            (from_node, to_node, call, by_mask)
+            for from_node, to_node, call, by_mask in transitions
+            if stored_edges.get((from_node.id, call)) != (to_node.id, by_mask)
+        ])
 
         # Create edges for each call
-        for call, users in call_groups.items():
-            # Compute child state
-            child_history = (current_node.history + ' ' + call).strip()
-            child_seat = get_next_seat(current_node.seat_to_act)
-
-            # Get or create child node
-            child_node = get_or_create_node(deal, child_history, child_seat)
+        for call, user_ids in call_groups.items():
+            child_node = children[child_states[call]]
             child_id = get_node_id(child_node)
 
-            # Determine by_set based on who made this call
-            by_set = []
-            if creator_name in users:
-                by_set.append('creator')
-            if partner_name in users:
-                by_set.append('partner')
-
-            # Create/update Edge record in database
-            from ..models import Edge
-            Edge.objects.update_or_create(
-                session=deal.session,
-                deal=deal,
-                from_node=current_node,
-                to_node=child_node,
-                call=call,
-                defaults={'by_set': by_set}
-            )
+            # Determine by_mask/by_set based on who made this call
+            by_mask = mask_of(user_ids, bits)
+            by_set = roles_for_mask(by_mask)
 
             # Add edge to tree JSON
             edge = {
                 'from': current_id,
                 'call': call,
-                'by': sorted(users),  # Sort for consistency
+                'by': sorted(names.get(user_id, str(user_id)) for user_id in user_ids),  # Sort for consistency
                 'by_set': by_set,  # Add by_set to JSON response
+                'by_mask': by_mask,
                 'to': child_id
             }
             tree['edges'].append(edge)
@@ -262,7 +284,8 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
                 'seat': node.seat_to_act,
                 'divergence': node.divergence,
                 'status': node.status,
-                'who_needs': node.who_needs  # Add who_needs for coloring
+                'who_needs': node.who_needs,  # Add who_needs for coloring
+                'needs_mask': node.needs_mask
             }
 
     # Update status and who_needs for all nodes to ensure consistency
@@ -277,9 +300,10 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
             fields_to_update.append('status')
 
         # If auction closed, who_needs should be 'none'
-        if auction_closed and node.who_needs != 'none':
+        if auction_closed and (node.who_needs != 'none' or node.needs_mask):
             node.who_needs = 'none'
-            fields_to_update.append('who_needs')
+            node.needs_mask = 0
+            fields_to_update.extend(['who_needs', 'needs_mask'])
 
         if fields_to_update:
             node.save(update_fields=fields_to_update)
@@ -294,10 +318,488 @@ def build_auction_tree(session_id: int, deal_index: int) -> dict:
         if node_id in tree['nodes']:
             tree['nodes'][node_id]['status'] = node.status
             tree['nodes'][node_id]['who_needs'] = node.who_needs
+            tree['nodes'][node_id]['needs_mask'] = node.needs_mask
+
+    refresh_pending_counters(session, [deal])
 
     return tree
 
 
+def stored_tree_fragment(session: Session, deal: Deal, nodes: List[Node],
+                         expanded: Optional[Set[int]] = None) -> Tuple[dict, list]:
+    """
+    Node and edge JSON for some stored nodes, in the shape of build_auction_tree.
+
+    Reads the active responses of the nodes and the ids of their children
+    with two queries. Outgoing edges are only emitted for nodes in
+    `expanded` (default: all).
+
+    Returns:
+        ({node_id: node JSON}, [edge JSON])
+    """
+    bits = participant_bits(session)
+    names = participant_names(session)
+    if expanded is None:
+        expanded = {node.id for node in nodes}
+
+    calls_by_node = {}
+    active = Response.objects.filter(
+        node__in=[node.id for node in nodes],
+        is_active=True
+    ).values_list('node_id', 'user_id', 'call')
+    for node_id, user_id, call in active:
+        calls_by_node.setdefault(node_id, {})[user_id] = call
+
+    # Child nodes the edges point to (they need not be among `nodes`)
+    child_states = {
+        ((node.history + ' ' + call).strip(), get_next_seat(node.seat_to_act))
+        for node in nodes if node.id in expanded and node.status != 'closed'
+        for call in calls_by_node.get(node.id, {}).values()
+    }
+    child_ids = {}
+    if child_states:
+        children = Node.objects.filter(
+            deal=deal, history__in={history for history, _ in child_states}
+        ).values_list('history', 'seat_to_act', 'id')
+        child_ids = {(history, seat): node_id for history, seat, node_id in children}
+
+    nodes_json, edges = {}, []
+    for node in nodes:
+        node_calls = calls_by_node.get(node.id, {})
+        nodes_json[node.stable_id] = {
+            'db_id': node.id,
+            'history': node.history,
+            'seat': node.seat_to_act,
+            'divergence': len(set(node_calls.values())) > 1,
+            'status': node.status,
+            'who_needs': node.who_needs,
+            'needs_mask': node.needs_mask,
+            'version': node.version
+        }
+        if node.id not in expanded or node.status == 'closed':
+            continue
+
+        call_groups = {}
+        for user_id, call in node_calls.items():
+            call_groups.setdefault(call, []).append(user_id)
+        for call, user_ids in call_groups.items():
+            child_id = child_ids.get(((node.history + ' ' + call).strip(), get_next_seat(node.seat_to_act)))
+            by_mask = mask_of(user_ids, bits)
+            edges.append({
+                'from': node.stable_id,
+                'call': call,
+                'by': sorted(names.get(user_id, str(user_id)) for user_id in user_ids),
+                'by_set': roles_for_mask(by_mask),
+                'by_mask': by_mask,
+                'to': f"n_{child_id}" if child_id else None
+            })
+
+    return nodes_json, edges
+
+
+def branch_range(history: str) -> dict:
+    """
+    Filter kwargs selecting the descendants of the node with `history`.
+
+    Descendants' histories start with the history followed by a space, i.e.
+    lie in [history + ' ', history + '!'), which an index on history can
+    serve as a range (LIKE 'prefix%' cannot use it on SQLite).
+    """
+    if not history:
+        return {}
+    return {'history__gte': history + ' ', 'history__lt': history + '!'}
+
+
+def with_child_counts(queryset: models.QuerySet) -> models.QuerySet:
+    """
+    Annotate non-root nodes with 'child_nodes', the number of stored nodes
+    one call deeper on their branch, using a correlated range query per node.
+    """
+    children = Node.objects.filter(
+        deal=OuterRef('deal'),
+        depth=OuterRef('depth') + 1,
+        history__gte=Concat(OuterRef('history'), Value(' '), output_field=TextField()),
+        history__lt=Concat(OuterRef('history'), Value('!'), output_field=TextField())
+    )
+    return queryset.annotate(child_nodes=Coalesce(
+        Subquery(
+            children.order_by().values('deal').annotate(count=Count('pk')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    ))
+
+
+def get_root_node_id(deal: Deal) -> Optional[int]:
+    """Primary key of a deal's root node, if the tree has been started"""
+    return Node.objects.filter(
+        deal=deal, history='', seat_to_act=deal.dealer
+    ).values_list('id', flat=True).first()
+
+
+def build_tree_delta(session: Session, deal: Deal, since_version: int) -> dict:
+    """
+    Build the part of a deal's tree that changed after `since_version`.
+
+    Returns the nodes whose version is greater than since_version and the
+    outgoing edges of those nodes, with the same ids and fields as
+    build_auction_tree. Clients merge the nodes into their copy of the tree,
+    replace the outgoing edges of every returned node, and keep 'version' for
+    the next request.
+
+    Args:
+        session: The session the deal belongs to
+        deal: The deal (its tree_version is read before the nodes)
+        since_version: The tree version the client already has
+
+    Returns:
+        Delta tree JSON structure ('delta': True)
+    """
+    root_id = get_root_node_id(deal)
+    changed = list(Node.objects.filter(deal=deal, version__gt=since_version).order_by('depth', 'id'))
+    nodes_json, edges = stored_tree_fragment(session, deal, changed)
+
+    return {
+        'session_id': session.id,
+        'deal_index': deal.deal_number,
+        'dealer': deal.dealer,
+        'vul': deal.vulnerability,
+        'root': f"n_{root_id}" if root_id else None,
+        'version': deal.tree_version,
+        'since_version': since_version,
+        'delta': True,
+        'nodes': nodes_json,
+        'edges': edges
+    }
+
+
+def build_auction_subtree(session: Session, deal: Deal, root: Node, depth: int,
+                          cursor: Optional[Tuple[int, str]] = None, limit: int = 200) -> dict:
+    """
+    Build one page of the subtree below `root`, down to `depth` calls deeper.
+
+    Descendants are read with a range query on history (every descendant's
+    history starts with the root's history followed by a space) in
+    (depth, history) order, so a page is continued with a keyset cursor
+    rather than an offset. Every node carries its 'child_count' (stored child
+    nodes). Nodes on the depth limit are collapsed: they have no outgoing
+    edges and 'has_more' is true when they have children, which are fetched
+    by requesting the subtree rooted at them.
+
+    Args:
+        session: The session the deal belongs to
+        deal: The deal
+        root: Node the subtree starts at (included on the first page)
+        depth: Number of levels below the root to include
+        cursor: (depth, history) of the last node of the previous page
+        limit: Maximum number of nodes in the page
+
+    Returns:
+        Subtree JSON structure with 'next_cursor' ((depth, history) or None)
+    """
+    max_depth = root.depth + depth
+    descendants = Node.objects.filter(
+        deal=deal, depth__gt=root.depth, depth__lte=max_depth, **branch_range(root.history)
+    )
+    if cursor is not None:
+        last_depth, last_history = cursor
+        descendants = descendants.filter(
+            models.Q(depth__gt=last_depth) | models.Q(depth=last_depth, history__gt=last_history)
+        )
+
+    page = list(with_child_counts(descendants).order_by('depth', 'history')[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = (page[-1].depth, page[-1].history)
+    if cursor is None:
+        root.child_nodes = Node.objects.filter(
+            deal=deal, depth=root.depth + 1, **branch_range(root.history)
+        ).count()
+        page.insert(0, root)
+
+    nodes_json, edges = stored_tree_fragment(
+        session, deal, page,
+        expanded={node.id for node in page if node.depth < max_depth}
+    )
+    for node in page:
+        node_json = nodes_json[node.stable_id]
+        node_json['child_count'] = node.child_nodes
+        node_json['has_more'] = node.depth >= max_depth and node.child_nodes > 0
+
+    return {
+        'session_id': session.id,
+        'deal_index': deal.deal_number,
+        'dealer': deal.dealer,
+        'vul': deal.vulnerability,
+        'root': root.stable_id,
+        'depth': depth,
+        'version': deal.tree_version,
+        'nodes': nodes_json,
+        'edges': edges,
+        'next_cursor': next_cursor
+    }
+
+
+def answer_masks(responses_by_node: Dict[tuple, Dict[int, str]],
+                 bits: Dict[int, int]) -> Dict[tuple, Dict[str, int]]:
+    """
+    Group active responses into participant masks per call.
+
+    Args:
+        responses_by_node: {(history, seat): {user_id: call}} of active responses
+        bits: {user_id: bit} of the session's participants
+
+    Returns:
+        {(history, seat): {call: mask of the participants who made it}}
+    """
+    call_masks = {}
+    for state, answers in responses_by_node.items():
+        masks = call_masks[state] = {}
+        for user_id, call in answers.items():
+            masks[call] = masks.get(call, 0) | bits.get(user_id, 0)
+    return call_masks
+
+
+def subtree_answer_masks(call_masks: Dict[tuple, Dict[str, int]]) -> Dict[str, int]:
+    """
+    Mask of the participants who answered at or below each history.
+
+    Masks are folded into parents one level at a time, deepest first, so
+    the whole map costs O(answered nodes) rather than a scan per node.
+
+    Returns:
+        {history: mask}
+    """
+    masks, levels = {}, {}
+    for (history, _), calls in call_masks.items():
+        for mask in calls.values():
+            masks[history] = masks.get(history, 0) | mask
+        levels.setdefault(len(history.split()), set()).add(history)
+
+    for depth in range(max(levels, default=0), 0, -1):
+        parents = levels.setdefault(depth - 1, set())
+        for history in levels.get(depth, ()):
+            parent = history.rpartition(' ')[0]
+            masks[parent] = masks.get(parent, 0) | masks[history]
+            parents.add(parent)
+    return masks
+
+
+def derive_needs_mask(history: str, seat_to_act: str, dealer: str, everyone: int,
+                      call_masks: Dict[tuple, Dict[str, int]],
+                      subtree_masks: Dict[str, int]) -> int:
+    """
+    In-memory equivalent of update_node_who_needs, over participant bitmasks.
+
+    Args:
+        history: History of the node
+        seat_to_act: Seat to act at the node
+        dealer: Dealer of the deal
+        everyone: Session.participant_mask
+        call_masks: answer_masks() of the deal's active responses
+        subtree_masks: subtree_answer_masks() of call_masks
+
+    Returns:
+        Mask of the participants who still need to answer the node
+    """
+    if is_auction_closed(history):
+        return 0
+
+    answered = 0
+    for mask in call_masks.get((history, seat_to_act), {}).values():
+        answered |= mask
+    needs = everyone & ~answered
+
+    # Same-seat no-follow: find the closest same-seat divergence ancestor
+    calls = history.split() if history else []
+    seat = dealer
+    seats_at_depth = [dealer]
+    for _ in calls:
+        seat = get_next_seat(seat)
+        seats_at_depth.append(seat)
+
+    for i in range(len(calls) - 1, -1, -1):
+        if seats_at_depth[i] != seat_to_act:
+            continue
+        ancestor_history = ' '.join(calls[:i])
+        ancestor_calls = call_masks.get((ancestor_history, seat_to_act), {})
+        if len(ancestor_calls) < 2:
+            continue
+
+        choosers = ancestor_calls.get(calls[i], 0)
+        if choosers and not choosers & (choosers - 1):
+            # A single participant chose this branch: the others are exempt
+            # unless they answered somewhere from the divergence down
+            others = everyone & ~choosers
+            needs &= ~(others & ~subtree_masks.get(ancestor_history, 0))
+        break
+
+    return needs
+
+
+def assemble_auction_tree(session: Session, deal: Deal, nodes: List[Node],
+                          responses_by_node: Dict[tuple, Dict[int, str]]) -> dict:
+    """
+    Build the tree JSON from already-loaded nodes and responses without
+    touching the database. Produces the same shape as build_auction_tree.
+
+    Args:
+        session: The session the deal belongs to
+        deal: The deal
+        nodes: Node rows to include
+        responses_by_node: {(history, seat): {user_id: call}} of active responses
+
+    Returns:
+        Tree JSON structure with nodes and edges
+    """
+    bits = participant_bits(session)
+    names = participant_names(session)
+    call_masks = answer_masks(responses_by_node, bits)
+    subtree_masks = subtree_answer_masks(call_masks)
+
+    tree = {
+        'session_id': session.id,
+        'deal_index': deal.deal_number,
+        'dealer': deal.dealer,
+        'vul': deal.vulnerability,
+        'root': None,
+        'nodes': {},
+        'edges': []
+    }
+
+    nodes_by_state = {(node.history, node.seat_to_act): node for node in nodes}
+
+    def get_node_id(state: tuple) -> str:
+        node = nodes_by_state.get(state)
+        if node is not None:
+            return node.stable_id
+        # State without a stored node (e.g. in a historical tree)
+        history, seat = state
+        return f"s_{seat}_{history.replace(' ', '-')}"
+
+    def node_json(state: tuple) -> dict:
+        history, seat = state
+        node = nodes_by_state.get(state)
+        closed = is_auction_closed(history)
+        needs_mask = derive_needs_mask(
+            history, seat, deal.dealer, session.participant_mask, call_masks, subtree_masks
+        )
+        return {
+            'db_id': node.id if node else None,
+            'history': history,
+            'seat': seat,
+            'divergence': len(call_masks.get(state, {})) > 1,
+            'status': 'closed' if closed else 'open',
+            'who_needs': who_needs_for_mask(needs_mask),
+            'needs_mask': needs_mask
+        }
+
+    root_state = ('', deal.dealer)
+    tree['root'] = get_node_id(root_state)
+
+    queue = [root_state]
+    processed = set()
+    while queue:
+        state = queue.pop(0)
+        if state in processed:
+            continue
+        processed.add(state)
+
+        state_id = get_node_id(state)
+        tree['nodes'][state_id] = node_json(state)
+        if tree['nodes'][state_id]['status'] == 'closed':
+            continue
+
+        call_groups = {}
+        for user_id, call in responses_by_node.get(state, {}).items():
+            call_groups.setdefault(call, []).append(user_id)
+
+        history, seat = state
+        for call, user_ids in call_groups.items():
+            child_state = ((history + ' ' + call).strip(), get_next_seat(seat))
+            by_mask = call_masks[state][call]
+            tree['edges'].append({
+                'from': state_id,
+                'call': call,
+                'by': sorted(names.get(user_id, str(user_id)) for user_id in user_ids),
+                'by_set': roles_for_mask(by_mask),
+                'by_mask': by_mask,
+                'to': get_node_id(child_state)
+            })
+            if child_state not in processed:
+                queue.append(child_state)
+
+    # Nodes that exist but were not reached from the root
+    for state in nodes_by_state:
+        state_id = get_node_id(state)
+        if state_id not in tree['nodes']:
+            tree['nodes'][state_id] = node_json(state)
+
+    return tree
+
+
+def refresh_derived_state(session: Session, deal: Deal) -> int:
+    """
+    Recompute depth, divergence, status and needs for every node of a
+    deal in memory and write back only the rows that changed.
+
+    Uses two reads and one bulk update regardless of tree size, so it is the
+    preferred recompute after bulk writes (imports, batch submissions).
+
+    Returns:
+        Number of nodes updated
+    """
+    changed = derived_state_changes(session, deal, list(Node.objects.filter(deal=deal)))
+    if changed:
+        Node.objects.bulk_update(
+            changed, ['depth', 'divergence', 'status', 'who_needs', 'needs_mask'], batch_size=500
+        )
+        mark_nodes_changed(deal.id, [node.id for node in changed])
+    refresh_pending_counters(session, [deal])
+
+    return len(changed)
+
+
+def derived_state_changes(session: Session, deal: Deal, nodes: Iterable[Node]) -> List[Node]:
+    """
+    Recompute the derived fields of a deal's nodes from its active responses
+    (one read) and set them on the nodes whose stored values differ.
+
+    Returns:
+        The nodes that changed (not saved)
+    """
+    responses_by_node = {}
+    active = Response.objects.filter(
+        node__deal=deal,
+        is_active=True
+    ).values_list('node__history', 'node__seat_to_act', 'user_id', 'call')
+    for history, seat, user_id, call in active:
+        responses_by_node.setdefault((history, seat), {})[user_id] = call
+    call_masks = answer_masks(responses_by_node, participant_bits(session))
+    subtree_masks = subtree_answer_masks(call_masks)
+
+    changed = []
+    for node in nodes:
+        state = (node.history, node.seat_to_act)
+        needs_mask = derive_needs_mask(
+            node.history, node.seat_to_act, deal.dealer, session.participant_mask,
+            call_masks, subtree_masks
+        )
+        derived = {
+            'depth': len(node.history.split()),
+            'divergence': len(call_masks.get(state, {})) > 1,
+            'status': 'closed' if is_auction_closed(node.history) else 'open',
+            'who_needs': who_needs_for_mask(needs_mask),
+            'needs_mask': needs_mask,
+        }
+        if any(getattr(node, field) != value for field, value in derived.items()):
+            for field, value in derived.items():
+                setattr(node, field, value)
+            changed.append(node)
+    return changed
+
+
 def find_divergence_ancestry(node: Node) -> Optional[Node]:
     """
     Find the closest ancestor divergence node with the same seat as this node.
@@ -336,118 +838,89 @@ def find_divergence_ancestry(node: Node) -> Optional[Node]:
     return None
 
 
-def get_branch_owner_for_same_seat_no_follow(node: Node, divergence_node: Node) -> Optional[str]:
+def get_branch_choosers_mask(node: Node, divergence_node: Node, bits: Dict[int, int]) -> int:
     """
     Given a node and its ancestor divergence node with the same seat,
-    determine which user 'owns' the branch (i.e., made the choice at divergence
-    that leads to this node) and should be exempted from answering.
+    determine which participants made the choice at the divergence that
+    leads to this node's branch.
 
-    Returns: 'creator', 'partner', or None
+    Returns: mask of the choosing participants (0 if none)
     """
-    session = node.deal.session
-
-    # Find the call that was made from divergence_node to lead to this node's branch
-    # The branch is determined by the first call after divergence_node
-
     div_history_calls = divergence_node.history.strip().split() if divergence_node.history else []
     node_history_calls = node.history.strip().split()
 
     if len(node_history_calls) <= len(div_history_calls):
-        return None
+        return 0
 
     # The call that creates the branch is the one immediately after divergence
     branch_call = node_history_calls[len(div_history_calls)]
 
     # Find which user(s) made this call at the divergence node
-    # Check responses at divergence_node
-    responses_at_div = Response.objects.filter(
+    choosers = Response.objects.filter(
         node=divergence_node,
         call=branch_call,
         is_active=True
-    ).select_related('user')
-
-    # If exactly one user made this call, they own this branch
-    users_who_chose = [r.user for r in responses_at_div]
+    ).values_list('user_id', flat=True)
 
-    if len(users_who_chose) == 1:
-        user = users_who_chose[0]
-        if user == session.creator:
-            return 'creator'
-        elif user == session.partner:
-            return 'partner'
-
-    return None
+    return mask_of(choosers, bits)
 
 
 def update_node_who_needs(node: Node) -> None:
     """
-    Update who_needs field based on active responses and same-seat no-follow rule.
+    Update needs_mask (and its who_needs projection) based on active responses
+    and the same-seat no-follow rule.
 
-    Same-seat no-follow: After a divergence at seat S, if a user chose a branch,
-    the OTHER user is exempted from answering future S-seat nodes on that branch.
+    Same-seat no-follow: After a divergence at seat S, if a single participant
+    chose a branch, the OTHER participants are exempted from answering future
+    S-seat nodes on that branch.
     Rationale: Don't force a player to continue along a line they did not endorse.
 
-    IMPORTANT: Exemption only applies if the user has NOT made any responses on this branch.
+    IMPORTANT: Exemption only applies if the participant has NOT made any responses on this branch.
     If they have participated in the branch, they should continue answering.
     """
     # CRITICAL: If auction is closed at this node, no one needs to answer
     if is_auction_closed(node.history):
-        if node.who_needs != 'none':
+        if node.who_needs != 'none' or node.needs_mask:
             node.who_needs = 'none'
-            node.save(update_fields=['who_needs'])
+            node.needs_mask = 0
+            node.save(update_fields=['who_needs', 'needs_mask'])
         return
 
     session = node.session
-    active_responses = Response.objects.filter(node=node, is_active=True)
-
-    creator_answered = active_responses.filter(user=session.creator).exists()
-    partner_answered = active_responses.filter(user=session.partner).exists()
+    bits = participant_bits(session)
+    answered = mask_of(
+        Response.objects.filter(node=node, is_active=True).values_list('user_id', flat=True),
+        bits
+    )
 
-    # Start with basic logic
-    needs_creator = not creator_answered
-    needs_partner = not partner_answered
+    # Start with basic logic: everyone who has not answered yet
+    needs = session.participant_mask & ~answered
 
     # Apply same-seat no-follow rule
     divergence_ancestor = find_divergence_ancestry(node)
 
     if divergence_ancestor and divergence_ancestor.seat_to_act == node.seat_to_act:
         # Same seat as divergence - check if exemption applies
-        branch_owner = get_branch_owner_for_same_seat_no_follow(node, divergence_ancestor)
-
-        # CRITICAL: Only exempt if the user hasn't participated in this branch
-        # Check if the non-owner has made any responses on this branch path
-        if branch_owner == 'creator':
-            # Creator owns branch - check if partner has participated
-            partner_participated = Response.objects.filter(
-                node__deal=node.deal,
-                node__history__startswith=divergence_ancestor.history if divergence_ancestor.history else '',
-                user=session.partner,
-                is_active=True
-            ).exists()
-            if not partner_participated:
-                needs_partner = False  # Exempt partner only if they haven't participated
-        elif branch_owner == 'partner':
-            # Partner owns branch - check if creator has participated
-            creator_participated = Response.objects.filter(
-                node__deal=node.deal,
-                node__history__startswith=divergence_ancestor.history if divergence_ancestor.history else '',
-                user=session.creator,
-                is_active=True
-            ).exists()
-            if not creator_participated:
-                needs_creator = False  # Exempt creator only if they haven't participated
-
-    # Set who_needs based on final determination
-    if not needs_creator and not needs_partner:
-        node.who_needs = 'none'
-    elif needs_creator and needs_partner:
-        node.who_needs = 'both'
-    elif needs_creator:
-        node.who_needs = 'creator'
-    else:  # needs_partner
-        node.who_needs = 'partner'
-
-    node.save(update_fields=['who_needs'])
+        choosers = get_branch_choosers_mask(node, divergence_ancestor, bits)
+
+        # CRITICAL: Only exempt the participants who haven't participated in this branch
+        if choosers and not choosers & (choosers - 1):
+            participated = mask_of(
+                Response.objects.filter(
+                    node__deal=node.deal,
+                    node__history__startswith=divergence_ancestor.history if divergence_ancestor.history else '',
+                    is_active=True
+                ).values_list('user_id', flat=True).distinct(),
+                bits
+            )
+            needs &= ~(session.participant_mask & ~choosers & ~participated)
+
+    # Only write (and bump the node's version) when the value changes
+    who_needs = who_needs_for_mask(needs)
+    if node.needs_mask != needs or node.who_needs != who_needs:
+        node.needs_mask = needs
+        node.who_needs = who_needs
+        node.save(update_fields=['who_needs', 'needs_mask'])
 
 
 def update_descendants_who_needs(node: Node) -> None:
@@ -473,13 +946,17 @@ def update_descendants_who_needs(node: Node) -> None:
             update_node_who_needs(desc)
 
 
+@retrying_tree_write
 def record_user_response(session_id: int, deal_index: int, user_id: int,
                          history: str, seat_to_act: str, call: str) -> Response:
     """
     Record a user's response at a specific node.
     This is called when a user makes a bid in their sequence.
-    Supports concurrency via UPSERT and who_needs update.
+    Supports concurrency via UPSERT and who_needs update: the write commits
+    only if the deal's tree_version is unchanged since it was read, and is
+    run again on the partner's committed state otherwise.
     Also creates child node to ensure it's available for scheduling.
+    With a tree worker (TREE_WORKER_MODE) the derived state is left to it.
     """
     try:
         session = Session.objects.get(id=session_id)
@@ -487,16 +964,46 @@ def record_user_response(session_id: int, deal_index: int, user_id: int,
         user = User.objects.get(id=user_id)
     except (Session.DoesNotExist, Deal.DoesNotExist, User.DoesNotExist):
         return None
+    expect_tree_version(deal.id, deal.tree_version)
 
-    # Get or create the node (UPSERT)
-    node = get_or_create_node(deal, history, seat_to_act)
+    # Get or create the node and the child the call leads to (one UPSERT)
+    child_history = (history + ' ' + call).strip()
+    child_seat = get_next_seat(seat_to_act)
+    nodes = get_or_create_nodes(deal, [(history, seat_to_act), (child_history, child_seat)])
+    node = nodes[(history, seat_to_act)]
 
     # Record the response (update if exists)
-    response, created = Response.objects.update_or_create(
-        node=node,
-        user=user,
-        defaults={'call': call, 'is_active': True}
-    )
+    response = Response.objects.filter(node=node, user=user).first()
+    if response is None:
+        response = Response.objects.create(node=node, user=user, call=call)
+    elif not response.is_active or response.call != call:
+        if response.is_active:
+            # Keep the replaced call in the audit trail for historical views
+            ResponseAudit.objects.create(
+                response=response,
+                user=user,
+                node=node,
+                session=session,
+                deal=deal,
+                old_call=response.call,
+                action='REPLACE',
+                metadata={'answered_at': response.timestamp.isoformat(), 'new_call': call}
+            )
+        # (Re)activation starts a new active interval for this response
+        response.call = call
+        response.is_active = True
+        response.superseded_at = None
+        response.superseded_by_action = None
+        response.timestamp = timezone.now()
+        response.save()
+
+    # Append to the deal's event log so the tree can be replayed later
+    from .event_log import append_event
+    append_event(deal, user, 'CALL', node.history, node.seat_to_act, call=call)
+
+    if deferring_recompute():
+        schedule_recompute(deal.id)
+        return response
 
     # Check if we need to update divergence
     all_responses = Response.objects.filter(node=node, is_active=True)
@@ -518,11 +1025,112 @@ def record_user_response(session_id: int, deal_index: int, user_id: int,
     # CRITICAL: Always create child node after a response
     # Even if the child node closes the auction, we need it in the tree
     # Closed nodes will be properly marked and won't have their own children
-    child_history = (node.history + ' ' + call).strip()
-    child_seat = get_next_seat(node.seat_to_act)
-    child_node = get_or_create_node(deal, child_history, child_seat)
+    # (upserted above together with the node)
+    child_node = nodes[(child_history, child_seat)]
+    if divergence_just_created:
+        # update_descendants_who_needs may have rewritten it meanwhile
+        child_node.refresh_from_db()
     # Update child's who_needs to reflect current state
     # If child is closed, update_node_who_needs will set who_needs='none'
     update_node_who_needs(child_node)
 
-    return response
\ No newline at end of file
+    refresh_pending_counters(session, [deal])
+
+    return response
+
+
+@retrying_tree_write
+def record_user_responses(session: Session, deal: Deal, user, history: str,
+                          calls: List[Tuple[str, str]]) -> List[Response]:
+    """
+    Record a line of consecutive calls by one user in a single pass.
+
+    Bulk counterpart of record_user_response: nodes and responses along the
+    line are upserted with bulk queries and divergence/who_needs are
+    recomputed once for the whole line instead of once per call.
+
+    Args:
+        session: The session
+        deal: The deal
+        user: The user making the calls
+        history: History of the node where the first call is made
+        calls: (seat_to_act, call) pairs in auction order
+
+    Returns:
+        The recorded Response objects, in call order
+    """
+    from .event_log import append_events
+    from .rewind_helpers import recompute_all_for_nodes
+
+    expect_tree_version(deal.id)
+
+    # Node state at which each call is made, plus the final child node
+    steps = []
+    current_history = history
+    for seat_to_act, call in calls:
+        steps.append((current_history, seat_to_act, call))
+        current_history = (current_history + ' ' + call).strip()
+    final_state = (current_history, get_next_seat(steps[-1][1]))
+
+    nodes = get_or_create_nodes(
+        deal,
+        [(step_history, seat) for step_history, seat, _ in steps] + [final_state]
+    )
+    line_nodes = [nodes[(step_history, seat)] for step_history, seat, _ in steps]
+
+    existing = {
+        response.node_id: response
+        for response in Response.objects.filter(node__in=line_nodes, user=user).order_by('-id')
+    }
+
+    now = timezone.now()
+    to_create, to_update, audits = [], [], []
+    responses = []
+    for node, (_, _, call) in zip(line_nodes, steps):
+        response = existing.get(node.id)
+        if response is None:
+            response = Response(node=node, user=user, call=call)
+            to_create.append(response)
+        elif not response.is_active or response.call != call:
+            if response.is_active:
+                audits.append(ResponseAudit(
+                    response=response,
+                    user=user,
+                    node=node,
+                    session=session,
+                    deal=deal,
+                    old_call=response.call,
+                    action='REPLACE',
+                    metadata={'answered_at': response.timestamp.isoformat(), 'new_call': call}
+                ))
+            response.call = call
+            response.is_active = True
+            response.superseded_at = None
+            response.superseded_by_action = None
+            response.timestamp = now
+            to_update.append(response)
+        responses.append(response)
+
+    if audits:
+        ResponseAudit.objects.bulk_create(audits)
+    if to_update:
+        Response.objects.bulk_update(
+            to_update,
+            ['call', 'is_active', 'superseded_at', 'superseded_by_action', 'timestamp']
+        )
+    if to_create:
+        Response.objects.bulk_create(to_create)
+    mark_nodes_changed(deal.id, [response.node_id for response in to_create + to_update])
+
+    append_events(deal, user, [
+        ('CALL', step_history, seat, call, {}) for step_history, seat, call in steps
+    ])
+
+    # Recompute derived state once for the whole line
+    if deferring_recompute():
+        schedule_recompute(deal.id)
+    else:
+        recompute_all_for_nodes(set(line_nodes) | {nodes[final_state]})
+        refresh_pending_counters(session, [deal])
+
+    return responses
@@ -0,0 +1,676 @@
+"""
+PBN and LIN reading and writing for deals and auctions
+
+Readers are generators that turn a stream of lines into one record per
+board, so files of any size are processed in constant memory. A record is a
+dict with the board number, dealer, vulnerability, hands (in the Deal.hands
+layout, '10' for tens and '' for voids), the auction as (call, alert) pairs
+and an error message for boards that could not be read.
+
+Writers are generators too: they take records and yield the text of one
+board at a time, ready to be streamed to a file or an HTTP response.
+"""
+import itertools
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from ..models import Session, Deal, Node, Edge, Response, PlayerGame, UserBiddingSequence, UserBiddingCall, TreeEvent
+from ..sharding import select_users, shard_atomic
+from .auction_tree import is_auction_closed, get_next_seat, answer_masks, subtree_answer_masks, derive_needs_mask
+from .participants import participant_bits, mask_of, who_needs_for_mask, roles_for_mask
+from .system_import import normalize_call, validate_sequence
+from .pending_work import refresh_pending_counters
+from .auction_paths import intern_paths, classify, count_new_nodes
+from .user_sequences import history_is_complete, with_entries
+
+SEATS = 'NESW'  # Clockwise, the order hands are listed in a PBN [Deal] tag
+SUITS = 'SHDC'
+RANKS = 'AKQJT98765432'
+
+PBN_VULNERABILITY = {
+    'NONE': 'None', 'LOVE': 'None', '-': 'None',
+    'NS': 'NS', 'EW': 'EW', 'ALL': 'Both', 'BOTH': 'Both',
+}
+PBN_VULNERABILITY_OUT = {'None': 'None', 'NS': 'NS', 'EW': 'EW', 'Both': 'All'}
+PBN_TAG_RE = re.compile(r'^\[(\w+)\s+"([^"]*)"\]')
+PBN_COMMENT_RE = re.compile(r'\{[^}]*\}')
+PBN_NOTE_REF_RE = re.compile(r'^=(\d+)=$')
+
+# LIN lists hands from South clockwise; the md digit gives the dealer
+LIN_SEATS = 'SWNE'
+LIN_DEALER = {'1': 'S', '2': 'W', '3': 'N', '4': 'E'}
+LIN_DEALER_OUT = {seat: digit for digit, seat in LIN_DEALER.items()}
+LIN_VULNERABILITY = {'o': 'None', '0': 'None', '-': 'None', 'n': 'NS', 'e': 'EW', 'b': 'Both'}
+LIN_VULNERABILITY_OUT = {'None': 'o', 'NS': 'n', 'EW': 'e', 'Both': 'b'}
+LIN_CALLS_OUT = {'Pass': 'p', 'X': 'd', 'XX': 'r'}
+
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 50
+
+
+def normalize_holding(text: str) -> str:
+    """Turn a written suit holding ('AKT2', 'AK102', '-') into Deal.hands form ('AK102')"""
+    text = text.strip().upper().replace('10', 'T')
+    if text in ('', '-'):
+        return ''
+    if any(rank not in RANKS for rank in text):
+        raise ValueError(f'Invalid holding: {text}')
+    return ''.join(sorted(text, key=RANKS.index)).replace('T', '10')
+
+
+def holding_cards(holding: str) -> List[str]:
+    """Ranks of a Deal.hands holding, one character per card ('T' for ten)"""
+    return list(holding.replace('10', 'T'))
+
+
+def complete_hands(hands: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    """
+    Check a deal and fill in one missing hand from the unused cards.
+
+    Raises:
+        ValueError: when the deal is not four 13-card hands of distinct cards
+    """
+    seen = set()
+    for seat, hand in hands.items():
+        for suit in SUITS:
+            for rank in holding_cards(hand.get(suit, '')):
+                if (suit, rank) in seen:
+                    raise ValueError(f'Card {suit}{rank} appears twice')
+                seen.add((suit, rank))
+
+    missing = [seat for seat in SEATS if seat not in hands]
+    if len(missing) == 1:
+        hands[missing[0]] = {
+            suit: ''.join(rank for rank in RANKS if (suit, rank) not in seen).replace('T', '10')
+            for suit in SUITS
+        }
+    elif missing:
+        raise ValueError('At least three hands are required')
+
+    for seat in SEATS:
+        if sum(len(holding_cards(holding)) for holding in hands[seat].values()) != 13:
+            raise ValueError(f'Hand {seat} does not hold 13 cards')
+    return {seat: hands[seat] for seat in SEATS}
+
+
+def board_defaults(board: Optional[int]) -> Tuple[str, str]:
+    """Standard dealer and vulnerability for a board number"""
+    deal = Deal(deal_number=board or 1)
+    return deal.get_dealer_for_deal(), deal.get_vulnerability_for_deal()
+
+
+def new_record(line_number: int) -> dict:
+    return {
+        'line': line_number,
+        'board': None,
+        'dealer': None,
+        'vulnerability': None,
+        'hands': {},
+        'auction': [],
+        'error': None,
+    }
+
+
+def finish_record(record: dict) -> dict:
+    """Fill in defaults, validate the deal and the auction"""
+    if record['error']:
+        return record
+
+    dealer, vulnerability = board_defaults(record['board'])
+    record['dealer'] = record['dealer'] or dealer
+    record['vulnerability'] = record['vulnerability'] or vulnerability
+
+    try:
+        record['hands'] = complete_hands(record['hands'])
+    except ValueError as exc:
+        record['error'] = str(exc)
+        return record
+
+    if record['auction']:
+        error = validate_sequence([call for call, _ in record['auction']])
+        if error:
+            record['error'] = f'Invalid auction: {error}'
+    return record
+
+
+# ---------------------------------------------------------------------------
+# PBN
+# ---------------------------------------------------------------------------
+
+def parse_pbn_deal(value: str) -> Dict[str, Dict[str, str]]:
+    """Parse a PBN [Deal] value such as 'N:AKQ.JT9.876.5432 - ...'"""
+    first, _, rest = value.strip().partition(':')
+    if first.upper() not in SEATS or not rest:
+        raise ValueError(f'Invalid Deal tag: {value}')
+
+    hands = {}
+    seat_index = SEATS.index(first.upper())
+    for offset, hand in enumerate(rest.split()[:4]):
+        seat = SEATS[(seat_index + offset) % 4]
+        if hand == '-':
+            continue  # Unknown hand
+        holdings = hand.split('.')
+        if len(holdings) != 4:
+            raise ValueError(f'Invalid hand: {hand}')
+        hands[seat] = {suit: normalize_holding(holding) for suit, holding in zip(SUITS, holdings)}
+    return hands
+
+
+def parse_pbn_auction(text: str, notes: Optional[Dict[str, str]] = None) -> List[Tuple[str, str]]:
+    """
+    Parse the call lines of a PBN auction section.
+
+    A note reference (=1=) after a call makes the text of that [Note] the
+    call's alert; references to notes the board does not have are ignored.
+    """
+    notes = notes or {}
+    calls = []
+    for token in PBN_COMMENT_RE.sub(' ', text).split():
+        note = PBN_NOTE_REF_RE.match(token)
+        if note:
+            note_text = notes.get(note.group(1), '')
+            if calls and note_text:
+                call, alert = calls[-1]
+                calls[-1] = (call, f'{alert}; {note_text}' if alert else note_text)
+            continue
+        if token[0] in '=$' or token in ('*', '+', '-'):
+            continue  # NAGs and the end/irregularity markers
+        if token.upper() == 'AP':
+            calls.extend([('Pass', '')] * 3)
+            continue
+        call = normalize_call(token)
+        if call is None:
+            raise ValueError(f'Unknown call: {token}')
+        calls.append((call, ''))
+    return calls
+
+
+def read_pbn(lines: Iterable) -> Iterator[dict]:
+    """
+    Stream boards out of a PBN file.
+
+    A board is the run of tags up to the next blank line; the lines after an
+    [Auction] tag are its calls, and its [Note "1:..."] tags the alerts the
+    calls refer to. Other sections (Play) are skipped.
+
+    Yields:
+        One record per board
+    """
+    record = None
+    section = None
+    auction_text = []
+    notes = {}
+
+    def close():
+        if auction_text and not record['error']:
+            try:
+                record['auction'] = parse_pbn_auction(' '.join(auction_text), notes)
+            except ValueError as exc:
+                record['error'] = str(exc)
+        return finish_record(record)
+
+    for line_number, raw in enumerate(lines, start=1):
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8', errors='replace')
+        line = raw.strip()
+
+        if not line:
+            if record is not None:
+                yield close()
+                record, section, auction_text, notes = None, None, [], {}
+            continue
+        if line[0] in ';%':
+            continue
+
+        tag = PBN_TAG_RE.match(line)
+        if not tag:
+            if record is not None and section == 'Auction':
+                auction_text.append(line)
+            continue
+
+        if record is None:
+            record = new_record(line_number)
+        name, value = tag.groups()
+        section = name
+        try:
+            if name == 'Board':
+                record['board'] = int(value) if value.isdigit() else None
+            elif name == 'Dealer' and value.upper() in SEATS:
+                record['dealer'] = value.upper()
+            elif name == 'Vulnerable':
+                record['vulnerability'] = PBN_VULNERABILITY.get(value.upper())
+            elif name == 'Deal':
+                record['hands'] = parse_pbn_deal(value)
+            elif name == 'Note':
+                number, _, text = value.partition(':')
+                if number.strip().isdigit() and text.strip():
+                    notes[number.strip()] = text.strip()
+        except ValueError as exc:
+            record['error'] = record['error'] or str(exc)
+
+    if record is not None:
+        yield close()
+
+
+def write_pbn(records: Iterable[dict]) -> Iterator[str]:
+    """
+    Yield the PBN text of each record, boards separated by blank lines.
+
+    Alerted calls are followed by a note reference (=1=) and the alerts
+    written as [Note] tags after the auction.
+    """
+    for index, record in enumerate(records):
+        dealer = record['dealer']
+        deal_value = dealer + ':' + ' '.join(
+            '.'.join(record['hands'].get(seat, {}).get(suit, '').replace('10', 'T') for suit in SUITS)
+            for seat in (SEATS[(SEATS.index(dealer) + offset) % 4] for offset in range(4))
+        )
+        lines = [
+            f'[Board "{record["board"]}"]',
+            f'[Dealer "{dealer}"]',
+            f'[Vulnerable "{PBN_VULNERABILITY_OUT.get(record["vulnerability"], "None")}"]',
+            f'[Deal "{deal_value}"]',
+        ]
+        auction = record.get('auction') or []
+        if auction:
+            notes, tokens = [], []
+            for call, alert in auction:
+                if alert:
+                    # A tag value is one line without double quotes
+                    notes.append(' '.join(alert.split()).replace('"', "'"))
+                    tokens.append(f'{call} ={len(notes)}=')
+                else:
+                    tokens.append(call)
+            lines.append(f'[Auction "{dealer}"]')
+            for start in range(0, len(tokens), 4):
+                lines.append(' '.join(tokens[start:start + 4]))
+            if not is_auction_closed(' '.join(call for call, _ in auction)):
+                lines.append('*')
+            lines.extend(f'[Note "{number}:{note}"]' for number, note in enumerate(notes, start=1))
+        yield ('\n' if index else '') + '\n'.join(lines) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# LIN
+# ---------------------------------------------------------------------------
+
+def lin_pairs(lines: Iterable) -> Iterator[Tuple[int, str, str]]:
+    """
+    Stream the key|value| pairs of a LIN file.
+
+    Pairs may span physical lines, so the text is split on '|' incrementally.
+
+    Yields:
+        (line number, key, value)
+    """
+    pending = ''
+    key = None
+    line_number = 0
+    for line_number, raw in enumerate(lines, start=1):
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8', errors='replace')
+        pending += raw.rstrip('\r\n')
+        tokens = pending.split('|')
+        pending = tokens.pop()
+        for token in tokens:
+            if key is None:
+                key = token.strip().lower()
+            else:
+                yield line_number, key, token
+                key = None
+    if key is not None:
+        yield line_number, key, pending
+
+
+def parse_lin_deal(value: str) -> Tuple[Optional[str], Dict[str, Dict[str, str]]]:
+    """Parse an md value such as '3SAKQHJT9D876C5432,S...,S...,' into (dealer, hands)"""
+    value = value.strip()
+    dealer = LIN_DEALER.get(value[:1])
+    if dealer:
+        value = value[1:]
+
+    hands = {}
+    for seat, hand in zip(LIN_SEATS, value.split(',')):
+        hand = hand.strip().upper()
+        if not hand:
+            continue
+        holdings = dict.fromkeys(SUITS, '')
+        suit = None
+        for char in hand:
+            if char in SUITS:
+                suit = char
+            elif suit is None:
+                raise ValueError(f'Invalid hand: {hand}')
+            else:
+                holdings[suit] += char
+        hands[seat] = {suit: normalize_holding(holding) for suit, holding in holdings.items()}
+    return dealer, hands
+
+
+def read_lin(lines: Iterable) -> Iterator[dict]:
+    """
+    Stream boards out of a LIN file (one or many boards per file).
+
+    A new board starts at every qx pair, or at an md pair when the current
+    board already has hands.
+
+    Yields:
+        One record per board
+    """
+    record = None
+
+    for line_number, key, value in lin_pairs(lines):
+        if key == 'qx' or (key == 'md' and record is not None and record['hands']):
+            if record is not None and (record['hands'] or record['error']):
+                yield finish_record(record)
+            record = new_record(line_number)
+            if key == 'qx':
+                digits = re.sub(r'\D', '', value)
+                record['board'] = int(digits) if digits else None
+                continue
+        if record is None:
+            record = new_record(line_number)
+
+        try:
+            if key == 'md':
+                dealer, record['hands'] = parse_lin_deal(value)
+                record['dealer'] = dealer or record['dealer']
+            elif key == 'ah':
+                digits = re.sub(r'\D', '', value)
+                if digits:
+                    record['board'] = int(digits)
+            elif key == 'sv':
+                record['vulnerability'] = LIN_VULNERABILITY.get(value.strip().lower())
+            elif key == 'mb':
+                call = normalize_call(value)
+                if call is None:
+                    raise ValueError(f'Unknown call: {value}')
+                record['auction'].append((call, ''))
+            elif key == 'an' and record['auction']:
+                call, _ = record['auction'][-1]
+                record['auction'][-1] = (call, value.strip())
+        except ValueError as exc:
+            record['error'] = record['error'] or str(exc)
+
+    if record is not None and (record['hands'] or record['error']):
+        yield finish_record(record)
+
+
+def write_lin(records: Iterable[dict]) -> Iterator[str]:
+    """Yield one LIN line per record"""
+    for record in records:
+        hands = ','.join(
+            ''.join(suit + record['hands'].get(seat, {}).get(suit, '').replace('10', 'T') for suit in SUITS)
+            for seat in LIN_SEATS
+        )
+        parts = [
+            f'qx|o{record["board"]}',
+            f'md|{LIN_DEALER_OUT[record["dealer"]]}{hands}',
+            'rh|',
+            f'ah|Board {record["board"]}',
+            f'sv|{LIN_VULNERABILITY_OUT.get(record["vulnerability"], "o")}',
+        ]
+        for call, alert in record.get('auction') or []:
+            lin_call = LIN_CALLS_OUT.get(call, call[:2] if call.endswith('NT') else call)
+            parts.append(f'mb|{lin_call}{"!" if alert else ""}')
+            if alert:
+                parts.append(f'an|{alert.replace("|", "/")}')
+        parts.append('pg|')
+        yield '|'.join(parts) + '|\n'
+
+
+READERS = {'pbn': read_pbn, 'lin': read_lin}
+WRITERS = {'pbn': write_pbn, 'lin': write_lin}
+
+
+def detect_format(first_line: str) -> str:
+    """Guess the format from the first non-blank line of a file"""
+    return 'lin' if '|' in first_line and not first_line.lstrip().startswith('[') else 'pbn'
+
+
+def read_records(lines: Iterable, file_format: Optional[str] = None) -> Iterator[dict]:
+    """Read records in the given format, detecting it from the first line when not given"""
+    lines = iter(lines)
+    if file_format is None:
+        buffered = []
+        for line in lines:
+            text = line.decode('utf-8', errors='replace') if isinstance(line, bytes) else line
+            buffered.append(text)
+            if text.strip() and text.strip()[0] not in ';%':
+                break
+        file_format = detect_format(buffered[-1] if buffered else '')
+        lines = itertools.chain(buffered, lines)
+    return READERS[file_format](lines)
+
+
+# ---------------------------------------------------------------------------
+# Import / export
+# ---------------------------------------------------------------------------
+
+def batched(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_auctions(session: Session, items: List[Tuple[Deal, List[Tuple[str, str]]]],
+                   positions: Dict[int, str]) -> None:
+    """
+    Record imported auctions for both partners on freshly created deals.
+
+    Each auction becomes a branch of the deal's tree answered identically by
+    both partners (ending in a leaf), a UserBiddingSequence per partner and
+    the matching CALL events. Everything for the batch is written with one
+    bulk INSERT per table; derived node state is computed in memory first.
+    """
+    user_ids = (session.creator_id, session.partner_id)
+    bits = participant_bits(session)
+    by_mask = mask_of(user_ids, bits)
+    now = timezone.now()
+    interval = getattr(settings, 'TREE_SNAPSHOT_INTERVAL', 50)
+
+    nodes, paths, sequences, events = [], [], [], []
+    for deal, auction in items:
+        responses_by_node = {}
+        path = [('', deal.dealer)]
+        for call, _ in auction:
+            history, seat = path[-1]
+            responses_by_node[path[-1]] = dict.fromkeys(user_ids, call)
+            path.append(((history + ' ' + call).strip(), get_next_seat(seat)))
+        call_masks = answer_masks(responses_by_node, bits)
+        subtree_masks = subtree_answer_masks(call_masks)
+
+        for history, seat in path:
+            closed = is_auction_closed(history)
+            needs_mask = derive_needs_mask(
+                history, seat, deal.dealer, session.participant_mask, call_masks, subtree_masks
+            )
+            nodes.append(Node(
+                session=session,
+                deal=deal,
+                history=history,
+                seat_to_act=seat,
+                divergence=False,
+                status='closed' if closed else 'open',
+                depth=len(history.split()),
+                who_needs=who_needs_for_mask(needs_mask),
+                needs_mask=needs_mask,
+                version=1,
+                path_outcome=classify(
+                    responses_by_node.get((history, seat), {}), session.creator_id, session.partner_id
+                )
+            ))
+        paths.append((deal, path, auction))
+
+        sequence_number = 0
+        for user_id in user_ids:
+            entries = []
+            for (history, seat), (call, alert) in zip(path, auction):
+                entries.append(UserBiddingCall(
+                    call_index=len(entries), position=seat, call=call, alert=alert, timestamp=now
+                ))
+                sequence_number += 1
+                events.append(TreeEvent(
+                    session=session, deal=deal, user_id=user_id, sequence=sequence_number,
+                    kind='CALL', history=history, seat_to_act=seat, call=call,
+                    payload={'source': 'import'}
+                ))
+            calls = [call for call, _ in auction]
+            sequences.append((UserBiddingSequence(
+                deal=deal, user_id=user_id, position=positions.get(user_id, 'S'),
+                history=' '.join(calls), call_count=len(calls),
+                last_position=entries[-1].position if entries else '',
+                is_complete=history_is_complete(calls)
+            ), entries))
+
+    path_ids = intern_paths({node.history for node in nodes})
+    for node in nodes:
+        node.path_id = path_ids[node.history]
+    created = Node.objects.bulk_create(nodes, batch_size=DEFAULT_BATCH_SIZE)
+    count_new_nodes(nodes)
+    if any(node.pk is None for node in created):
+        # Backend could not return primary keys; read them back
+        created = Node.objects.filter(deal__in=[deal for deal, _, _ in paths])
+    node_map = {(node.deal_id, node.history, node.seat_to_act): node for node in created}
+
+    edges, responses = [], []
+    for deal, path, auction in paths:
+        for (state, next_state), (call, _) in zip(zip(path, path[1:]), auction):
+            from_node = node_map[(deal.id, *state)]
+            edges.append(Edge(
+                session=session, deal=deal, from_node=from_node,
+                to_node=node_map[(deal.id, *next_state)], call=call,
+                by_set=roles_for_mask(by_mask), by_mask=by_mask
+            ))
+            for user_id in user_ids:
+                responses.append(Response(node=from_node, user_id=user_id, call=call, timestamp=now))
+
+    Edge.objects.bulk_create(edges, batch_size=DEFAULT_BATCH_SIZE)
+    Response.objects.bulk_create(responses, batch_size=DEFAULT_BATCH_SIZE)
+    # The whole tree is version 1 of a fresh deal (bulk_create skips save())
+    Deal.objects.filter(id__in=[deal.id for deal, _, _ in paths]).update(tree_version=1)
+    created_sequences = UserBiddingSequence.objects.bulk_create(
+        [user_sequence for user_sequence, _ in sequences], batch_size=DEFAULT_BATCH_SIZE
+    )
+    if any(user_sequence.pk is None for user_sequence in created_sequences):
+        # Backend could not return primary keys; read them back
+        sequence_ids = dict(((deal_id, user_id), sequence_id) for deal_id, user_id, sequence_id in
+                            UserBiddingSequence.objects.filter(deal__in=[deal for deal, _, _ in paths])
+                            .values_list('deal_id', 'user_id', 'id'))
+        for user_sequence, _ in sequences:
+            user_sequence.pk = sequence_ids[(user_sequence.deal_id, user_sequence.user_id)]
+    calls = []
+    for user_sequence, entries in sequences:
+        for entry in entries:
+            entry.sequence_id = user_sequence.pk
+            calls.append(entry)
+    UserBiddingCall.objects.bulk_create(calls, batch_size=DEFAULT_BATCH_SIZE)
+    TreeEvent.objects.bulk_create(events, batch_size=DEFAULT_BATCH_SIZE)
+
+    if interval:
+        from .event_log import take_snapshot
+        for deal, _, auction in paths:
+            event_count = len(auction) * len(user_ids)
+            if event_count >= interval:
+                take_snapshot(deal, event_count - event_count % interval)
+
+
+def import_deal_records(session: Session, records: Iterable[dict], with_auctions: bool = True,
+                        batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Append imported boards to a session as new deals.
+
+    Records are consumed lazily and written in batches of `batch_size`, so
+    memory use does not grow with the file. Boards are numbered after the
+    session's existing deals; unreadable boards are skipped and reported.
+
+    Args:
+        session: Target session
+        records: Records from read_pbn/read_lin
+        with_auctions: Also record each board's auction for both partners
+        batch_size: Number of deals per bulk INSERT
+
+    Returns:
+        Summary with deal and auction counts, deal number range and errors
+    """
+    positions = dict(PlayerGame.objects.filter(session=session).values_list('player_id', 'position'))
+    summary = {'deals': 0, 'auctions': 0, 'first_deal_number': None, 'last_deal_number': None, 'errors': []}
+
+    def valid_records():
+        for record in records:
+            if record['error']:
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'line': record['line'], 'board': record['board'],
+                                              'error': record['error']})
+                continue
+            yield record
+
+    with shard_atomic():
+        last_deal = session.deals.order_by('-deal_number').values_list('deal_number', flat=True).first()
+        deal_number = last_deal or 0
+
+        for batch in batched(valid_records(), batch_size):
+            deals = []
+            for record in batch:
+                deal_number += 1
+                deals.append(Deal(
+                    session=session,
+                    deal_number=deal_number,
+                    dealer=record['dealer'],
+                    vulnerability=record['vulnerability'],
+                    hands=record['hands']
+                ))
+            deals = Deal.objects.bulk_create(deals)
+            if any(deal.pk is None for deal in deals):
+                numbers = {deal.deal_number: deal for deal in session.deals.filter(
+                    deal_number__gte=deals[0].deal_number, deal_number__lte=deal_number)}
+                deals = [numbers[deal.deal_number] for deal in deals]
+
+            auctions = [(deal, record['auction']) for deal, record in zip(deals, batch)
+                        if with_auctions and record['auction']]
+            if auctions:
+                write_auctions(session, auctions, positions)
+            refresh_pending_counters(session, deals)
+
+            summary['deals'] += len(deals)
+            summary['auctions'] += len(auctions)
+            summary['first_deal_number'] = summary['first_deal_number'] or deals[0].deal_number
+            summary['last_deal_number'] = deal_number
+
+        if deal_number > session.max_deals:
+            session.max_deals = deal_number
+            session.save(update_fields=['max_deals', 'updated_at'])
+
+    return summary
+
+
+def iter_deal_records(session: Session, user=None, chunk_size: int = DEFAULT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Stream a session's deals as records.
+
+    The auction of each record is `user`'s own bidding sequence for the deal
+    (fetched in the same query), or no auction when no user is given.
+    """
+    deals = select_users(session.deals.order_by('deal_number'), 'pooled_deal')
+    if user is not None:
+        deals = deals.annotate(user_sequence_id=Subquery(
+            UserBiddingSequence.objects.filter(deal=OuterRef('pk'), user=user).values('id')[:1]
+        ))
+
+    # The calls of each chunk of deals are read in one query
+    for deal, sequence in with_entries(deals.iterator(chunk_size=chunk_size),
+                                       lambda deal: getattr(deal, 'user_sequence_id', None), chunk_size):
+        yield {
+            'board': deal.deal_number,
+            'dealer': deal.dealer,
+            'vulnerability': deal.vulnerability,
+            'hands': deal.board_hands,
+            'auction': [(entry.get('call'), entry.get('alert') or '') for entry in sequence],
+        }
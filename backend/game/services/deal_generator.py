@@ -0,0 +1,449 @@
+"""
+Constrained deal generation
+
+A small constraint language over the four hands, in the spirit of the
+classic "dealer" program:
+
+    hcp(north) >= 15 and hcp(north) <= 17 and shape(north, any 4333 + any 4432 + any 5332)
+    spades(south) >= 6 && hcp(south, spades) >= 5 && hcp(south) < 11
+    balanced(north) and hcp(north) + hcp(south) >= 33
+
+Functions take a seat (north/east/south/west or N/E/S/W):
+
+- hcp(seat[, suit]), controls(seat[, suit]): high card points (A4 K3 Q2 J1)
+  and controls (A2 K1), of the hand or of one suit
+- spades(seat), hearts(seat), diamonds(seat), clubs(seat): suit lengths
+- shape(seat, patterns): patterns are four lengths in S H D C order, with
+  'x' for any length, 'any' for every permutation, joined with + and -
+  (e.g. "any 4333 + 5xxx - 5431")
+- balanced(seat): shape any 4333 + any 4432 + any 5332
+
+with integers, + - *, comparisons, and/or/not (&&, ||, !) and parentheses.
+
+A constraint is compiled once into a predicate over a table of hand
+features. With NumPy installed, candidates are dealt and filtered in
+batches of thousands: every feature is an array over the batch and the
+predicate is evaluated once per batch. Without it the same predicate runs
+deal by deal, about twenty times slower, so the search gives up after
+PYTHON_MAX_CANDIDATES. Rare constraints can be spread over a process pool
+(DEAL_GENERATOR_WORKERS); by default everything runs in the calling process.
+
+This module only uses the standard library (and NumPy when present), so
+pool workers can import it without setting Django up.
+"""
+import hashlib
+import itertools
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional: deal by deal in pure Python
+    np = None
+
+SEATS = ['N', 'E', 'S', 'W']
+SUITS = ['S', 'H', 'D', 'C']
+RANKS = ['A', 'K', 'Q', 'J', '10', '9', '8', '7', '6', '5', '4', '3', '2']
+HCP_BY_RANK = [4, 3, 2, 1] + [0] * 9
+CONTROLS_BY_RANK = [2, 1] + [0] * 11
+
+SEAT_NAMES = {'north': 0, 'n': 0, 'east': 1, 'e': 1, 'south': 2, 's': 2, 'west': 3, 'w': 3}
+SUIT_NAMES = {'spades': 0, 'hearts': 1, 'diamonds': 2, 'clubs': 3}
+BALANCED = 'any 4333 + any 4432 + any 5332'
+
+NUMPY_BATCH_SIZE = 20000
+PYTHON_BATCH_SIZE = 2000
+# Searches expected to need more candidates than this are spread over processes
+POOL_THRESHOLD = 200000
+DEFAULT_MAX_CANDIDATES = 5000000
+# Pure Python deals about 20,000 candidates a second
+PYTHON_MAX_CANDIDATES = 200000
+
+TOKEN_RE = re.compile(r'\s*(?:(&&|\|\||==|!=|<=|>=|[-+*()<>,!])|([0-9][0-9A-Za-z]*)|([A-Za-z_][A-Za-z_0-9]*))')
+COMPARISONS = {
+    '==': lambda a, b: a == b, '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b, '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+}
+ARITHMETIC = {'+': lambda a, b: a + b, '-': lambda a, b: a - b, '*': lambda a, b: a * b}
+
+# A compiled expression: (features, ops) -> value (array over a batch or scalar)
+Expression = Callable[['object', 'object'], object]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a constraint into operator, number and word tokens"""
+    tokens, position = [], 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if not match:
+            position = len(text) - len(text[position:].lstrip())
+            raise ValueError(f'Unexpected character at {position}: {text[position]!r}')
+        tokens.append(match.group(1) or (match.group(2) or match.group(3)).lower())
+        position = match.end()
+    return tokens
+
+
+def shape_code(lengths) -> int:
+    """Pack four suit lengths (S H D C) into one integer"""
+    return (lengths[0] << 12) | (lengths[1] << 8) | (lengths[2] << 4) | lengths[3]
+
+
+def expand_shape(pattern: str, any_order: bool) -> set:
+    """Shape codes matched by one pattern such as '5xxx' or 'any 4432'"""
+    if not re.fullmatch(r'[0-9x]{4}', pattern):
+        raise ValueError(f'Invalid shape pattern: {pattern}')
+    orders = set(itertools.permutations(pattern)) if any_order else {tuple(pattern)}
+    codes = set()
+    for order in orders:
+        options = [range(14) if char == 'x' else [int(char)] for char in order]
+        for lengths in itertools.product(*options):
+            if sum(lengths) == 13:
+                codes.add(shape_code(lengths))
+    return codes
+
+
+class Parser:
+    """Recursive descent parser compiling a constraint into an Expression"""
+
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: Optional[str] = None) -> str:
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError(f"Expected {expected or 'more input'} but found {token or 'end of constraint'}")
+        self.position += 1
+        return token
+
+    def parse(self) -> Expression:
+        if not self.tokens:
+            raise ValueError('Constraint is empty')
+        expression = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f'Unexpected {self.peek()}')
+        return expression
+
+    def parse_or(self) -> Expression:
+        left = self.parse_and()
+        while self.peek() in ('or', '||'):
+            self.take()
+            left = (lambda a, b: lambda f, ops: ops.or_(a(f, ops), b(f, ops)))(left, self.parse_and())
+        return left
+
+    def parse_and(self) -> Expression:
+        left = self.parse_not()
+        while self.peek() in ('and', '&&'):
+            self.take()
+            left = (lambda a, b: lambda f, ops: ops.and_(a(f, ops), b(f, ops)))(left, self.parse_not())
+        return left
+
+    def parse_not(self) -> Expression:
+        if self.peek() in ('not', '!'):
+            self.take()
+            operand = self.parse_not()
+            return lambda f, ops: ops.not_(operand(f, ops))
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Expression:
+        left = self.parse_sum()
+        if self.peek() in COMPARISONS:
+            compare, right = COMPARISONS[self.take()], self.parse_sum()
+            return lambda f, ops: compare(left(f, ops), right(f, ops))
+        return left
+
+    def parse_sum(self) -> Expression:
+        left = self.parse_product()
+        while self.peek() in ('+', '-'):
+            combine = ARITHMETIC[self.take()]
+            left = (lambda a, b, op: lambda f, ops: op(a(f, ops), b(f, ops)))(left, self.parse_product(), combine)
+        return left
+
+    def parse_product(self) -> Expression:
+        left = self.parse_unary()
+        while self.peek() == '*':
+            self.take()
+            left = (lambda a, b: lambda f, ops: a(f, ops) * b(f, ops))(left, self.parse_unary())
+        return left
+
+    def parse_unary(self) -> Expression:
+        if self.peek() == '-':
+            self.take()
+            operand = self.parse_unary()
+            return lambda f, ops: -operand(f, ops)
+        return self.parse_atom()
+
+    def parse_atom(self) -> Expression:
+        token = self.take()
+        if token == '(':
+            expression = self.parse_or()
+            self.take(')')
+            return expression
+        if token.isdigit():
+            value = int(token)
+            return lambda f, ops: value
+        if token in ('hcp', 'controls'):
+            seat, suit = self.parse_seat_and_suit()
+            return lambda f, ops: getattr(f, token)(seat, suit)
+        if token in SUIT_NAMES:
+            self.take('(')
+            seat, suit = self.parse_seat(), SUIT_NAMES[token]
+            self.take(')')
+            return lambda f, ops: f.length(seat, suit)
+        if token in ('shape', 'balanced'):
+            self.take('(')
+            seat = self.parse_seat()
+            if token == 'shape':
+                self.take(',')
+                codes = self.parse_shape_list()
+            else:
+                codes = Parser(BALANCED).parse_shape_list()
+            self.take(')')
+            return lambda f, ops: ops.isin(f.shape(seat), codes)
+        raise ValueError(f'Unknown word: {token}')
+
+    def parse_seat(self) -> int:
+        token = self.take()
+        if token not in SEAT_NAMES:
+            raise ValueError(f'Unknown seat: {token}')
+        return SEAT_NAMES[token]
+
+    def parse_seat_and_suit(self) -> Tuple[int, Optional[int]]:
+        self.take('(')
+        seat, suit = self.parse_seat(), None
+        if self.peek() == ',':
+            self.take()
+            token = self.take()
+            if token not in SUIT_NAMES:
+                raise ValueError(f'Unknown suit: {token}')
+            suit = SUIT_NAMES[token]
+        self.take(')')
+        return seat, suit
+
+    def parse_shape_list(self) -> set:
+        """[+|-] [any] PATTERN ... as a set of shape codes"""
+        codes, sign = set(), '+'
+        while True:
+            any_order = self.peek() == 'any'
+            if any_order:
+                self.take()
+            pattern = expand_shape(self.take(), any_order)
+            codes = codes | pattern if sign == '+' else codes - pattern
+            if self.peek() not in ('+', '-'):
+                return codes
+            sign = self.take()
+
+
+class ScalarOps:
+    """Operators for evaluating a predicate on a single deal"""
+    and_ = staticmethod(lambda a, b: bool(a) and bool(b))
+    or_ = staticmethod(lambda a, b: bool(a) or bool(b))
+    not_ = staticmethod(lambda a: not a)
+    isin = staticmethod(lambda code, codes: code in codes)
+
+
+class ArrayOps:
+    """Operators for evaluating a predicate on a whole NumPy batch"""
+    and_ = staticmethod(lambda a, b: np.logical_and(a, b))
+    or_ = staticmethod(lambda a, b: np.logical_or(a, b))
+    not_ = staticmethod(lambda a: np.logical_not(a))
+    isin = staticmethod(lambda code, codes: np.isin(code, np.fromiter(codes, dtype=np.int64)))
+
+
+class HandFeatures:
+    """
+    Features of one deal or of a batch of deals.
+
+    `lengths`, `points` and `controls` are indexed [seat][suit]; entries are
+    ints for a single deal and arrays over the batch for NumPy batches.
+    """
+
+    def __init__(self, lengths, points, controls):
+        self.lengths, self.points, self.control_counts = lengths, points, controls
+
+    def length(self, seat: int, suit: int):
+        return self.lengths[seat][suit]
+
+    def hcp(self, seat: int, suit: Optional[int] = None):
+        points = self.points[seat]
+        return points[suit] if suit is not None else points[0] + points[1] + points[2] + points[3]
+
+    def controls(self, seat: int, suit: Optional[int] = None):
+        controls = self.control_counts[seat]
+        return controls[suit] if suit is not None else controls[0] + controls[1] + controls[2] + controls[3]
+
+    def shape(self, seat: int):
+        return shape_code(self.lengths[seat])
+
+
+class DealPredicate:
+    """A compiled constraint"""
+
+    def __init__(self, constraint: str):
+        self.constraint = constraint
+        self.expression = Parser(constraint).parse()
+
+    def matches(self, owners: List[int]) -> bool:
+        """Whether one deal (the seat holding each card) satisfies the constraint"""
+        lengths = [[0] * 4 for _ in SEATS]
+        points = [[0] * 4 for _ in SEATS]
+        controls = [[0] * 4 for _ in SEATS]
+        for card, seat in enumerate(owners):
+            suit, rank = divmod(card, 13)
+            lengths[seat][suit] += 1
+            points[seat][suit] += HCP_BY_RANK[rank]
+            controls[seat][suit] += CONTROLS_BY_RANK[rank]
+        return bool(self.expression(HandFeatures(lengths, points, controls), ScalarOps))
+
+    def filter_batch(self, owners):
+        """Boolean mask of the deals of a NumPy batch (deals x 52 card owners) that match"""
+        # owned[deal, seat, suit, rank]
+        owned = (owners[:, None, :] == np.arange(4, dtype=owners.dtype)[None, :, None]).reshape(-1, 4, 4, 13)
+        lengths = owned.sum(axis=3)
+        points = (owned * np.array(HCP_BY_RANK, dtype=np.int8)).sum(axis=3)
+        controls = (owned * np.array(CONTROLS_BY_RANK, dtype=np.int8)).sum(axis=3)
+
+        def columns(values):
+            return [[values[:, seat, suit].astype(np.int64) for suit in range(4)] for seat in range(4)]
+
+        result = self.expression(HandFeatures(columns(lengths), columns(points), columns(controls)), ArrayOps)
+        return np.broadcast_to(np.asarray(result, dtype=bool), (len(owners),))
+
+
+def compile_constraint(constraint: str) -> DealPredicate:
+    """
+    Compile a constraint (see module docstring).
+
+    Raises:
+        ValueError: If the constraint does not parse
+    """
+    return DealPredicate(constraint)
+
+
+def seed_int(seed) -> int:
+    """A 64-bit integer seed from any seed value (e.g. Session.seed)"""
+    return int(hashlib.sha256(str(seed).encode()).hexdigest()[:16], 16)
+
+
+def owners_to_hands(owners) -> Dict[str, Dict[str, str]]:
+    """Deal.hands from the seat holding each card (cards in S H D C, A..2 order)"""
+    hands = {seat: {suit: '' for suit in SUITS} for seat in SEATS}
+    for card, seat in enumerate(owners):
+        suit, rank = divmod(card, 13)
+        hands[SEATS[int(seat)]][SUITS[suit]] += RANKS[rank]
+    return hands
+
+
+def search(constraint: str, count: int, seed: int, max_candidates: int) -> Tuple[List[dict], int]:
+    """
+    Deal candidates until `count` match or `max_candidates` were tried.
+
+    Returns:
+        (matching hands, number of candidates tried)
+    """
+    predicate = compile_constraint(constraint)
+    found, tried = [], 0
+
+    if np is not None:
+        rng = np.random.default_rng(seed)
+        dealt = np.repeat(np.arange(4, dtype=np.int8), 13)
+        while len(found) < count and tried < max_candidates:
+            size = min(NUMPY_BATCH_SIZE, max_candidates - tried)
+            # A random permutation per row; owners[deal, card] is the seat holding the card
+            owners = np.empty((size, 52), dtype=np.int8)
+            owners[np.arange(size)[:, None], rng.random((size, 52)).argsort(axis=1)] = dealt
+            tried += size
+            for row in owners[predicate.filter_batch(owners)][:count - len(found)]:
+                found.append(owners_to_hands(row.tolist()))
+        return found, tried
+
+    rng = random.Random(seed)
+    owners = [card // 13 for card in range(52)]
+    while len(found) < count and tried < max_candidates:
+        for _ in range(min(PYTHON_BATCH_SIZE, max_candidates - tried)):
+            rng.shuffle(owners)
+            tried += 1
+            if predicate.matches(owners):
+                found.append(owners_to_hands(owners))
+                if len(found) == count:
+                    break
+    return found, tried
+
+
+def generate_deals(constraint: str, count: int, seed=None, max_candidates: Optional[int] = None,
+                   workers: Optional[int] = None) -> List[Dict[str, Dict[str, str]]]:
+    """
+    Generate hands for `count` deals satisfying a constraint.
+
+    A first batch is dealt in this process. If it shows the rest would need
+    more candidates than are left, the search fails at once. If it would
+    need more than POOL_THRESHOLD and `workers` is above 1, the remaining
+    search is split over that many processes, each with its own seed, so a
+    seeded search stays reproducible.
+
+    Args:
+        constraint: Constraint text (see module docstring)
+        count: Number of deals wanted
+        seed: Any value to make the result reproducible (None: random)
+        max_candidates: Give up after dealing this many candidates in total
+            (default: settings.DEAL_GENERATOR_MAX_CANDIDATES, at most
+            PYTHON_MAX_CANDIDATES without NumPy)
+        workers: Process pool size for rare constraints; 0 or 1 searches
+            in this process (default: settings.DEAL_GENERATOR_WORKERS)
+
+    Returns:
+        Hands in Deal.hands form
+
+    Raises:
+        ValueError: If the constraint does not parse or too few deals match
+    """
+    compile_constraint(constraint)  # Report syntax errors before dealing anything
+    if max_candidates is None or workers is None:
+        from django.conf import settings  # Only in the calling process; workers stay Django-free
+        if max_candidates is None:
+            max_candidates = getattr(settings, 'DEAL_GENERATOR_MAX_CANDIDATES', DEFAULT_MAX_CANDIDATES)
+            if np is None:
+                max_candidates = min(max_candidates, PYTHON_MAX_CANDIDATES)
+        if workers is None:
+            workers = getattr(settings, 'DEAL_GENERATOR_WORKERS', 0)
+    base_seed = seed_int(seed) if seed is not None else random.getrandbits(64)
+    first_batch = NUMPY_BATCH_SIZE if np is not None else PYTHON_BATCH_SIZE
+    found, tried = search(constraint, count, base_seed, min(first_batch, max_candidates))
+
+    missing = count - len(found)
+    budget = max_candidates - tried
+    expected = missing * tried / len(found) if found else budget
+    if missing > 0 and expected > budget:
+        raise ValueError(
+            f'Only {len(found)} of {tried} candidates matched; {count} deals would need about '
+            f'{int(expected) + tried} candidates (limit {max_candidates}), the constraint may be too rare'
+        )
+    if missing > 0 and budget > 0 and workers > 1 and expected > POOL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                search,
+                [constraint] * workers,
+                [missing] * workers,
+                [base_seed + index + 1 for index in range(workers)],
+                [budget // workers] * workers
+            )
+            for hands, worker_tried in results:
+                found.extend(hands)
+                tried += worker_tried
+    elif missing > 0 and budget > 0:
+        hands, more = search(constraint, missing, base_seed + 1, budget)
+        found.extend(hands)
+        tried += more
+
+    if len(found) < count:
+        raise ValueError(
+            f'Only {len(found)} of {count} deals matched in {tried} candidates; the constraint may be too rare'
+        )
+    return found[:count]
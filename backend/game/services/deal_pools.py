@@ -0,0 +1,248 @@
+"""
+Shared deal pools and field trees
+
+A PooledDeal holds one set of cards, addressed by a hash of its canonical
+form, so the same board is stored once however many sessions play it. A
+DealPool is a numbered list of pooled deals; sessions started from a pool
+get Deal rows that point at the pooled deals instead of copying the hands.
+
+The field tree of a pooled deal is FieldCall: for every auction state, how
+many players (and sessions) chose each call, over every session playing
+the deal. It is kept up to date incrementally: when tree_write stamps the
+nodes changed by a write, refresh_field_calls recounts the active responses
+of just those auction states across the field. With sessions spread over
+shards (game.sharding) each shard counts its own sessions and
+build_field_tree adds the shards up.
+"""
+import hashlib
+from typing import Dict, Iterable, List, Optional
+from django.db import transaction
+from django.db.models import Count
+from ..models import Session, Deal, Node, Response, PooledDeal, DealPool, DealPoolBoard, FieldCall
+from ..sharding import for_each_shard
+from ..utils import shuffle_and_deal
+from .deal_formats import SEATS, SUITS, normalize_holding
+from .deal_generator import generate_deals
+
+BATCH_SIZE = 500
+
+
+def canonical_hands(hands: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    """Hands in Deal.hands form with every holding sorted by rank"""
+    return {
+        seat: {suit: normalize_holding(hands.get(seat, {}).get(suit, '')) for suit in SUITS}
+        for seat in SEATS
+    }
+
+
+def deal_hash(hands: Dict[str, Dict[str, str]], dealer: str, vulnerability: str) -> str:
+    """
+    Content hash of a deal.
+
+    The canonical text is the dealer, the vulnerability and the four hands
+    in PBN order (N E S W, suits S H D C, ranks high to low), so the same
+    board hashes the same whatever order its cards were stored in.
+    """
+    hands = canonical_hands(hands)
+    text = '|'.join([
+        dealer,
+        vulnerability,
+        ' '.join('.'.join(hands[seat][suit].replace('10', 'T') for suit in SUITS) for seat in SEATS),
+    ])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def get_or_create_pooled_deal(hands: Dict[str, Dict[str, str]], dealer: str, vulnerability: str) -> PooledDeal:
+    """The pooled deal with these cards, created on first use"""
+    pooled_deal, _ = PooledDeal.objects.get_or_create(
+        deal_hash=deal_hash(hands, dealer, vulnerability),
+        defaults={'hands': canonical_hands(hands), 'dealer': dealer, 'vulnerability': vulnerability}
+    )
+    return pooled_deal
+
+
+@transaction.atomic
+def create_pool(name: str, user, board_count: int = 0, boards: Optional[Iterable[dict]] = None,
+                description: str = '', constraint: str = '') -> DealPool:
+    """
+    Create a pool from given boards or freshly shuffled ones.
+
+    Args:
+        name: Unique pool name
+        user: Owner of the pool
+        board_count: Number of boards to shuffle when `boards` is not given
+        boards: Records with 'hands', 'dealer' and 'vulnerability' (as read by
+            game.services.deal_formats), numbered in order
+        description: Free text
+        constraint: Only shuffle boards matching this constraint (see
+            game.services.deal_generator)
+
+    Returns:
+        The new DealPool
+
+    Raises:
+        ValueError: If the constraint is invalid or too rare
+    """
+    if boards is None:
+        hands = generate_deals(constraint, board_count) if constraint else None
+        boards = []
+        for board_number in range(1, board_count + 1):
+            numbering = Deal(deal_number=board_number)  # Standard dealer/vulnerability rotation
+            boards.append({
+                'hands': hands[board_number - 1] if hands else shuffle_and_deal(),
+                'dealer': numbering.get_dealer_for_deal(),
+                'vulnerability': numbering.get_vulnerability_for_deal(),
+            })
+
+    pool = DealPool.objects.create(name=name, description=description, created_by=user)
+    DealPoolBoard.objects.bulk_create([
+        DealPoolBoard(
+            pool=pool,
+            board_number=board_number,
+            pooled_deal=get_or_create_pooled_deal(board['hands'], board['dealer'], board['vulnerability'])
+        )
+        for board_number, board in enumerate(boards, start=1)
+    ])
+    return pool
+
+
+def create_deals_from_pool(session: Session, pool: DealPool) -> List[Deal]:
+    """
+    Give a session one deal per board of a pool, sharing the pooled cards.
+
+    Returns:
+        The created deals
+    """
+    pool_boards = pool.pool_boards.select_related('pooled_deal').order_by('board_number')
+    return Deal.objects.bulk_create([
+        Deal(
+            session=session,
+            deal_number=pool_board.board_number,
+            dealer=pool_board.pooled_deal.dealer,
+            vulnerability=pool_board.pooled_deal.vulnerability,
+            pooled_deal=pool_board.pooled_deal
+        )
+        for pool_board in pool_boards
+    ])
+
+
+def refresh_field_calls(pooled_deal_id: int, node_ids: Iterable[int]) -> int:
+    """
+    Recount the field at the auction states of some changed nodes.
+
+    One grouped query per batch of states counts the active responses by
+    call over every deal sharing the pooled deal; counts that dropped to
+    zero are removed.
+
+    Returns:
+        Number of FieldCall rows written
+    """
+    node_ids = list(node_ids)
+    states = set()
+    for start in range(0, len(node_ids), BATCH_SIZE):
+        states.update(Node.objects.filter(id__in=node_ids[start:start + BATCH_SIZE]).values_list(
+            'history', 'seat_to_act'
+        ))
+    return recount_field_states(pooled_deal_id, states)
+
+
+def recount_field_states(pooled_deal_id: int, states: Iterable[tuple]) -> int:
+    """
+    Recount the field of a pooled deal at some (history, seat_to_act) states.
+
+    Returns:
+        Number of FieldCall rows written
+    """
+    written = 0
+    states = sorted(states)
+    for start in range(0, len(states), BATCH_SIZE):
+        batch = dict(states[start:start + BATCH_SIZE])  # {history: seat}
+        rows = Response.objects.filter(
+            is_active=True,
+            node__deal__pooled_deal_id=pooled_deal_id,
+            node__history__in=list(batch)
+        ).values('node__history', 'call').annotate(
+            responses=Count('id'),
+            sessions=Count('node__session', distinct=True)
+        ).order_by()
+
+        field_calls = [
+            FieldCall(
+                pooled_deal_id=pooled_deal_id,
+                history=row['node__history'],
+                seat_to_act=batch[row['node__history']],
+                call=row['call'],
+                responses=row['responses'],
+                sessions=row['sessions']
+            )
+            for row in rows
+        ]
+        current = {(field_call.history, field_call.call) for field_call in field_calls}
+        stale = [
+            field_call_id
+            for field_call_id, history, call in FieldCall.objects.filter(
+                pooled_deal_id=pooled_deal_id, history__in=list(batch)
+            ).values_list('id', 'history', 'call')
+            if (history, call) not in current
+        ]
+        if stale:
+            FieldCall.objects.filter(id__in=stale).delete()
+
+        FieldCall.objects.bulk_create(
+            field_calls,
+            update_conflicts=True,
+            unique_fields=['pooled_deal', 'history', 'call'],
+            update_fields=['seat_to_act', 'responses', 'sessions', 'updated_at']
+        )
+        written += len(field_calls)
+    return written
+
+
+def build_field_tree(pooled_deal: PooledDeal, deal: Optional[Deal] = None) -> dict:
+    """
+    Describe how the field bid a pooled deal.
+
+    Args:
+        pooled_deal: The pooled deal
+        deal: A session's deal of this board; its own active calls are
+            listed per state as 'session_calls' for comparison
+
+    Returns:
+        {'deal_hash', 'dealer', 'vul', 'sessions', 'states': {history: {'seat',
+         'total', 'calls': [{'call', 'responses', 'sessions', 'share'}]}}}
+    """
+    states = {}
+    session_count = 0
+    for _ in for_each_shard():
+        for field_call in FieldCall.objects.filter(pooled_deal=pooled_deal).order_by('history', 'call'):
+            state = states.setdefault(field_call.history, {
+                'seat': field_call.seat_to_act, 'total': 0, 'calls': {}
+            })
+            state['total'] += field_call.responses
+            call = state['calls'].setdefault(field_call.call, {
+                'call': field_call.call, 'responses': 0, 'sessions': 0
+            })
+            call['responses'] += field_call.responses
+            call['sessions'] += field_call.sessions
+        session_count += Deal.objects.filter(pooled_deal=pooled_deal).count()
+
+    states = dict(sorted(states.items()))
+    for state in states.values():
+        state['calls'] = sorted(state['calls'].values(), key=lambda call: (-call['responses'], call['call']))
+        for call in state['calls']:
+            call['share'] = round(call['responses'] / state['total'], 4) if state['total'] else 0
+
+    if deal is not None:
+        own = Response.objects.filter(node__deal=deal, is_active=True).values_list('node__history', 'call')
+        for history, call in own:
+            if history in states:
+                session_calls = states[history].setdefault('session_calls', {})
+                session_calls[call] = session_calls.get(call, 0) + 1
+
+    return {
+        'deal_hash': pooled_deal.deal_hash,
+        'dealer': pooled_deal.dealer,
+        'vul': pooled_deal.vulnerability,
+        'sessions': session_count,
+        'states': states,
+    }
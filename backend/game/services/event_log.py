@@ -0,0 +1,300 @@
+"""
+Append-only event log for auction trees
+
+Every call, rewind and undo on a deal is appended to TreeEvent. Every
+TREE_SNAPSHOT_INTERVAL events a compact TreeSnapshot of the replayed state
+(the active responses and each node's divergence, status and needs) is
+written, so the tree of any deal at any point in time can be rebuilt by
+loading the nearest snapshot and replaying only the events after it.
+
+Sequences are numbered from the last one in the log. Two writers that read
+the same last sequence collide on the (deal, sequence) constraint; the
+loser's write fails with TreeVersionConflict, which tree_write_attempts()
+runs again after the winner's events.
+"""
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Max
+from ..models import Deal, Node, Response, TreeEvent, TreeSnapshot
+from .auction_tree import answer_masks, derive_needs_mask, is_auction_closed, get_next_seat, subtree_answer_masks
+from .participants import participant_bits, who_needs_for_mask
+from .tree_versions import TreeVersionConflict
+
+
+def node_key(history: str, seat_to_act: str) -> str:
+    """Key identifying a node inside a replayed state"""
+    return f"{history}|{seat_to_act}"
+
+
+def empty_state() -> dict:
+    return {'responses': {}, 'nodes': {}}
+
+
+def _log_conflict(deal: Deal) -> TreeVersionConflict:
+    """The error for an event insert that lost its sequence to a concurrent write"""
+    return TreeVersionConflict(f'The event log of deal {deal.id} changed concurrently')
+
+
+def append_event(deal: Deal, user, kind: str, history: str, seat_to_act: str,
+                 call: str = '', payload: Optional[dict] = None) -> TreeEvent:
+    """
+    Append an event to the deal's log and snapshot the state when due.
+
+    Args:
+        deal: The deal the event applies to
+        user: The user who performed the action
+        kind: 'CALL', 'REWIND' or 'UNDO'
+        history: History of the node the event applies to
+        seat_to_act: Seat to act at that node
+        call: The call made (CALL events only)
+        payload: Extra data; rewinds and undos list the cleared nodes
+
+    Returns:
+        The created TreeEvent
+    """
+    last_sequence = deal.tree_events.aggregate(last=Max('sequence'))['last'] or 0
+    try:
+        event = TreeEvent.objects.create(
+            session_id=deal.session_id,
+            deal=deal,
+            user=user,
+            sequence=last_sequence + 1,
+            kind=kind,
+            history=history,
+            seat_to_act=seat_to_act,
+            call=call,
+            payload=payload or {}
+        )
+    except IntegrityError as error:
+        raise _log_conflict(deal) from error
+
+    interval = getattr(settings, 'TREE_SNAPSHOT_INTERVAL', 50)
+    if interval and event.sequence % interval == 0:
+        take_snapshot(deal, event.sequence)
+
+    return event
+
+
+def append_events(deal: Deal, user, entries: List[tuple]) -> List[TreeEvent]:
+    """
+    Append several events from one user with a single INSERT.
+
+    Args:
+        deal: The deal the events apply to
+        user: The user who performed the actions
+        entries: (kind, history, seat_to_act, call, payload) tuples in order
+
+    Returns:
+        The created TreeEvents
+    """
+    last_sequence = deal.tree_events.aggregate(last=Max('sequence'))['last'] or 0
+    try:
+        events = TreeEvent.objects.bulk_create([
+            TreeEvent(
+                session_id=deal.session_id,
+                deal=deal,
+                user=user,
+                sequence=last_sequence + offset,
+                kind=kind,
+                history=history,
+                seat_to_act=seat_to_act,
+                call=call,
+                payload=payload or {}
+            )
+            for offset, (kind, history, seat_to_act, call, payload) in enumerate(entries, start=1)
+        ])
+    except IntegrityError as error:
+        raise _log_conflict(deal) from error
+
+    interval = getattr(settings, 'TREE_SNAPSHOT_INTERVAL', 50)
+    new_last = last_sequence + len(entries)
+    if interval and new_last // interval > last_sequence // interval:
+        take_snapshot(deal, new_last - new_last % interval)
+
+    return events
+
+
+def apply_event(state: dict, event: TreeEvent) -> None:
+    """Fold a single event into a replayed state (responses only)"""
+    responses = state['responses']
+    user_key = str(event.user_id)
+
+    if event.kind == 'CALL':
+        key = node_key(event.history, event.seat_to_act)
+        responses.setdefault(key, {})[user_key] = event.call
+        return
+
+    # REWIND / UNDO: drop the user's responses at every cleared node
+    for history, seat in event.payload.get('cleared', []):
+        key = node_key(history, seat)
+        node_responses = responses.get(key)
+        if node_responses and user_key in node_responses:
+            del node_responses[user_key]
+            if not node_responses:
+                del responses[key]
+
+
+def derive_nodes(deal: Deal, responses: Dict[str, Dict[str, str]]) -> Dict[str, dict]:
+    """
+    Derive divergence, open/closed status and needs for every node in a state.
+
+    Nodes are the ones holding responses plus the children those responses
+    create, mirroring what record_user_response writes to the database.
+    Needs are derived like refresh_derived_state does, over the session's
+    current participants.
+    """
+    session = deal.session
+    responses_by_node = {}
+    for key, node_responses in responses.items():
+        history, seat = key.rsplit('|', 1)
+        responses_by_node[(history, seat)] = {int(user_id): call for user_id, call in node_responses.items()}
+    call_masks = answer_masks(responses_by_node, participant_bits(session))
+    subtree_masks = subtree_answer_masks(call_masks)
+
+    states = set(responses_by_node)
+    for (history, seat), node_responses in responses_by_node.items():
+        for call in set(node_responses.values()):
+            states.add(((history + ' ' + call).strip(), get_next_seat(seat)))
+
+    nodes = {}
+    for history, seat in states:
+        needs_mask = derive_needs_mask(
+            history, seat, deal.dealer, session.participant_mask, call_masks, subtree_masks
+        )
+        nodes[node_key(history, seat)] = {
+            'divergence': len(call_masks.get((history, seat), {})) > 1,
+            'status': 'closed' if is_auction_closed(history) else 'open',
+            'who_needs': who_needs_for_mask(needs_mask),
+            'needs_mask': needs_mask
+        }
+    return nodes
+
+
+def load_state(deal: Deal, sequence: Optional[int] = None) -> Tuple[dict, int]:
+    """
+    Rebuild a deal's tree state after the given event.
+
+    Args:
+        deal: The deal to rebuild
+        sequence: Last event to include; None replays the whole log
+
+    Returns:
+        (state, last applied sequence)
+    """
+    snapshots = TreeSnapshot.objects.filter(deal=deal)
+    events = TreeEvent.objects.filter(deal=deal)
+    if sequence is not None:
+        snapshots = snapshots.filter(sequence__lte=sequence)
+        events = events.filter(sequence__lte=sequence)
+
+    snapshot = snapshots.order_by('-sequence').first()
+    if snapshot:
+        state = {'responses': snapshot.state.get('responses', {}), 'nodes': snapshot.state.get('nodes', {})}
+        last_sequence = snapshot.sequence
+        events = events.filter(sequence__gt=snapshot.sequence)
+    else:
+        state = empty_state()
+        last_sequence = 0
+
+    for event in events.order_by('sequence').iterator():
+        apply_event(state, event)
+        last_sequence = event.sequence
+
+    # A snapshot's stored nodes hold until an event after it changes the
+    # responses (snapshots from before needs were stored are derived again)
+    if (snapshot is None or last_sequence != snapshot.sequence
+            or any('needs_mask' not in node for node in state['nodes'].values())):
+        state['nodes'] = derive_nodes(deal, state['responses'])
+    return state, last_sequence
+
+
+def state_as_of(deal: Deal, as_of) -> Tuple[dict, int]:
+    """Rebuild a deal's tree state as it was at the given datetime"""
+    last_event = TreeEvent.objects.filter(
+        deal=deal,
+        created_at__lte=as_of
+    ).order_by('-sequence').values_list('sequence', flat=True).first()
+    return load_state(deal, last_event or 0)
+
+
+def take_snapshot(deal: Deal, sequence: Optional[int] = None) -> TreeSnapshot:
+    """Persist the replayed state after the given event as a snapshot"""
+    state, last_sequence = load_state(deal, sequence)
+    snapshot, _ = TreeSnapshot.objects.update_or_create(
+        deal=deal,
+        sequence=last_sequence,
+        defaults={'state': state}
+    )
+    return snapshot
+
+
+def db_state(deal: Deal) -> dict:
+    """Build a state from the live Response/Node rows of a deal"""
+    responses = {}
+    active = Response.objects.filter(
+        node__deal=deal,
+        is_active=True
+    ).values_list('node__history', 'node__seat_to_act', 'user_id', 'call')
+    for history, seat, user_id, call in active:
+        responses.setdefault(node_key(history, seat), {})[str(user_id)] = call
+
+    nodes = {
+        node_key(history, seat): {
+            'divergence': divergence, 'status': status, 'who_needs': who_needs, 'needs_mask': needs_mask
+        }
+        for history, seat, divergence, status, who_needs, needs_mask in Node.objects.filter(deal=deal).values_list(
+            'history', 'seat_to_act', 'divergence', 'status', 'who_needs', 'needs_mask'
+        )
+    }
+    return {'responses': responses, 'nodes': nodes}
+
+
+def seed_snapshot(deal: Deal) -> Optional[TreeSnapshot]:
+    """
+    Snapshot the live database state at the current end of the log.
+    Used to bring deals that pre-date the event log under replay.
+
+    Returns:
+        The snapshot, or None for a deal without events (a seed at sequence
+        0 would stand for the tree before any event)
+    """
+    last_sequence = deal.tree_events.aggregate(last=Max('sequence'))['last']
+    if not last_sequence:
+        return None
+    snapshot, _ = TreeSnapshot.objects.update_or_create(
+        deal=deal,
+        sequence=last_sequence,
+        defaults={'state': db_state(deal)}
+    )
+    return snapshot
+
+
+def verify_deal_state(deal: Deal) -> List[dict]:
+    """
+    Compare the replayed log against the live rows of a deal.
+
+    Returns:
+        List of mismatches; empty when the log and the database agree
+    """
+    replayed, _ = load_state(deal)
+    live = db_state(deal)
+    mismatches = []
+
+    for key in set(replayed['responses']) | set(live['responses']):
+        expected = replayed['responses'].get(key, {})
+        actual = live['responses'].get(key, {})
+        if expected != actual:
+            mismatches.append({'node': key, 'field': 'responses', 'log': expected, 'db': actual})
+
+    for key, derived in replayed['nodes'].items():
+        actual = live['nodes'].get(key)
+        if actual is None:
+            mismatches.append({'node': key, 'field': 'missing', 'log': derived, 'db': None})
+            continue
+        for field in ('divergence', 'status', 'who_needs', 'needs_mask'):
+            if derived[field] != actual[field]:
+                mismatches.append({'node': key, 'field': field, 'log': derived[field], 'db': actual[field]})
+
+    return mismatches
+
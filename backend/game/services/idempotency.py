@@ -0,0 +1,115 @@
+"""
+Idempotency keys for retried write requests
+
+A client on a flaky connection cannot tell whether a timed-out POST was
+applied, so it retries. When the request carries an Idempotency-Key header,
+the first successful response is stored under (user, key) and every retry
+within IDEMPOTENCY_KEY_TTL_SECONDS gets that stored response back without
+running the view again: no second validation, no duplicate calls in the
+user's sequence and no second recompute of the tree.
+
+A retry that arrives while the first attempt is still running gets 409, and
+reusing a key for a different request body gets 422. Only 2xx responses are
+kept; after an error the key is released so the retry runs for real.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from ..models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_hash(endpoint: str, data) -> str:
+    """Fingerprint of a request: its endpoint and canonical JSON body"""
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{endpoint}\n{body}'.encode()).hexdigest()
+
+
+def _claim(user, key: str, endpoint: str, fingerprint: str):
+    """
+    Claim a key for a new request.
+
+    Returns:
+        (IdempotencyKey, None) when the request should run, or
+        (None, Response) to answer with instead
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(user=user, expires_at__lte=now).delete()
+
+    existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if existing is None:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user,
+                    key=key,
+                    endpoint=endpoint,
+                    request_hash=fingerprint,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+                ), None
+        except IntegrityError:
+            # A concurrent attempt with the same key claimed it first
+            existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if existing is None:
+                return None, Response(
+                    {'error': 'Could not claim the Idempotency-Key, please retry'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+    if existing.request_hash != fingerprint:
+        return None, Response(
+            {'error': 'This Idempotency-Key was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if existing.status_code is None:
+        return None, Response(
+            {'error': 'A request with this Idempotency-Key is still being processed'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return None, Response(existing.response, status=existing.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view_method):
+    """
+    Decorator for viewset actions honouring the Idempotency-Key header.
+
+    Requests without the header run as usual.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER, '').strip()
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        endpoint = view_method.__name__
+        claimed, replay = _claim(request.user, key, endpoint, request_hash(endpoint, request.data))
+        if replay is not None:
+            return replay
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            claimed.delete()
+            raise
+        if status.is_success(response.status_code):
+            claimed.status_code = response.status_code
+            claimed.response = response.data
+            claimed.save(update_fields=['status_code', 'response'])
+        else:
+            claimed.delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,141 @@
+"""
+Session participants and participant bitmasks
+
+Every member of a session (creator, partner, and any members or coaches
+added later) holds a slot in SessionParticipant, and slot s stands for the
+bit 1 << s. Sets of participants are stored as integers over those bits:
+Node.needs_mask (who still has to answer), Edge.by_mask (who made the call)
+and Session.participant_mask (everyone). Set logic in the tree rules is then
+plain bitwise arithmetic, independent of how many people share the session.
+
+The creator always holds slot 0 and the partner slot 1, so the legacy
+who_needs strings and by_set role lists are projections of bits 0 and 1.
+"""
+from typing import Dict, Iterable, List
+from django.db.models import F, QuerySet
+from ..models import Session, SessionParticipant
+from ..sharding import select_users
+from .pending_work import refresh_pending_counters
+from .tree_versions import tree_write
+
+CREATOR_BIT = 1 << SessionParticipant.CREATOR_SLOT
+PARTNER_BIT = 1 << SessionParticipant.PARTNER_SLOT
+# Masks are stored in PositiveIntegerFields (31 usable bits)
+MAX_PARTICIPANTS = 31
+
+WHO_NEEDS_BY_PAIR = {0: 'none', CREATOR_BIT: 'creator', PARTNER_BIT: 'partner', CREATOR_BIT | PARTNER_BIT: 'both'}
+
+
+def display_name(user) -> str:
+    """Name shown for a user in trees and edge 'by' lists"""
+    return user.username or user.email.split('@')[0]
+
+
+def session_participants(session: Session) -> List[SessionParticipant]:
+    """A session's participants in slot order, cached on the session instance"""
+    cached = getattr(session, '_participants_cache', None)
+    if cached is None:
+        cached = list(select_users(session.participants.order_by('slot'), 'user'))
+        session._participants_cache = cached
+    return cached
+
+
+def participant_bits(session: Session) -> Dict[int, int]:
+    """{user_id: bit} of a session's participants"""
+    return {participant.user_id: participant.bit for participant in session_participants(session)}
+
+
+def participant_names(session: Session) -> Dict[int, str]:
+    """{user_id: display name} of a session's participants"""
+    return {participant.user_id: display_name(participant.user) for participant in session_participants(session)}
+
+
+def participant_bit(session: Session, user_id: int) -> int:
+    """Bit of a user in a session (0 if the user does not take part)"""
+    return participant_bits(session).get(user_id, 0)
+
+
+def mask_of(user_ids: Iterable[int], bits: Dict[int, int]) -> int:
+    """OR of the bits of some users"""
+    mask = 0
+    for user_id in user_ids:
+        mask |= bits.get(user_id, 0)
+    return mask
+
+
+def who_needs_for_mask(mask: int) -> str:
+    """Legacy who_needs value of a needs mask (creator and partner bits only)"""
+    return WHO_NEEDS_BY_PAIR[mask & (CREATOR_BIT | PARTNER_BIT)]
+
+
+def roles_for_mask(mask: int) -> List[str]:
+    """Legacy by_set role list of a by mask (creator and partner bits only)"""
+    roles = []
+    if mask & CREATOR_BIT:
+        roles.append('creator')
+    if mask & PARTNER_BIT:
+        roles.append('partner')
+    return roles
+
+
+def needing_user(queryset: QuerySet, bit: int) -> QuerySet:
+    """Restrict a Node queryset to nodes whose needs_mask includes `bit`"""
+    return queryset.alias(needed_by_user=F('needs_mask').bitand(bit)).filter(needed_by_user__gt=0)
+
+
+def ensure_core_participants(session: Session) -> None:
+    """Give a session's creator and partner their fixed slots"""
+    participants = [SessionParticipant(
+        session=session, user_id=session.creator_id,
+        slot=SessionParticipant.CREATOR_SLOT, role='creator'
+    )]
+    if session.partner_id != session.creator_id:
+        participants.append(SessionParticipant(
+            session=session, user_id=session.partner_id,
+            slot=SessionParticipant.PARTNER_SLOT, role='partner'
+        ))
+    SessionParticipant.objects.bulk_create(participants, ignore_conflicts=True)
+
+    session._participants_cache = None
+    session.participant_mask = sum(participant_bits(session).values())  # Bits are distinct
+    Session.objects.filter(id=session.id).update(participant_mask=session.participant_mask)
+
+
+@tree_write()
+def add_participant(session: Session, user, role: str = 'member') -> SessionParticipant:
+    """
+    Add a user to a session in the lowest free slot.
+
+    Open nodes of the session start needing the new participant's answer
+    (unless a same-seat no-follow exemption applies, as for the partners),
+    so the tree grows to cover them just like it does for the partners.
+
+    Returns:
+        The new (or existing) SessionParticipant
+
+    Raises:
+        ValueError: If every slot is taken
+    """
+    # Lock the session row so concurrent joins cannot pick the same slot
+    session = Session.objects.select_for_update().get(id=session.id)
+    existing = session.participants.filter(user=user).first()
+    if existing is not None:
+        return existing
+
+    taken = set(session.participants.values_list('slot', flat=True))
+    slot = next((slot for slot in range(MAX_PARTICIPANTS) if slot not in taken), None)
+    if slot is None:
+        raise ValueError(f'A session can have at most {MAX_PARTICIPANTS} participants')
+
+    participant = SessionParticipant.objects.create(session=session, user=user, slot=slot, role=role)
+    Session.objects.filter(id=session.id).update(participant_mask=F('participant_mask').bitor(participant.bit))
+    session.refresh_from_db(fields=['participant_mask'])
+    session._participants_cache = None
+
+    # Needs are derived again (not just widened by the new bit) so the
+    # same-seat no-follow exemptions apply to the new participant too
+    from .auction_tree import refresh_derived_state
+    for deal in session.deals.filter(nodes__status='open').distinct():
+        refresh_derived_state(session, deal)
+    refresh_pending_counters(session)
+    return participant
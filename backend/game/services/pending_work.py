@@ -0,0 +1,173 @@
+"""
+Materialized pending-work counters
+
+Keeps one PendingWorkCounter row per (user, deal) holding the number of open
+nodes whose needs_mask includes that user's participant bit, so a user's outstanding work across
+every session can be read with one indexed query. Counters are recomputed
+from the tree (not incremented) inside the same transaction as each write
+that can change who_needs: recording, rewinding, undoing and importing.
+
+A deal whose tree has not been built yet counts its root as pending for every
+participant, since the root is created (needed by everyone) on first visit.
+"""
+from typing import Dict, Iterable, List, Optional
+from django.db.models import F, Q, Sum
+from django.contrib.auth import get_user_model
+from ..models import Session, SessionParticipant, Deal, Node, PendingWorkCounter
+from ..sharding import for_each_shard
+
+BATCH_SIZE = 500
+
+
+def pending_counts(session: Session, deal_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+    """
+    Count the open nodes awaiting each participant, per deal, in one grouped query.
+
+    needs_mask & bit is either 0 or bit, so summing it over the open nodes
+    and dividing by the bit counts the nodes needing that participant.
+
+    Returns:
+        {deal_id: {user_id: pending}}
+    """
+    from .participants import participant_bits
+
+    deal_ids = list(deal_ids)
+    bits = participant_bits(session)
+    open_nodes = Q(status='open')
+    rows = Node.objects.filter(deal_id__in=deal_ids).values('deal_id').annotate(**{
+        f'pending_{user_id}': Sum(F('needs_mask').bitand(bit), filter=open_nodes, default=0)
+        for user_id, bit in bits.items()
+    }).order_by()
+
+    # Unbuilt trees: the root awaits everyone
+    counts = {deal_id: dict.fromkeys(bits, 1) for deal_id in deal_ids}
+    for row in rows:
+        counts[row['deal_id']] = {
+            user_id: row[f'pending_{user_id}'] // bit for user_id, bit in bits.items()
+        }
+    return counts
+
+
+def stale_pending_counters(session: Session, deal_ids: Iterable[int]) -> List[PendingWorkCounter]:
+    """
+    The counters of some deals whose stored value differs from the tree.
+
+    Returns:
+        Unsaved PendingWorkCounter rows holding the recomputed values
+    """
+    deal_ids = list(deal_ids)
+    counts = pending_counts(session, deal_ids)
+    stored = {
+        (deal_id, user_id): pending
+        for deal_id, user_id, pending in PendingWorkCounter.objects.filter(
+            deal_id__in=deal_ids
+        ).values_list('deal_id', 'user_id', 'pending')
+    }
+    return [
+        PendingWorkCounter(user_id=user_id, session=session, deal_id=deal_id, pending=pending)
+        for deal_id, per_user in counts.items()
+        for user_id, pending in per_user.items()
+        if stored.get((deal_id, user_id)) != pending
+    ]
+
+
+def refresh_pending_counters(session: Session, deals: Optional[Iterable[Deal]] = None) -> int:
+    """
+    Recompute the counters of every participant for some deals and upsert
+    the ones that changed (a tree read that changed nothing writes nothing).
+
+    Args:
+        session: The session the deals belong to
+        deals: Deals to refresh; defaults to every deal in the session
+
+    Returns:
+        Number of counter rows written
+    """
+    if deals is None:
+        deal_ids = list(session.deals.values_list('id', flat=True))
+    else:
+        deal_ids = [deal.id for deal in deals]
+
+    written = 0
+    for start in range(0, len(deal_ids), BATCH_SIZE):
+        counters = stale_pending_counters(session, deal_ids[start:start + BATCH_SIZE])
+        if not counters:
+            continue
+        PendingWorkCounter.objects.bulk_create(
+            counters,
+            update_conflicts=True,
+            unique_fields=['user', 'deal'],
+            update_fields=['pending', 'updated_at']
+        )
+        written += len(counters)
+    return written
+
+
+def dashboard_for_user(user) -> dict:
+    """
+    Pending work of a user grouped by session, from two queries per shard
+    (counters, then the other participants of their sessions) plus one for
+    the participants' users (users live apart from sessions).
+
+    Returns:
+        {'total_pending': int, 'sessions': [{session fields, 'participants',
+         'pending', 'deals': [...]}]}, participants in slot order without the user
+    """
+    sessions = {}
+    updated = {}
+    others = {}  # {session_id: [(user_id, role)]}
+    for _ in for_each_shard():
+        counters = PendingWorkCounter.objects.filter(
+            user=user,
+            pending__gt=0,
+            session__is_active=True
+        ).select_related('session', 'deal').only(
+            'pending', 'session_id', 'deal_id',
+            'session__name', 'session__updated_at',
+            'deal__deal_number'
+        ).order_by('session_id', 'deal__deal_number')
+
+        shard_sessions = []
+        for counter in counters:
+            session = counter.session
+            entry = sessions.get(session.id)
+            if entry is None:
+                entry = sessions[session.id] = {
+                    'session_id': session.id,
+                    'session_name': session.name,
+                    'participants': [],
+                    'pending': 0,
+                    'deals': [],
+                }
+                updated[session.id] = session.updated_at
+                shard_sessions.append(session.id)
+            entry['pending'] += counter.pending
+            entry['deals'].append({
+                'deal_id': counter.deal_id,
+                'deal_number': counter.deal.deal_number,
+                'pending': counter.pending,
+            })
+
+        if shard_sessions:
+            participants = SessionParticipant.objects.filter(
+                session_id__in=shard_sessions
+            ).exclude(user_id=user.id).order_by('session_id', 'slot').values_list('session_id', 'user_id', 'role')
+            for session_id, user_id, role in participants:
+                others.setdefault(session_id, []).append((user_id, role))
+
+    users = get_user_model().objects.only('id', 'username', 'email').in_bulk(
+        {user_id for members in others.values() for user_id, _ in members}
+    )
+    for session_id, members in others.items():
+        sessions[session_id]['participants'] = [
+            {'id': user_id, 'username': users[user_id].username, 'email': users[user_id].email, 'role': role}
+            for user_id, role in members if user_id in users
+        ]
+
+    # Most recently updated sessions first, ties by id
+    ordered = sorted(sessions)
+    ordered.sort(key=updated.get, reverse=True)
+    return {
+        'total_pending': sum(entry['pending'] for entry in sessions.values()),
+        'sessions': [sessions[session_id] for session_id in ordered],
+    }
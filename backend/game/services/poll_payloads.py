@@ -0,0 +1,156 @@
+"""
+JSON payloads of the polling endpoints
+
+my_progress, get_next_task and node_comments are answered both by the DRF
+actions and, under ASGI, by the coroutines in game.async_views. Each side
+runs its own queries (the ORM or the async ORM) and hands the rows to these
+builders, so both return the same JSON.
+"""
+from typing import Iterable, List, Optional
+from ..models import Session, Deal, Node, NodeComment, Response, UserBiddingSequence
+from ..utils import get_next_position
+
+# Default theme colors of the progress timeline
+PROGRESS_THEME = {
+    'primary': '#2D3A8C',
+    'muted': '#6B7280',
+    'bg': '#0B1023'
+}
+
+
+def progress_payload(session: Session, deal: Deal, responses: Iterable[Response]) -> dict:
+    """
+    A user's bidding progress on a deal.
+
+    Args:
+        responses: The user's active responses on the deal with their nodes,
+            in node history order
+    """
+    nodes = [{
+        'node_id': 'n_root',
+        'seat': deal.dealer,
+        'history': '',
+        'your_call': None,
+        'created_at': None,
+        'is_terminal': False
+    }]
+    current_node_id = None
+    for response in responses:
+        node = response.node
+        nodes.append({
+            'node_id': node.stable_id,
+            'seat': node.seat_to_act,
+            'history': node.history,
+            'your_call': response.call,
+            'created_at': response.timestamp.isoformat(),
+            'is_terminal': node.is_auction_complete(),
+            'who_needs': node.who_needs,  # For coloring
+            'needs_mask': node.needs_mask
+        })
+        current_node_id = node.stable_id
+
+    return {
+        'session_id': session.id,
+        'deal_index': deal.deal_number,
+        'dealer': deal.dealer,
+        'vul': deal.vulnerability,
+        'theme': PROGRESS_THEME,
+        'nodes': nodes,
+        'current_node_id': current_node_id or 'n_root'
+    }
+
+
+def no_task_payload(reason: str) -> dict:
+    """get_next_task answer when the scheduler has nothing for the user"""
+    return {
+        'node_id': None,
+        'deal_index': None,
+        'depth': None,
+        'seat': None,
+        'history': '',
+        'reason': reason,
+        'all_completed': reason == 'ALL_CAUGHT_UP'
+    }
+
+
+def shows_user_sequence(user_sequence: Optional[UserBiddingSequence], node: Node) -> bool:
+    """Whether a task is on the branch of the user's own sequence, which is then displayed"""
+    if user_sequence is None or not user_sequence.call_count:
+        return False
+    user_history = user_sequence.history
+    return user_history.startswith(node.history) or node.history.startswith(user_history)
+
+
+def off_branch_entries(user_sequence: Optional[UserBiddingSequence], node: Node) -> List[dict]:
+    """
+    Display entries of a task off the user's branch: the node's history
+    built from the dealer on, or none before the user has made a call.
+    """
+    if user_sequence is None or not user_sequence.call_count:
+        return []
+    entries = []
+    position = node.deal.dealer
+    for call in node.history.split():
+        entries.append({
+            'position': position,
+            'call': call,
+            'type': 'bid' if call[0].isdigit() else 'action',
+            'call_index': len(entries)
+        })
+        position = get_next_position(position)
+    return entries
+
+
+def next_task_payload(node: Node, reason: str, display_sequence: List[dict]) -> dict:
+    """
+    get_next_task answer for a scheduled node.
+
+    Args:
+        node: The node (its deal loaded); requires_user() has already
+            checked its seat is the user's to answer
+        reason: Why the scheduler picked it
+        display_sequence: The user's sequence entries when
+            shows_user_sequence(), else off_branch_entries()
+    """
+    deal = node.deal
+    return {
+        'node_id': node.id,
+        'deal_index': deal.deal_number,
+        'depth': node.depth,
+        'seat': node.seat_to_act,
+        'history': node.history or '',
+        'reason': reason,
+        'deal': {
+            'id': deal.id,
+            'deal_number': deal.deal_number,
+            'hands': deal.board_hands,
+            'dealer': deal.dealer,
+            'vulnerability': deal.vulnerability
+        },
+        'user_sequence': display_sequence
+    }
+
+
+def comment_json(comment: NodeComment) -> dict:
+    """API form of a node comment (its node and user loaded)"""
+    return {
+        'id': comment.id,
+        'node_id': comment.node.id,
+        'node_history': comment.node.history,
+        'user': {
+            'id': comment.user.id,
+            'username': comment.user.username,
+            'email': comment.user.email
+        },
+        'comment_text': comment.comment_text,
+        'created_at': comment.created_at.isoformat(),
+        'updated_at': comment.updated_at.isoformat()
+    }
+
+
+def comments_payload(deal: Deal, comments: Iterable[NodeComment]) -> dict:
+    """All comments on a deal's nodes"""
+    return {
+        'comments': [comment_json(comment) for comment in comments],
+        'deal_index': deal.deal_number
+    }
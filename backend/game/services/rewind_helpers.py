@@ -138,7 +138,8 @@ def recompute_open_closed_status(node: Node) -> bool:
         # If auction closed, who_needs should be 'none'
         if auction_closed:
             node.who_needs = 'none'
-            node.save(update_fields=['status', 'who_needs'])
+            node.needs_mask = 0
+            node.save(update_fields=['status', 'who_needs', 'needs_mask'])
         else:
             node.save(update_fields=['status'])
 
@@ -5,60 +5,43 @@ from typing import Optional, Dict, Any, Tuple, List
 import random
 from django.db.models import Q
 from ..models import Session, Node, Response
-from django.contrib.auth import get_user_model
 from ..bridge_auction_validator import get_auction_state_from_history
+from .participants import participant_bit, needing_user
 
-User = get_user_model()
 
-
-def requires_user(node: Node, user_id: int) -> bool:
-    """Check if node requires response from this user based on who_needs AND seat matching (for independent bidding)"""
+def requires_user(node: Node, user_id: int, bit: Optional[int] = None) -> bool:
+    """Check if node requires response from this user based on needs_mask AND seat matching (for independent bidding)"""
     from ..models import PlayerGame, UserBiddingSequence
     from ..utils import get_next_position
 
-    session = node.session
-
-    # First check who_needs
-    if node.who_needs == 'none':
-        return False
-
-    user_needs_based_on_field = False
-    if node.who_needs == 'both':
-        user_needs_based_on_field = True
-    elif node.who_needs == 'creator':
-        user_needs_based_on_field = (user_id == session.creator.id)
-    elif node.who_needs == 'partner':
-        user_needs_based_on_field = (user_id == session.partner.id)
-
-    if not user_needs_based_on_field:
+    # First check the user's bit in needs_mask
+    if bit is None:
+        bit = participant_bit(node.session, user_id)
+    if not node.needs_mask & bit:
         return False
 
     # For independent bidding: check if this node matches user's current position in their sequence
-    user = User.objects.get(id=user_id)
+    # (the cached history and last seat are enough; the call rows are not read)
     user_sequence = UserBiddingSequence.objects.filter(
-        deal=node.deal,
-        user=user
-    ).first()
+        deal_id=node.deal_id,
+        user_id=user_id
+    ).only('history', 'call_count', 'last_position').first()
 
     # Check if this node is on the same branch as user's sequence
     # If user has a sequence, check if node's history matches the sequence
-    if user_sequence and user_sequence.sequence:
-        # Build user's history from their sequence
-        user_history_calls = [call.get('call') for call in user_sequence.sequence]
-        user_history = ' '.join(user_history_calls) if user_history_calls else ''
+    if user_sequence and user_sequence.call_count:
+        user_history = user_sequence.history
 
         # If node's history is a prefix of user's history, calculate next position from user sequence
         if user_history.startswith(node.history) or node.history.startswith(user_history):
             # Same branch - use user's sequence
-            last_call = user_sequence.sequence[-1]
-            last_position = last_call.get('position', node.deal.dealer)
-            next_position = get_next_position(last_position)
+            next_position = get_next_position(user_sequence.last_position or node.deal.dealer)
         else:
             # Different branch - find user's last response on this branch path
             # to determine correct position
             branch_responses = Response.objects.filter(
                 node__deal=node.deal,
-                user=user,
+                user_id=user_id,
                 is_active=True
             ).select_related('node').order_by('-node__depth', '-timestamp')
 
@@ -107,18 +90,27 @@ def get_last_answer(user_id: int, session_id: int) -> Optional[Tuple[int, int]]:
     return (last_response.node.deal.deal_number, last_response.node.depth)
 
 
+def user_bit(session_id: int, user_id: int) -> int:
+    """The user's participant bit in a session (0 if not a participant)"""
+    return participant_bit(Session.objects.get(id=session_id), user_id)
+
+
+def open_nodes_needing(session_id: int, bit: int):
+    """Open nodes of a session whose needs_mask includes `bit`, filtered in SQL"""
+    return needing_user(Node.objects.filter(session_id=session_id, status='open'), bit)
+
+
 def find_eligible_node(session_id: int, deal_index: int, depth: int, user_id: int) -> Optional[Node]:
     """Find eligible node at specific depth in specific deal"""
-    candidates = Node.objects.filter(
-        session_id=session_id,
+    bit = user_bit(session_id, user_id)
+    candidates = open_nodes_needing(session_id, bit).filter(
         deal__deal_number=deal_index,
-        depth=depth,
-        status='open'
+        depth=depth
     )
 
     for node in candidates:
         # Check if user needs to answer and hasn't answered yet
-        if requires_user(node, user_id):
+        if requires_user(node, user_id, bit):
             has_answered = Response.objects.filter(
                 node=node,
                 user_id=user_id,
@@ -139,7 +131,7 @@ def list_deals_with_eligible_nodes(session_id: int, user_id: int) -> list:
     open_nodes = Node.objects.filter(
         session_id=session_id,
         status='open'
-    ).select_related('deal')
+    )
 
     # If no nodes exist, build auction trees for all deals
     if not open_nodes.exists():
@@ -150,16 +142,14 @@ def list_deals_with_eligible_nodes(session_id: int, user_id: int) -> list:
         for deal in all_deals:
             build_auction_tree(session_id, deal.deal_number)
 
-        # Re-query for open nodes after building trees
-        open_nodes = Node.objects.filter(
-            session_id=session_id,
-            status='open'
-        ).select_related('deal')
+    # Only nodes whose needs_mask includes the user can be eligible
+    bit = user_bit(session_id, user_id)
+    open_nodes = open_nodes_needing(session_id, bit).select_related('deal')
 
     eligible_deals = set()
 
     for node in open_nodes:
-        if requires_user(node, user_id):
+        if requires_user(node, user_id, bit):
             # Check if user hasn't answered
             has_answered = Response.objects.filter(
                 node=node,
@@ -174,14 +164,13 @@ def list_deals_with_eligible_nodes(session_id: int, user_id: int) -> list:
 
 def find_smallest_depth_eligible_node(session_id: int, deal_index: int, user_id: int) -> Optional[Node]:
     """Find the smallest depth eligible node in the specified deal"""
-    candidates = Node.objects.filter(
-        session_id=session_id,
-        deal__deal_number=deal_index,
-        status='open'
+    bit = user_bit(session_id, user_id)
+    candidates = open_nodes_needing(session_id, bit).filter(
+        deal__deal_number=deal_index
     ).order_by('depth')
 
     for node in candidates:
-        if requires_user(node, user_id):
+        if requires_user(node, user_id, bit):
             has_answered = Response.objects.filter(
                 node=node,
                 user_id=user_id,
@@ -0,0 +1,330 @@
+"""
+Import partnership system notes as pre-populated tree branches
+
+Agreed sequences ("1NT-2C-2D" with implied opponent passes, or full
+auctions, one per line as plain text, CSV or PBN-style [Auction] sections) are streamed line by line into an in-memory prefix trie.
+The trie is then written to each target deal with bulk inserts along the
+pair's chosen line, the first continuation listed at every node: one Node
+per prefix of the line, one Edge per call and one Response per partner. The
+other continuations are reported as conflicts, since a partner answers a
+node with one call and nobody would reach them.
+"""
+import csv
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from django.utils import timezone
+from ..models import Session, Deal, Edge, Response
+from ..sharding import shard_atomic
+from ..bridge_auction_validator import AuctionState, validate_call, update_auction_state
+from .auction_tree import get_or_create_nodes, get_next_seat, refresh_derived_state
+from .participants import participant_bits, mask_of, roles_for_mask
+from .tree_versions import tree_write, mark_nodes_changed
+
+CALL_ALIASES = {
+    'P': 'Pass', 'PASS': 'Pass',
+    'D': 'X', 'X': 'X', 'DBL': 'X', 'DOUBLE': 'X',
+    'R': 'XX', 'XX': 'XX', 'RDBL': 'XX', 'REDOUBLE': 'XX',
+}
+SPLIT_RE = re.compile(r'[\s,/]+')
+BID_RE = re.compile(r'^([1-7])(C|D|H|S|N|NT)$')
+PBN_AUCTION_RE = re.compile(r'^\[Auction\s+"([NESW])"\]', re.IGNORECASE)
+MAX_REPORTED_ERRORS = 50
+
+
+def normalize_call(token: str) -> Optional[str]:
+    """Normalize a call token to the form used in tree histories ('1NT', 'Pass', 'X', 'XX')"""
+    token = token.strip().upper().rstrip('!*')
+    if token in CALL_ALIASES:
+        return CALL_ALIASES[token]
+    match = BID_RE.match(token)
+    if match:
+        level, strain = match.groups()
+        return level + ('NT' if strain == 'N' else strain)
+    return None
+
+
+def parse_calls(text: str) -> Tuple[List[str], Optional[str]]:
+    """
+    Parse one written sequence into calls.
+
+    Returns:
+        (calls, error) - error is None when every token is a call
+    """
+    calls = []
+    for token in SPLIT_RE.split(text.strip()):
+        if not token or token[0] in '=$':
+            continue  # PBN note references and NAGs
+        if token.upper() == 'AP':
+            # "All pass": three passes close the auction
+            calls.extend(['Pass', 'Pass', 'Pass'])
+            continue
+        call = normalize_call(token)
+        if call is None:
+            return [], f'Unknown call: {token}'
+        calls.append(call)
+    return calls, None
+
+
+def parse_partnership_calls(text: str) -> Tuple[List[str], Optional[str]]:
+    """
+    Parse dash notation such as "1NT-2C-2D" or "1NT-(2H)-X".
+
+    Tokens are the partnership's calls; opponents pass in between unless
+    their call is given in parentheses.
+    """
+    calls = []
+    last_was_ours = False
+    for token in text.split('-'):
+        token = token.strip()
+        if not token:
+            continue
+        opponent = token.startswith('(') and token.endswith(')')
+        token_calls, error = parse_calls(token.strip('()'))
+        if error:
+            return [], error
+        if opponent:
+            calls.extend(token_calls)
+            last_was_ours = False
+            continue
+        if token.upper() == 'AP':
+            calls.extend(token_calls)
+            continue
+        if last_was_ours:
+            calls.append('Pass')
+        calls.extend(token_calls)
+        last_was_ours = True
+    return calls, None
+
+
+def iter_sequences(lines: Iterable[str]) -> Iterator[Tuple[int, List[str], Optional[str]]]:
+    """
+    Stream sequences out of text, CSV or PBN-style input.
+
+    Plain lines hold one sequence each, either as a full space-separated
+    auction or in dash notation (see parse_partnership_calls); CSV lines use
+    the first column; PBN sections collect the call lines that follow an
+    [Auction "X"] tag up to the next blank line or tag.
+    Blank lines and lines starting with '#', '%' or ';' are skipped.
+
+    Yields:
+        (line number, calls, error)
+    """
+    pbn_calls = None
+    pbn_error = None
+    pbn_line = 0
+
+    for line_number, raw in enumerate(lines, start=1):
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8', errors='replace')
+        line = raw.strip()
+
+        if pbn_calls is not None:
+            if line and not line.startswith('['):
+                calls, error = parse_calls(line)
+                pbn_error = pbn_error or error
+                pbn_calls.extend(calls)
+                continue
+            yield pbn_line, pbn_calls, pbn_error
+            pbn_calls, pbn_error = None, None
+
+        if not line or line[0] in '#%;':
+            continue
+
+        if PBN_AUCTION_RE.match(line):
+            pbn_calls = []
+            pbn_line = line_number
+            continue
+        if line.startswith('['):
+            continue  # Other PBN tags
+
+        if ',' in line or '"' in line:
+            line = next(csv.reader([line]))[0]
+        if '-' in line:
+            calls, error = parse_partnership_calls(line)
+        else:
+            calls, error = parse_calls(line)
+        yield line_number, calls, error
+
+    if pbn_calls is not None:
+        yield pbn_line, pbn_calls, pbn_error
+
+
+def validate_sequence(calls: List[str]) -> Optional[str]:
+    """Check a sequence against the bridge auction rules (legality does not depend on the dealer)"""
+    state = AuctionState('N')
+    for call in calls:
+        validation = validate_call(state, call, state.to_act_seat)
+        if not validation['ok']:
+            return validation['error']
+        update_auction_state(state, call, state.to_act_seat)
+    return None
+
+
+def build_trie(lines: Iterable[str]) -> Tuple[Dict[str, List[str]], int, List[dict]]:
+    """
+    Build the shared prefix trie of all valid sequences.
+
+    Returns:
+        (trie, number of sequences added, errors) where trie maps each
+        history to its ordered list of agreed continuation calls
+    """
+    trie = {'': []}
+    count = 0
+    errors = []
+
+    for line_number, calls, error in iter_sequences(lines):
+        if not error and not calls:
+            continue
+        error = error or validate_sequence(calls)
+        if error:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'error': error})
+            continue
+
+        history = ''
+        for call in calls:
+            children = trie.setdefault(history, [])
+            if call not in children:
+                children.append(call)
+            history = (history + ' ' + call).strip()
+        trie.setdefault(history, [])
+        count += 1
+
+    return trie, count, errors
+
+
+def chosen_line(trie: Dict[str, List[str]]) -> Tuple[List[Tuple[str, str]], List[dict]]:
+    """
+    Follow the first agreed continuation from the root.
+
+    Returns:
+        ((history, call) steps of the line, conflicts) where each conflict is
+        {'history', 'call', 'chosen'} of a continuation left off the line
+    """
+    steps, conflicts = [], []
+    history = ''
+    while trie.get(history):
+        chosen, *others = trie[history]
+        conflicts.extend({'history': history, 'call': call, 'chosen': chosen} for call in others)
+        steps.append((history, chosen))
+        history = (history + ' ' + chosen).strip()
+    return steps, conflicts
+
+
+@tree_write()
+def apply_trie_to_deal(session: Session, deal: Deal, trie: Dict[str, List[str]]) -> dict:
+    """
+    Write the trie's chosen line (see chosen_line) into a deal's tree with
+    bulk inserts.
+
+    Both partners get a response at every node of the line. Existing active
+    responses are never overwritten: a partner who already answered a node
+    with another call has left the line there, so nothing further down it is
+    recorded for them.
+
+    Returns:
+        Counts of nodes, edges and responses written
+    """
+    from .event_log import append_events
+
+    steps, _ = chosen_line(trie)
+    seat = deal.dealer
+    states = []
+    for history, _ in steps:
+        states.append((history, seat))
+        seat = get_next_seat(seat)
+    line_end = ((steps[-1][0] + ' ' + steps[-1][1]).strip(), seat) if steps else ('', deal.dealer)
+    nodes = get_or_create_nodes(deal, states + [line_end])
+
+    existing = {
+        (response.node_id, response.user_id): response
+        for response in Response.objects.filter(node__deal=deal).order_by('-id')
+    }
+
+    bits = participant_bits(session)
+    now = timezone.now()
+    to_create, to_reactivate, edges = [], [], []
+    events = {session.creator_id: [], session.partner_id: []}
+    on_line = set(events)  # Partners still following the line
+    for (history, call), state in zip(steps, states):
+        node = nodes[state]
+        for user_id in list(on_line):
+            response = existing.get((node.id, user_id))
+            if response is None:
+                to_create.append(Response(node=node, user_id=user_id, call=call))
+            elif not response.is_active:
+                response.call = call
+                response.is_active = True
+                response.superseded_at = None
+                response.superseded_by_action = None
+                response.timestamp = now
+                to_reactivate.append(response)
+            elif response.call == call:
+                continue
+            else:
+                on_line.discard(user_id)
+                continue
+            events[user_id].append(('CALL', history, node.seat_to_act, call, {'source': 'import'}))
+        if not on_line:
+            break
+
+        by_mask = mask_of(on_line, bits)
+        child_state = ((history + ' ' + call).strip(), get_next_seat(node.seat_to_act))
+        edges.append(Edge(
+            session=session,
+            deal=deal,
+            from_node=node,
+            to_node=nodes[child_state],
+            call=call,
+            by_set=roles_for_mask(by_mask),
+            by_mask=by_mask
+        ))
+    Edge.objects.bulk_create(edges, ignore_conflicts=True)
+
+    Response.objects.bulk_create(to_create, batch_size=500)
+    if to_reactivate:
+        Response.objects.bulk_update(
+            to_reactivate,
+            ['call', 'is_active', 'superseded_at', 'superseded_by_action', 'timestamp'],
+            batch_size=500
+        )
+    mark_nodes_changed(deal.id, [response.node_id for response in to_create + to_reactivate])
+
+    for user, user_events in ((session.creator, events[session.creator_id]),
+                              (session.partner, events[session.partner_id])):
+        if user_events:
+            append_events(deal, user, user_events)
+
+    refresh_derived_state(session, deal)
+
+    return {'nodes': len(nodes), 'edges': len(edges), 'responses': len(to_create) + len(to_reactivate)}
+
+
+def import_system_notes(session: Session, lines: Iterable[str],
+                        deals: Optional[Iterable[Deal]] = None) -> dict:
+    """
+    Import agreed sequences into one or more deals of a session.
+
+    Args:
+        session: Target session
+        lines: Iterable of text lines (a file object is streamed lazily)
+        deals: Deals to populate; defaults to every deal in the session
+
+    Returns:
+        Summary with sequence count, per-deal counts, parse errors and the
+        conflicts left off the chosen line
+    """
+    trie, count, errors = build_trie(lines)
+    if deals is None:
+        deals = session.deals.order_by('deal_number')
+
+    summary = {'sequences': count, 'errors': errors, 'conflicts': chosen_line(trie)[1], 'deals': []}
+    if not count:
+        return summary
+
+    with shard_atomic():
+        for deal in deals:
+            result = apply_trie_to_deal(session, deal, trie)
+            summary['deals'].append({'deal_number': deal.deal_number, **result})
+
+    return summary
@@ -0,0 +1,126 @@
+"""
+Compact columnar encoding of auction trees
+
+The tree JSON repeats every key and spells the full history of every node.
+The columnar form sends each node attribute as one array indexed by node
+position instead, and drops what clients can rebuild:
+
+- nodes are ordered by depth, so a node's parent always comes first; a node
+  is its parent's index plus the code of the call leading to it, and its
+  history and seat follow from the parent's and the dealer
+- 'calls' is the table of call strings the call codes point into
+- divergence and closed status are packed in one 'flags' integer, and
+  'needs' is the node's needs_mask (who_needs is its creator/partner part)
+- an edge always leads from a node's parent with the node's call, so edges
+  are a per-node 'by' participant bitmask of who made that call (0: no
+  edge), with 'by' names rebuilt from 'users' (indexed by participant
+  slot); the rare edges whose child node is not stored are listed
+  separately in 'dangling'
+- node ids are sent as differences from the previous node's id, which are
+  small because nodes are mostly created in tree order
+
+It is served as JSON ('?format=columnar') or MessagePack ('Accept:
+application/msgpack') and decoded by frontend/src/utils/treeCodec.js.
+"""
+from ..models import Session, Deal
+from .auction_tree import get_or_create_root
+from .participants import display_name, session_participants
+from .tree_stream import iter_tree_nodes, iter_tree_edges
+
+FORMAT = 'columnar-v2'
+
+FLAG_DIVERGENCE = 1
+FLAG_CLOSED = 2
+
+
+def encode_flags(divergence: bool, status: str) -> int:
+    """Pack a node's divergence and status into one integer"""
+    flags = 0
+    if divergence:
+        flags |= FLAG_DIVERGENCE
+    if status == 'closed':
+        flags |= FLAG_CLOSED
+    return flags
+
+
+def build_columnar_tree(session: Session, deal: Deal) -> dict:
+    """
+    Build the columnar form of a deal's full tree.
+
+    Returns:
+        {'format', header fields, 'calls', 'users', 'nodes': {column: [...]},
+         'dangling': {column: [...]}, 'histories': {index: history}}
+        where 'histories' lists the few nodes whose parent is not stored
+    """
+    root = get_or_create_root(deal)
+    deal.refresh_from_db(fields=['tree_version'])
+
+    calls, call_codes = [], {}
+
+    def call_code(call: str) -> int:
+        if call not in call_codes:
+            call_codes[call] = len(calls)
+            calls.append(call)
+        return call_codes[call]
+
+    nodes = {'id_delta': [], 'parent': [], 'call': [], 'flags': [], 'needs': [], 'version': [], 'by': []}
+    histories = {}
+    index_by_id = {}
+    last_id = 0
+    previous_level, current_level, level = {}, {}, 0
+    for _, node in iter_tree_nodes(deal):
+        history = node['history']
+        depth = len(history.split())
+        if depth != level:
+            previous_level, current_level, level = current_level, {}, depth
+
+        index = len(nodes['flags'])
+        index_by_id[node['db_id']] = index
+        current_level[history] = index
+
+        parent_history, _, call = history.rpartition(' ')
+        parent = previous_level.get(parent_history) if history else None
+        if parent is None:
+            nodes['parent'].append(-1)
+            nodes['call'].append(-1)
+            if history:
+                histories[index] = history
+        else:
+            nodes['parent'].append(parent)
+            nodes['call'].append(call_code(call))
+
+        nodes['id_delta'].append(node['db_id'] - last_id)
+        last_id = node['db_id']
+        nodes['by'].append(0)
+        nodes['flags'].append(encode_flags(node['divergence'], node['status']))
+        nodes['needs'].append(node['needs_mask'])
+        nodes['version'].append(node['version'])
+
+    dangling = {'from': [], 'call': [], 'by': []}
+    for edge in iter_tree_edges(session, deal):
+        by = edge['by_mask']
+        if edge['to']:
+            nodes['by'][index_by_id[int(edge['to'][2:])]] = by
+        else:
+            dangling['from'].append(index_by_id[int(edge['from'][2:])])
+            dangling['call'].append(call_code(edge['call']))
+            dangling['by'].append(by)
+
+    participants = session_participants(session)
+    users = [None] * (max((participant.slot for participant in participants), default=-1) + 1)
+    for participant in participants:
+        users[participant.slot] = display_name(participant.user)
+    return {
+        'format': FORMAT,
+        'session_id': session.id,
+        'deal_index': deal.deal_number,
+        'dealer': deal.dealer,
+        'vul': deal.vulnerability,
+        'root': index_by_id[root.id],
+        'version': deal.tree_version,
+        'calls': calls,
+        'users': users,
+        'nodes': nodes,
+        'dangling': dangling,
+        'histories': histories,
+    }
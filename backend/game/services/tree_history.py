@@ -0,0 +1,133 @@
+"""
+Historical auction tree views ("tree as of timestamp")
+
+Rebuilds a deal's tree from the responses that were active at a given
+instant, using the Response timestamp/superseded_at ranges plus the
+ResponseAudit trail for answers that were later replaced or re-activated.
+Runs in a fixed number of queries.
+
+A past tree is rebuilt as it stood after the last write logged at or
+before the requested instant, so it is exact for every call made by then
+and is cached per (deal, event sequence). Every as_of between two writes
+shares one cache entry, and no entry can hide a later call.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from ..models import Session, Deal, Node, Response, ResponseAudit, TreeEvent
+from .auction_tree import assemble_auction_tree
+
+
+def parse_as_of(value: str) -> Optional[datetime]:
+    """Parse an ISO datetime (or date) query parameter into an aware datetime"""
+    if not value:
+        return None
+
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime.combine(day, datetime.min.time())
+    except ValueError:
+        return None
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+    return parsed
+
+
+def responses_active_at(deal: Deal, at: datetime) -> Dict[tuple, Dict[int, str]]:
+    """
+    Collect the responses that were active at the given instant.
+
+    Returns:
+        {(history, seat): {user_id: call}}
+    """
+    responses_by_node = {}
+
+    # Responses whose current active interval contains `at`
+    current = Response.objects.filter(
+        node__deal=deal,
+        timestamp__lte=at
+    ).filter(
+        Q(superseded_at__isnull=True) | Q(superseded_at__gt=at)
+    ).values_list('node__history', 'node__seat_to_act', 'user_id', 'call')
+
+    for history, seat, user_id, call in current:
+        responses_by_node.setdefault((history, seat), {})[user_id] = call
+
+    # Earlier intervals that were closed by a rewind, undo or replacement
+    audits = ResponseAudit.objects.filter(
+        deal=deal,
+        action_timestamp__gt=at,
+        response__isnull=False
+    ).values_list(
+        'response__node__history', 'response__node__seat_to_act',
+        'response__user_id', 'old_call', 'metadata'
+    )
+
+    for history, seat, user_id, old_call, metadata in audits:
+        answered_at = parse_datetime((metadata or {}).get('answered_at') or '')
+        if answered_at is None or answered_at > at:
+            continue
+        responses_by_node.setdefault((history, seat), {})[user_id] = old_call
+
+    return responses_by_node
+
+
+def build_auction_tree_as_of(session: Session, deal: Deal, as_of: datetime) -> dict:
+    """
+    Build the auction tree of a deal as it was at `as_of`.
+
+    Past timestamps are rebuilt at the last event logged at or before them
+    (every call, rewind and undo logs one in the transaction that makes it)
+    and cached for TREE_AS_OF_CACHE_SECONDS under that event's sequence.
+    Deals with no event by then, and the present, are rebuilt exactly at
+    `as_of` and not cached.
+
+    Args:
+        session: The session (creator/partner already loaded)
+        deal: The deal to rebuild
+        as_of: The instant to rebuild at
+
+    Returns:
+        Tree JSON structure with extra 'as_of' and 'as_of_sequence' keys
+    """
+    now = timezone.now()
+    at = min(as_of, now)
+    last_event = None
+    if as_of < now:
+        last_event = TreeEvent.objects.filter(
+            deal=deal,
+            created_at__lte=as_of
+        ).order_by('-sequence').values('sequence', 'created_at').first()
+
+    cache_key = None
+    if last_event is not None:
+        # Nothing changes the tree between two logged writes, so the state
+        # after the last one is the state at `as_of`
+        at = last_event['created_at']
+        cache_key = f"auction_tree_as_of:{deal.id}:{last_event['sequence']}"
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {**cached, 'as_of': as_of.isoformat()}
+
+    nodes = list(Node.objects.filter(
+        deal=deal,
+        created_at__lte=at
+    ).only('id', 'history', 'seat_to_act'))
+    responses_by_node = responses_active_at(deal, at)
+
+    tree = assemble_auction_tree(session, deal, nodes, responses_by_node)
+    tree['as_of_sequence'] = last_event['sequence'] if last_event is not None else 0
+
+    if cache_key is not None:
+        cache.set(cache_key, tree, getattr(settings, 'TREE_AS_OF_CACHE_SECONDS', 3600))
+
+    return {**tree, 'as_of': as_of.isoformat()}
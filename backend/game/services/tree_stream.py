@@ -0,0 +1,202 @@
+"""
+Iterator-based auction tree builder
+
+Produces the same nodes and edges as build_auction_tree, but as generators
+over database cursors instead of one dict, so a tree can be streamed to the
+client (see game.streaming) with memory bounded by the widest level of the
+tree rather than its size.
+
+Nodes and active responses are read in the same (depth, history, seat)
+order and merged, so each node is seen together with its responses. A node
+is reachable (gets edges and a response-based divergence flag, like the BFS
+of build_auction_tree) if it is the root or a reachable node has a response
+leading to it; only the reachable children of the current level are kept in
+memory. A streamed response walks the nodes once for the 'nodes' object and
+once more for the 'edges' array; read_current_tree builds both in one walk.
+
+The builder reads the stored tree as maintained by the write paths and does
+not repair it, apart from creating a missing root.
+"""
+from typing import Iterator, Optional, Tuple
+from ..models import Session, Deal, Node, Response
+from ..streaming import JSONArray, JSONObject
+from .auction_tree import derived_state_changes, get_or_create_root, get_next_seat
+from .participants import participant_bits, participant_names, mask_of, roles_for_mask
+from .pending_work import stale_pending_counters
+
+CHUNK_SIZE = 2000
+
+
+def walk_tree(deal: Deal) -> Iterator[Tuple[tuple, dict, bool]]:
+    """
+    Walk a deal's stored nodes in (depth, history) order.
+
+    Yields:
+        (node row, {user_id: call} of active responses, reachable)
+        where a node row is (id, depth, history, seat_to_act, status,
+        divergence, who_needs, needs_mask, version)
+    """
+    order = ('depth', 'history', 'seat_to_act', 'id')
+    nodes = Node.objects.filter(deal=deal).order_by(*order).values_list(
+        'id', 'depth', 'history', 'seat_to_act', 'status', 'divergence', 'who_needs', 'needs_mask', 'version'
+    ).iterator(chunk_size=CHUNK_SIZE)
+    responses = Response.objects.filter(node__deal=deal, is_active=True).order_by(
+        *('node__' + field for field in order)
+    ).values_list('node_id', 'user_id', 'call').iterator(chunk_size=CHUNK_SIZE)
+
+    pending = next(responses, None)
+    reachable_children = set()  # (history, seat, depth) of children of reachable nodes
+    for row in nodes:
+        node_id, depth, history, seat, status = row[:5]
+        calls = {}
+        while pending is not None and pending[0] == node_id:
+            calls[pending[1]] = pending[2]
+            pending = next(responses, None)
+
+        state = (history, seat, depth)
+        reachable = (not history and seat == deal.dealer) or state in reachable_children
+        reachable_children.discard(state)
+        if reachable and status != 'closed':
+            for call in set(calls.values()):
+                reachable_children.add(((history + ' ' + call).strip(), get_next_seat(seat), depth + 1))
+        yield row, calls, reachable
+
+
+def node_json(row: tuple, calls: dict, reachable: bool) -> dict:
+    """The node JSON of a walk_tree step"""
+    node_id, _, history, seat, status, divergence, who_needs, needs_mask, version = row
+    if reachable:
+        divergence = status != 'closed' and len(set(calls.values())) > 1
+    return {
+        'db_id': node_id,
+        'history': history,
+        'seat': seat,
+        'divergence': divergence,
+        'status': status,
+        'who_needs': who_needs,
+        'needs_mask': needs_mask,
+        'version': version
+    }
+
+
+def iter_tree_nodes(deal: Deal) -> Iterator[Tuple[str, dict]]:
+    """Yield (node id, node JSON) pairs of a deal's tree"""
+    for row, calls, reachable in walk_tree(deal):
+        yield f"n_{row[0]}", node_json(row, calls, reachable)
+
+
+def iter_tree_edges(session: Session, deal: Deal) -> Iterator[dict]:
+    """Yield the edge JSON of a deal's tree"""
+    return edges_of_walk(session, walk_tree(deal))
+
+
+def edges_of_walk(session: Session, steps: Iterator[Tuple[tuple, dict, bool]]) -> Iterator[dict]:
+    """
+    Yield the edge JSON of walk_tree steps.
+
+    An edge is emitted when its child node is reached, which is when the
+    child's id is known; edges whose child node is missing are emitted with
+    'to': None once their level has been passed.
+    """
+    bits = participant_bits(session)
+    names = participant_names(session)
+
+    waiting = {}  # (history, seat, depth) of a child -> edges leading to it
+    level = 0
+    for (node_id, depth, history, seat, status, *_), calls, reachable in steps:
+        if depth != level:
+            # Edges to children on the levels passed have no child node
+            for child_state in [state for state in waiting if state[2] < depth]:
+                yield from waiting.pop(child_state)
+            level = depth
+
+        for edge in waiting.pop((history, seat, depth), []):
+            edge['to'] = f"n_{node_id}"
+            yield edge
+
+        if not reachable or status == 'closed':
+            continue
+        call_groups = {}
+        for user_id, call in calls.items():
+            call_groups.setdefault(call, []).append(user_id)
+        for call, user_ids in call_groups.items():
+            by_mask = mask_of(user_ids, bits)
+            child_state = ((history + ' ' + call).strip(), get_next_seat(seat), depth + 1)
+            waiting.setdefault(child_state, []).append({
+                'from': f"n_{node_id}",
+                'call': call,
+                'by': sorted(names.get(user_id, str(user_id)) for user_id in user_ids),
+                'by_set': roles_for_mask(by_mask),
+                'by_mask': by_mask,
+                'to': None
+            })
+
+    for edges in waiting.values():
+        yield from edges
+
+
+def stream_auction_tree(session: Session, deal: Deal) -> JSONObject:
+    """
+    Describe a deal's full tree for StreamingJSONResponse.
+
+    Creates the root node if the tree has not been started; everything else
+    is read lazily while the response is written.
+    """
+    root = get_or_create_root(deal)
+    deal.refresh_from_db(fields=['tree_version'])
+
+    return JSONObject([
+        ('session_id', session.id),
+        ('deal_index', deal.deal_number),
+        ('dealer', deal.dealer),
+        ('vul', deal.vulnerability),
+        ('root', root.stable_id),
+        ('version', deal.tree_version),
+        ('nodes', JSONObject(iter_tree_nodes(deal))),
+        ('edges', JSONArray(iter_tree_edges(session, deal))),
+    ])
+
+
+def read_current_tree(session: Session, deal: Deal) -> Optional[dict]:
+    """
+    Read a deal's full tree with the builders above, without writing anything.
+
+    Returns:
+        The tree as build_auction_tree returns it, or None when
+        update_auction_tree has something to write first: the root or a node
+        an answer leads to is missing, or the derived node state or the
+        pending-work counters are out of date
+    """
+    version = Deal.objects.filter(id=deal.id).values_list('tree_version', flat=True).get()
+    root = Node.objects.filter(deal=deal, history='', seat_to_act=deal.dealer).only('id').first()
+    if root is None or stale_pending_counters(session, [deal.id]):
+        return None
+    stored = Node.objects.filter(deal=deal).only(
+        'history', 'seat_to_act', 'depth', 'divergence', 'status', 'who_needs', 'needs_mask'
+    ).iterator(chunk_size=CHUNK_SIZE)
+    if derived_state_changes(session, deal, stored):
+        return None
+
+    nodes = {}
+
+    def steps():
+        for row, calls, reachable in walk_tree(deal):
+            nodes[f"n_{row[0]}"] = node_json(row, calls, reachable)
+            yield row, calls, reachable
+
+    edges = []
+    for edge in edges_of_walk(session, steps()):
+        if edge['to'] is None:
+            return None
+        edges.append(edge)
+
+    return {
+        'session_id': session.id,
+        'deal_index': deal.deal_number,
+        'dealer': deal.dealer,
+        'vul': deal.vulnerability,
+        'root': root.stable_id,
+        'nodes': nodes,
+        'edges': edges,
+        'version': version
+    }
@@ -0,0 +1,145 @@
+"""
+Set-based upserts of auction tree nodes and edges
+
+get_or_create per node costs a SELECT, maybe an INSERT (inside a savepoint)
+and maybe an UPDATE, and Edge.update_or_create the same per edge; under
+concurrent partners both race on the unique constraints. These helpers
+write a whole batch of states or transitions in single statements instead:
+
+- upsert_nodes: one SELECT for the states, then for the missing ones one
+  INSERT ... ON CONFLICT DO NOTHING and one SELECT reading them back
+  (existing nodes are never rewritten, and a node a concurrent writer
+  inserts first is simply read instead of failing the transaction)
+- upsert_edges: one INSERT ... ON CONFLICT DO UPDATE (bulk_create with
+  update_conflicts) that creates new edges and refreshes the target and
+  callers of existing ones
+
+so a node, its child and the edge between them take one statement for the
+nodes when they exist (three when some are new) plus one for the edge, and
+a batch from an import or a bulk call submission takes the same whatever its
+size (in BATCH_SIZE chunks). Existing states are read before inserting so
+conflicting inserts do not burn primary key values.
+"""
+from typing import Dict, Iterable, List, Tuple
+from ..models import Deal, Node, Edge
+from .participants import roles_for_mask
+from .tree_versions import mark_nodes_changed
+
+BATCH_SIZE = 500
+
+
+def new_node(deal: Deal, history: str, seat_to_act: str) -> Node:
+    """Unsaved node for a state, with the derived fields a fresh node starts with"""
+    from .auction_tree import is_auction_closed
+    auction_closed = is_auction_closed(history)
+    return Node(
+        session_id=deal.session_id,
+        deal=deal,
+        history=history,
+        seat_to_act=seat_to_act,
+        divergence=False,
+        status='closed' if auction_closed else 'open',
+        depth=len(history.split()),
+        who_needs='none' if auction_closed else 'both',  # Closed auctions need no one
+        needs_mask=0 if auction_closed else deal.session.participant_mask
+    )
+
+
+def _read_nodes(deal: Deal, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Node]:
+    """{(history, seat_to_act): Node} of the keys that exist, one SELECT per BATCH_SIZE keys"""
+    wanted_keys = set(keys)
+    nodes = {}
+    for start in range(0, len(keys), BATCH_SIZE):
+        histories = {history for history, _ in keys[start:start + BATCH_SIZE]}
+        for node in Node.objects.filter(deal=deal, history__in=histories):
+            key = (node.history, node.seat_to_act)
+            if key in wanted_keys:
+                nodes[key] = node
+    return nodes
+
+
+def upsert_nodes(deal: Deal, states: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Node]:
+    """
+    Get or create the nodes of some states of a deal.
+
+    Existing nodes whose depth or status disagree with their history (rows
+    written before those were derived) are corrected with one bulk UPDATE.
+    New and corrected nodes are marked changed for tree_write.
+
+    Args:
+        deal: The deal the nodes belong to
+        states: (history, seat_to_act) pairs
+
+    Returns:
+        {(history, seat_to_act): Node} read back from the database
+    """
+    from .auction_tree import is_auction_closed
+    wanted = list(dict.fromkeys(states))
+    nodes = _read_nodes(deal, wanted)
+
+    missing = [key for key in wanted if key not in nodes]
+    if missing:
+        # Rows a concurrent writer inserts meanwhile are skipped, not errors
+        Node.objects.bulk_create(
+            [new_node(deal, history, seat_to_act) for history, seat_to_act in missing],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        nodes.update(_read_nodes(deal, missing))
+
+    to_fix = []
+    for node in nodes.values():
+        auction_closed = is_auction_closed(node.history)
+        correct_status = 'closed' if auction_closed else 'open'
+        depth = len(node.history.split())
+        if (node.depth != depth or node.status != correct_status
+                or (auction_closed and (node.who_needs != 'none' or node.needs_mask))):
+            node.depth = depth
+            node.status = correct_status
+            if auction_closed:
+                node.who_needs = 'none'
+                node.needs_mask = 0
+            to_fix.append(node)
+
+    if to_fix:
+        Node.objects.bulk_update(to_fix, ['depth', 'status', 'who_needs', 'needs_mask'], batch_size=BATCH_SIZE)
+    # Nodes never stamped are the ones just inserted (here or by a concurrent writer)
+    changed = [node.id for node in nodes.values() if node.version == 0 or node in to_fix]
+    if changed:
+        mark_nodes_changed(deal.id, changed)
+    return nodes
+
+
+def upsert_edges(deal: Deal, transitions: Iterable[Tuple[Node, Node, str, int]]) -> List[Edge]:
+    """
+    Create or refresh the edges of some transitions.
+
+    Args:
+        deal: The deal
+        transitions: (from_node, to_node, call, by_mask) tuples; by_mask is
+            the mask of the participants who made the call
+
+    Returns:
+        The upserted edges
+    """
+    edges = [
+        Edge(
+            session_id=deal.session_id,
+            deal=deal,
+            from_node=from_node,
+            to_node=to_node,
+            call=call,
+            by_set=roles_for_mask(by_mask),
+            by_mask=by_mask
+        )
+        for from_node, to_node, call, by_mask in transitions
+    ]
+    if not edges:
+        return []
+    return Edge.objects.bulk_create(
+        edges,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['session', 'deal', 'from_node', 'call'],
+        update_fields=['to_node', 'by_set', 'by_mask']
+    )
@@ -0,0 +1,212 @@
+"""
+Tree versions for incremental tree payloads
+
+Every deal carries a tree_version counter and every node the deal version at
+which it (or one of its active responses) last changed. A client that kept
+the 'version' of its last tree payload can then ask for only the nodes that
+changed since, instead of downloading the whole tree again.
+
+Writes are grouped with tree_write() (a context manager or decorator): node
+and response saves inside the block only collect the touched node ids, and
+leaving the outermost block bumps each touched deal's version once and stamps
+its touched nodes with the new value. Saves
+outside any block are stamped immediately. Bulk writes (bulk_create,
+bulk_update, queryset.update) bypass save() and must call mark_nodes_changed
+themselves.
+
+Stamping is also where derived tables catch up with the nodes that changed:
+the field tree of a pooled deal (game.services.deal_pools) and the interned
+auction paths with their statistics (game.services.auction_paths).
+
+The version doubles as an optimistic lock. A block that calls
+expect_tree_version() before reading a deal's tree only bumps the version if
+it is still the one it read (compare-and-swap); otherwise a concurrent write
+to the same deal committed first, the block rolls back with
+TreeVersionConflict, and tree_write_attempts() runs it again on fresh state.
+Derived state (divergence, who_needs, exemptions) is therefore always
+computed from the responses it is committed with, without row locks.
+"""
+import functools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, Optional, Set
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import F
+from ..models import Deal, Node
+from ..sharding import shard_atomic
+from .auction_paths import refresh_path_stats
+
+BATCH_SIZE = 500
+
+# {deal_id: {node_id}} touched inside the current tree_write block
+_pending: ContextVar[Optional[Dict[int, Set[int]]]] = ContextVar('tree_write_pending', default=None)
+# {deal_id: tree_version} the current tree_write block read its deals at
+_expected: ContextVar[Optional[Dict[int, int]]] = ContextVar('tree_write_expected', default=None)
+
+# PostgreSQL serialization failure and deadlock
+RETRYABLE_SQLSTATES = {'40001', '40P01'}
+
+
+class TreeVersionConflict(Exception):
+    """A deal's tree changed between a tree_write block reading it and committing"""
+
+
+@contextmanager
+def tree_write():
+    """
+    Group the tree writes of a block under a single version bump per deal.
+
+    Nested blocks join the outermost one, which also owns the transaction,
+    so versions are only bumped if the whole block commits.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+
+    pending, expected = {}, {}
+    token = _pending.set(pending)
+    expected_token = _expected.set(expected)
+    try:
+        with shard_atomic():
+            yield
+            for deal_id, node_ids in pending.items():
+                stamp_nodes(deal_id, node_ids, expected.get(deal_id))
+    finally:
+        _pending.reset(token)
+        _expected.reset(expected_token)
+
+
+def expect_tree_version(deal_id: int, version: Optional[int] = None) -> None:
+    """
+    Make the current tree_write block commit only if the deal's tree is
+    still at the version it had when the block started reading it.
+
+    Call before reading the tree state a write depends on. The first call
+    per deal counts; `version` defaults to the stored one. Outside a block
+    this does nothing.
+    """
+    expected = _expected.get()
+    if expected is None or deal_id in expected:
+        return
+    if version is None:
+        version = Deal.objects.filter(id=deal_id).values_list('tree_version', flat=True).get()
+    expected[deal_id] = version
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a failed tree_write block may succeed when run again"""
+    if isinstance(exc, TreeVersionConflict):
+        return True
+    if isinstance(exc, OperationalError):
+        # SQLite reports concurrent writers as a locked database; PostgreSQL
+        # as a serialization failure or deadlock
+        cause = exc.__cause__
+        return 'locked' in str(exc) or getattr(cause, 'sqlstate', getattr(cause, 'pgcode', None)) in RETRYABLE_SQLSTATES
+    return False
+
+
+class _Attempt:
+    """One run of a retried tree_write block (see tree_write_attempts)"""
+
+    def __init__(self, last: bool):
+        self.last = last
+        self.succeeded = False
+        self._block = None
+
+    def __enter__(self):
+        self._block = tree_write()
+        return self._block.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._block.__exit__(exc_type, exc, tb)
+        except Exception as error:
+            # Raised while stamping or committing, e.g. TreeVersionConflict
+            if self.last or not is_retryable(error):
+                raise
+            return True
+        if exc is None:
+            self.succeeded = True
+            return False
+        # Swallow the failure so the loop runs the block again
+        return not self.last and is_retryable(exc)
+
+
+def tree_write_attempts(max_attempts: Optional[int] = None) -> Iterator[_Attempt]:
+    """
+    Run a tree_write block until it commits without a conflict.
+
+        for attempt in tree_write_attempts():
+            with attempt:
+                ...
+
+    Each attempt is a fresh tree_write block. Conflicts are retried with
+    a short randomized backoff; the last attempt's error propagates.
+    Nested inside another tree_write block the body runs once and conflicts
+    go to the outermost block, which is where versions are compared.
+    """
+    max_attempts = max_attempts or settings.TREE_WRITE_MAX_ATTEMPTS
+    for attempt_number in range(1, max_attempts + 1):
+        attempt = _Attempt(last=attempt_number == max_attempts or _pending.get() is not None)
+        yield attempt
+        if attempt.succeeded:
+            return
+        time.sleep(random.uniform(0, settings.TREE_WRITE_RETRY_DELAY * attempt_number))
+
+
+def retrying_tree_write(func):
+    """Decorator running a function as a tree_write block retried on conflicts"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in tree_write_attempts():
+            with attempt:
+                result = func(*args, **kwargs)
+        return result
+    return wrapper
+
+
+def mark_nodes_changed(deal_id: int, node_ids: Iterable[int]) -> None:
+    """Record that some nodes of a deal changed (stamped now if outside tree_write)"""
+    node_ids = [node_id for node_id in node_ids if node_id is not None]
+    pending = _pending.get()
+    if pending is None:
+        stamp_nodes(deal_id, node_ids)
+    else:
+        pending.setdefault(deal_id, set()).update(node_ids)
+
+
+def stamp_nodes(deal_id: int, node_ids: Iterable[int], expected_version: Optional[int] = None) -> Optional[int]:
+    """
+    Bump a deal's tree_version and stamp the given nodes with the new value.
+
+    Args:
+        deal_id: The deal
+        node_ids: Nodes that changed
+        expected_version: Only bump from this version (compare-and-swap)
+
+    Returns:
+        The new tree_version, or None if there was nothing to stamp
+
+    Raises:
+        TreeVersionConflict: If the version is no longer expected_version
+    """
+    node_ids = list(node_ids)
+    if not node_ids:
+        return None
+    if expected_version is None:
+        Deal.objects.filter(id=deal_id).update(tree_version=F('tree_version') + 1)
+    elif not Deal.objects.filter(id=deal_id, tree_version=expected_version).update(
+        tree_version=expected_version + 1
+    ):
+        raise TreeVersionConflict(f'The auction tree of deal {deal_id} changed concurrently')
+    version, pooled_deal_id = Deal.objects.filter(id=deal_id).values_list('tree_version', 'pooled_deal_id').get()
+    for start in range(0, len(node_ids), BATCH_SIZE):
+        Node.objects.filter(id__in=node_ids[start:start + BATCH_SIZE]).update(version=version)
+    if pooled_deal_id is not None:
+        from .deal_pools import refresh_field_calls
+        refresh_field_calls(pooled_deal_id, node_ids)
+    refresh_path_stats(node_ids)
+    return version
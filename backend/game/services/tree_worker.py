@@ -0,0 +1,219 @@
+"""
+Post-commit recompute of derived tree state
+
+A call only has to store its response for the write to be durable; the
+state derived from the responses (divergence, who_needs/needs_mask with the
+descendant exemptions, pending-work counters) can follow a moment later.
+TREE_WORKER_MODE chooses where that recompute runs:
+
+- 'sync' (default): inside the write, as before
+- 'thread': in an in-process thread pool, started by transaction.on_commit
+  once the write has committed
+- 'queue': by `python manage.py run_tree_worker`, from TreeRecomputeJob rows
+  written in the same transaction as the call (a crash between commit and
+  recompute cannot lose the mark)
+
+Either way dirty marks coalesce per deal: a deal already waiting is not
+queued twice, and a deal marked while it is being recomputed is recomputed
+once more afterwards, so a burst of calls costs one or two recomputes. The
+recompute itself is refresh_derived_state() under an optimistic tree_write,
+so it never overwrites state computed from responses it has not seen.
+
+Deal ids are only unique within a shard, so the thread pool tracks deals by
+(shard, deal id) and the queue is drained shard by shard.
+"""
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from ..models import Deal, TreeRecomputeJob
+from ..sharding import active_shard, for_each_shard, on_shard_commit, use_shard
+from .tree_versions import expect_tree_version, is_retryable, tree_write_attempts
+
+MODES = ('sync', 'thread', 'queue')
+
+
+def worker_mode() -> str:
+    mode = settings.TREE_WORKER_MODE
+    if mode not in MODES:
+        raise ValueError(f"TREE_WORKER_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+    return mode
+
+
+def deferring_recompute() -> bool:
+    """Whether writes leave the derived tree state to schedule_recompute()"""
+    return worker_mode() != 'sync'
+
+
+def schedule_recompute(deal_id: int) -> None:
+    """
+    Mark a deal's derived tree state dirty.
+
+    Call at the end of the write transaction: in 'queue' mode this writes
+    the deal's job row, in 'thread' mode the pool picks the deal up after
+    the transaction commits. Does nothing in 'sync' mode.
+    """
+    mode = worker_mode()
+    if mode == 'queue':
+        TreeRecomputeJob.objects.bulk_create(
+            [TreeRecomputeJob(deal_id=deal_id, requested_at=timezone.now())],
+            update_conflicts=True,
+            unique_fields=['deal'],
+            update_fields=['requested_at']
+        )
+    elif mode == 'thread':
+        alias = active_shard()
+        on_shard_commit(lambda: thread_worker().schedule(deal_id, alias))
+
+
+def recompute_deal(deal_id: int) -> Optional[int]:
+    """
+    Recompute a deal's derived tree state from its active responses
+    (the deal of the active shard).
+
+    Returns:
+        Number of nodes updated, or None if the deal no longer exists
+    """
+    from .auction_tree import refresh_derived_state
+
+    for attempt in tree_write_attempts():
+        with attempt:
+            deal = Deal.objects.select_related('session').filter(id=deal_id).first()
+            if deal is None:
+                return None
+            expect_tree_version(deal.id, deal.tree_version)
+            changed = refresh_derived_state(deal.session, deal)
+    return changed
+
+
+class ThreadWorker:
+    """In-process pool recomputing dirty deals (TREE_WORKER_MODE='thread')"""
+
+    def __init__(self, threads: int):
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tree-worker')
+        self._lock = threading.Condition()
+        self._queued = set()  # Waiting for a pool thread
+        self._running = set()
+        self._again = set()  # Marked while running: recompute once more
+
+    def schedule(self, deal_id: int, alias: str) -> None:
+        key = (alias, deal_id)
+        with self._lock:
+            if key in self._running:
+                self._again.add(key)
+                return
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self._pool.submit(self._run, key)
+
+    def _run(self, key: tuple) -> None:
+        alias, deal_id = key
+        with self._lock:
+            self._queued.discard(key)
+            self._running.add(key)
+        retry = False
+        try:
+            with use_shard(alias):
+                recompute_deal(deal_id)
+        except Exception as error:
+            # Lost to writers once more than tree_write_attempts allows: go
+            # again; any other failure leaves the deal stale until its next write
+            retry = is_retryable(error)
+            if not retry:
+                traceback.print_exc()
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running.discard(key)
+                again = retry or key in self._again
+                self._again.discard(key)
+                self._lock.notify_all()
+        if again:
+            self.schedule(deal_id, alias)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until no deal is waiting or being recomputed; False on timeout"""
+        with self._lock:
+            return self._lock.wait_for(lambda: not (self._queued or self._running), timeout)
+
+
+_thread_worker = None
+_thread_worker_lock = threading.Lock()
+
+
+def thread_worker() -> ThreadWorker:
+    """The process's ThreadWorker, started on first use"""
+    global _thread_worker
+    with _thread_worker_lock:
+        if _thread_worker is None:
+            _thread_worker = ThreadWorker(settings.TREE_WORKER_THREADS)
+        return _thread_worker
+
+
+def claim_jobs(limit: int) -> list:
+    """
+    Claim up to `limit` of the oldest unclaimed jobs (or jobs whose worker
+    has held them longer than TREE_WORKER_CLAIM_SECONDS).
+
+    A job is claimed by an UPDATE guarded on the claimed_at value read, so
+    concurrent workers never take the same job.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.TREE_WORKER_CLAIM_SECONDS)
+    candidates = TreeRecomputeJob.objects.filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale)
+    ).order_by('requested_at').values_list('id', 'claimed_at')[:limit]
+
+    claimed = []
+    for job_id, claimed_at in candidates:
+        if TreeRecomputeJob.objects.filter(id=job_id, claimed_at=claimed_at).update(claimed_at=now):
+            claimed.append(job_id)
+    return list(TreeRecomputeJob.objects.filter(id__in=claimed, claimed_at=now).order_by('requested_at'))
+
+
+def run_job(job: TreeRecomputeJob) -> bool:
+    """
+    Recompute a claimed job's deal and retire the job.
+
+    A job marked again while it ran (requested_at moved) is released for
+    another round instead of deleted. A failed job keeps its claim, so it
+    is retried once the claim goes stale rather than in a tight loop.
+
+    Returns:
+        True if the recompute succeeded
+    """
+    try:
+        recompute_deal(job.deal_id)
+    except Exception:
+        traceback.print_exc()
+        TreeRecomputeJob.objects.filter(id=job.id).update(failures=F('failures') + 1)
+        return False
+    if not TreeRecomputeJob.objects.filter(id=job.id, requested_at=job.requested_at).delete()[0]:
+        TreeRecomputeJob.objects.filter(id=job.id).update(claimed_at=None)
+    return True
+
+
+def drain_queue(batch_size: int = 50, max_jobs: Optional[int] = None) -> int:
+    """
+    Run queued jobs until the queue of every shard is empty (or `max_jobs` ran).
+
+    Returns:
+        Number of jobs run
+    """
+    done = 0
+    for _ in for_each_shard():
+        while max_jobs is None or done < max_jobs:
+            limit = batch_size if max_jobs is None else min(batch_size, max_jobs - done)
+            jobs = claim_jobs(limit)
+            if not jobs:
+                break
+            for job in jobs:
+                run_job(job)
+                done += 1
+    return done
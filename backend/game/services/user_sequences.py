@@ -0,0 +1,157 @@
+"""
+User bidding sequences stored as call rows
+
+Each call of a user's sequence is one UserBiddingCall row, and the sequence
+row caches what branch logic needs: the space-separated history, the number
+of calls and the last seat. Appending writes the new rows and updates the
+cache in one statement; truncating deletes the tail and does the same, so
+neither rewrites the calls that stay. Branch checks compare the cached
+history (indexed with the deal) and never read the rows.
+
+Entries are returned in the shape the API has always used: {'position',
+'call', 'alert', 'type', 'timestamp', 'call_index'}.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from django.utils import timezone
+from ..models import UserBiddingSequence, UserBiddingCall
+from ..sharding import shard_atomic
+from ..utils import is_auction_complete
+
+BATCH_SIZE = 500
+
+
+def call_type(call: str) -> str:
+    """'bid' for contract bids, 'action' for pass, double and redouble"""
+    return 'bid' if call[0].isdigit() else 'action'
+
+
+def history_is_complete(calls: Sequence[str]) -> bool:
+    """is_auction_complete() of a list of call strings"""
+    return is_auction_complete([{'call': call, 'type': call_type(call)} for call in calls])
+
+
+def call_entry(row: UserBiddingCall) -> dict:
+    """API entry of one call row"""
+    return {
+        'position': row.position,
+        'call': row.call,
+        'alert': row.alert,
+        'type': call_type(row.call),
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+        'call_index': row.call_index,
+    }
+
+
+def sequence_entries(user_sequence: Optional[UserBiddingSequence]) -> List[dict]:
+    """Entries of a sequence (uses prefetched calls when present)"""
+    if user_sequence is None or not user_sequence.call_count:
+        return []
+    return [call_entry(row) for row in user_sequence.calls.all()]
+
+
+def entries_by_sequence(sequence_ids: Iterable[int]) -> Dict[int, List[dict]]:
+    """{sequence_id: entries} for many sequences, in batched queries"""
+    sequence_ids = sorted({sequence_id for sequence_id in sequence_ids if sequence_id})
+    entries = {}
+    for start in range(0, len(sequence_ids), BATCH_SIZE):
+        for row in UserBiddingCall.objects.filter(sequence_id__in=sequence_ids[start:start + BATCH_SIZE]):
+            entries.setdefault(row.sequence_id, []).append(call_entry(row))
+    return entries
+
+
+def with_entries(items: Iterable, sequence_id_of, chunk_size: int = BATCH_SIZE) -> Iterator[Tuple[object, List[dict]]]:
+    """
+    Pair each item with the entries of its sequence, reading the call rows
+    of every `chunk_size` items in one query (items are consumed lazily).
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield from _pair_chunk(chunk, sequence_id_of)
+            chunk = []
+    if chunk:
+        yield from _pair_chunk(chunk, sequence_id_of)
+
+
+def _pair_chunk(chunk: list, sequence_id_of) -> Iterator[Tuple[object, List[dict]]]:
+    entries = entries_by_sequence(sequence_id_of(item) for item in chunk)
+    for item in chunk:
+        yield item, entries.get(sequence_id_of(item), [])
+
+
+def _store(user_sequence: UserBiddingSequence, calls: List[str], last_position: str) -> None:
+    """Write the cached history fields of a sequence (one UPDATE)"""
+    user_sequence.history = ' '.join(calls)
+    user_sequence.call_count = len(calls)
+    user_sequence.last_position = last_position
+    user_sequence.is_complete = history_is_complete(calls)
+    user_sequence.save(update_fields=['history', 'call_count', 'last_position', 'is_complete', 'updated_at'])
+
+
+@shard_atomic(savepoint=False)
+def append_calls(user_sequence: UserBiddingSequence, calls: Iterable[tuple]) -> List[dict]:
+    """
+    Append calls to a sequence.
+
+    Args:
+        user_sequence: The sequence (its cached fields are refreshed)
+        calls: (position, call) or (position, call, alert) tuples
+
+    Returns:
+        Entries of the appended calls
+    """
+    # Lock the sequence so concurrent appends cannot take the same indexes
+    locked = UserBiddingSequence.objects.select_for_update().only(
+        'history', 'call_count', 'last_position'
+    ).get(pk=user_sequence.pk)
+    now = timezone.now()
+    rows = [
+        UserBiddingCall(
+            sequence=user_sequence,
+            call_index=locked.call_count + offset,
+            position=call[0],
+            call=call[1],
+            alert=(call[2] if len(call) > 2 else '') or '',
+            timestamp=now
+        )
+        for offset, call in enumerate(calls)
+    ]
+    if not rows:
+        return []
+    UserBiddingCall.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+    history = locked.history.split() + [row.call for row in rows]
+    _store(user_sequence, history, rows[-1].position)
+    return [call_entry(row) for row in rows]
+
+
+@shard_atomic(savepoint=False)
+def truncate_sequence(user_sequence: UserBiddingSequence, keep: int) -> None:
+    """Keep only the first `keep` calls of a sequence"""
+    locked = UserBiddingSequence.objects.select_for_update().only(
+        'history', 'call_count', 'last_position'
+    ).get(pk=user_sequence.pk)
+    if keep >= locked.call_count:
+        # Nothing to cut, but the caller's copy may be stale
+        user_sequence.history = locked.history
+        user_sequence.call_count = locked.call_count
+        user_sequence.last_position = locked.last_position
+        return
+    keep = max(keep, 0)
+    UserBiddingCall.objects.filter(sequence=user_sequence, call_index__gte=keep).delete()
+    last_position = UserBiddingCall.objects.filter(
+        sequence=user_sequence, call_index=keep - 1
+    ).values_list('position', flat=True).first() if keep else ''
+    _store(user_sequence, locked.history.split()[:keep], last_position or '')
+
+
+@shard_atomic(savepoint=False)
+def pop_call(user_sequence: UserBiddingSequence) -> Optional[dict]:
+    """Remove and return the last call of a sequence (None if it is empty)"""
+    last = UserBiddingCall.objects.select_for_update().filter(sequence=user_sequence).order_by('-call_index').first()
+    if last is None:
+        return None
+    entry = call_entry(last)
+    truncate_sequence(user_sequence, last.call_index)
+    return entry
@@ -0,0 +1,346 @@
+"""
+Session sharding across several databases
+
+Every partnership's writes used to go to the one `default` database. With
+SESSION_SHARD_COUNT > 1 each session lives in one of the SESSION_SHARDS
+databases together with every row that hangs off it (deals, nodes, edges,
+responses, sequences, audits, comments, events, counters) and the per-shard
+rollups built from them (auction paths and their statistics, field calls).
+Users, deal pools, pooled deals and idempotency keys stay global in
+`default`, which is also the first shard.
+
+SessionShard rows in `default` are the directory: their id is the session
+id (so session ids stay unique across shards) and they name the database
+holding the session. A new session goes to SESSION_SHARDS[id % count];
+`python manage.py rebalance_shards` moves sessions whose shard differs
+(after shards are added) or a given session to a given shard.
+
+SessionShardRouter sends global models to `default` and sharded ones to the
+database of the instance a query starts from, else to the active shard:
+
+- SessionViewSet activates the shard of the session a request names (its pk
+  or session_id), and SessionShardMiddleware scopes that to the request
+- services and commands working on one session wrap it in use_shard()
+- views spanning sessions (the session list, dashboard, path statistics,
+  field trees) read each shard in turn with for_each_shard()
+
+Rows of different shards cannot join, so foreign keys from sharded models to
+users and pooled deals carry no database constraint, and select_related()
+of users goes through select_users(), which prefetches instead once there
+is more than one shard.
+"""
+import heapq
+from contextlib import ContextDecorator, contextmanager
+from contextvars import ContextVar
+from functools import cmp_to_key
+from typing import Iterable, Iterator, List, Optional
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.utils import timezone
+
+GLOBAL_DB = DEFAULT_DB_ALIAS
+
+# game models stored with their session (model_name as in migrations)
+SHARDED_MODELS = frozenset({
+    'session', 'sessionparticipant', 'deal', 'playergame', 'playergamebid',
+    'dealcall', 'userbiddingsequence', 'userbiddingcall', 'bidcomment',
+    'forkdeal', 'node', 'response', 'responseaudit', 'nodecomment', 'edge',
+    'treeevent', 'treesnapshot', 'pendingworkcounter', 'treerecomputejob',
+    'fieldcall', 'auctionpath', 'pathstats',
+})
+
+_active_shard: ContextVar[str] = ContextVar('active_shard', default=GLOBAL_DB)
+
+
+def shard_aliases() -> List[str]:
+    """DATABASES aliases of the shards, 'default' first"""
+    return list(getattr(settings, 'SESSION_SHARDS', [GLOBAL_DB]))
+
+
+def sharded() -> bool:
+    """Whether sessions are spread over more than one database"""
+    return len(shard_aliases()) > 1
+
+
+def is_sharded(model) -> bool:
+    return model._meta.app_label == 'game' and model._meta.model_name in SHARDED_MODELS
+
+
+def home_shard(session_id: int) -> str:
+    """The shard a session is assigned to by its id"""
+    aliases = shard_aliases()
+    return aliases[session_id % len(aliases)]
+
+
+def active_shard() -> str:
+    return _active_shard.get()
+
+
+def activate_shard(alias: str) -> None:
+    """Make `alias` the active shard until the enclosing use_shard() block ends"""
+    if alias not in shard_aliases():
+        raise ValueError(f"Unknown shard {alias!r}")
+    _active_shard.set(alias)
+
+
+@contextmanager
+def use_shard(alias: Optional[str] = None):
+    """
+    Run a block with `alias` as the active shard.
+
+    Without an alias the block keeps the current one, but anything it
+    activates is undone on exit.
+    """
+    token = _active_shard.set(_active_shard.get())
+    try:
+        if alias is not None:
+            activate_shard(alias)
+        yield
+    finally:
+        _active_shard.reset(token)
+
+
+def for_each_shard() -> Iterator[str]:
+    """Yield every shard alias with that shard active"""
+    for alias in shard_aliases():
+        with use_shard(alias):
+            yield alias
+
+
+def shard_of_session(session_id) -> str:
+    """
+    The database holding a session.
+
+    Unknown (or malformed) ids resolve to the active shard, where looking
+    the session up simply finds nothing.
+    """
+    if not sharded():
+        return GLOBAL_DB
+    from .models import SessionShard
+    try:
+        session_id = int(session_id)
+    except (TypeError, ValueError):
+        return active_shard()
+    database = SessionShard.objects.filter(id=session_id).values_list('database', flat=True).first()
+    return database or active_shard()
+
+
+async def ashard_of_session(session_id) -> str:
+    """shard_of_session() for async code"""
+    if not sharded():
+        return GLOBAL_DB
+    from .models import SessionShard
+    try:
+        session_id = int(session_id)
+    except (TypeError, ValueError):
+        return active_shard()
+    database = await SessionShard.objects.filter(id=session_id).values_list('database', flat=True).afirst()
+    return database or active_shard()
+
+
+def allocate_session() -> tuple:
+    """
+    Reserve a session id in the directory.
+
+    Returns:
+        (session_id, shard alias) for a new session
+    """
+    from .models import SessionShard
+    entry = SessionShard.objects.create(database=GLOBAL_DB)
+    database = home_shard(entry.id)
+    if database != GLOBAL_DB:
+        SessionShard.objects.filter(id=entry.id).update(database=database)
+    return entry.id, database
+
+
+def move_session_entry(session_id: int, database: str) -> None:
+    """Point the directory entry of a session at another shard"""
+    from .models import SessionShard
+    SessionShard.objects.update_or_create(
+        id=session_id, defaults={'database': database, 'moved_at': timezone.now()}
+    )
+
+
+class ShardAtomic(ContextDecorator):
+    """transaction.atomic() on the shard active when the block is entered"""
+
+    def __init__(self, savepoint: bool = True, durable: bool = False):
+        self.savepoint = savepoint
+        self.durable = durable
+
+    def _recreate_cm(self):
+        # Each decorated call resolves its own shard
+        return ShardAtomic(self.savepoint, self.durable)
+
+    def __enter__(self):
+        self._atomic = transaction.atomic(using=active_shard(), savepoint=self.savepoint, durable=self.durable)
+        return self._atomic.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._atomic.__exit__(exc_type, exc_value, traceback)
+
+
+def shard_atomic(savepoint: bool = True, durable: bool = False) -> ShardAtomic:
+    """
+    transaction.atomic() for session data, as a context manager or decorator.
+
+    Plain transaction.atomic() covers the default database only, which
+    holds just the first shard's sessions.
+    """
+    return ShardAtomic(savepoint=savepoint, durable=durable)
+
+
+def on_shard_commit(func) -> None:
+    """transaction.on_commit() of the active shard's transaction"""
+    transaction.on_commit(func, using=active_shard())
+
+
+def select_users(queryset, *lookups):
+    """
+    select_related() for lookups that reach users (or pooled deals).
+
+    Users live in the default database, so once sessions are spread over
+    several the join is impossible and the users are prefetched instead.
+    """
+    if sharded():
+        return queryset.prefetch_related(*lookups)
+    return queryset.select_related(*lookups)
+
+
+def bind_shard(iterable: Iterable, alias: Optional[str] = None) -> Iterator:
+    """
+    Iterate lazily with a shard active (by default the current one).
+
+    For streamed responses, which are consumed after the view has returned
+    and the request's shard is no longer active.
+    """
+    alias = alias or active_shard()
+    iterator = iter(iterable)
+    while True:
+        with use_shard(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _ordering_key(ordering):
+    """Sort key function for model instances in a queryset ordering"""
+    fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def compare(left, right):
+        for name, descending in fields:
+            a, b = getattr(left, name), getattr(right, name)
+            if a != b:
+                return (1 if a < b else -1) if descending else (-1 if a < b else 1)
+        return 0
+    return cmp_to_key(compare)
+
+
+class ShardedQuerySet:
+    """
+    Read-only union of the same query on every shard.
+
+    Supports the part of the QuerySet API that listing and cursor
+    pagination use (filter, exclude, order_by, slicing, iteration, count):
+    a slice reads at most `stop` rows per shard and merges them in order.
+    """
+
+    def __init__(self, querysets: list, ordering: Optional[tuple] = None):
+        self.querysets = querysets
+        self.model = querysets[0].model
+        self.ordering = tuple(ordering if ordering is not None else querysets[0].query.order_by)
+
+    @classmethod
+    def across_shards(cls, queryset) -> 'ShardedQuerySet':
+        # Each shard's part is read from wherever the routers send its reads
+        return cls([queryset.using(router.db_for_read(queryset.model)) for _ in for_each_shard()])
+
+    def _clone(self, method: str, *args, **kwargs) -> 'ShardedQuerySet':
+        return ShardedQuerySet(
+            [getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets], self.ordering
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._clone('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._clone('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        clone = self._clone('order_by', *fields)
+        clone.ordering = tuple(fields)
+        return clone
+
+    def count(self) -> int:
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def _merged(self, stop: Optional[int] = None) -> list:
+        parts = [queryset if stop is None else queryset[:stop] for queryset in self.querysets]
+        if not self.ordering:
+            return [obj for part in parts for obj in part]
+        return list(heapq.merge(*parts, key=_ordering_key(self.ordering)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError('ShardedQuerySet slices take no step')
+            return self._merged(key.stop)[key]
+        return self._merged(key + 1)[key]
+
+    def __iter__(self):
+        return iter(self._merged())
+
+    def __len__(self) -> int:
+        return len(self._merged())
+
+
+class SessionShardMiddleware:
+    """Undo the shard a request activated once its response is ready"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with use_shard():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with use_shard():
+            return await self.get_response(request)
+
+
+class SessionShardRouter:
+    """Route sharded models to their session's database, the rest to default"""
+
+    def _shard_for(self, model, **hints):
+        if not is_sharded(model):
+            return GLOBAL_DB
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)) and instance._state.db:
+            return instance._state.db
+        return active_shard()
+
+    db_for_read = _shard_for
+    db_for_write = _shard_for
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == GLOBAL_DB:
+            return True
+        if db not in shard_aliases():
+            return None
+        # Data migrations only have rows to migrate in default; shards start empty
+        return app_label == 'game' and model_name in SHARDED_MODELS
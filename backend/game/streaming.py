@@ -0,0 +1,166 @@
+"""
+Streaming JSON responses for large payloads
+
+A payload is described as nested JSONObject/JSONArray wrappers around
+iterators and written to the client piece by piece, so peak memory stays
+flat however many nodes or deals are sent. Values are encoded with orjson
+when it is installed (falling back to the standard library json with DRF's
+encoder, so the output is the same), and the stream is compressed with
+brotli or gzip when the client accepts it.
+"""
+import json
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.utils.encoders import JSONEncoder
+from .sharding import bind_shard
+
+try:
+    import orjson
+except ImportError:  # Optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional encoding
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class JSONObject:
+    """An iterable of (key, value) pairs to be streamed as a JSON object"""
+
+    def __init__(self, items: Iterable):
+        self.items = items
+
+
+class JSONArray:
+    """An iterable of values to be streamed as a JSON array"""
+
+    def __init__(self, items: Iterable):
+        self.items = items
+
+
+def dumps(value) -> bytes:
+    """Encode one value as compact JSON"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def iter_json(value) -> Iterator[bytes]:
+    """Yield the JSON encoding of a value, expanding JSONObject/JSONArray lazily"""
+    if isinstance(value, JSONObject):
+        yield b'{'
+        separator = b''
+        for key, item in value.items:
+            yield separator + dumps(str(key)) + b':'
+            yield from iter_json(item)
+            separator = b','
+        yield b'}'
+    elif isinstance(value, JSONArray):
+        yield b'['
+        separator = b''
+        for item in value.items:
+            yield separator
+            yield from iter_json(item)
+            separator = b','
+        yield b']'
+    else:
+        yield dumps(value)
+
+
+def rechunk(pieces: Iterable[bytes], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Join small pieces into chunks of about `size` bytes"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def compress(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a chunk stream incrementally ('gzip' or 'br')"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def available_encodings() -> list:
+    """Content encodings this server can produce, most preferred first"""
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def negotiate_encoding(request) -> Optional[str]:
+    """
+    Pick a content encoding from the request's Accept-Encoding header.
+
+    Returns:
+        'br', 'gzip', or None for an uncompressed response
+    """
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def wants_stream(request) -> bool:
+    """True when the client asked for a streamed response (?stream=1)"""
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    JSON response written incrementally from JSONObject/JSONArray iterators
+
+    The iterators run once the view has returned, still reading the shard
+    that was active when the response was built.
+    """
+
+    def __init__(self, value, request=None, status: int = 200):
+        encoding = negotiate_encoding(request) if request is not None else None
+        chunks = rechunk(bind_shard(iter_json(value)))
+        if encoding:
+            chunks = compress(chunks, encoding)
+        super().__init__(chunks, content_type='application/json', status=status)
+        if encoding:
+            self['Content-Encoding'] = encoding
+        patch_vary_headers(self, ('Accept-Encoding',))
@@ -1,3 +1,1781 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (
+    Session, Deal, DealCall, PlayerGame, Node, NodeComment, Edge, Response, TreeEvent, UserBiddingSequence,
+    UserBiddingCall, IdempotencyKey, PendingWorkCounter, DealPool, DealPoolBoard, PooledDeal, TreeRecomputeJob,
+    SessionShard, PathStats
+)
+from .renderers import msgpack
+from .services import auction_calls, tree_upsert, tree_worker
+from .services.auction_calls import append_deal_call
+from .services.auction_tree import (
+    assemble_auction_tree, build_auction_tree, get_or_create_node, record_user_response, record_user_responses,
+    refresh_derived_state, update_auction_tree
+)
+from .services.deal_formats import read_lin, read_pbn, write_lin, write_pbn
+from .services.deal_generator import BALANCED, DealPredicate, Parser, expand_shape, generate_deals
+from .services.event_log import load_state, seed_snapshot, state_as_of, verify_deal_state
+from .services.participants import add_participant
+from .services.pending_work import dashboard_for_user, stale_pending_counters
+from .services.system_import import import_system_notes
+from .services.tree_history import build_auction_tree_as_of
+from .services.tree_stream import read_current_tree
+from .services.tree_upsert import upsert_edges, upsert_nodes
+from .services.tree_versions import (
+    TreeVersionConflict, expect_tree_version, mark_nodes_changed, tree_write, tree_write_attempts
+)
+from .services.user_sequences import append_calls, pop_call, truncate_sequence
+from .sharding import home_shard, shard_aliases, shard_of_session, use_shard
+
+User = get_user_model()
+
+SEATS = ['N', 'E', 'S', 'W']
+
+
+def line_steps(prefix, calls, dealer='N'):
+    """(history, seat_to_act, call) of each call of a line played after `prefix`"""
+    auction = list(prefix) + list(calls)
+    return [
+        (' '.join(auction[:index]), SEATS[(SEATS.index(dealer) + index) % 4], auction[index])
+        for index in range(len(prefix), len(auction))
+    ]
+
+
+@override_settings(TREE_WRITE_MAX_ATTEMPTS=50, TREE_WRITE_RETRY_DELAY=0.01)
+class ConcurrentTreeWriteTests(TransactionTestCase):
+    """Partners writing to the same deal at once"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='stress', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+
+    def run_concurrently(self, jobs):
+        """Start every job at the same moment in its own thread; return the errors raised"""
+        barrier = threading.Barrier(len(jobs))
+        errors = []
+
+        def run(job):
+            try:
+                barrier.wait()
+                job()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(job,)) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def bid_line(self, user, prefix, calls):
+        def job():
+            for history, seat, call in line_steps(prefix, calls):
+                record_user_response(self.session.id, self.deal.deal_number, user.id, history, seat, call)
+        return job
+
+    def test_partners_bidding_at_once_leave_consistent_derived_state(self):
+        # Three lines per partner, each in its own thread; no partner answers
+        # a node twice, so every write changes the tree
+        lines = {
+            self.alice: [
+                ([], ['1NT', 'P', '2C', 'P', '2D', 'P', 'P', 'P']),
+                (['1NT', 'P', '3NT'], ['P', 'P', 'P']),
+                (['1C', 'P', '1H'], ['P', '1NT', 'P', 'P', 'P']),
+            ],
+            self.bob: [
+                ([], ['1NT', 'P', '2C', 'P', '2H', 'P', 'P', 'P']),
+                (['1NT', 'P', '3NT'], ['P', 'P', 'P']),
+                (['1C', 'P', '1H'], ['P', '2NT', 'P', 'P', 'P']),
+            ],
+        }
+        jobs = [
+            self.bid_line(user, prefix, calls)
+            for user, user_lines in lines.items()
+            for prefix, calls in user_lines
+        ]
+
+        errors = self.run_concurrently(jobs)
+
+        self.assertEqual(errors, [])
+        # Each write committed exactly one version bump
+        writes = sum(len(calls) for user_lines in lines.values() for _, calls in user_lines)
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.tree_version, writes)
+        self.assertEqual(Response.objects.filter(node__deal=self.deal, is_active=True).count(), writes)
+        # Incrementally maintained state matches a recompute from scratch
+        self.assertEqual(refresh_derived_state(self.session, self.deal), 0)
+
+        divergent = set(Node.objects.filter(deal=self.deal, divergence=True).values_list('history', flat=True))
+        self.assertEqual(divergent, {'1NT P 2C P', '1C P 1H P'})
+
+
+class TreeVersionCheckTests(TestCase):
+    """Compare-and-swap on Deal.tree_version"""
+
+    def setUp(self):
+        alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        session = Session.objects.create(name='cas', creator=alice, partner=bob)
+        self.deal = Deal.objects.create(session=session, deal_number=1, dealer='N', vulnerability='None')
+        self.node = Node.objects.create(
+            session=session, deal=self.deal, history='', seat_to_act='N', depth=0, needs_mask=3
+        )
+        self.deal.refresh_from_db()
+        self.start_version = self.deal.tree_version
+
+    def write(self, interfere_times):
+        """A tree write that a concurrent one beats `interfere_times` times"""
+        attempts = 0
+        for attempt in tree_write_attempts(max_attempts=3):
+            with attempt:
+                attempts += 1
+                expect_tree_version(self.deal.id)
+                if attempts <= interfere_times:
+                    # Stands in for a concurrent write committing meanwhile
+                    Deal.objects.filter(id=self.deal.id).update(tree_version=F('tree_version') + 1)
+                mark_nodes_changed(self.deal.id, [self.node.id])
+        return attempts
+
+    def test_lost_version_check_runs_the_block_again(self):
+        self.assertEqual(self.write(interfere_times=1), 2)
+        self.deal.refresh_from_db()
+        self.node.refresh_from_db()
+        self.assertEqual(self.deal.tree_version, self.start_version + 1)
+        self.assertEqual(self.node.version, self.start_version + 1)
+
+    def test_conflict_propagates_after_the_last_attempt(self):
+        with self.assertRaises(TreeVersionConflict):
+            self.write(interfere_times=3)
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.tree_version, self.start_version)
+
+
+
+@override_settings(TREE_WRITE_RETRY_DELAY=0)
+class TreeWorkerTests(TestCase):
+    """Derived tree state recomputed after the write (TREE_WORKER_MODE)"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='worker', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+
+    def bid_apart(self):
+        """Three writes to the deal, leaving a divergence at '1NT'"""
+        record_user_response(self.session.id, 1, self.alice.id, '', 'N', '1NT')
+        record_user_response(self.session.id, 1, self.alice.id, '1NT', 'E', 'P')
+        record_user_response(self.session.id, 1, self.bob.id, '1NT', 'E', 'X')
+
+    def divergence(self, history):
+        return Node.objects.get(deal=self.deal, history=history).divergence
+
+    @override_settings(TREE_WORKER_MODE='queue')
+    def test_queued_marks_of_a_deal_run_once(self):
+        self.bid_apart()
+
+        self.assertEqual(TreeRecomputeJob.objects.filter(deal=self.deal).count(), 1)
+        self.assertFalse(self.divergence('1NT'))
+
+        with mock.patch('game.services.tree_worker.recompute_deal', wraps=tree_worker.recompute_deal) as recompute:
+            self.assertEqual(tree_worker.drain_queue(), 1)
+        recompute.assert_called_once_with(self.deal.id)
+        self.assertTrue(self.divergence('1NT'))
+        self.assertFalse(TreeRecomputeJob.objects.exists())
+        self.assertEqual(tree_worker.drain_queue(), 0)
+
+    def test_sync_mode_recomputes_in_the_write(self):
+        with mock.patch('game.services.tree_worker.recompute_deal') as recompute:
+            self.bid_apart()
+
+        recompute.assert_not_called()
+        self.assertTrue(self.divergence('1NT'))
+        self.assertFalse(TreeRecomputeJob.objects.exists())
+
+    def test_thread_marks_coalesce_per_deal(self):
+        worker = tree_worker.ThreadWorker(1)
+        started, release = threading.Event(), threading.Event()
+        runs = []
+
+        def recompute(deal_id):
+            runs.append(deal_id)
+            if len(runs) == 1:
+                started.set()
+                release.wait(5)
+
+        with mock.patch('game.services.tree_worker.recompute_deal', side_effect=recompute):
+            # Deal 1 is running: marking it again asks for one more round
+            worker.schedule(1, 'default')
+            self.assertTrue(started.wait(5))
+            # Deal 2 waits for the only thread: marking it again does nothing
+            for _ in range(3):
+                worker.schedule(1, 'default')
+                worker.schedule(2, 'default')
+            release.set()
+            self.assertTrue(worker.wait_idle(5))
+
+        self.assertEqual(sorted(runs), [1, 1, 2])
+
+
+class StableIdTests(TestCase):
+    """Node ids that survive rebuilds, and tree deltas by version"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='stable', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        for user, calls in ((self.alice, ['1NT', 'P', '2C']), (self.bob, ['1NT', 'P'])):
+            for history, seat, call in line_steps([], calls):
+                record_user_response(self.session.id, 1, user.id, history, seat, call)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def tree(self, **params):
+        response = self.client.get(
+            f'/api/game/sessions/{self.session.id}/auction_tree/', {'deal_index': 1, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, tree):
+        return {node['history']: node_id for node_id, node in tree['nodes'].items()}
+
+    def test_ids_are_kept_across_rebuilds(self):
+        before = self.ids(self.tree())
+        self.assertEqual(before['1NT P'], f"n_{Node.objects.get(deal=self.deal, history='1NT P').pk}")
+
+        record_user_response(self.session.id, 1, self.bob.id, '1NT P', 'S', '3NT')
+        after = self.ids(self.tree())
+        self.assertEqual({history: after[history] for history in before}, before)
+        self.assertIn('1NT P 3NT', after)
+
+        # A full rebuild writes the same ids
+        rebuilt = update_auction_tree(self.session.id, 1)
+        self.assertEqual(self.ids(rebuilt), after)
+        self.assertEqual(rebuilt['root'], after[''])
+
+    def test_states_without_a_node_get_state_ids(self):
+        responses = {('', 'N'): {self.alice.id: '1NT'}}
+        tree = assemble_auction_tree(self.session, self.deal, [], responses)
+
+        self.assertEqual(tree['root'], 's_N_')
+        self.assertEqual([(edge['from'], edge['to']) for edge in tree['edges']], [('s_N_', 's_E_1NT')])
+
+    def test_a_delta_has_only_the_changed_nodes(self):
+        version = self.tree()['version']
+        self.assertEqual(self.tree(since_version=version)['nodes'], {})
+
+        record_user_response(self.session.id, 1, self.bob.id, '1NT P', 'S', '3NT')
+        delta = self.tree(since_version=version)
+        full = self.tree()
+
+        self.assertTrue(delta['delta'])
+        self.assertEqual(delta['version'], full['version'])
+        self.assertGreater(delta['version'], version)
+        changed = set(Node.objects.filter(deal=self.deal, version__gt=version).values_list('history', flat=True))
+        self.assertEqual({node['history'] for node in delta['nodes'].values()}, changed)
+        self.assertTrue({'1NT P', '1NT P 3NT'} <= changed)
+        self.assertNotIn('', changed)
+        for node_id, node in delta['nodes'].items():
+            self.assertEqual(node, full['nodes'][node_id])
+        edge_key = lambda edge: (edge['from'], edge['call'])
+        self.assertEqual(
+            sorted(delta['edges'], key=edge_key),
+            sorted([edge for edge in full['edges'] if edge['from'] in delta['nodes']], key=edge_key)
+        )
+
+
+class TreeUpsertTests(TestCase):
+    """Set-based node and edge upserts"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='upsert', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.states = [('', 'N'), ('1NT', 'E'), ('1NT P P P', 'N')]
+
+    def upsert(self, states):
+        with CaptureQueriesContext(connection) as queries:
+            with tree_write():
+                nodes = upsert_nodes(self.deal, states)
+        inserts = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('INSERT') and 'INTO "game_node"' in query['sql']
+        ]
+        return nodes, inserts
+
+    def test_new_states_are_inserted_once(self):
+        nodes, inserts = self.upsert(self.states + [('1NT', 'E')])
+
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(set(nodes), set(self.states))
+        self.assertEqual(Node.objects.filter(deal=self.deal).count(), 3)
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.tree_version, 1)
+        closed = Node.objects.get(deal=self.deal, history='1NT P P P')
+        self.assertEqual((closed.depth, closed.status, closed.needs_mask, closed.version), (4, 'closed', 0, 1))
+
+    def test_existing_states_are_read_without_writing(self):
+        created, _ = self.upsert(self.states)
+
+        nodes, inserts = self.upsert(self.states)
+        self.assertEqual(inserts, [])
+        self.assertEqual({key: node.pk for key, node in nodes.items()}, {key: node.pk for key, node in created.items()})
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.tree_version, 1)
+
+    def test_rows_out_of_step_with_their_history_are_corrected(self):
+        self.upsert(self.states)
+        Node.objects.filter(deal=self.deal, history='1NT P P P').update(depth=0, status='open', needs_mask=3)
+
+        nodes, inserts = self.upsert([('1NT P P P', 'N'), ('1NT', 'E')])
+        self.assertEqual(inserts, [])
+        fixed = Node.objects.get(deal=self.deal, history='1NT P P P')
+        self.assertEqual((fixed.depth, fixed.status, fixed.needs_mask, fixed.version), (4, 'closed', 0, 2))
+        self.assertEqual(Node.objects.get(deal=self.deal, history='1NT').version, 1)
+
+    def test_a_row_inserted_concurrently_is_read_back(self):
+        existing, _ = self.upsert([('1NT', 'E')])
+        read_nodes = tree_upsert._read_nodes
+        reads = []
+
+        def miss_first_read(deal, keys):
+            # The first read runs before the concurrent writer's row is visible
+            reads.append(keys)
+            return {} if len(reads) == 1 else read_nodes(deal, keys)
+
+        with mock.patch('game.services.tree_upsert._read_nodes', side_effect=miss_first_read):
+            nodes, inserts = self.upsert([('1NT', 'E')])
+
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(nodes[('1NT', 'E')].pk, existing[('1NT', 'E')].pk)
+        self.assertEqual(Node.objects.filter(deal=self.deal).count(), 1)
+
+    def test_edges_are_created_then_refreshed(self):
+        nodes, _ = self.upsert(self.states + [('1C', 'E')])
+        root = nodes[('', 'N')]
+
+        with tree_write():
+            upsert_edges(self.deal, [(root, nodes[('1NT', 'E')], '1NT', 1)])
+            upsert_edges(self.deal, [(root, nodes[('1C', 'E')], '1NT', 3)])
+
+        edge = Edge.objects.get(deal=self.deal)
+        self.assertEqual((edge.to_node_id, edge.by_mask), (nodes[('1C', 'E')].pk, 3))
+
+
+class EventSequenceTests(TestCase):
+    """Event log sequences taken by a concurrent write"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='events', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+
+    def test_taken_sequence_runs_the_write_again(self):
+        create = TreeEvent.objects.create
+        raced = []
+
+        def racing_create(**fields):
+            if not raced:
+                # The partner's event takes the sequence between the read and the insert
+                raced.append(create(**{**fields, 'user': self.bob}))
+            return create(**fields)
+
+        with mock.patch.object(TreeEvent.objects, 'create', side_effect=racing_create):
+            record_user_response(self.session.id, self.deal.deal_number, self.alice.id, '', 'N', '1NT')
+
+        self.assertEqual(len(raced), 1)
+        events = list(TreeEvent.objects.filter(deal=self.deal).values_list('sequence', 'user_id', 'call'))
+        self.assertEqual(events, [(1, self.alice.id, '1NT')])
+        self.assertTrue(Response.objects.filter(node__deal=self.deal, user=self.alice, call='1NT').exists())
+
+
+@override_settings(TREE_SNAPSHOT_INTERVAL=3)
+class EventReplayTests(TestCase):
+    """Trees rebuilt from the event log and its snapshots"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='replay', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def node_needs(self, state):
+        return {key: (node['who_needs'], node['needs_mask']) for key, node in state['nodes'].items()}
+
+    def test_replay_matches_the_tree_through_rewind_and_undo(self):
+        for history, seat, call in line_steps([], ['1NT', 'P', '2C', 'P']):
+            record_user_response(self.session.id, 1, self.alice.id, history, seat, call)
+        record_user_response(self.session.id, 1, self.bob.id, '', 'N', '1C')
+        before_rewind, sequence = load_state(self.deal)
+
+        rewind_to = Node.objects.get(deal=self.deal, history='1NT').id
+        response = self.client.post(f'/api/game/sessions/{self.session.id}/rewind/', {
+            'deal_index': 1, 'node_id': f'n_{rewind_to}', 'confirm': True
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify_deal_state(self.deal), [])
+        self.assertEqual(self.client.post(f'/api/game/sessions/{self.session.id}/undo/').status_code, 200)
+        self.assertEqual(verify_deal_state(self.deal), [])
+
+        # Snapshots (every 3 events) hold the needs and are restored as stored
+        self.assertTrue(self.deal.tree_snapshots.exists())
+        snapshot = self.deal.tree_snapshots.order_by('-sequence').first()
+        self.assertEqual(self.node_needs(load_state(self.deal, snapshot.sequence)[0]),
+                         self.node_needs(snapshot.state))
+        state, _ = load_state(self.deal)
+        self.assertEqual(state['responses']['|N'], {str(self.alice.id): '1NT', str(self.bob.id): '1C'})
+        self.assertNotIn('1NT P|S', state['responses'])
+
+        # The state before the rewind is still there to replay
+        self.assertEqual(load_state(self.deal, sequence)[0]['responses'], before_rewind['responses'])
+        self.assertEqual(before_rewind['responses']['1NT P|S'], {str(self.alice.id): '2C'})
+
+    def test_seed_snapshot_sits_at_the_end_of_the_log(self):
+        self.assertIsNone(seed_snapshot(self.deal))
+        before_first_event = timezone.now()
+        record_user_response(self.session.id, 1, self.alice.id, '', 'N', '1NT')
+
+        snapshot = seed_snapshot(self.deal)
+        self.assertEqual(snapshot.sequence, 1)
+        self.assertEqual(snapshot.state['nodes']['|N']['who_needs'], 'partner')
+        self.assertEqual(state_as_of(self.deal, before_first_event), ({'responses': {}, 'nodes': {}}, 0))
+        self.assertEqual(verify_deal_state(self.deal), [])
+
+
+class TreeAsOfTests(TestCase):
+    """Historical trees (?as_of=)"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='history', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+
+    def call(self, user, history, seat, call):
+        record_user_response(self.session.id, self.deal.deal_number, user.id, history, seat, call)
+        return timezone.now()
+
+    def edge_calls(self, as_of):
+        tree = build_auction_tree_as_of(self.session, self.deal, as_of)
+        return sorted((edge['call'], tuple(edge['by'])) for edge in tree['edges'])
+
+    def test_call_made_just_before_as_of_is_included(self):
+        after_first = self.call(self.alice, '', 'N', '1NT')
+        after_second = self.call(self.bob, '', 'N', '1C')
+
+        self.assertEqual(self.edge_calls(after_first), [('1NT', ('alice',))])
+        self.assertEqual(self.edge_calls(after_second), [('1C', ('bob',)), ('1NT', ('alice',))])
+        # Cached per event, so asking again between the calls is not served the later tree
+        self.assertEqual(self.edge_calls(after_first), [('1NT', ('alice',))])
+
+    def test_as_of_reports_the_requested_instant(self):
+        after_call = self.call(self.alice, '', 'N', '1NT')
+        tree = build_auction_tree_as_of(self.session, self.deal, after_call)
+        self.assertEqual(tree['as_of'], after_call.isoformat())
+        self.assertEqual(tree['as_of_sequence'], 1)
+
+
+class SharedAuctionTests(TestCase):
+    """Calls appended to a deal's shared auction"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='table', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+
+    def racing(self, race):
+        """Patch the step between reading the deal's auction state and writing the call to run `race` first"""
+        state_after = auction_calls.auction_state_after
+
+        def racing_state_after(state, call):
+            race()
+            return state_after(state, call)
+        return mock.patch.object(auction_calls, 'auction_state_after', side_effect=racing_state_after)
+
+    def calls(self):
+        return list(DealCall.objects.filter(deal=self.deal).order_by('call_index').values_list('call_index', 'call'))
+
+    def partner_calls_first(self, seat, call):
+        """A race in which Bob's call takes the tail slot once"""
+        pending = [(seat, call)]
+
+        def race():
+            if pending:
+                racing_seat, racing_call = pending.pop()
+                append_deal_call(self.deal.id, racing_seat, self.bob, racing_call)
+        return race
+
+    def test_call_that_lost_the_tail_slot_is_validated_again(self):
+        with self.racing(self.partner_calls_first('E', '1NT')):
+            deal_call, after = append_deal_call(self.deal.id, 'S', self.alice, '2C')
+        self.assertEqual(deal_call.call_index, 1)
+        self.assertEqual((after['call_count'], after['last_bid']), (2, '2C'))
+        self.assertEqual(self.calls(), [(0, '1NT'), (1, '2C')])
+
+        # Checked against the auction that now holds Bob's 3NT
+        with self.racing(self.partner_calls_first('W', '3NT')):
+            with self.assertRaises(ValueError):
+                append_deal_call(self.deal.id, 'N', self.alice, '3C')
+        self.assertEqual(self.calls(), [(0, '1NT'), (1, '2C'), (2, '3NT')])
+
+    def test_call_losing_every_attempt_is_a_conflict(self):
+        PlayerGame.objects.create(session=self.session, player=self.alice, position='N')
+        client = APIClient()
+        client.force_authenticate(self.alice)
+
+        def version_moves():
+            Deal.objects.filter(id=self.deal.id).update(call_count=F('call_count') + 1)
+
+        with self.racing(version_moves):
+            response = client.post('/api/game/sessions/make_call/', {
+                'session_id': self.session.id, 'deal_id': self.deal.id, 'call': '1NT'
+            }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.calls(), [])
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.call_count, auction_calls.MAX_ATTEMPTS)
+
+
+class UserSequenceTests(TestCase):
+    """Call rows of a user's bidding sequence"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='rows', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.sequence = UserBiddingSequence.objects.create(deal=self.deal, user=self.alice, position='N')
+        append_calls(self.sequence, [('N', '1NT'), ('E', 'P'), ('S', '2C', 'Stayman'), ('W', 'P')])
+
+    def rows(self):
+        return list(self.sequence.calls.order_by('call_index').values_list('call_index', 'position', 'call'))
+
+    def test_truncate_keeps_the_leading_indexes(self):
+        truncate_sequence(self.sequence, 2)
+        self.assertEqual(self.rows(), [(0, 'N', '1NT'), (1, 'E', 'P')])
+        self.sequence.refresh_from_db()
+        self.assertEqual((self.sequence.history, self.sequence.call_count, self.sequence.last_position), ('1NT P', 2, 'E'))
+
+        # Appending continues right after the kept calls
+        append_calls(self.sequence, [('S', '3NT')])
+        self.assertEqual(self.rows(), [(0, 'N', '1NT'), (1, 'E', 'P'), (2, 'S', '3NT')])
+
+        # Keeping at least every call leaves the rows alone
+        truncate_sequence(self.sequence, 5)
+        self.assertEqual(len(self.rows()), 3)
+        truncate_sequence(self.sequence, 0)
+        self.sequence.refresh_from_db()
+        self.assertEqual((self.rows(), self.sequence.history, self.sequence.last_position), ([], '', ''))
+
+    def test_pop_call_removes_the_last_index(self):
+        popped = pop_call(self.sequence)
+        self.assertEqual((popped['call_index'], popped['position'], popped['call']), (3, 'W', 'P'))
+        popped = pop_call(self.sequence)
+        self.assertEqual((popped['call_index'], popped['call'], popped['alert']), (2, '2C', 'Stayman'))
+
+        self.sequence.refresh_from_db()
+        self.assertEqual((self.sequence.history, self.sequence.call_count, self.sequence.last_position), ('1NT P', 2, 'E'))
+        append_calls(self.sequence, [('S', '2NT')])
+        self.assertEqual([index for index, _, _ in self.rows()], [0, 1, 2])
+
+        for _ in range(3):
+            pop_call(self.sequence)
+        self.assertIsNone(pop_call(self.sequence))
+
+
+class BatchCallTests(TestCase):
+    """Several calls along one branch in one make_user_calls request"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='batch', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def make_calls(self, calls, history=''):
+        return self.client.post('/api/game/sessions/make_user_calls/', {
+            'session_id': self.session.id, 'deal_id': self.deal.id, 'calls': calls, 'history': history
+        }, format='json')
+
+    def sequence_calls(self):
+        return list(UserBiddingCall.objects.filter(
+            sequence__deal=self.deal, sequence__user=self.alice
+        ).order_by('call_index').values_list('position', 'call'))
+
+    def active_calls(self):
+        return dict(Response.objects.filter(node__deal=self.deal, user=self.alice, is_active=True).values_list(
+            'node__history', 'call'
+        ))
+
+    def test_an_invalid_call_rejects_the_whole_line(self):
+        response = self.make_calls(['1NT', 'P', '1C', 'P'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['call_index'], 2)
+        self.assertFalse(Response.objects.filter(node__deal=self.deal).exists())
+        self.assertFalse(Node.objects.filter(deal=self.deal).exists())
+        self.assertEqual(self.sequence_calls(), [])
+
+    def test_a_line_is_recorded_with_one_write(self):
+        with mock.patch(
+            'game.actions.bidding_actions.record_user_responses', wraps=record_user_responses
+        ) as record:
+            response = self.make_calls(['1NT', 'P', {'call': '2C', 'alert': 'Stayman'}, 'P'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['calls_recorded'], 4)
+        record.assert_called_once()
+        self.assertEqual(record.call_args.args[3:], ('', [('N', '1NT'), ('E', 'P'), ('S', '2C'), ('W', 'P')]))
+        self.assertEqual(self.active_calls(), {'': '1NT', '1NT': 'P', '1NT P': '2C', '1NT P 2C': 'P'})
+        self.assertEqual(self.sequence_calls(), [('N', '1NT'), ('E', 'P'), ('S', '2C'), ('W', 'P')])
+        self.assertEqual(UserBiddingCall.objects.get(call='2C').alert, 'Stayman')
+
+    def test_a_line_from_an_earlier_call_replaces_the_rest_of_the_sequence(self):
+        self.assertEqual(self.make_calls(['1NT', 'P', '2C', 'P']).status_code, 200)
+
+        response = self.make_calls(['3NT', 'P'], history='1NT P')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [entry['call'] for entry in response.json()['user_sequence']['sequence']], ['1NT', 'P', '3NT', 'P']
+        )
+        self.assertEqual(self.sequence_calls(), [('N', '1NT'), ('E', 'P'), ('S', '3NT'), ('W', 'P')])
+        sequence = UserBiddingSequence.objects.get(deal=self.deal, user=self.alice)
+        self.assertEqual((sequence.history, sequence.call_count), ('1NT P 3NT P', 4))
+        self.assertEqual(self.active_calls()['1NT P'], '3NT')
+
+
+class SystemImportTests(TestCase):
+    """Partnership system notes imported into a deal's tree"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='notes', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+
+    def test_only_the_chosen_line_is_answered(self):
+        summary = import_system_notes(self.session, ['1NT-2C-2D', '1NT-2C-2H', '1C-1D'])
+
+        self.assertEqual(summary['sequences'], 3)
+        self.assertEqual(summary['conflicts'], [
+            {'history': '', 'call': '1C', 'chosen': '1NT'},
+            {'history': '1NT Pass 2C Pass', 'call': '2H', 'chosen': '2D'},
+        ])
+        line = [('', '1NT'), ('1NT', 'Pass'), ('1NT Pass', '2C'), ('1NT Pass 2C', 'Pass'), ('1NT Pass 2C Pass', '2D')]
+        for user in (self.alice, self.bob):
+            self.assertEqual(
+                list(Response.objects.filter(node__deal=self.deal, user=user, is_active=True)
+                     .order_by('node__depth').values_list('node__history', 'call')),
+                line
+            )
+        self.assertEqual(
+            sorted(Edge.objects.filter(deal=self.deal).values_list('from_node__history', 'call', 'by_mask')),
+            sorted((history, call, 3) for history, call in line)
+        )
+        histories = set(Node.objects.filter(deal=self.deal).values_list('history', flat=True))
+        self.assertFalse({'1C', '1C Pass', '1C Pass 1D', '1NT Pass 2C Pass 2H'} & histories)
+        # Only the end of the line awaits anyone
+        self.assertEqual(
+            list(Node.objects.filter(deal=self.deal).exclude(who_needs='none').values_list('history', 'who_needs')),
+            [('1NT Pass 2C Pass 2D', 'both')]
+        )
+
+    def test_partner_who_answered_otherwise_leaves_the_line(self):
+        record_user_response(self.session.id, 1, self.bob.id, '1NT', 'E', 'X')
+
+        import_system_notes(self.session, ['1NT-2C'])
+
+        self.assertEqual(
+            list(Response.objects.filter(user=self.bob, is_active=True).order_by('node__depth')
+                 .values_list('node__history', 'call')),
+            [('', '1NT'), ('1NT', 'X')]
+        )
+        self.assertEqual(
+            list(Edge.objects.filter(deal=self.deal, from_node__history='1NT').values_list('call', 'by_mask')),
+            [('Pass', 1)]
+        )
+
+
+class IdempotencyKeyTests(TestCase):
+    """Retried make_user_call requests carrying an Idempotency-Key"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='retries', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def make_call(self, key, call='1NT', position='N'):
+        return self.client.post('/api/game/sessions/make_user_call/', {
+            'session_id': self.session.id, 'deal_id': self.deal.id, 'call': call, 'position': position, 'history': ''
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.make_call('call-1')
+        retry = self.make_call('call-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(UserBiddingCall.objects.filter(sequence__deal=self.deal, sequence__user=self.alice).count(), 1)
+
+    def test_key_reused_for_a_different_body_is_rejected(self):
+        self.assertEqual(self.make_call('call-1').status_code, 200)
+
+        response = self.make_call('call-1', call='1C')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(
+            list(UserBiddingCall.objects.filter(sequence__user=self.alice).values_list('call', flat=True)), ['1NT']
+        )
+
+    def test_key_is_released_after_a_client_error(self):
+        self.assertEqual(self.make_call('call-1', position='E').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(user=self.alice, key='call-1').exists())
+
+        response = self.make_call('call-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+class SessionListTests(TestCase):
+    """Paginated session summaries"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pw')
+        self.sessions = [
+            Session.objects.create(name=f'session {index}', creator=self.alice, partner=self.bob)
+            for index in range(5)
+        ]
+        Session.objects.create(name='not hers', creator=self.bob, partner=self.carol)
+        Deal.objects.create(session=self.sessions[0], deal_number=1, dealer='N', vulnerability='None')
+        # Sessions updated at the same instant still page in a stable order
+        Session.objects.filter(id__in=[session.id for session in self.sessions[1:4]]).update(
+            updated_at=self.sessions[4].updated_at
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_cursor_pages_list_each_session_once(self):
+        ids, pages = [], 0
+        url = '/api/game/sessions/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [summary['id'] for summary in page['results']]
+            url = page['next']
+            pages += 1
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            ids, list(Session.objects.filter(creator=self.alice).order_by('-updated_at', '-id').values_list('id', flat=True))
+        )
+
+    def test_summaries_carry_counts_without_deals(self):
+        response = self.client.get('/api/game/sessions/', {'page_size': 100})
+        summary = next(item for item in response.json()['results'] if item['id'] == self.sessions[0].id)
+        self.assertEqual(summary['deal_count'], 1)
+        self.assertEqual(summary['partner']['username'], 'bob')
+        self.assertNotIn('deals', summary)
+
+
+class DealListTests(TestCase):
+    """The annotated deal list (all_deals) and deal history (get_deal_history)"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='deals', creator=self.alice, partner=self.bob)
+        self.add_deals(3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def add_deals(self, count):
+        """Deals in threes: completed by alice with a tree, untouched, started by alice"""
+        first = self.session.deals.count() + 1
+        for deal_number in range(first, first + count):
+            deal = Deal.objects.create(session=self.session, deal_number=deal_number, dealer='N', vulnerability='None')
+            kind = (deal_number - 1) % 3
+            if kind == 1:
+                continue
+            calls = [('N', '1NT'), ('E', 'Pass'), ('S', 'Pass'), ('W', 'Pass')] if kind == 0 else [('N', '1C')]
+            for index, (position, call) in enumerate(calls):
+                DealCall.objects.create(deal=deal, call_index=index, position=position, player=self.alice, call=call)
+            sequence = UserBiddingSequence.objects.create(deal=deal, user=self.alice, position='N')
+            append_calls(sequence, calls)
+            if kind == 0:
+                record_user_response(self.session.id, deal_number, self.alice.id, '', 'N', '1NT')
+
+    def get(self, action):
+        response = self.client.get(f'/api/game/sessions/{self.session.id}/{action}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def queries(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(action)
+        return len(queries.captured_queries)
+
+    def test_all_deals_are_annotated(self):
+        data = self.get('all_deals')
+
+        self.assertEqual((data['total'], data['latest_deal_number']), (3, 3))
+        self.assertEqual([deal['deal_number'] for deal in data['deals']], [1, 2, 3])
+        self.assertEqual([deal['has_tree_data'] for deal in data['deals']], [True, False, False])
+
+    def test_history_lists_the_completed_deals(self):
+        data = self.get('get_deal_history')
+
+        self.assertEqual(data['total_completed'], 1)
+        [entry] = data['history']
+        self.assertEqual(entry['deal_number'], 1)
+        self.assertEqual([call['call'] for call in entry['sequence']], ['1NT', 'Pass', 'Pass', 'Pass'])
+        sequence = UserBiddingSequence.objects.get(deal__deal_number=1, user=self.alice)
+        self.assertEqual(entry['completed_at'].replace('Z', '+00:00'), sequence.updated_at.isoformat())
+
+        # The partner has completed nothing
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.get('get_deal_history'), {'history': [], 'total_completed': 0})
+
+    def test_query_count_does_not_grow_with_the_deals(self):
+        queries = {action: self.queries(action) for action in ('all_deals', 'get_deal_history')}
+        self.add_deals(6)
+
+        for action, count in queries.items():
+            with self.assertNumQueries(count):
+                self.get(action)
+        self.assertEqual(len(self.get('get_deal_history')['history']), 3)
+
+
+class PathStatsTests(TestCase):
+    """Per-partnership agreement counts at interned auction paths"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pw')
+        self.with_bob = Session.objects.create(name='with bob', creator=self.alice, partner=self.bob)
+        self.with_carol = Session.objects.create(name='with carol', creator=self.alice, partner=self.carol)
+        for session, deal_number in ((self.with_bob, 1), (self.with_bob, 2), (self.with_carol, 1)):
+            Deal.objects.create(session=session, deal_number=deal_number, dealer='N', vulnerability='None')
+        self.bid(self.with_bob, 1, self.alice, ['1NT', 'P', '2C'])
+        self.bid(self.with_bob, 1, self.bob, ['1NT', 'P', '3NT'])
+        self.bid(self.with_bob, 2, self.alice, ['1C'])
+        self.bid(self.with_bob, 2, self.bob, ['1NT'])
+        self.bid(self.with_carol, 1, self.alice, ['1NT'])
+        self.bid(self.with_carol, 1, self.carol, ['1NT'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def bid(self, session, deal_number, user, calls):
+        for history, seat, call in line_steps([], calls):
+            record_user_response(session.id, deal_number, user.id, history, seat, call)
+
+    def stats(self, history, **params):
+        response = self.client.get('/api/game/dashboard/path_stats/', {'history': history, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, stats):
+        return (stats['nodes'], stats['agreements'], stats['divergences'], stats['divergence_rate'])
+
+    def test_counts_over_the_partnerships(self):
+        opening = self.stats('')
+        self.assertEqual(self.counts(opening), (3, 2, 1, 0.3333))
+        self.assertEqual(
+            [(row['history'], *self.counts(row)) for row in opening['continuations']],
+            [('1NT', 3, 1, 0, 0), ('1C', 1, 0, 0, 0)]
+        )
+
+        response = self.stats('1NT  P')
+        self.assertEqual((response['history'], response['depth']), ('1NT P', 2))
+        self.assertEqual(self.counts(response), (1, 0, 1, 1.0))
+        self.assertEqual([row['call'] for row in response['continuations']], ['2C', '3NT'])
+
+        # One partnership only
+        self.assertEqual(self.counts(self.stats('', partner_id=self.carol.id)), (1, 1, 0, 0))
+        self.assertEqual(self.client.get('/api/game/dashboard/path_stats/', {'history': '2NT'}).status_code, 404)
+
+    def test_counts_follow_changed_calls(self):
+        self.bid(self.with_bob, 1, self.bob, ['1NT', 'P', '2C'])
+        self.assertEqual(self.counts(self.stats('1NT P')), (1, 1, 0, 0))
+
+        # Counts are the same when rebuilt from scratch
+        stats = {history: self.stats(history) for history in ('', '1NT', '1NT P')}
+        call_command('rebuild_path_stats', stdout=StringIO())
+        self.assertEqual({history: self.stats(history) for history in stats}, stats)
+
+
+class DealPoolTests(TestCase):
+    """Sessions playing the boards of a shared deal pool, and the pool's field tree"""
+
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(username=name, email=f'{name}@example.com', password='pw')
+            for name in ('alice', 'bob', 'carol', 'dave')
+        }
+        self.client = APIClient()
+
+    def as_user(self, name):
+        self.client.force_authenticate(self.users[name])
+        return self.client
+
+    def create_pool(self, **data):
+        return self.as_user('alice').post('/api/game/deal-pools/', {'name': 'weekly', **data}, format='json')
+
+    def start_session(self, creator, partner, pool_id):
+        response = self.as_user(creator).post('/api/game/sessions/', {
+            'name': f'{creator} and {partner}', 'partner_email': f'{partner}@example.com', 'pool_id': pool_id
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Session.objects.get(id=response.json()['id'])
+
+    def test_a_pool_is_created_with_its_boards(self):
+        response = self.create_pool(board_count=3)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['board_count'], 3)
+        pool = DealPool.objects.get(id=response.json()['id'])
+        self.assertEqual(list(pool.pool_boards.order_by('board_number').values_list('board_number', flat=True)), [1, 2, 3])
+        self.assertEqual(self.create_pool(name='empty', board_count=0).status_code, 400)
+
+    def test_sessions_from_a_pool_share_its_boards(self):
+        pool_id = self.create_pool(board_count=3).json()['id']
+        first = self.start_session('alice', 'bob', pool_id)
+        second = self.start_session('carol', 'dave', pool_id)
+
+        boards = list(DealPoolBoard.objects.filter(pool_id=pool_id).order_by('board_number').values_list(
+            'board_number', 'pooled_deal_id'
+        ))
+        for session in (first, second):
+            self.assertEqual(
+                list(session.deals.order_by('deal_number').values_list('deal_number', 'pooled_deal_id')), boards
+            )
+        self.assertEqual(PooledDeal.objects.count(), 3)
+        self.assertEqual(first.deals.get(deal_number=1).board_hands, second.deals.get(deal_number=1).board_hands)
+
+    def test_field_tree_adds_up_the_sessions(self):
+        pool_id = self.create_pool(board_count=2).json()['id']
+        first = self.start_session('alice', 'bob', pool_id)
+        second = self.start_session('carol', 'dave', pool_id)
+        dealer = first.deals.get(deal_number=1).dealer
+        for session, name, call in ((first, 'alice', '1NT'), (first, 'bob', '1C'), (second, 'carol', '1NT')):
+            record_user_response(session.id, 1, self.users[name].id, '', dealer, call)
+
+        response = self.as_user('alice').get(f'/api/game/deal-pools/{pool_id}/field_tree/', {'board': 1})
+        self.assertEqual(response.status_code, 200)
+        field = response.json()
+        self.assertEqual((field['board'], field['sessions']), (1, 2))
+        self.assertEqual(field['states'][''], {'seat': dealer, 'total': 3, 'calls': [
+            {'call': '1NT', 'responses': 2, 'sessions': 2, 'share': 0.6667},
+            {'call': '1C', 'responses': 1, 'sessions': 1, 'share': 0.3333},
+        ]})
+
+        # A session's own view lists its calls next to the field's
+        response = self.client.get(f'/api/game/sessions/{first.id}/field_tree/', {'deal_index': 1})
+        self.assertEqual(response.json()['states']['']['session_calls'], {'1NT': 1, '1C': 1})
+        self.assertEqual(
+            self.client.get(f'/api/game/deal-pools/{pool_id}/field_tree/', {'board': 5}).status_code, 404
+        )
+
+
+class PendingCounterTests(TestCase):
+    """Materialized pending-work counters kept in step with the tree"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='counters', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.clients = {}
+        for user in (self.alice, self.bob):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+
+    def post(self, user, action, data):
+        response = self.clients[user].post(f'/api/game/sessions/{self.session.id}/{action}/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def counters(self):
+        """{username: pending} stored for the deal, after checking none is stale"""
+        self.assertEqual(stale_pending_counters(self.session, [self.deal.id]), [])
+        return dict(PendingWorkCounter.objects.filter(deal=self.deal).values_list('user__username', 'pending'))
+
+    def node_id(self, history):
+        return f"n_{Node.objects.get(deal=self.deal, history=history).id}"
+
+    def test_counters_follow_record_rewind_and_undo(self):
+        expected = [{'alice': 1, 'bob': 2}, {'alice': 1, 'bob': 3}, {'alice': 1, 'bob': 4}]
+        for (history, seat, call), counters in zip(line_steps([], ['1NT', 'P', '2C']), expected):
+            record_user_response(self.session.id, 1, self.alice.id, history, seat, call)
+            self.assertEqual(self.counters(), counters)
+        record_user_response(self.session.id, 1, self.bob.id, '', 'N', '1C')
+        self.assertEqual(self.counters(), {'alice': 2, 'bob': 4})
+
+        # Rewinding to '1NT' reopens '1NT P' (her 2C) for Alice
+        self.post(self.alice, 'rewind', {'deal_index': 1, 'node_id': self.node_id('1NT'), 'confirm': True})
+        self.assertEqual(self.counters(), {'alice': 3, 'bob': 4})
+
+        # Undoing her pass at '1NT' reopens that node too
+        self.post(self.alice, 'undo', {})
+        self.assertEqual(self.counters(), {'alice': 4, 'bob': 4})
+        self.assertEqual(
+            list(Response.objects.filter(user=self.alice, is_active=True).values_list('node__history', 'call')),
+            [('', '1NT')]
+        )
+
+
+class DashboardTests(TestCase):
+    """Pending work listed per session with the caller's fellow participants"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pw')
+        self.session = Session.objects.create(name='trio', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        add_participant(self.session, self.carol, role='coach')
+        record_user_response(self.session.id, self.deal.deal_number, self.alice.id, '', 'N', '1NT')
+
+    def participants_seen_by(self, user):
+        sessions = dashboard_for_user(user)['sessions']
+        self.assertEqual([entry['session_id'] for entry in sessions], [self.session.id])
+        return [(member['username'], member['role']) for member in sessions[0]['participants']]
+
+    def test_every_other_participant_is_listed(self):
+        self.assertEqual(self.participants_seen_by(self.carol), [('alice', 'creator'), ('bob', 'partner')])
+        self.assertEqual(self.participants_seen_by(self.alice), [('bob', 'partner'), ('carol', 'coach')])
+
+
+class AuctionSubtreeTests(TestCase):
+    """Lazy expansion of a tree through auction_subtree pages"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='lazy', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        for user, calls in ((self.alice, ['1NT', 'P', '2C', 'P', '2D']), (self.bob, ['1NT', 'P', '3NT']),
+                            (self.bob, ['1C', 'P', '1H'])):
+            for history, seat, call in line_steps([], calls):
+                record_user_response(self.session.id, 1, user.id, history, seat, call)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def subtree(self, **params):
+        response = self.client.get(
+            f'/api/game/sessions/{self.session.id}/auction_subtree/', {'deal_index': 1, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_nodes_on_the_depth_limit_are_collapsed(self):
+        page = self.subtree(depth=2)
+
+        nodes = {node['history']: node for node in page['nodes'].values()}
+        self.assertEqual(set(nodes), {'', '1NT', '1C', '1NT P', '1C P'})
+        self.assertEqual(page['root'], f"n_{nodes['']['db_id']}")
+        self.assertEqual(nodes['1NT P']['child_count'], 2)
+        self.assertTrue(nodes['1NT P']['has_more'])
+        self.assertFalse(nodes['1NT']['has_more'])
+        collapsed = {f"n_{node['db_id']}" for node in nodes.values() if node['history'].count(' ') == 1}
+        self.assertFalse([edge for edge in page['edges'] if edge['from'] in collapsed])
+        self.assertIsNone(page['next_cursor'])
+
+        # A collapsed node is expanded by requesting the subtree rooted at it
+        below = self.subtree(node_id=f"n_{nodes['1NT P']['db_id']}", depth=1)
+        self.assertEqual(
+            sorted(node['history'] for node in below['nodes'].values()), ['1NT P', '1NT P 2C', '1NT P 3NT']
+        )
+
+    def test_cursor_pages_cover_the_subtree_once(self):
+        whole = self.subtree(depth=20)
+        self.assertIsNone(whole['next_cursor'])
+
+        nodes, edges, pages, cursor = [], [], 0, None
+        while True:
+            page = self.subtree(depth=20, limit=2, **({'cursor': cursor} if cursor else {}))
+            nodes += list(page['nodes'])
+            edges += page['edges']
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(len(nodes), len(set(nodes)))
+        self.assertEqual(set(nodes), set(whole['nodes']))
+        edge_key = lambda edge: (edge['from'], edge['call'])
+        self.assertEqual(sorted(edges, key=edge_key), sorted(whole['edges'], key=edge_key))
+        # The root joins the first page on top of its limit
+        self.assertEqual(pages, -(-(len(nodes) - 1) // 2))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(
+            f'/api/game/sessions/{self.session.id}/auction_subtree/', {'deal_index': 1, 'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+def decode_columnar_tree(payload):
+    """The regular tree JSON rebuilt from a columnar payload, as frontend/src/utils/treeCodec.js does"""
+    columns, calls, users = payload['nodes'], payload['calls'], payload['users']
+    detached = payload['histories']
+    ids, histories, nodes, edges = [], [], {}, []
+    db_id = 0
+    for delta in columns['id_delta']:
+        db_id += delta
+        ids.append(db_id)
+
+    def edge(parent, call, by, to):
+        return {
+            'from': f'n_{ids[parent]}',
+            'call': call,
+            'by': sorted(name for slot, name in enumerate(users) if name is not None and by & (1 << slot)),
+            'by_set': [role for bit, role in ((1, 'creator'), (2, 'partner')) if by & bit],
+            'by_mask': by,
+            'to': to,
+        }
+
+    for index, parent in enumerate(columns['parent']):
+        if parent >= 0:
+            call = calls[columns['call'][index]]
+            histories.append(f'{histories[parent]} {call}'.strip())
+            if columns['by'][index]:
+                edges.append(edge(parent, call, columns['by'][index], f'n_{ids[index]}'))
+        else:
+            histories.append(detached.get(str(index), ''))
+        flags = columns['flags'][index]
+        nodes[f'n_{ids[index]}'] = {
+            'db_id': ids[index],
+            'history': histories[index],
+            'seat': SEATS[(SEATS.index(payload['dealer']) + len(histories[index].split())) % 4],
+            'divergence': bool(flags & 1),
+            'status': 'closed' if flags & 2 else 'open',
+            'who_needs': ['none', 'creator', 'partner', 'both'][columns['needs'][index] & 3],
+            'needs_mask': columns['needs'][index],
+            'version': columns['version'][index],
+        }
+    dangling = payload['dangling']
+    for index, parent in enumerate(dangling['from']):
+        edges.append(edge(parent, calls[dangling['call'][index]], dangling['by'][index], None))
+    return {'root': f"n_{ids[payload['root']]}", 'version': payload['version'], 'nodes': nodes, 'edges': edges}
+
+
+class CurrentTreeReadTests(TestCase):
+    """Full trees read from stored state by read_current_tree"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='read', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        for user, calls in ((self.alice, ['1NT', 'P', '2C']), (self.bob, ['1NT', 'P', '3NT'])):
+            for history, seat, call in line_steps([], calls):
+                record_user_response(self.session.id, 1, user.id, history, seat, call)
+
+    def writes(self, queries):
+        return [query['sql'] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def test_an_up_to_date_tree_is_read_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            tree = read_current_tree(self.session, self.deal)
+        self.assertEqual(self.writes(queries.captured_queries), [])
+
+        built = update_auction_tree(self.session.id, 1)
+        self.assertEqual(tree['root'], built['root'])
+        self.assertEqual(
+            {key: {**node, 'version': 0} for key, node in tree['nodes'].items()},
+            {key: {**node, 'version': 0} for key, node in built['nodes'].items()}
+        )
+        edge_key = lambda edge: (edge['from'], edge['call'])
+        self.assertEqual(sorted(tree['edges'], key=edge_key), sorted(built['edges'], key=edge_key))
+
+    def test_a_stale_tree_is_brought_up_to_date_without_recreating_the_root(self):
+        Node.objects.filter(deal=self.deal, history='1NT P').update(divergence=False)
+        self.assertIsNone(read_current_tree(self.session, self.deal))
+
+        with CaptureQueriesContext(connection) as queries, mock.patch(
+            'game.services.auction_tree.get_or_create_node', wraps=get_or_create_node
+        ) as create_root:
+            tree = build_auction_tree(self.session.id, 1)
+        create_root.assert_not_called()
+        self.assertFalse([sql for sql in self.writes(queries.captured_queries) if 'INTO "game_node"' in sql])
+        nodes = {node['history']: node for node in tree['nodes'].values()}
+        self.assertTrue(nodes['1NT P']['divergence'])
+        self.assertEqual(read_current_tree(self.session, self.deal)['nodes'], tree['nodes'])
+
+    def streamed_tree(self, **headers):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get(
+            f'/api/game/sessions/{self.session.id}/auction_tree/', {'deal_index': 1, 'stream': 1}, **headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response, b''.join(response.streaming_content)
+
+    def test_streamed_tree_is_the_built_tree(self):
+        built = build_auction_tree(self.session.id, 1)
+
+        response, body = self.streamed_tree()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        streamed = json.loads(body)
+        edge_key = lambda edge: (edge['from'], edge['call'])
+        self.assertEqual(
+            {**streamed, 'edges': sorted(streamed['edges'], key=edge_key)},
+            {**built, 'edges': sorted(built['edges'], key=edge_key)}
+        )
+
+        response, body = self.streamed_tree(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(body)), streamed)
+
+
+class ColumnarTreeTests(TestCase):
+    """The compact columnar tree payload (?format=columnar)"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='compact', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='E', vulnerability='NS')
+        for user, calls in ((self.alice, ['1NT', 'P', '2C', 'P', '2D', 'P', 'P', 'P']),
+                            (self.bob, ['1NT', 'P', '3NT', 'P', 'P', 'P']), (self.bob, ['1C', 'X', '1H'])):
+            for history, seat, call in line_steps([], calls, dealer='E'):
+                record_user_response(self.session.id, 1, user.id, history, seat, call)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def tree(self, **params):
+        response = self.client.get(
+            f'/api/game/sessions/{self.session.id}/auction_tree/', {'deal_index': 1, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_columnar_payload_decodes_to_the_full_tree(self):
+        payload = self.tree(format='columnar')
+        full = self.tree()
+
+        self.assertEqual(payload['format'], 'columnar-v2')
+        decoded = decode_columnar_tree(payload)
+        self.assertEqual(decoded['root'], full['root'])
+        self.assertEqual(decoded['version'], full['version'])
+        self.assertEqual(decoded['nodes'], full['nodes'])
+        edge_key = lambda edge: (edge['from'], edge['call'])
+        full_edges = [{**edge, 'by': sorted(edge['by'])} for edge in full['edges']]
+        self.assertEqual(sorted(decoded['edges'], key=edge_key), sorted(full_edges, key=edge_key))
+        self.assertEqual(len(decoded['nodes']), Node.objects.filter(deal=self.deal).count())
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_payload_is_the_columnar_payload(self):
+        response = self.client.get(
+            f'/api/game/sessions/{self.session.id}/auction_tree/', {'deal_index': 1},
+            HTTP_ACCEPT='application/msgpack'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        payload = msgpack.unpackb(response.content, raw=False, strict_map_key=False)
+        # Through JSON, whose object keys are strings where msgpack keeps integers
+        self.assertEqual(json.loads(json.dumps(payload)), self.tree(format='columnar'))
+
+
+class AddParticipantTests(TestCase):
+    """Members joining a session with a tree under way"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pw')
+        self.session = Session.objects.create(name='joining', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        for history, seat, call in line_steps([], ['1NT', 'P', '2C', 'P']):
+            record_user_response(self.session.id, 1, self.alice.id, history, seat, call)
+        record_user_response(self.session.id, 1, self.bob.id, '', 'N', '1C')
+
+    def test_new_member_keeps_the_same_seat_exemption(self):
+        bit = add_participant(self.session, self.carol).bit
+
+        needs = dict(Node.objects.filter(deal=self.deal).values_list('history', 'needs_mask'))
+        self.assertTrue(needs[''] & bit)
+        self.assertTrue(needs['1NT'] & bit)
+        # North again on Alice's branch of the North divergence: only Alice chose it
+        self.assertFalse(needs['1NT P 2C P'] & bit)
+        self.session.refresh_from_db()
+        self.assertEqual(refresh_derived_state(self.session, self.deal), 0)
+        self.assertEqual(stale_pending_counters(self.session, [self.deal.id]), [])
+
+
+class PollingPayloadTests(TestCase):
+    """The DRF actions and the async views answer the polling endpoints alike"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='polls', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        for user, call in ((self.alice, '1NT'), (self.bob, '1C')):
+            client = APIClient()
+            client.force_authenticate(user)
+            client.post('/api/game/sessions/make_user_call/', {
+                'session_id': self.session.id, 'deal_id': self.deal.id, 'call': call, 'position': 'N', 'history': ''
+            }, format='json')
+        NodeComment.objects.create(
+            node=Node.objects.get(deal=self.deal, history=''), user=self.bob, session=self.session,
+            deal=self.deal, comment_text='Strong or weak?'
+        )
+
+    def both_paths(self, user, endpoint):
+        """(DRF JSON, async view JSON) of a GET by the user"""
+        url = f'/api/game/sessions/{self.session.id}/{endpoint}/?deal_index=1'
+        token = f'Bearer {RefreshToken.for_user(user).access_token}'
+        drf = APIClient().get(url, HTTP_AUTHORIZATION=token)
+        with self.settings(ROOT_URLCONF='backend.asgi_urls'):
+            native = async_to_sync(AsyncClient().get)(url, headers={'Authorization': token})
+        self.assertEqual(drf.status_code, 200)
+        self.assertEqual(native.status_code, 200)
+        return drf.json(), native.json()
+
+    def test_sync_and_async_views_return_identical_json(self):
+        for user in (self.alice, self.bob):
+            for endpoint in ('my_progress', 'get_next_task', 'node_comments'):
+                with self.subTest(user=user.username, endpoint=endpoint):
+                    drf, native = self.both_paths(user, endpoint)
+                    self.assertEqual(native, drf)
+
+        progress, _ = self.both_paths(self.alice, 'my_progress')
+        self.assertEqual([node['your_call'] for node in progress['nodes']], [None, '1NT'])
+        # Alice's task shows her own sequence (with its timestamps), Bob's is off his branch
+        task, _ = self.both_paths(self.alice, 'get_next_task')
+        self.assertEqual(task['history'], '1NT')
+        self.assertIn('timestamp', task['user_sequence'][0])
+        task, _ = self.both_paths(self.bob, 'get_next_task')
+        self.assertEqual(task['history'], '1NT')
+        self.assertEqual(task['user_sequence'], [{'position': 'N', 'call': '1NT', 'type': 'bid', 'call_index': 0}])
+        comments, _ = self.both_paths(self.alice, 'node_comments')
+        self.assertEqual([comment['comment_text'] for comment in comments['comments']], ['Strong or weak?'])
+
+
+def card_owners(hands):
+    """The seat index holding each card, from {seat: 'S.H.D.C'} hands"""
+    owners = [None] * 52
+    for seat_index, seat in enumerate(SEATS):
+        for suit, cards in enumerate(hands[seat].split('.')):
+            for rank in cards:
+                owners[suit * 13 + 'AKQJT98765432'.index(rank)] = seat_index
+    return owners
+
+
+# North 14 HCP 4-3-3-3, East 25 HCP, South 1 HCP, West 1-4-4-4 without honours
+SAMPLE_DEAL = card_owners({
+    'N': 'AKQ2.K32.Q32.432',
+    'E': 'JT98.AQJ.AKJ.AKQ',
+    'S': '7654.T98.T98.JT9',
+    'W': '3.7654.7654.8765',
+})
+
+
+class DealGeneratorTests(SimpleTestCase):
+    """Constraint language and seeded generation (pure Python without NumPy)"""
+
+    def holds(self, constraint):
+        return DealPredicate(constraint).matches(SAMPLE_DEAL)
+
+    def test_operator_precedence(self):
+        self.assertTrue(self.holds('1 + 2 * 3 == 7'))
+        self.assertTrue(self.holds('10 - 2 - 3 == 5'))
+        self.assertTrue(self.holds('-2 + 5 == 3'))
+        # and binds tighter than or, not tighter than and
+        self.assertTrue(self.holds('1 == 1 or 1 == 2 and 1 == 2'))
+        self.assertFalse(self.holds('(1 == 1 || 1 == 2) && 1 == 2'))
+        self.assertTrue(self.holds('not 1 == 2 and 1 == 1'))
+        self.assertFalse(self.holds('!(1 == 2 or 1 == 1)'))
+
+    def test_shape_patterns(self):
+        def codes(text):
+            return Parser(text).parse_shape_list()
+
+        self.assertEqual(len(codes('any 4333')), 4)
+        self.assertEqual(len(codes('any 4432')), 12)
+        self.assertEqual(len(codes(BALANCED)), 28)
+        self.assertEqual(codes('5xxx - 5431'), expand_shape('5xxx', False) - expand_shape('5431', False))
+        self.assertEqual(len(codes('any 5431 - 5431')), 23)
+        with self.assertRaises(ValueError):
+            codes('433')
+
+    def test_matches_hand_features(self):
+        self.assertTrue(self.holds('hcp(north) == 14 and hcp(n, spades) == 9 and controls(north) == 4'))
+        self.assertTrue(self.holds('hcp(east) == 25 && hcp(south) == 1 && hcp(west) == 0'))
+        self.assertTrue(self.holds('spades(north) == 4 and clubs(west) == 4 and hearts(w) == 4'))
+        self.assertTrue(self.holds('hcp(north) + hcp(south) == 15'))
+        self.assertTrue(self.holds('shape(north, 4333) and shape(west, any 4441 - 4441)'))
+        self.assertTrue(self.holds('balanced(north) and balanced(south) and not balanced(west)'))
+        self.assertFalse(self.holds('shape(west, xxxx - any 4441)'))
+
+    def test_invalid_constraints_raise(self):
+        for constraint in ('', 'hcp(middle) > 3', 'hcp(north', 'spades(north) > ', 'foo(north)', 'hcp(north) > 3 )'):
+            with self.subTest(constraint=constraint), self.assertRaises(ValueError):
+                DealPredicate(constraint)
+
+    def test_seeded_generation_is_reproducible(self):
+        constraint = 'hcp(north) >= 15 and balanced(north)'
+        first = generate_deals(constraint, 3, seed='session-1', max_candidates=20000, workers=0)
+        again = generate_deals(constraint, 3, seed='session-1', max_candidates=20000, workers=0)
+        other = generate_deals(constraint, 3, seed='session-2', max_candidates=20000, workers=0)
+
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        predicate = DealPredicate(constraint)
+        for hands in first:
+            owners = card_owners({
+                seat: '.'.join(hands[seat][suit].replace('10', 'T') for suit in 'SHDC') for seat in SEATS
+            })
+            self.assertTrue(predicate.matches(owners))
+
+    def test_rare_constraint_fails_before_the_full_search(self):
+        with self.assertRaisesRegex(ValueError, 'too rare'):
+            generate_deals('hcp(north) >= 20', 500, seed=1, max_candidates=10000, workers=0)
+
+
+ALERTED_PBN = """\
+[Board "1"]
+[Dealer "N"]
+[Vulnerable "None"]
+[Deal "N:AKQ2.JT9.876.543 J98.AKQ.5432.T98 T76.876.AKQJ.AK2 543.5432.T9.QJ76"]
+[Auction "N"]
+1NT Pass 2C =1= Pass
+2D =2= Pass Pass Pass
+[Note "1:Stayman"]
+[Note "2:no major"]
+
+[Board "2"]
+[Deal "E:AKQJT98765432.-.-.- -.AKQJT98765432.-.- -.-.AKQJT98765432.- -"]
+[Auction "E"]
+1C X =3= AP
+[Note "x:not a note number"]
+
+[Board "3"]
+[Deal "N:AKQ2.JT9.876.543 J98.AKQ.5432.T98 T76.876.AKQJ.AK2 543.5432.T9.QJ7"]
+
+[Board "4"]
+[Deal "N:AKQ2.JT9.876.543 J98.AKQ.5432.T98 T76.876.AKQJ.AK2 -"]
+[Auction "N"]
+1NT 1C
+"""
+
+
+class DealFormatTests(SimpleTestCase):
+    """PBN and LIN boards read back as they were written"""
+
+    def read(self):
+        return list(read_pbn(ALERTED_PBN.splitlines()))
+
+    def comparable(self, records):
+        return [
+            (record['board'], record['dealer'], record['vulnerability'], record['hands'], record['auction'])
+            for record in records
+        ]
+
+    def test_pbn_notes_become_alerts(self):
+        board = self.read()[0]
+        self.assertIsNone(board['error'])
+        self.assertEqual(board['auction'][2], ('2C', 'Stayman'))
+        self.assertEqual(board['auction'][4], ('2D', 'no major'))
+        self.assertEqual([alert for _, alert in board['auction']].count(''), 6)
+
+    def test_voids_three_hand_deals_and_unknown_notes(self):
+        board = self.read()[1]
+        self.assertIsNone(board['error'])
+        self.assertEqual(board['hands']['E'], {'S': 'AKQJ1098765432', 'H': '', 'D': '', 'C': ''})
+        self.assertEqual(board['hands']['W'], {'S': '', 'H': '', 'D': 'AKQJ1098765432', 'C': ''})
+        # The missing hand is the cards nobody else holds
+        self.assertEqual(board['hands']['N'], {'S': '', 'H': '', 'D': '', 'C': 'AKQJ1098765432'})
+        self.assertEqual(board['auction'], [('1C', ''), ('X', ''), ('Pass', ''), ('Pass', ''), ('Pass', '')])
+
+    def test_malformed_boards_carry_errors(self):
+        records = self.read()
+        self.assertEqual(records[2]['error'], 'Hand W does not hold 13 cards')
+        self.assertTrue(records[3]['error'].startswith('Invalid auction'))
+
+    def test_pbn_round_trip(self):
+        valid = [record for record in self.read() if not record['error']]
+        written = ''.join(write_pbn(valid))
+
+        self.assertIn('2C =1=', written)
+        self.assertIn('[Note "2:no major"]', written)
+        self.assertEqual(self.comparable(read_pbn(written.splitlines())), self.comparable(valid))
+
+    def test_lin_round_trip(self):
+        valid = [record for record in self.read() if not record['error']]
+        written = ''.join(write_lin(valid))
+
+        self.assertIn('mb|2C!|an|Stayman|', written)
+        self.assertEqual(self.comparable(read_lin(written.splitlines())), self.comparable(valid))
+
+    def test_malformed_lin_boards_carry_errors(self):
+        records = list(read_lin(['qx|o1|md|3SAKQ,SJ,ST,|mb|1n|mb|zz|pg||']))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['error'], 'Unknown call: zz')
+
+
+SHARD = 'shard_1'
+
+
+@override_settings(SESSION_SHARDS=['default', SHARD])
+class ShardingTests(TransactionTestCase):
+    """
+    Sessions spread over two shards: default and a second SQLite file,
+    migrated in setUp.
+    """
+
+    def setUp(self):
+        cache.clear()
+        handle, self.shard_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.settings[SHARD] = {**connections.settings['default'], 'NAME': self.shard_path}
+        # Opened here: the test case only lets queries open connections to 'default'
+        connections[SHARD].connect()
+        call_command('migrate', database=SHARD, verbosity=0)
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def tearDown(self):
+        connections[SHARD].close()
+        del connections[SHARD]
+        del connections.settings[SHARD]
+        os.remove(self.shard_path)
+
+    def start_sessions(self, count):
+        """Sessions of alice and bob with two deals each, bob having opened deal 1"""
+        session_ids = []
+        for index in range(count):
+            response = self.client.post('/api/game/sessions/', {
+                'name': f'session {index}', 'partner_email': 'bob@example.com', 'max_deals': 2
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            session_id = response.json()['id']
+            with use_shard(shard_of_session(session_id)):
+                dealer = Deal.objects.get(session_id=session_id, deal_number=1).dealer
+                record_user_response(session_id, 1, self.bob.id, '', dealer, '1NT')
+            session_ids.append(session_id)
+        return session_ids
+
+    def rows_by_shard(self, model, session_id, lookup='session_id'):
+        return {alias: model.objects.using(alias).filter(**{lookup: session_id}).count() for alias in shard_aliases()}
+
+    def tree_of(self, session_id):
+        """(deal number, history, call) of the session's active responses"""
+        return sorted(Response.objects.using(shard_of_session(session_id)).filter(
+            node__session_id=session_id, is_active=True
+        ).values_list('node__deal__deal_number', 'node__history', 'call'))
+
+    def test_sessions_land_on_their_home_shard(self):
+        session_ids = self.start_sessions(4)
+
+        self.assertEqual({home_shard(session_id) for session_id in session_ids}, {'default', SHARD})
+        for session_id in session_ids:
+            shard = home_shard(session_id)
+            self.assertEqual(SessionShard.objects.get(id=session_id).database, shard)
+            other = SHARD if shard == 'default' else 'default'
+            self.assertEqual(self.rows_by_shard(Session, session_id, 'id'), {shard: 1, other: 0})
+            self.assertEqual(self.rows_by_shard(Deal, session_id), {shard: 2, other: 0})
+            self.assertEqual(self.rows_by_shard(PlayerGame, session_id), {shard: 2, other: 0})
+            self.assertEqual(self.tree_of(session_id), [(1, '', '1NT')])
+
+            deals = self.client.get(f'/api/game/sessions/{session_id}/all_deals/').json()['deals']
+            self.assertEqual([deal['has_tree_data'] for deal in deals], [True, False])
+
+        listed = self.client.get('/api/game/sessions/').json()['results']
+        self.assertEqual(sorted(session['id'] for session in listed), sorted(session_ids))
+
+    def test_dashboard_reads_every_shard(self):
+        session_ids = self.start_sessions(4)
+
+        dashboard = self.client.get('/api/game/dashboard/').json()
+        pending = {
+            session_id: sum(PendingWorkCounter.objects.using(home_shard(session_id)).filter(
+                session_id=session_id, user=self.alice
+            ).values_list('pending', flat=True))
+            for session_id in session_ids
+        }
+        self.assertTrue(all(pending.values()))
+        self.assertEqual({entry['session_id']: entry['pending'] for entry in dashboard['sessions']}, pending)
+        self.assertEqual(dashboard['total_pending'], sum(pending.values()))
+
+    def test_rebalance_moves_sessions_to_their_home_shard(self):
+        with self.settings(SESSION_SHARDS=['default']):
+            session_ids = self.start_sessions(3)
+            trees = {session_id: self.tree_of(session_id) for session_id in session_ids}
+            paths = self.client.get('/api/game/dashboard/path_stats/', {'history': ''}).json()
+        moved = [session_id for session_id in session_ids if home_shard(session_id) == SHARD]
+        self.assertTrue(moved)
+
+        call_command('rebalance_shards', stdout=StringIO())
+
+        for session_id in session_ids:
+            shard = home_shard(session_id)
+            other = SHARD if shard == 'default' else 'default'
+            self.assertEqual(SessionShard.objects.get(id=session_id).database, shard)
+            self.assertEqual(self.rows_by_shard(Session, session_id, 'id'), {shard: 1, other: 0})
+            self.assertEqual(self.rows_by_shard(Deal, session_id), {shard: 2, other: 0})
+            self.assertEqual(self.rows_by_shard(Node, session_id)[other], 0)
+            self.assertEqual(self.tree_of(session_id), trees[session_id])
+        # Path statistics move along and still add up over the shards
+        self.assertEqual(self.client.get('/api/game/dashboard/path_stats/', {'history': ''}).json(), paths)
+        self.assertEqual(
+            PathStats.objects.using(SHARD).get(path__history='').nodes, len(moved)
+        )
+
+        # Running again has nothing left to move
+        output = StringIO()
+        call_command('rebalance_shards', stdout=output)
+        self.assertIn('Moved 0 sessions', output.getvalue())
+
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS={'default': [REPLICA]}, READ_YOUR_WRITES_SECONDS=60)
+class ReplicaReadTests(TransactionTestCase):
+    """
+    Reads routed to a replica: a second SQLite file, brought up to date by
+    copying the primary into it where a real replica would replicate.
+    """
+
+    def setUp(self):
+        cache.clear()
+        handle, self.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.settings[REPLICA] = {**connections.settings['default'], 'NAME': self.replica_path}
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.session = Session.objects.create(name='replicated', creator=self.alice, partner=self.bob)
+        self.deal = Deal.objects.create(session=self.session, deal_number=1, dealer='N', vulnerability='None')
+        self.replicate()
+
+    def tearDown(self):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        os.remove(self.replica_path)
+
+    def replicate(self):
+        """Copy the primary into the replica"""
+        connections[REPLICA].close()
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        try:
+            connection.connection.backup(replica)
+        finally:
+            replica.close()
+        # Opened here: the test case only lets queries open connections to 'default'
+        connections[REPLICA].connect()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def tree_histories(self, user):
+        # The delta of everything
+        response = self.client_for(user).get(
+            f'/api/game/sessions/{self.session.id}/auction_tree/?deal_index=1&since_version=0'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {node['history'] for node in response.json()['nodes'].values()}
+
+    def make_call(self, user, call, history=''):
+        response = self.client_for(user).post('/api/game/sessions/make_user_call/', {
+            'session_id': self.session.id, 'deal_id': self.deal.id, 'call': call, 'position': 'N', 'history': history
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_list_is_read_from_the_replica(self):
+        Session.objects.create(name='not replicated yet', creator=self.alice, partner=self.bob)
+
+        listed = self.client_for(self.alice).get('/api/game/sessions/').json()['results']
+        self.assertEqual([session['name'] for session in listed], ['replicated'])
+
+        self.replicate()
+        listed = self.client_for(self.alice).get('/api/game/sessions/').json()['results']
+        self.assertEqual(len(listed), 2)
+
+    def test_writer_reads_their_own_call_from_the_primary(self):
+        self.make_call(self.alice, '1NT')
+
+        self.assertIn('1NT', self.tree_histories(self.alice))
+        # The partner has not written, so reads the lagging replica
+        self.assertNotIn('1NT', self.tree_histories(self.bob))
+        self.replicate()
+        self.assertIn('1NT', self.tree_histories(self.bob))
+
+    def full_tree_calls(self, user):
+        response = self.client_for(user).get(f'/api/game/sessions/{self.session.id}/auction_tree/?deal_index=1')
+        self.assertEqual(response.status_code, 200)
+        return {edge['call'] for edge in response.json()['edges']}
+
+    def test_repeated_full_tree_reads_are_served_from_the_replica(self):
+        self.make_call(self.alice, '1NT')
+        self.replicate()
+        self.assertEqual(self.full_tree_calls(self.bob), {'1NT'})
+
+        # A stored tree that is up to date is read without writing, so the
+        # poller is not pinned to the primary and keeps reading the replica
+        self.make_call(self.alice, '1C')
+        self.assertEqual(self.full_tree_calls(self.bob), {'1NT'})
+        self.assertEqual(self.full_tree_calls(self.bob), {'1NT'})
+        self.replicate()
+        self.assertEqual(self.full_tree_calls(self.bob), {'1C'})
+
+    @override_settings(READ_YOUR_WRITES_SECONDS=0)
+    def test_without_a_pin_window_the_writer_reads_the_replica(self):
+        self.make_call(self.alice, '1NT')
+
+        self.assertNotIn('1NT', self.tree_histories(self.alice))
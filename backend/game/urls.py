@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SessionViewSet, PlayerGameViewSet
+from .views import SessionViewSet, PlayerGameViewSet, DashboardViewSet, DealPoolViewSet
 
 router = DefaultRouter()
 router.register(r'sessions', SessionViewSet, basename='session')
 router.register(r'player-games', PlayerGameViewSet, basename='playergame')
+router.register(r'dashboard', DashboardViewSet, basename='dashboard')
+router.register(r'deal-pools', DealPoolViewSet, basename='dealpool')
 
 urlpatterns = [
     path('', include(router.urls)),
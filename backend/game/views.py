@@ -1,30 +1,85 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db import models
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
 import hashlib
 import time
-from .models import Session, PlayerGame
-from .serializers import SessionSerializer, PlayerGameSerializer
+from .models import Session, PlayerGame, Deal, DealCall, Node, PendingWorkCounter, DealPool, DealPoolBoard
+from .serializers import SessionSerializer, SessionSummarySerializer, PlayerGameSerializer, DealPoolSerializer
+from .pagination import SessionCursorPagination
+from .replicas import read_from_replicas
+from .sharding import ShardedQuerySet, activate_shard, select_users, shard_of_session, sharded
+from .services.pending_work import dashboard_for_user, refresh_pending_counters
+from .services.deal_pools import create_pool, create_deals_from_pool, build_field_tree
+from .services.auction_paths import forget_session_paths, path_statistics
+from .services.deal_generator import generate_deals
+from .services.tree_versions import TreeVersionConflict
 from .actions import (
     DealActionsMixin,
     BiddingActionsMixin,
     SequenceActionsMixin,
     TreeActionsMixin,
     SchedulerActionsMixin,
+    ImportActionsMixin,
+    ParticipantActionsMixin,
 )
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+def count_subquery(queryset):
+    """Correlated COUNT(*) of a queryset filtered on session=OuterRef('pk')"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values('session').annotate(count=Count('pk')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class SessionShardMixin:
+    """
+    Activate the shard of the session a request is about (game.sharding),
+    named by the `session_lookup` URL kwarg or a session_id parameter.
+    """
+    session_lookup = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        data = request.data if isinstance(request.data, dict) else {}
+        session_id = kwargs.get(self.session_lookup) or data.get('session_id') or request.query_params.get('session_id')
+        if session_id is not None:
+            activate_shard(shard_of_session(session_id))
+
+
+class ReplicaReadMixin:
+    """
+    Let the GET actions in `replica_actions` read from replicas
+    (game.replicas), unless the user has just written.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action in self.replica_actions:
+            read_from_replicas(request.user)
+
+
 class SessionViewSet(
+    ReplicaReadMixin,
+    SessionShardMixin,
     DealActionsMixin,
     BiddingActionsMixin,
     SequenceActionsMixin,
     TreeActionsMixin,
     SchedulerActionsMixin,
+    ImportActionsMixin,
+    ParticipantActionsMixin,
     viewsets.ModelViewSet
 ):
     """
@@ -36,16 +91,79 @@ class SessionViewSet(
     - SequenceActionsMixin: User bidding sequences
     - TreeActionsMixin: Auction tree and progress
     - SchedulerActionsMixin: Task scheduling
+    - ImportActionsMixin: System notes and deal import/export
+    - ParticipantActionsMixin: Members and coaches beyond the pair
     """
     serializer_class = SessionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionCursorPagination
+    session_lookup = 'pk'
+    replica_actions = ('list', 'all_deals', 'auction_tree', 'get_user_sequences')
 
     def get_queryset(self):
-        return Session.objects.filter(
-            models.Q(creator=self.request.user) | models.Q(partner=self.request.user),
+        # Creator and partner hold participant rows too, so this covers them
+        queryset = Session.objects.filter(
+            participants__user=self.request.user,
             is_active=True
         ).order_by('-updated_at')
 
+        if self.action == 'list':
+            queryset = self.annotate_summary(queryset)
+            # The caller's sessions may sit on any shard
+            return ShardedQuerySet.across_shards(queryset) if sharded() else queryset
+        if self.action == 'retrieve':
+            return select_users(queryset, 'creator', 'partner').prefetch_related(
+                Prefetch('player_games', queryset=select_users(PlayerGame.objects.all(), 'player').prefetch_related('bids')),
+                Prefetch('deals', queryset=select_users(Deal.objects.all(), 'pooled_deal').prefetch_related(
+                    Prefetch('calls', queryset=select_users(DealCall.objects.all(), 'player'))
+                ))
+            )
+        return queryset
+
+    def annotate_summary(self, queryset):
+        """
+        Add the per-session counts shown in listings, one correlated subquery
+        each so the list stays a single query (plus two prefetches) per page.
+
+        pending_count sums the caller's materialized PendingWorkCounter rows.
+        """
+        user = self.request.user
+        session_ref = OuterRef('pk')
+        pending = PendingWorkCounter.objects.filter(session=session_ref, user=user).order_by().values(
+            'session'
+        ).annotate(total=Sum('pending')).values('total')
+
+        if sharded():
+            player_games = PlayerGame.objects.only('id', 'session_id', 'position', 'player_id').prefetch_related(
+                Prefetch('player', queryset=User.objects.only('id', 'username', 'email'))
+            )
+        else:
+            player_games = PlayerGame.objects.select_related('player').only(
+                'id', 'session_id', 'position',
+                'player__id', 'player__username', 'player__email'
+            )
+        return select_users(queryset, 'creator', 'partner').prefetch_related(
+            Prefetch('player_games', queryset=player_games)
+        ).annotate(
+            deal_count=count_subquery(Deal.objects.filter(session=session_ref)),
+            open_node_count=count_subquery(Node.objects.filter(session=session_ref, status='open')),
+            pending_count=Coalesce(Subquery(pending, output_field=IntegerField()), 0),
+            players_with_bids=count_subquery(
+                PlayerGame.objects.filter(session=session_ref, bid_number__gt=0)
+            ),
+        )
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SessionSummarySerializer
+        return super().get_serializer_class()
+
+    def handle_exception(self, exc):
+        # Tree writes that kept losing their version check to concurrent ones
+        if isinstance(exc, TreeVersionConflict):
+            return Response({'error': f'{exc}, please retry'}, status=status.HTTP_409_CONFLICT)
+        return super().handle_exception(exc)
+
     def create(self, request):
         partner_email = request.data.get('partner_email')
         if not partner_email:
@@ -68,8 +186,22 @@ class SessionViewSet(
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get max deals from request or use default
+        # Sessions started from a deal pool play the pool's boards
+        pool = None
+        pool_id = request.data.get('pool_id')
+        if pool_id:
+            try:
+                pool = DealPool.objects.get(id=int(pool_id))
+            except (ValueError, TypeError, DealPool.DoesNotExist):
+                return Response(
+                    {'error': 'Deal pool not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+        # Get max deals from request (or the pool size) or use default
         max_deals = request.data.get('max_deals', settings.MAX_DEALS_PER_SESSION)
+        if pool is not None:
+            max_deals = pool.pool_boards.count()
 
         # Validate max_deals
         try:
@@ -89,6 +221,24 @@ class SessionViewSet(
         seed_string = f"{request.user.id}_{partner.id}_{time.time()}"
         seed = hashlib.md5(seed_string.encode()).hexdigest()
 
+        # Targeted practice: only deals matching a constraint such as
+        # "hcp(north) >= 15 and hcp(north) <= 17 and balanced(north)"
+        generated_hands = None
+        constraint = (request.data.get('constraint') or '').strip()
+        if constraint:
+            if pool is not None:
+                return Response(
+                    {'error': 'A session cannot use both a deal pool and a constraint'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                generated_hands = generate_deals(constraint, max_deals, seed=seed)
+            except ValueError as e:
+                return Response(
+                    {'error': f'Could not generate deals: {e}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         session = serializer.save(
@@ -97,6 +247,8 @@ class SessionViewSet(
             seed=seed,
             max_deals=max_deals
         )
+        # Everything else of the session goes to the shard it was placed on
+        activate_shard(session._state.db)
 
         # Create PlayerGame entries for both players
         PlayerGame.objects.create(
@@ -114,24 +266,138 @@ class SessionViewSet(
         from .utils import shuffle_and_deal
         from .models import Deal
 
-        for i in range(max_deals):
-            deal = Deal(session=session, deal_number=i + 1)
-            deal.dealer = deal.get_dealer_for_deal()
-            deal.vulnerability = deal.get_vulnerability_for_deal()
-            deal.hands = shuffle_and_deal()
-            deal.save()
+        if pool is not None:
+            create_deals_from_pool(session, pool)
+        else:
+            for i in range(max_deals):
+                deal = Deal(session=session, deal_number=i + 1)
+                deal.dealer = deal.get_dealer_for_deal()
+                deal.vulnerability = deal.get_vulnerability_for_deal()
+                deal.hands = generated_hands[i] if generated_hands else shuffle_and_deal()
+                deal.save()
+        refresh_pending_counters(session)
 
         serializer = self.get_serializer(session)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_destroy(self, instance):
+        # PathStats counts outlive sessions, so take this one's nodes out first
+        forget_session_paths(instance)
+        instance.delete()
+
+
+class PlayerGameViewSet(SessionShardMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for managing player games
 
-class PlayerGameViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing player games"""
+    Player game ids are per shard, so once sessions are sharded requests
+    for a single game pass its session_id; the list covers every shard.
+    """
     serializer_class = PlayerGameSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return PlayerGame.objects.filter(
+        queryset = select_users(PlayerGame.objects.filter(
             player=self.request.user,
             is_active=True
-        ).select_related('session')
+        ).select_related('session'), 'player').prefetch_related('bids')
+        if self.action == 'list' and sharded():
+            return ShardedQuerySet.across_shards(queryset.order_by('session_id', 'id'))
+        return queryset
+
+
+class DashboardViewSet(viewsets.ViewSet):
+    """Pending work for the current user across all of their sessions"""
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        """
+        Pending node counts per session and per deal, read from the
+        materialized PendingWorkCounter rows in a single query.
+        """
+        return Response(dashboard_for_user(request.user))
+
+    @action(detail=False, methods=['get'])
+    def path_stats(self, request):
+        """
+        Agreement and divergence counts at an auction path and its
+        continuations over the user's partnerships (?history=1NT P 2C,
+        optionally &partner_id=N for a single partnership).
+        """
+        try:
+            partner_id = int(request.query_params['partner_id']) if 'partner_id' in request.query_params else None
+        except ValueError:
+            return Response(
+                {'error': 'Invalid partner_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stats = path_statistics(request.user, request.query_params.get('history', ''), partner_id)
+        if stats is None:
+            return Response(
+                {'error': 'No auction has reached this path'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(stats)
+
+
+class DealPoolViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Shared deal pools: boards stored once and played by many sessions.
+    Start a session from a pool by passing pool_id when creating it.
+    """
+    serializer_class = DealPoolSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return DealPool.objects.select_related('created_by').annotate(
+            board_count=Count('pool_boards')
+        ).order_by('-created_at')
+
+    def create(self, request):
+        """Create a pool of 'board_count' freshly shuffled boards (matching 'constraint' if given)"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            board_count = int(request.data.get('board_count', settings.MAX_DEALS_PER_SESSION))
+        except (ValueError, TypeError):
+            board_count = 0
+        if board_count < 1 or board_count > 100:
+            return Response(
+                {'error': 'Number of boards must be between 1 and 100'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            pool = create_pool(
+                serializer.validated_data['name'],
+                request.user,
+                board_count=board_count,
+                description=serializer.validated_data.get('description', ''),
+                constraint=(request.data.get('constraint') or '').strip()
+            )
+        except ValueError as e:
+            return Response(
+                {'error': f'Could not generate deals: {e}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(self.get_serializer(self.get_queryset().get(id=pool.id)).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def field_tree(self, request, pk=None):
+        """How every session playing the pool bid one board (?board=N)"""
+        pool = self.get_object()
+        try:
+            pool_board = pool.pool_boards.select_related('pooled_deal').get(
+                board_number=int(request.query_params.get('board', 1))
+            )
+        except (ValueError, TypeError, DealPoolBoard.DoesNotExist):
+            return Response(
+                {'error': 'Invalid board or board not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        field = build_field_tree(pool_board.pooled_deal)
+        field['board'] = pool_board.board_number
+        return Response(field)
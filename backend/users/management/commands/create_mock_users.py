@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
 from game.models import Session, PlayerGame, Deal
+from game.sharding import activate_shard
 from game.utils import shuffle_and_deal
 
 User = get_user_model()
@@ -114,6 +115,8 @@ class Command(BaseCommand):
                     dealer='N',
                     vulnerability='None'
                 )
+                # The session's rows go to the shard it was placed on
+                activate_shard(session._state.db)
 
                 # Create PlayerGame entries
                 PlayerGame.objects.create(
@@ -7,6 +7,7 @@ import ProfileForm from "./profilepage.js";
 
 function SessionManagerConnected({ onEnterSession, onViewComparison }) {
   const [sessions, setSessions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [error, setError] = useState('');
@@ -20,6 +21,7 @@ function SessionManagerConnected({ onEnterSession, onViewComparison }) {
       setIsLoading(true);
       const data = await sessionService.getSessions();
       setSessions(data.results || data);
+      setNextCursor(cursorFromUrl(data.next));
       setError('');
     } catch (err) {
       setError('Failed to load sessions');
@@ -29,6 +31,19 @@ function SessionManagerConnected({ onEnterSession, onViewComparison }) {
     }
   };
 
+  const cursorFromUrl = (url) => (url ? new URL(url).searchParams.get('cursor') : null);
+
+  const loadMoreSessions = async () => {
+    try {
+      const data = await sessionService.getSessions(nextCursor);
+      setSessions(prevSessions => [...prevSessions, ...data.results]);
+      setNextCursor(cursorFromUrl(data.next));
+    } catch (err) {
+      setError('Failed to load sessions');
+      console.error('Load sessions error:', err);
+    }
+  };
+
   const handleSessionCreated = (newSession) => {
     setSessions(prevSessions => [newSession, ...prevSessions]);
   };
@@ -51,6 +66,8 @@ function SessionManagerConnected({ onEnterSession, onViewComparison }) {
   };
 
   const countCompletedBids = (session) => {
+    // Session listings carry the count; full session objects carry the histories
+    if (session.players_with_bids !== undefined) return session.players_with_bids;
     if (!session.player_games) return 0;
 
     const completedCount = session.player_games.filter(pg =>
@@ -153,6 +170,12 @@ function SessionManagerConnected({ onEnterSession, onViewComparison }) {
         {renderSessionItems()}
       </div>
 
+      {nextCursor && !isLoading && (
+        <button className="create-session" onClick={loadMoreSessions}>
+          Load More Sessions
+        </button>
+      )}
+
       {showCreateModal && (
         <CreateSessionModalConnected
           onClose={() => setShowCreateModal(false)}
@@ -55,8 +55,11 @@ function TreeView({ session, onBackToGame }) {
     const activeNodes = Object.values(treeData.nodes).filter(node => node.status !== 'closed');
     if (activeNodes.length === 0) return false;
 
-    // All active nodes must have who_needs = 'none' for auction to be complete
-    return activeNodes.every(node => node.who_needs === 'none');
+    // No participant may still need to answer an active node (needs_mask covers
+    // every session member, who_needs only the creator and partner)
+    return activeNodes.every(node => (
+      node.needs_mask !== undefined ? node.needs_mask === 0 : node.who_needs === 'none'
+    ));
   };
 
   // Toggle dev mode (for developers to view tree in real-time)
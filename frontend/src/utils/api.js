@@ -52,7 +52,7 @@ export const apiCall = async (endpoint, options = {}) => {
   // First attempt with current token
   let response = await fetch(url, {
     ...options,
-    headers: getAuthHeaders(),
+    headers: { ...getAuthHeaders(), ...options.headers },
   });
 
   // If 401 unauthorized, try refreshing token
@@ -62,7 +62,7 @@ export const apiCall = async (endpoint, options = {}) => {
       // Retry with new token
       response = await fetch(url, {
         ...options,
-        headers: getAuthHeaders(),
+        headers: { ...getAuthHeaders(), ...options.headers },
       });
     } catch (error) {
       // Refresh failed, user needs to login again
@@ -74,6 +74,39 @@ export const apiCall = async (endpoint, options = {}) => {
   return response;
 };
 
+// Generate a key identifying one logical write across its retries
+export const newIdempotencyKey = () => {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+};
+
+// API call for writes that are safe to retry: every attempt carries the same
+// Idempotency-Key, so if an earlier attempt did reach the server the retry
+// gets its stored response instead of applying the write twice
+export const idempotentApiCall = async (endpoint, options = {}, attempts = 3) => {
+  const key = newIdempotencyKey();
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await apiCall(endpoint, {
+        ...options,
+        headers: { ...options.headers, 'Idempotency-Key': key },
+      });
+      // 409: the earlier attempt is still being processed
+      if (response.status !== 409 || attempt >= attempts) {
+        return response;
+      }
+    } catch (error) {
+      // Network failure: the server may or may not have applied the write
+      if (attempt >= attempts) {
+        throw error;
+      }
+    }
+    await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+  }
+};
+
 // Logout function
 export const logout = async () => {
   const refreshToken = localStorage.getItem('refresh_token');
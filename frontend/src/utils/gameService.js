@@ -1,10 +1,12 @@
-import { apiCall } from './api';
+import { apiCall, idempotentApiCall } from './api';
+import { decodeColumnarTree } from './treeCodec';
 
 // Session API calls
 export const sessionService = {
-  // Get all sessions for the current user
-  getSessions: async () => {
-    const response = await apiCall('/game/sessions/', {
+  // Get one page of session summaries for the current user ({ next, previous, results })
+  getSessions: async (cursor = null) => {
+    const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await apiCall(`/game/sessions/${params}`, {
       method: 'GET',
     });
     return response.json();
@@ -45,14 +47,54 @@ export const sessionService = {
     return response.json();
   },
 
-  // Get the auction tree for a specific deal
-  fetchAuctionTree: async (sessionId, dealIndex) => {
-    const response = await apiCall(`/game/sessions/${sessionId}/auction_tree/?deal_index=${dealIndex}`, {
+  // Get the auction tree for a specific deal; with sinceVersion (the 'version'
+  // of a previous tree) only the nodes changed since then are returned
+  fetchAuctionTree: async (sessionId, dealIndex, sinceVersion = null) => {
+    const since = sinceVersion !== null ? `&since_version=${sinceVersion}` : '';
+    const response = await apiCall(`/game/sessions/${sessionId}/auction_tree/?deal_index=${dealIndex}${since}`, {
+      method: 'GET',
+    });
+    return response.json();
+  },
+
+  // Get the auction tree in the compact columnar form and decode it to the
+  // regular tree shape (much smaller on the wire for large trees)
+  fetchAuctionTreeCompact: async (sessionId, dealIndex) => {
+    const response = await apiCall(`/game/sessions/${sessionId}/auction_tree/?deal_index=${dealIndex}&format=columnar`, {
+      method: 'GET',
+    });
+    return decodeColumnarTree(await response.json());
+  },
+
+  // Get one page of the auction tree below a node (default: the root), for
+  // lazy expansion; pass the returned next_cursor to get the following page
+  fetchAuctionSubtree: async (sessionId, dealIndex, { nodeId = null, depth = 3, limit = 200, cursor = null } = {}) => {
+    const params = new URLSearchParams({ deal_index: dealIndex, depth, limit });
+    if (nodeId) params.append('node_id', nodeId);
+    if (cursor) params.append('cursor', cursor);
+    const response = await apiCall(`/game/sessions/${sessionId}/auction_subtree/?${params.toString()}`, {
       method: 'GET',
     });
     return response.json();
   },
 
+  // List session participants (slot and mask bit per member)
+  fetchSessionParticipants: async (sessionId) => {
+    const response = await apiCall(`/game/sessions/${sessionId}/participants/`, {
+      method: 'GET',
+    });
+    return response.json();
+  },
+
+  // Add a member or coach to a session (creator only)
+  addSessionParticipant: async (sessionId, email, role = 'member') => {
+    const response = await apiCall(`/game/sessions/${sessionId}/add_participant/`, {
+      method: 'POST',
+      body: JSON.stringify({ email, role }),
+    });
+    return response.json();
+  },
+
   // Get all deals for a session
   getAllDeals: async (sessionId) => {
     const response = await apiCall(`/game/sessions/${sessionId}/all_deals/`, {
@@ -110,10 +152,11 @@ export const sessionService = {
     return response.ok;
   },
 
-  // Create a new deal
-  createDeal: async (sessionId) => {
+  // Create a new deal, optionally matching a constraint such as 'hcp(north) >= 15 and balanced(north)'
+  createDeal: async (sessionId, constraint = '') => {
     const response = await apiCall(`/game/sessions/${sessionId}/create_deal/`, {
       method: 'POST',
+      ...(constraint ? { body: JSON.stringify({ constraint }) } : {}),
     });
     return response.json();
   },
@@ -150,7 +193,7 @@ export const sessionService = {
 
   // Make a user-specific call (for independent bidding)
   makeUserCall: async (sessionId, dealId, position, call, alert = '', history = '') => {
-    const response = await apiCall('/game/sessions/make_user_call/', {
+    const response = await idempotentApiCall('/game/sessions/make_user_call/', {
       method: 'POST',
       body: JSON.stringify({
         session_id: sessionId,
@@ -164,6 +207,20 @@ export const sessionService = {
     return response.json();
   },
 
+  // Make several consecutive calls along one branch in a single request
+  makeUserCalls: async (sessionId, dealId, calls, history = '') => {
+    const response = await idempotentApiCall('/game/sessions/make_user_calls/', {
+      method: 'POST',
+      body: JSON.stringify({
+        session_id: sessionId,
+        deal_id: dealId,
+        calls: calls,  // ['1NT', 'P', ...] or [{ call, alert }, ...]
+        history: history
+      }),
+    });
+    return response.json();
+  },
+
   // Get all users' bidding sequences for a deal
   getUserSequences: async (sessionId, dealNumber) => {
     const response = await apiCall(`/game/sessions/${sessionId}/get_user_sequences/?deal_number=${dealNumber}`, {
@@ -234,6 +291,32 @@ export const sessionService = {
     return response.json();
   },
 
+  // Import agreed partnership sequences (one per line) as tree branches
+  importSystemNotes: async (sessionId, content, dealIndex = null) => {
+    const response = await apiCall(`/game/sessions/${sessionId}/import_system/`, {
+      method: 'POST',
+      body: JSON.stringify(dealIndex ? { content, deal_index: dealIndex } : { content }),
+    });
+    return response.json();
+  },
+
+  // Append the boards of a PBN or LIN file to the session as new deals
+  importDeals: async (sessionId, content, fileFormat = null) => {
+    const response = await apiCall(`/game/sessions/${sessionId}/import_deals/`, {
+      method: 'POST',
+      body: JSON.stringify(fileFormat ? { content, file_format: fileFormat } : { content }),
+    });
+    return response.json();
+  },
+
+  // Download the session's deals with the user's auctions as PBN or LIN text
+  exportDeals: async (sessionId, fileFormat = 'pbn') => {
+    const response = await apiCall(`/game/sessions/${sessionId}/export_deals/?file_format=${fileFormat}`, {
+      method: 'GET',
+    });
+    return response.text();
+  },
+
   // Get next task using simplified scheduler (PLUS4 then RANDOM_DEAL)
   getNextTask: async (sessionId) => {
     const response = await apiCall(`/game/sessions/${sessionId}/get_next_task/`, {
@@ -241,6 +324,65 @@ export const sessionService = {
     });
     return response.json();
   },
+
+  // How every session playing a pooled deal bid it, with this session's calls
+  fetchFieldTree: async (sessionId, dealIndex) => {
+    const response = await apiCall(`/game/sessions/${sessionId}/field_tree/?deal_index=${dealIndex}`, {
+      method: 'GET',
+    });
+    return response.json();
+  },
+};
+
+// Deal pool API calls
+export const dealPoolService = {
+  // List shared deal pools
+  getDealPools: async () => {
+    const response = await apiCall('/game/deal-pools/', {
+      method: 'GET',
+    });
+    return response.json();
+  },
+
+  // Create a pool of freshly shuffled boards (start sessions from it with pool_id)
+  createDealPool: async (name, boardCount, description = '') => {
+    const response = await apiCall('/game/deal-pools/', {
+      method: 'POST',
+      body: JSON.stringify({ name, board_count: boardCount, description }),
+    });
+    return response.json();
+  },
+
+  // Field tree of one board of a pool
+  getPoolFieldTree: async (poolId, board) => {
+    const response = await apiCall(`/game/deal-pools/${poolId}/field_tree/?board=${board}`, {
+      method: 'GET',
+    });
+    return response.json();
+  },
+};
+
+// Dashboard API calls
+export const dashboardService = {
+  // Pending node counts per session and per deal for the current user
+  getDashboard: async () => {
+    const response = await apiCall('/game/dashboard/', {
+      method: 'GET',
+    });
+    return response.json();
+  },
+
+  // Agreement/divergence counts at an auction path and its continuations
+  getPathStats: async (history, partnerId = null) => {
+    const params = new URLSearchParams({ history });
+    if (partnerId !== null) {
+      params.set('partner_id', partnerId);
+    }
+    const response = await apiCall(`/game/dashboard/path_stats/?${params.toString()}`, {
+      method: 'GET',
+    });
+    return response.json();
+  },
 };
 
 // PlayerGame API calls
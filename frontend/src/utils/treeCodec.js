@@ -0,0 +1,99 @@
+// Decoder for the compact columnar auction tree format ('columnar-v2')
+// served by auction_tree with ?format=columnar or Accept: application/msgpack
+// (MessagePack payloads must be unpacked to an object first)
+
+const SEATS = ['W', 'N', 'E', 'S'];
+const FLAG_DIVERGENCE = 1;
+const FLAG_CLOSED = 2;
+// who_needs / by_set are the creator (bit 0) and partner (bit 1) part of a participant mask
+const WHO_NEEDS = ['none', 'creator', 'partner', 'both'];
+const CREATOR_BIT = 1;
+const PARTNER_BIT = 2;
+
+/**
+ * Seat to act after `depth` calls from the dealer
+ */
+const seatAfter = (dealer, depth) => SEATS[(SEATS.indexOf(dealer) + depth) % 4];
+
+/**
+ * Rebuild the regular tree JSON ({ root, nodes: { n_<id>: {...} }, edges: [...] })
+ * from a columnar payload. Histories are rebuilt from parent index + call code;
+ * nodes come parents-first, so one forward pass is enough.
+ */
+export const decodeColumnarTree = (payload) => {
+  if (!payload || payload.format !== 'columnar-v2') {
+    return payload;
+  }
+
+  const { calls, users, nodes: columns, dangling } = payload;
+  const detached = payload.histories || {};
+  const dbIds = new Array(columns.id_delta.length);
+  let lastId = 0;
+  columns.id_delta.forEach((delta, i) => {
+    lastId += delta;
+    dbIds[i] = lastId;
+  });
+  const ids = dbIds.map((id) => `n_${id}`);
+  const histories = new Array(ids.length);
+  const depths = new Array(ids.length);
+  const nodes = {};
+  const edges = [];
+
+  const makeEdge = (from, call, by, to) => {
+    const bySet = [];
+    if (by & CREATOR_BIT) bySet.push('creator');
+    if (by & PARTNER_BIT) bySet.push('partner');
+    return {
+      from: ids[from],
+      call,
+      by: users.filter((name, slot) => name !== null && (by & (1 << slot))).sort(),
+      by_set: bySet,
+      by_mask: by,
+      to,
+    };
+  };
+
+  for (let i = 0; i < ids.length; i += 1) {
+    const parent = columns.parent[i];
+    if (parent >= 0) {
+      const call = calls[columns.call[i]];
+      histories[i] = histories[parent] ? `${histories[parent]} ${call}` : call;
+      depths[i] = depths[parent] + 1;
+      // A non-zero 'by' is the edge from the parent with this node's call
+      if (columns.by[i]) {
+        edges.push(makeEdge(parent, call, columns.by[i], ids[i]));
+      }
+    } else {
+      histories[i] = detached[i] || '';
+      depths[i] = histories[i] ? histories[i].split(' ').length : 0;
+    }
+
+    const flags = columns.flags[i];
+    nodes[ids[i]] = {
+      db_id: dbIds[i],
+      history: histories[i],
+      seat: seatAfter(payload.dealer, depths[i]),
+      divergence: (flags & FLAG_DIVERGENCE) !== 0,
+      status: (flags & FLAG_CLOSED) !== 0 ? 'closed' : 'open',
+      who_needs: WHO_NEEDS[columns.needs[i] & (CREATOR_BIT | PARTNER_BIT)],
+      needs_mask: columns.needs[i],
+      version: columns.version[i],
+    };
+  }
+
+  // Edges whose child node is not stored
+  (dangling ? dangling.from : []).forEach((from, i) => {
+    edges.push(makeEdge(from, calls[dangling.call[i]], dangling.by[i], null));
+  });
+
+  return {
+    session_id: payload.session_id,
+    deal_index: payload.deal_index,
+    dealer: payload.dealer,
+    vul: payload.vul,
+    root: ids[payload.root],
+    version: payload.version,
+    nodes,
+    edges,
+  };
+};